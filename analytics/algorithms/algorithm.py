@@ -51,9 +51,36 @@ class Algorithm(object):
         return self._short
 
     # [Abstract]
-    def rankResults(self, elementMap, pulseMap):
+    def rankResults(self, elementMap, pulseMap, diagnostics=None,
+            deadline=None):
         return elementMap
 
+    # [Abstract]
+    def rankCandidates(self, elementMap, pulseMap, pulses, candidates,
+            diagnostics=None):
+        """
+            Ranks elements for every candidate list of default values of
+            "pulses" by ranking them again. Defaults of pulses are restored,
+            elements keep ranks of the last candidate. Algorithms override it
+            to share work between candidates.
+
+            Returns:
+                list<dict<str, Rank>>: element id and rank for each candidate
+        """
+        defaults = [x._default for x in pulses]
+        results = []
+        try:
+            for candidate in candidates:
+                for _i in range(len(pulses)):
+                    pulses[_i]._default = candidate[_i]
+                self.rankResults(elementMap, pulseMap, diagnostics)
+                results.append(dict((x.id(), x.rank()) for x in
+                    elementMap._map.values()))
+        finally:
+            for _i in range(len(pulses)):
+                pulses[_i]._default = defaults[_i]
+        return results
+
     # [Abstract]
     def getJSON(self):
         obj = {"id": self._id, "name": self._name}
@@ -31,19 +31,67 @@ class AlgorithmsMap(object):
         is a unique id of the Algorithm object, and @algorithm (value) is a
         reference to that Algorithm object.
 
+        Map can be frozen, after that it cannot be changed, so it is safe to
+        share it between requests.
+
         Attributes:
             _map (dict<str, Algorithm>): dictionary to hold all the values
+            _frozen (bool): flag to show that map cannot be changed
     """
     def __init__(self):
         self._map = {}
+        self._frozen = False
         self.reset()
 
+    # [Private]
+    def _checkNotFrozen(self):
+        """
+            Raises error, if map is frozen.
+        """
+        if self._frozen:
+            misc.raiseStandardError("Algorithms map is frozen", __file__)
+
+    # [Public]
+    def freeze(self):
+        """
+            Freezes map, any following attempt to change it raises error.
+
+            Returns:
+                AlgorithmsMap: reference to the frozen map
+        """
+        self._frozen = True
+        return self
+
+    # [Public]
+    def isFrozen(self):
+        """
+            Returns True, if map is frozen, otherwise False.
+
+            Returns:
+                bool: flag showing whether map is frozen
+        """
+        return self._frozen
+
+    # [Public]
+    def copy(self):
+        """
+            Returns new map that is not frozen with the same algorithms.
+            Algorithms themselves are shared, as they keep no request state.
+
+            Returns:
+                AlgorithmsMap: copy of the map
+        """
+        algmap = AlgorithmsMap()
+        algmap._map = dict(self._map)
+        return algmap
+
     # [Public]
     def reset(self):
         """
             Resets instance's _map attribute to default value. In case of
             dictionary it is {}.
         """
+        self._checkNotFrozen()
         self._map = {}
 
     # [Public]
@@ -69,6 +117,7 @@ class AlgorithmsMap(object):
                 algorithm (Algorithm): Algorithm instance to be added to _map
         """
         misc.checkInstanceAgainst(algorithm, a.Algorithm, __file__)
+        self._checkNotFrozen()
         key = algorithm.getId()
         if not self.has(key):
             self._map[key] = algorithm
@@ -83,6 +132,7 @@ class AlgorithmsMap(object):
             Args:
                 id (str): Algorithm instance id
         """
+        self._checkNotFrozen()
         if self.has(id):
             del self._map[id]
 
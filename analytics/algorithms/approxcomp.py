@@ -0,0 +1,253 @@
+#!/usr/bin/env python
+
+'''
+Copyright 2015 Ivan Sadikov
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+
+# import libs
+import bisect
+import math
+# import classes
+import analytics.algorithms.relativecomp as rc
+from analytics.algorithms.relativecomp import RelativeComparison, _RelComp
+from analytics.core.attribute.dynamic import Dynamic
+from analytics.utils.sortedvalues import SKETCH_MIN_SIZE
+
+"""
+    Approximate relative comparison ranks dynamic features with many distinct
+    values without evaluating rank function for each value. Rank of a value
+    depends only on the value, median, order, bounds and number of distinct
+    values, so function is evaluated exactly at knots: bounds, median and
+    centroids of quantile sketch of the feature, that is built at load time.
+    Knots are added in the middle of intervals, where rank changes by more
+    than MAX_GAP, and rank of any other value is linearly interpolated
+    between knots around it.
+
+    Error bound: rank function is monotone on each side of median, and median
+    is a knot, so exact rank of value lies between ranks of knots around it.
+    Interpolated rank differs from exact one by at most the change of rank
+    over the interval plus rounding step 0.001, that is MAX_GAP + 0.001,
+    unless MAX_KNOTS is reached first, in which case bound is wider and is
+    returned by "_approxRankMap". Elements change rank class only when the
+    average of their ranks is within that bound from class threshold.
+
+    Algorithm is opt-in: select it with
+        select from ${algorithms} where @id = [relative_comparison_approx_1]
+"""
+
+# constants for the algorithm
+## id, name and short name for the algorithm
+ID = "relative_comparison_approx_1"
+LONG_NAME = "Approximate relative comparison"
+SHORT_NAME = "relative_comp_approx"
+## maximum change of rank between adjacent knots, and maximum number of knots
+MAX_GAP = 0.01
+MAX_KNOTS = 2000
+## rounding step of ranks
+RANK_STEP = 0.001
+
+
+class ApproximateComparison(RelativeComparison):
+    """
+        Approximate relative comparison is relative comparison, where rank
+        maps of dynamic features with at least SKETCH_MIN_SIZE distinct
+        values are interpolated from quantile sketch of the feature. Other
+        features are ranked exactly.
+
+        Attributes:
+            _id (str): id of the algorithm
+            _name (str): name of the algorithm
+            _short (str): short name of the algorithm
+    """
+    def __init__(self):
+        super(RelativeComparison, self).__init__(ID, LONG_NAME, SHORT_NAME)
+
+    # [Private]
+    def _dimensionRankMap(self, a, index, order, median, presorted, pulse,
+            token=None, deadline=None):
+        """
+            Returns interpolated rank map for a single dimension, if pulse
+            has sketch of values, otherwise exact rank map. Rank maps are
+            cached the same way exact ones are.
+
+            Args:
+                a (dict<str, list>): generic map with values and hashkeys
+                index (int): index of the dimension
+                order (int): priority order of the values
+                median (value): median (default) value
+                presorted (SortedValues): sorted distinct values, or None
+                pulse (DynamicPulse): pulse of the dimension, or None
+                token (obj): token of elements, or None
+                deadline (Deadline): deadline of the request
+
+            Returns:
+                dict<value, int>: map with pairs "value : rank-value"
+        """
+        allvalues = pulse.sortedValues() if pulse is not None else None
+        if allvalues is None or allvalues.size() < SKETCH_MIN_SIZE:
+            return super(ApproximateComparison, self)._dimensionRankMap(a,
+                index, order, median, presorted, pulse, token, deadline)
+        if presorted is not None:
+            values = presorted
+            key = (order, median, "approx", presorted.token())
+        else:
+            values = set()
+            for ls in a.values():
+                if ls[index] is not None:
+                    values.add(ls[index])
+            key = None if token is None else \
+                (order, median, "approx", (token, pulse.id()))
+        rankMap = rc._rankmaps.get(key) if key is not None else None
+        if rankMap is None:
+            rankMap, bound = self._approxRankMap(values, order, median,
+                allvalues.sketch())
+            if key is not None:
+                rc._rankmaps.put(key, rankMap)
+        return rankMap
+
+    # [Private]
+    def _approxRankMap(self, values, order, median, sketch):
+        """
+            Returns interpolated rank map and bound of its error. Median is
+            ranked with values, the same as "_relcomp" does.
+
+            Args:
+                values (SortedValues|set<value>): distinct values to rank
+                order (int): priority order of the values
+                median (value): median (default) value
+                sketch (QuantileSketch): sketch of values of the feature
+
+            Returns:
+                tuple<dict<value, int>, float>: rank map and maximum
+                    difference from exact rank of any value in the map
+        """
+        if type(values) is set:
+            distinct = values
+            lo = min(values) if values else median
+            hi = max(values) if values else median
+            size = len(values) + (0 if median in values else 1)
+        else:
+            distinct = values.values()
+            lo = distinct[0] if distinct else median
+            hi = distinct[-1] if distinct else median
+            size = values.size() + (0 if values.index(median) >= 0 else 1)
+        lo = min(lo, median); hi = max(hi, median)
+        rankAt = self._rankFunction(lo, hi, size, order, median)
+        # knots are bounds, median and centroids between them
+        points = set([lo, hi, median])
+        for mean, weight in sketch.centroids():
+            if lo < mean < hi:
+                points.add(mean)
+        knots, exact, cont = self._refine(sorted(points), rankAt)
+        # ranks of values between knots are interpolated, interval "i" is
+        # between knots "i-1" and "i"
+        gaps = [0.0]; slopes = [0.0]
+        for _i in range(1, len(knots)):
+            gaps.append(math.fabs(cont[_i] - cont[_i-1]))
+            slopes.append((cont[_i] - cont[_i-1]) / (knots[_i] - knots[_i-1]))
+        rankMap = {median: exact[bisect.bisect_left(knots, median)]}
+        bound = 0.0; numknots = len(knots)
+        search = bisect.bisect_left; floor = math.floor
+        for value in distinct:
+            _i = search(knots, value)
+            if _i < numknots and knots[_i] == value:
+                rankMap[value] = exact[_i]
+            else:
+                rank = cont[_i-1] + slopes[_i] * (value - knots[_i-1])
+                rankMap[value] = floor(rank*1000.0) / 1000.0
+                if gaps[_i] > bound:
+                    bound = gaps[_i]
+        return (rankMap, bound + RANK_STEP if bound > 0 else 0.0)
+
+    # [Private]
+    def _refine(self, points, rankAt):
+        """
+            Evaluates rank at points and adds middle points to intervals,
+            where rank changes by more than MAX_GAP, until there are
+            MAX_KNOTS knots.
+
+            Args:
+                points (list<value>): initial knots in increasing order
+                rankAt (func): returns exact and continuous rank of value
+
+            Returns:
+                tuple<list, list, list>: knots, exact and continuous ranks
+        """
+        first = rankAt(points[0])
+        knots = [points[0]]; exact = [first[0]]; cont = [first[1]]
+        budget = [MAX_KNOTS - len(points)]
+        # appends knots inside of interval in increasing order, then its end
+        def split(x0, c0, x1, r1):
+            middle = x0 + (x1 - x0) / 2.0
+            if math.fabs(r1[1] - c0) > MAX_GAP and budget[0] > 0 and \
+                    x0 < middle < x1:
+                budget[0] -= 1
+                rm = rankAt(middle)
+                split(x0, c0, middle, rm)
+                split(middle, rm[1], x1, r1)
+            else:
+                knots.append(x1); exact.append(r1[0]); cont.append(r1[1])
+        for _i in range(1, len(points)):
+            split(points[_i-1], cont[-1], points[_i], rankAt(points[_i]))
+        return (knots, exact, cont)
+
+    # [Private]
+    def _rankFunction(self, lo, hi, size, order, median):
+        """
+            Returns function that computes rank of value the same way
+            "_relcomp" does for sorted distinct values with given bounds and
+            size: order is applied by reflecting values, negative values are
+            shifted, and mean gap is span divided by number of gaps. Function
+            returns exact rank and continuous rank, which differs from exact
+            only at zero, where rank function has a jump. The other jump is
+            above median, where exponent of "k" underflows, and knots are
+            added around it until interval cannot be split.
+
+            Args:
+                lo (value): minimum value, including median
+                hi (value): maximum value, including median
+                size (int): number of distinct values, including median
+                order (int): priority order of the values
+                median (value): median (default) value
+
+            Returns:
+                func: function of value returning exact and continuous rank
+        """
+        reverse = order == Dynamic.ReversedPriority
+        base = lo + hi
+        first = base - hi if reverse else lo
+        negative = first if first < 0 else None
+        def transform(value):
+            value = base - value if reverse else value
+            return value - negative if negative is not None else value
+        last = transform(lo if reverse else hi)
+        da = (last - transform(hi if reverse else lo))*1.0 / (size - 1) \
+            if size > 1 else 1.0
+        rmedian = transform(median)
+        def rankAt(value):
+            r = transform(value)
+            ki = _RelComp.k(r, rmedian, da)
+            ai = _RelComp.alpha()
+            bi = _RelComp.beta(ai, ki, da)
+            rank = ai*ki + bi
+            exact = math.floor(rank*1000.0) / 1000.0
+            if ki == 0 and r < rmedian:
+                # limit of beta, when k goes to zero, above median k is zero
+                # only when exponent underflows, and rank is exact there
+                param = min(ai + da + 1, 500)
+                return (exact, 1.0 / (1 + math.exp(param)))
+            return (exact, rank)
+        return rankAt
@@ -205,5 +205,24 @@ class RSYS:
             cls.UND_RANK = Rank("Rank Undefined", cls.UND_CLASS, 0)
             cls.UND_CLASS.addRank(cls.UND_RANK)
 
+    @classmethod
+    def getRank(cls, name):
+        """
+            Returns rank of the system for name provided, e.g. to restore rank
+            that was passed by name. If there is no such rank, undefined rank
+            is returned.
+
+            Args:
+                name (str): name of the rank
+
+            Returns:
+                Rank: rank of the system
+        """
+        for pclass in [cls.ClassI, cls.ClassII, cls.ClassIII, cls.UND_CLASS]:
+            found = pclass.getRank(name)
+            if found is not None:
+                return found
+        return cls.UND_RANK
+
 # build ranking system
 RSYS.buildRankSystem()
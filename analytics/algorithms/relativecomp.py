@@ -19,16 +19,20 @@ limitations under the License.
 
 # import libs
 from types import ListType, DictType
-import warnings
+import bisect
 import math
 # import classes
 import analytics.utils.misc as misc
+import analytics.utils.diagnostics as diag
+import analytics.utils.deadline as dl
 import analytics.algorithms.rank as rank
 from analytics.algorithms.algorithm import Algorithm
 from analytics.core.map.elementmap import ElementMap
 from analytics.core.map.pulsemap import PulseMap
 from analytics.core.pulse import Pulse, DynamicPulse, StaticPulse
 from analytics.core.attribute.dynamic import Dynamic
+from analytics.utils.lrucache import LRUCache
+from analytics.utils.sortedvalues import SortedValues
 
 
 # constants for the algorithm
@@ -39,6 +43,30 @@ SHORT_NAME = "relative_comp"
 ## ranking constants
 MAX_DYNAMIC_PROPS = 2
 NONE_RANK = 0
+## cache of per-dimension rank maps, bounded by number of maps and total
+## number of ranked values
+RANK_MAP_CACHE_SIZE = 256
+RANK_MAP_CACHE_VALUES = 1000000
+
+# rank maps by priority order, median and token of values, see "_rankMap"
+_rankmaps = LRUCache(RANK_MAP_CACHE_SIZE, RANK_MAP_CACHE_VALUES, len)
+
+# [Public]
+def rankMapCacheStats():
+    """
+        Returns statistics of the rank map cache.
+
+        Returns:
+            dict<str, int>: hits, misses, evictions, size and weight
+    """
+    return _rankmaps.stats()
+
+# [Public]
+def clearRankMapCache():
+    """
+        Removes all rank maps from cache and resets statistics.
+    """
+    _rankmaps.clear()
 
 
 # [Private]
@@ -113,6 +141,17 @@ class _RelComp(object):
             dai += math.fabs(array[_i] - array[_i-1])
         return dai*1.0 / (len(array) - 1)
 
+    @staticmethod
+    def sortedDa(array):
+        # the same as "da" for array sorted in increasing order, but gaps
+        # telescope, so only the first and the last value are used
+        if len(array) == 0:
+            msg = "Array must have at least 1 element"
+            misc.raiseStandardError(msg, __file__)
+        elif len(array) == 1:
+            return 1.0
+        return (array[-1] - array[0])*1.0 / (len(array) - 1)
+
 
 class RelativeComparison(Algorithm):
     """
@@ -129,7 +168,8 @@ class RelativeComparison(Algorithm):
         super(RelativeComparison, self).__init__(ID, LONG_NAME, SHORT_NAME)
 
     # [Public]
-    def rankResults(self, elementmap, pulsemap):
+    def rankResults(self, elementmap, pulsemap, diagnostics=None,
+            deadline=None):
         """
             Main method to call and rank elements. It may raise errors on the
             way, because of some requirements that are necessary to run
@@ -138,6 +178,8 @@ class RelativeComparison(Algorithm):
             Args:
                 elementmap (ElementMap): map of the elements to rank
                 pulsemap (PulseMap): map of the pulses
+                diagnostics (Diagnostics): diagnostics to report to
+                deadline (Deadline): deadline of the request
 
             Returns:
                 ElementMap: the same map but with updated ranks
@@ -145,32 +187,200 @@ class RelativeComparison(Algorithm):
         # check that maps have the right types
         misc.checkTypeAgainst(type(elementmap), ElementMap, __file__)
         misc.checkTypeAgainst(type(pulsemap), PulseMap, __file__)
-        # if dynamic pulses are more than constant then select first two
-        pulses = pulsemap._map.values()
-        # retrieve only dynamic properties
-        dyns = []
+        dyns = self._dynamicPulses(pulsemap, [], diagnostics)
+        # call private method to select appropriate ranking scheme
+        return self._rank(elementmap, dyns, deadline)
+
+    # [Public]
+    def rankCandidates(self, elementmap, pulsemap, pulses, candidates,
+            diagnostics=None):
+        """
+            Ranks elements for every candidate list of default values of
+            "pulses". Values of elements and sorted distinct values of each
+            dimension are collected once and shared by all candidates, only
+            rank maps and frontier are computed for each candidate. Neither
+            elements nor pulses are changed.
+
+            Args:
+                elementmap (ElementMap): map of the elements to rank
+                pulsemap (PulseMap): map of the pulses
+                pulses (list<DynamicPulse>): pulses to set defaults of
+                candidates (list<list<obj>>): default values of "pulses"
+                diagnostics (Diagnostics): diagnostics to report to
+
+            Returns:
+                list<dict<str, Rank>>: element id and rank for each candidate
+        """
+        misc.checkTypeAgainst(type(elementmap), ElementMap, __file__)
+        misc.checkTypeAgainst(type(pulsemap), PulseMap, __file__)
+        misc.checkTypeAgainst(type(pulses), ListType, __file__)
+        misc.checkTypeAgainst(type(candidates), ListType, __file__)
+        if len(pulses) == 0 or len(pulses) > MAX_DYNAMIC_PROPS:
+            msg = "Expected 1 to %d pulses" % (MAX_DYNAMIC_PROPS)
+            misc.raiseValueError(msg, __file__)
+        for candidate in candidates:
+            if len(candidate) != len(pulses) or None in candidate:
+                misc.raiseValueError("Candidate does not match pulses",
+                    __file__)
+        dynamics = self._dynamicPulses(pulsemap, pulses, diagnostics)
+        if len(elementmap._map) == 0:
+            return [{} for candidate in candidates]
+        a, b, present = self._collectValues(elementmap, dynamics)
+        orders = [x._dynamic.priority() for x in dynamics]
+        presorted = self._presortedValues(dynamics, present)
+        # values that are not sorted by pulse are sorted once for all
+        # candidates
+        for _i in range(len(dynamics)):
+            if presorted[_i] is None:
+                presorted[_i] = SortedValues(set([ls[_i] for ls in a.values()
+                    if ls[_i] is not None]))
+        others = [x.default() for x in dynamics[len(pulses):]]
+        results = []
+        for candidate in candidates:
+            medians = list(candidate) + others
+            # ranking replaces values with ranks, so lists are copied
+            values = dict((key, list(ls)) for key, ls in a.items())
+            values[self._hashkeyForList(medians)] = list(medians)
+            hashRank = self._computeRanks(values, orders, medians, presorted,
+                dynamics)
+            results.append(dict((x, hashRank.get(b[x], rank.RSYS.UND_RANK))
+                for x in b))
+        return results
+
+    # [Public]
+    def distinctValues(self, elementmap, pulsemap, diagnostics=None):
+        """
+            Returns distinct values of dynamic pulses, that elements have.
+            Together with "rankMapsFor" and "rankWithMaps" it ranks elements
+            split into parts the same way "rankResults" ranks all of them:
+            distinct values of parts are merged, rank maps are computed once
+            from merged values, and each part is ranked with the same maps.
+
+            Args:
+                elementmap (ElementMap): map of the elements
+                pulsemap (PulseMap): map of the pulses
+                diagnostics (Diagnostics): diagnostics to report to
+
+            Returns:
+                dict<str, set<obj>>: pulse id and distinct values
+        """
+        misc.checkTypeAgainst(type(elementmap), ElementMap, __file__)
+        misc.checkTypeAgainst(type(pulsemap), PulseMap, __file__)
+        dynamics = self._dynamicPulses(pulsemap, [], diagnostics)
+        a, b, present = self._collectValues(elementmap, dynamics)
+        distinct = {}
+        for _i in range(len(dynamics)):
+            distinct[dynamics[_i].id()] = set([ls[_i] for ls in a.values()
+                if ls[_i] is not None])
+        return distinct
+
+    # [Public]
+    def rankMapsFor(self, pulsemap, distinct, diagnostics=None):
+        """
+            Returns rank map of each dynamic pulse for merged distinct values,
+            see "distinctValues". Default value of pulse is ranked with
+            values, the same as "rankResults" does.
+
+            Args:
+                pulsemap (PulseMap): map of the pulses
+                distinct (dict<str, set<obj>>): pulse id and distinct values
+                diagnostics (Diagnostics): diagnostics to report to
+
+            Returns:
+                dict<str, dict<obj, float>>: pulse id and rank map
+        """
+        misc.checkTypeAgainst(type(pulsemap), PulseMap, __file__)
+        misc.checkTypeAgainst(type(distinct), DictType, __file__)
+        dynamics = self._dynamicPulses(pulsemap, [], diagnostics)
+        if len(dynamics) > MAX_DYNAMIC_PROPS:
+            misc.raiseStandardError("Too many dynamic pulses", __file__)
+        rankmaps = {}
+        for pulse in dynamics:
+            values = set(distinct.get(pulse.id(), []))
+            values.add(pulse.default())
+            rankmaps[pulse.id()] = self._rankMap(values,
+                pulse._dynamic.priority(), pulse.default())
+        return rankmaps
+
+    # [Public]
+    def rankWithMaps(self, elementmap, pulsemap, rankmaps):
+        """
+            Ranks elements with rank maps of dynamic pulses, see
+            "rankMapsFor". Rank of element depends only on its values and
+            rank maps, so elements can be ranked in parts.
+
+            Args:
+                elementmap (ElementMap): map of the elements to rank
+                pulsemap (PulseMap): map of the pulses
+                rankmaps (dict<str, dict<obj, float>>): pulse id and rank map
+
+            Returns:
+                ElementMap: the same map but with updated ranks
+        """
+        misc.checkTypeAgainst(type(elementmap), ElementMap, __file__)
+        misc.checkTypeAgainst(type(pulsemap), PulseMap, __file__)
+        misc.checkTypeAgainst(type(rankmaps), DictType, __file__)
+        dynamics = self._dynamicPulses(pulsemap, [], diag.Diagnostics())
+        if len(dynamics) == 0 or len(elementmap._map) == 0:
+            return elementmap
+        elif len(dynamics) > MAX_DYNAMIC_PROPS:
+            misc.raiseStandardError("Too many dynamic pulses", __file__)
+        a, b, present = self._collectValues(elementmap, dynamics)
+        for _i in range(len(dynamics)):
+            rankMap = rankmaps.get(dynamics[_i].id())
+            if rankMap is None:
+                msg = "No rank map for pulse %s" % (dynamics[_i].id())
+                misc.raiseValueError(msg, __file__)
+            for ls in a.values():
+                ls[_i] = rankMap[ls[_i]] if ls[_i] in rankMap else NONE_RANK
+        hashRank = self._frontier(a)
+        for element in elementmap._map.values():
+            element.setRank(hashRank.get(b[element.id()], rank.RSYS.UND_RANK))
+        return elementmap
+
+    # [Private]
+    def _dynamicPulses(self, pulsemap, first, diagnostics=None):
+        """
+            Returns dynamic pulses to rank elements with: pulses in "first",
+            followed by dynamic pulses with default value. If there are more
+            than MAX_DYNAMIC_PROPS of them, others are ignored with warning.
+            Pulses are not modified, as they can be shared.
+
+            Args:
+                pulsemap (PulseMap): map of the pulses
+                first (list<DynamicPulse>): pulses that are selected first
+                diagnostics (Diagnostics): diagnostics to report to
+
+            Returns:
+                list<DynamicPulse>: selected dynamic pulses
+        """
+        dyns = list(first)
         exceedsMax = False
-        for p in pulses:
+        for p in pulsemap._map.values():
+            if p in first:
+                continue
             if type(p) is DynamicPulse and not p.static() and p.default():
                 if len(dyns)+1 > MAX_DYNAMIC_PROPS:
                     exceedsMax = True
-                    p.setStatic(True)
                 else:
                     dyns.append(p)
         if exceedsMax:
             msg = "Hey, too many dynamic pulses"
-            warnings.warn(msg, UserWarning)
-        # call private method to select appropriate ranking scheme
-        return self._rank(elementmap, dyns)
+            diag.orWarnings(diagnostics).report(
+                diag.DYNAMIC_PULSES_EXCEEDED,
+                msg
+            )
+        return dyns
 
     # [Private]
-    def _rank(self, elementmap, dynamics):
+    def _rank(self, elementmap, dynamics, deadline=None):
         """
             _rank method actually ranks the elements using dynamic pulses.
 
             Args:
                 elementmap (ElementMap): map of elements to rank
                 dynamics (list<DynamicPulse>): list of dynamic pulses
+                deadline (Deadline): deadline of the request
 
             Returns:
                 ResultsMap: updated with ranks results map
@@ -185,7 +395,8 @@ class RelativeComparison(Algorithm):
             misc.raiseStandardError("Too many dynamic pulses", __file__)
         # we are clear, start ranking results
         # compute hash and store values into a, store id and hash into b
-        a = {}; b = {}; _medians = []; _orders = []
+        a, b, present = self._collectValues(elementmap, dynamics)
+        _medians = []; _orders = []
         # append default values of the properties
         for _i in range(len(dynamics)):
             default = dynamics[_i].default()
@@ -197,7 +408,38 @@ class RelativeComparison(Algorithm):
             _orders.append(dynamics[_i]._dynamic.priority())
         medianHash = self._hashkeyForList(_medians)
         a[medianHash] = _medians
-        # compute hash and store values for each result
+        presorted = self._presortedValues(dynamics, present)
+        # rank map values by applying generic algorithm
+        hashRank = self._computeRanks(a, _orders, _medians, presorted,
+            dynamics, deadline, elementmap.token())
+        # update ranks
+        for element in elementmap._map.values():
+            key = b[element.id()]
+            # if rank is not found we assign undefined rank
+            rank = hashRank[key] if key in hashRank else rank.RSYS.UND_RANK
+            element.setRank(rank)
+        # return successfully updated elements map
+        return elementmap
+
+    # [Private]
+    def _collectValues(self, elementmap, dynamics):
+        """
+            Collects values of dynamic pulses for each element. Elements with
+            the same values share hashkey, so values are ranked once.
+
+            Args:
+                elementmap (ElementMap): map of elements to rank
+                dynamics (list<DynamicPulse>): list of dynamic pulses
+
+            Returns:
+                tuple<dict, dict, list>: map of hashkey and values, map of
+                    element id and hashkey, number of elements that have
+                    value for each pulse
+        """
+        a = {}; b = {}
+        # compute hash and store values for each result, count elements
+        # that have value for each pulse
+        present = [0] * len(dynamics)
         for element in elementmap._map.values():
             fmap = element._features; values = []
             for _i in range(len(dynamics)):
@@ -206,21 +448,43 @@ class RelativeComparison(Algorithm):
                     # check if feature exists in the list and get value
                     feature = fmap[dynamics[_i].id()]
                     values.append(feature.value())
+                    if feature.value() is not None:
+                        present[_i] += 1
                 else:
                     values.append(None)
             hashkey = self._hashkeyForList(values)
             a[hashkey] = values
             b[element.id()] = hashkey
-        # rank map values by applying generic algorithm
-        hashRank = self._computeRanks(a, _orders, _medians)
-        # update ranks
-        for element in elementmap._map.values():
-            key = b[element.id()]
-            # if rank is not found we assign undefined rank
-            rank = hashRank[key] if key in hashRank else rank.RSYS.UND_RANK
-            element.setRank(rank)
-        # return successfully updated elements map
-        return elementmap
+        return (a, b, present)
+
+    # [Private]
+    def _presortedValues(self, dynamics, present):
+        """
+            Returns sorted values of each pulse, if every element that has
+            pulse value is in the map, as they are the values to rank, and
+            they are not collected again. Otherwise None is returned for
+            pulse, i.e. sorted values are used for unfiltered elements only.
+            Sorted values of filtered elements are not derived from sorted
+            values of pulse: values of filtered elements have to be collected
+            to know which of them are left, and then sorting them costs less
+            than ranking them with "_relcomp". Rank map of filtered elements
+            is cached by token of elements instead, see "_dimensionRankMap".
+
+            Args:
+                dynamics (list<DynamicPulse>): list of dynamic pulses
+                present (list<int>): number of elements with value of pulse
+
+            Returns:
+                list<SortedValues>: sorted values or None for each pulse
+        """
+        presorted = []
+        for _i in range(len(dynamics)):
+            values = dynamics[_i].sortedValues()
+            if values is not None and values.total() == present[_i]:
+                presorted.append(values)
+            else:
+                presorted.append(None)
+        return presorted
 
     # [Private]
     def _hashkeyForList(self, list):
@@ -236,7 +500,8 @@ class RelativeComparison(Algorithm):
         return ":".join([str(value) for value in list])
 
     # [Private]
-    def _computeRanks(self, a, orders, medians):
+    def _computeRanks(self, a, orders, medians, presorted=None, pulses=None,
+            deadline=None, token=None):
         """
             Computes ranks for a generic map with hashkey and values as a list.
             Returns another map with hashkey and rank assigned to it. Method
@@ -247,6 +512,12 @@ class RelativeComparison(Algorithm):
                 a (dict<str, list>): generic map with values and hashkeys
                 orders (list<int>): list of priority orders
                 medians (list<value>): list of median values
+                presorted (list<SortedValues>): sorted distinct values for each
+                    dimension, or None, if values are collected from map
+                pulses (list<DynamicPulse>): pulse of each dimension, or None
+                deadline (Deadline): deadline of the request
+                token (obj): token of elements values are collected from, or
+                    None
 
             Returns:
                 dict<str, Rank>: map with hashkey and Rank object for that key
@@ -258,72 +529,180 @@ class RelativeComparison(Algorithm):
         if len(orders) != len(medians):
             msg = "Orders and medians have different length"
             misc.raiseStandardError(msg, __file__)
+        presorted = presorted or [None] * len(orders)
+        pulses = pulses or [None] * len(orders)
+        # check that values length equals orders length
+        # assert len(ls) == len(orders)
+        wrong = [ls for ls in a.values() if len(ls) != len(orders)]
+        misc.evaluateAssertion(len(wrong) == 0, "", __file__)
         # start separating threads of values
         for _i in range(len(orders)):
-            # ranking set of values
-            rankList = set()
-            for ls in a.values():
-                # check that values length equals orders length
-                # assert len(ls) == len(orders)
-                misc.evaluateAssertion(len(ls)==len(orders), "", __file__)
-                if ls[_i] is not None:
-                    rankList.add(ls[_i])
-            # convert set into list and pass to calculate rank value
-            rankList = list(rankList)
-            rankMap = self._relcomp(rankList, orders[_i], medians[_i])
+            rankMap = self._dimensionRankMap(a, _i, orders[_i], medians[_i],
+                presorted[_i], pulses[_i], token, deadline)
             # go again through values and update them on ranks
             for ls in a.values():
                 ls[_i] = rankMap[ls[_i]] if ls[_i] in rankMap else NONE_RANK
         # at this stage we have map with hashkeys and ranked values
         # now we need to assign a certain rank to list of values
-        return self._frontier(a)
+        return self._frontier(a, deadline)
+
+    # [Private]
+    def _dimensionRankMap(self, a, index, order, median, presorted, pulse,
+            token=None, deadline=None):
+        """
+            Returns rank map for a single dimension of generic map. Sorted
+            values are used, if they are provided, otherwise distinct values
+            are collected from map. Collected values of pulse are identified
+            by token of elements, if it is known.
+
+            Args:
+                a (dict<str, list>): generic map with values and hashkeys
+                index (int): index of the dimension
+                order (int): priority order of the values
+                median (value): median (default) value
+                presorted (SortedValues): sorted distinct values, or None
+                pulse (DynamicPulse): pulse of the dimension, or None
+                token (obj): token of elements, or None
+                deadline (Deadline): deadline of the request
+
+            Returns:
+                dict<value, int>: map with pairs "value : rank-value"
+        """
+        if presorted is not None:
+            return self._sortedRankMap(presorted, order, median, deadline)
+        # ranking set of values
+        rankList = set()
+        for ls in a.values():
+            if ls[index] is not None:
+                rankList.add(ls[index])
+        # rank map of the dimension is reused, if it was computed for the
+        # same elements
+        if token is not None and pulse is not None:
+            token = (token, pulse.id())
+        else:
+            token = None
+        return self._rankMap(rankList, order, median, token, deadline)
 
     # [Private]
-    def _relcomp(self, rankedList, order, median):
+    def _rankMap(self, values, order, median, token=None, deadline=None):
+        """
+            Returns rank map for a single dimension from cache, or computes
+            it with "_relcomp" and caches it. Rank map depends only on set of
+            distinct values, priority order and median. Values are identified
+            by token, e.g. of snapshot, query and pulse they are collected
+            for, so the same map is shared by any query that ranks the same
+            values, and values are not copied into key. Rank map is not
+            cached, if token is None. Cached maps must not be changed.
+
+            Args:
+                values (set<value>): distinct values to rank
+                order (int): priority order of the values
+                median (value): median (default) value
+                token (obj): hashable token of values, or None
+                deadline (Deadline): deadline of the request
+
+            Returns:
+                dict<value, int>: map with pairs "value : rank-value"
+        """
+        if token is None:
+            return self._relcomp(list(values), order, median, False, deadline)
+        key = (order, median, "values", token)
+        rankMap = _rankmaps.get(key)
+        if rankMap is None:
+            rankMap = self._relcomp(list(values), order, median, False,
+                deadline)
+            _rankmaps.put(key, rankMap)
+        return rankMap
+
+    # [Private]
+    def _sortedRankMap(self, values, order, median, deadline=None):
+        """
+            Returns rank map for sorted values of a single dimension, the
+            same as "_rankMap" does for set of values, but values are neither
+            collected nor sorted, and token of values is used as cache key.
+            Median is ranked with values, so it is inserted with binary
+            search, if none of elements has it.
+
+            Args:
+                values (SortedValues): sorted distinct values to rank
+                order (int): priority order of the values
+                median (value): median (default) value
+                deadline (Deadline): deadline of the request
+
+            Returns:
+                dict<value, int>: map with pairs "value : rank-value"
+        """
+        key = (order, median, "sorted", values.token())
+        rankMap = _rankmaps.get(key)
+        if rankMap is None:
+            array = values.values()
+            if values.index(median) < 0:
+                array = list(array)
+                bisect.insort_left(array, median)
+            rankMap = self._relcomp(array, order, median, True, deadline)
+            _rankmaps.put(key, rankMap)
+        return rankMap
+
+    # [Private]
+    def _relcomp(self, rankedList, order, median, presorted=False,
+            deadline=None):
         """
             Method returns map with pairs "value : rank-value", where rank-value
             is a relative independent of value rank from 0 to 1. ranked list is
             sorted before calculation. All values have to be unique, otherwise
             rank may be unreliable.
-            Value cannot be None or non-number.
+            Value cannot be None or non-number. Deadline is checked every
+            CHECK_INTERVAL values.
 
             Args:
                 rankedList (list<value>): list with values to rank
                 order (int): priority order of the values
                 median (value): median (default) value
+                presorted (bool): list is sorted in increasing order and has
+                    unique values, it is not sorted again
+                deadline (Deadline): deadline of the request
 
             Returns:
                 dict<value, int>: map with pairs "value : rank-value"
         """
         misc.checkTypeAgainst(type(rankedList), ListType, __file__)
+        deadline = dl.orNever(deadline)
         # map to store pairs "value - rank", negative flag, median index
         relmap = {}; negative = None; _median_i = -1; rln = len(rankedList)
         if rln > 0:
+            # sort ranked list in increasing order, and find median with
+            # binary search
+            if not presorted:
+                rankedList = sorted(rankedList)
+            _median_i = bisect.bisect_left(rankedList, median)
             # check that median is in the list
-            if median not in rankedList:
+            if _median_i >= rln or rankedList[_median_i] != median:
                 misc.raiseStandardError("Median is not in the list", __file__)
-            # sort ranked list according to priority order
+            # order list according to priority order
             # in the end we always get sorted array in increasing order
             if order == Dynamic.ReversedPriority:
-                rankedList = sorted(rankedList, None, None, True)
-                # find median index
-                _median_i = rankedList.index(median)
+                rankedList = rankedList[::-1]
+                _median_i = rln - 1 - _median_i
+            # original values in order of ranks, values are not restored
+            # from transformed ones, as float arithmetic does not give them
+            # back exactly
+            values = rankedList
+            if order == Dynamic.ReversedPriority:
                 # reverse array
                 minel = rankedList[0]; maxel = rankedList[rln-1]
                 rankedList = [maxel+minel-v for v in rankedList]
-            else:
-                rankedList = sorted(rankedList)
-                # find median index
-                _median_i = rankedList.index(median)
             # check for negative values
             # if it is, then nullify it, and reverse the whole array
             if rankedList[0] < 0:
                 negative = rankedList[0]
                 rankedList = [v - negative for v in rankedList]
 
-            # now we always have positive increasing order array
-            a = rankedList; da = _RelComp.da(a); ranks = []
+            # now we always have positive increasing order array, sum of
+            # adjacent gaps is difference of the last and the first value
+            a = rankedList; da = _RelComp.sortedDa(a); ranks = []
             for _i in range(0, rln):
+                if _i % dl.CHECK_INTERVAL == 0:
+                    deadline.check()
                 ki = _RelComp.k(a[_i], a[_median_i], da)
                 ai = _RelComp.alpha()
                 dri = _RelComp.dr(a[_i], a[_median_i], _i, _median_i)
@@ -333,29 +712,23 @@ class RelativeComparison(Algorithm):
                 rank = ai*ki + bi
                 ranks.append(math.floor(rank*1000.0) / 1000.0)
 
-            # having gotten ranks, reverse-engineer values in ranked list
-            # get back negative values
-            if negative is not None:
-                rankedList = [v + negative for v in rankedList]
-            # reverse values back according to order
-            if order == Dynamic.ReversedPriority:
-                minel = rankedList[0]; maxel = rankedList[rln-1]
-                rankedList = [maxel+minel-v for v in rankedList]
             # map original values and ranks
             for _i in range(0, rln):
-                relmap[rankedList[_i]] = ranks[_i]
+                relmap[values[_i]] = ranks[_i]
         # return map successfully
         return relmap
 
     # [Private]
-    def _frontier(self, map):
+    def _frontier(self, map, deadline=None):
         """
             Method takes map with "hashkey : list" pairs and assigns Rank
             object based on algorithm. If list length equals 1 then method
             performs trivial assignment, otherwise Pareto frontier is used.
+            Deadline is checked every CHECK_INTERVAL keys.
 
             Args:
                 map (dict<str, list>): map with "hashkey : list" pairs
+                deadline (Deadline): deadline of the request
 
             Returns:
                 dict<str, Rank>: map with "hashkey : Rank" pairs
@@ -376,13 +749,16 @@ class RelativeComparison(Algorithm):
         SUB_R_I = 0.2
         SUB_R_II = 0.3
         SUB_R_III = 0.5
+        deadline = dl.orNever(deadline)
         # declare hashRank
         hashRank = {}
         # loop through threshold intervals
         for _i in range(1, len(threads)):
             # map to hold values that are in this threshold
             classMap = {}
-            for key in map.keys():
+            for _j, key in enumerate(map.keys()):
+                if _j % dl.CHECK_INTERVAL == 0:
+                    deadline.check()
                 if map[key] is None:
                     continue
                 # calculate average for passing threshold
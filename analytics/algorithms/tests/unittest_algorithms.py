@@ -79,6 +79,27 @@ class AlgorithmsMap_TestSequence(unittest.TestCase):
         self._almap.remove("id")
         self.assertEqual(self._almap.isEmpty(), True)
 
+    def test_algorithmsmap_freeze(self):
+        test = TestAlgorithm("id", "name", "short")
+        self._almap.assign(test)
+        self.assertEqual(self._almap.isFrozen(), False)
+        self.assertEqual(self._almap.freeze(), self._almap)
+        self.assertEqual(self._almap.isFrozen(), True)
+        with self.assertRaises(ex.AnalyticsStandardError):
+            self._almap.assign(TestAlgorithm("id2", "name", "short"))
+        with self.assertRaises(ex.AnalyticsStandardError):
+            self._almap.remove("id")
+        with self.assertRaises(ex.AnalyticsStandardError):
+            self._almap.reset()
+        self.assertEqual(self._almap.keys(), ["id"])
+        # copy of frozen map can be changed
+        algmap = self._almap.copy()
+        self.assertEqual(algmap.isFrozen(), False)
+        self.assertEqual(algmap.get("id"), test)
+        algmap.remove("id")
+        self.assertEqual(algmap.isEmpty(), True)
+        self.assertEqual(self._almap.has("id"), True)
+
 # Rank tests
 class Rank_TestSequence(unittest.TestCase):
     def setUp(self):
@@ -24,10 +24,13 @@ import random
 # import classes
 import analytics.exceptions.exceptions as ex
 import analytics.algorithms.relativecomp as rc
+import analytics.algorithms.approxcomp as ac
 import analytics.algorithms.rank as rank
 import analytics.core.processor.processor as processor
 from analytics.core.map.elementmap import ElementMap
 from analytics.core.map.pulsemap import PulseMap
+from analytics.utils.sortedvalues import SortedValues, SKETCH_MIN_SIZE
+from analytics.utils.deadline import Deadline
 
 
 class RelComp_TestSequence(unittest.TestCase):
@@ -170,6 +173,19 @@ class RelativeComparison_TestSequence(unittest.TestCase):
                 self.assertEqual(type(hashRank[key]), rank.Rank)
                 self.assertTrue(hashRank[key] is not rank.RSYS.UND_RANK)
 
+    def test_relativecomp_deadline(self):
+        deadline = Deadline()
+        deadline.cancel()
+        a = [random.random() for _i in range(10)]
+        with self.assertRaises(ex.AnalyticsTimeoutError):
+            self._rel._relcomp(a, 1, a[0], False, deadline)
+        map = dict((str(_i), [random.random()]) for _i in range(10))
+        with self.assertRaises(ex.AnalyticsTimeoutError):
+            self._rel._frontier(map, deadline)
+        # deadline that has not passed does not change ranks
+        self.assertEqual(self._rel._relcomp(a, 1, a[0], False, Deadline(60)),
+            self._rel._relcomp(a, 1, a[0]))
+
     def test_relativecomp_computeRank(self):
         with self.assertRaises(ex.AnalyticsCheckError):
             self._rel._computeRanks([], [], [])
@@ -223,13 +239,246 @@ class RelativeComparison_TestSequence(unittest.TestCase):
             # warnings assertion
             self.assertEqual(len(w), 1)
             self.assertTrue(issubclass(w[0].category, UserWarning))
+        # pulses are not modified by ranking
+        for pulse in pulses._map.values():
+            self.assertEqual(pulse.static(), False)
+
+    def test_relativecomp_rankMapCache(self):
+        pulses = PulseMap(); elements = ElementMap(); idmapper = {}
+        idmapper = processor.parseElements(self._b, elements, idmapper)
+        idmapper = processor.parsePulses(self._a, pulses, idmapper)
+        for pulse in pulses._map.values():
+            if pulse.name() == "price":
+                pulse.setStatic(False)
+            if pulse.name() == "amount":
+                pulse.setStatic(True)
+        rc.clearRankMapCache()
+        self._rel.rankResults(elements, pulses)
+        ranks = dict((x.id(), x.rank()) for x in elements._map.values())
+        stats = rc.rankMapCacheStats()
+        self.assertEqual((stats["hits"], stats["misses"]), (0, 2))
+        # the same query is ranked from cache with the same result
+        self._rel.rankResults(elements, pulses)
+        stats = rc.rankMapCacheStats()
+        self.assertEqual((stats["hits"], stats["misses"]), (2, 2))
+        self.assertEqual(stats["size"], 2)
+        for element in elements._map.values():
+            self.assertEqual(element.rank(), ranks[element.id()])
+        # only dimension with changed default is recomputed
+        for pulse in pulses._map.values():
+            if pulse.name() == "price":
+                pulse.setDefaultValue(245.0)
+        self._rel.rankResults(elements, pulses)
+        stats = rc.rankMapCacheStats()
+        self.assertEqual((stats["hits"], stats["misses"]), (3, 3))
+        # cached map equals computed one
+        values = set([x["value"] for x in self._b])
+        self.assertEqual(self._rel._rankMap(values, -1, 124, "#values"),
+            self._rel._relcomp(list(values), -1, 124))
+        self.assertTrue((-1, 124, "values", "#values") in rc._rankmaps.keys())
+
+    def test_relativecomp_rankMapToken(self):
+        pulses = PulseMap(); elements = ElementMap()
+        idmapper = processor.parseElements(self._b, elements, {})
+        processor.parsePulses(self._a, pulses, idmapper)
+        for pulse in pulses._map.values():
+            pulse.setStatic(pulse.name() == "amount")
+        elements.remove(elements._map.keys()[0])
+        # values of elements without token are ranked, but not cached
+        rc.clearRankMapCache()
+        self._rel.rankResults(elements, pulses)
+        ranks = dict((x.id(), x.rank()) for x in elements._map.values())
+        self.assertEqual(rc.rankMapCacheStats()["size"], 0)
+        # values of elements with token are cached by token and pulse
+        elements.setToken("#snapshot")
+        self._rel.rankResults(elements, pulses)
+        self._rel.rankResults(elements, pulses)
+        stats = rc.rankMapCacheStats()
+        self.assertEqual((stats["hits"], stats["misses"]), (2, 2))
+        keys = sorted([x[3] for x in rc._rankmaps.keys()])
+        self.assertEqual(keys, sorted([("#snapshot", x.id()) for x in
+            pulses._map.values() if not x.static()]))
+        self.assertEqual(ranks, dict((x.id(), x.rank()) for x in
+            elements._map.values()))
+        # changed elements lose token
+        elements.remove(elements._map.keys()[0])
+        self.assertEqual(elements.token(), None)
+
+    def test_relativecomp_sortedDa(self):
+        for _k in range(10):
+            array = sorted(set([random.randrange(-100, 100) for _i in range(20)]))
+            self.assertAlmostEqual(rc._RelComp.sortedDa(array),
+                rc._RelComp.da(array))
+        self.assertEqual(rc._RelComp.sortedDa([5]), 1.0)
+        with self.assertRaises(ex.AnalyticsStandardError):
+            rc._RelComp.sortedDa([])
+
+    def test_relativecomp_presorted(self):
+        def ranked(dropSorted, subset=False):
+            pulses = PulseMap(); elements = ElementMap()
+            idmapper = processor.parseElements(self._b, elements, {})
+            processor.parsePulses(self._a, pulses, idmapper)
+            for pulse in pulses._map.values():
+                pulse.setStatic(pulse.name() == "amount")
+                if dropSorted:
+                    pulse._sorted = None
+            if subset:
+                elements.remove(elements._map.keys()[0])
+            self._rel.rankResults(elements, pulses)
+            return dict((x.id(), x.rank()) for x in elements._map.values())
+        # sorted values of pulses give the same ranks as collected values
+        rc.clearRankMapCache()
+        self.assertEqual(ranked(False), ranked(True))
+        self.assertEqual(ranked(False, True), ranked(True, True))
+        keys = [x[2] for x in rc._rankmaps.keys()]
+        self.assertEqual(keys.count("sorted"), 2)
+
+    def test_relativecomp_presortedFiltered(self):
+        pulses = PulseMap(); elements = ElementMap()
+        idmapper = processor.parseElements(self._b, elements, {})
+        processor.parsePulses(self._a, pulses, idmapper)
+        dynamics = [x for x in pulses._map.values() if x.name() != "price"]
+        for pulse in dynamics:
+            pulse.setStatic(False)
+        a, b, present = self._rel._collectValues(elements, dynamics)
+        self.assertEqual(self._rel._presortedValues(dynamics, present),
+            [x.sortedValues() for x in dynamics])
+        # sorted values are not used for filtered elements, their values are
+        # collected, and rank maps are cached by token of elements
+        elements.remove(elements._map.keys()[0])
+        a, b, present = self._rel._collectValues(elements, dynamics)
+        self.assertEqual(self._rel._presortedValues(dynamics, present),
+            [None, None])
+        elements.setToken("#filtered")
+        rc.clearRankMapCache()
+        self._rel.rankResults(elements, pulses)
+        self._rel.rankResults(elements, pulses)
+        stats = rc.rankMapCacheStats()
+        self.assertEqual((stats["hits"], stats["misses"]), (2, 2))
+        self.assertEqual([x[2] for x in rc._rankmaps.keys()],
+            ["values", "values"])
+
+    def test_relativecomp_relcompPresorted(self):
+        for order in [-1, 1]:
+            values = sorted(set([random.randrange(-50, 50) for _i in range(15)]))
+            median = values[len(values) / 2]
+            self.assertEqual(self._rel._relcomp(values, order, median, True),
+                self._rel._relcomp(list(reversed(values)), order, median))
+
+    def test_relativecomp_rankCandidates(self):
+        pulses = PulseMap(); elements = ElementMap()
+        idmapper = processor.parseElements(self._b, elements, {})
+        processor.parsePulses(self._a, pulses, idmapper)
+        pulse = [x for x in pulses._map.values() if x.name() == "value"][0]
+        amount = [x for x in pulses._map.values() if x.name() == "amount"][0]
+        amount.setStatic(True)
+        elements.remove(elements._map.keys()[0])
+        candidates = [[100], [124], [131], [200]]
+        default = pulse.default()
+        results = self._rel.rankCandidates(elements, pulses, [pulse],
+            candidates)
+        self.assertEqual(len(results), len(candidates))
+        self.assertEqual(pulse.default(), default)
+        for _i in range(len(candidates)):
+            pulse.setDefaultValue(candidates[_i][0])
+            self._rel.rankResults(elements, pulses)
+            expected = dict((x.id(), x.rank()) for x in elements._map.values())
+            self.assertEqual(results[_i], expected)
+        with self.assertRaises(ex.AnalyticsValueError):
+            self._rel.rankCandidates(elements, pulses, [pulse], [[1, 2]])
+        with self.assertRaises(ex.AnalyticsValueError):
+            self._rel.rankCandidates(elements, pulses, [], [])
+
+    def test_relativecomp_relcompFloatKeys(self):
+        # ranks are mapped to original values, not restored ones
+        values = [round(random.uniform(-50, 50), 2) for _i in range(200)]
+        values = sorted(set(values)); median = values[len(values) / 2]
+        for order in [-1, 1]:
+            relmap = self._rel._relcomp(list(values), order, median)
+            self.assertEqual(sorted(relmap.keys()), values)
+
+
+class ApproximateComparison_TestSequence(unittest.TestCase):
+    def setUp(self):
+        self._exact = rc.RelativeComparison()
+        self._approx = ac.ApproximateComparison()
+        self._pulses = [
+            {"name": "price", "desc": "price", "sample": 1.0, "dynamic": True,
+                "priority": -1},
+            {"name": "weight", "desc": "weight", "sample": 1.0, "dynamic": True}
+        ]
+        rnd = random.Random(3)
+        self._elements = [{"id": str(_i), "name": str(_i), "desc": "",
+            "cluster": "A", "price": round(rnd.uniform(-100, 900), 2),
+            "weight": round(rnd.uniform(0, 50), 3)}
+            for _i in range(3 * SKETCH_MIN_SIZE)]
+
+    def ranked(self, algorithm, numelements, subset=False):
+        pulses = PulseMap(); elements = ElementMap()
+        idmapper = processor.parseElements(self._elements[:numelements],
+            elements, {})
+        processor.parsePulses(self._pulses, pulses, idmapper)
+        if subset:
+            for key in elements._map.keys()[::3]:
+                elements.remove(key)
+            elements.setToken("#subset")
+        rc.clearRankMapCache()
+        algorithm.rankResults(elements, pulses)
+        return dict((x.id(), x.rank()._name) for x in elements._map.values())
+
+    def test_approxcomp_init(self):
+        self.assertEqual(self._approx.getId(), ac.ID)
+        self.assertNotEqual(self._approx.getId(), self._exact.getId())
+
+    def test_approxcomp_rankMap(self):
+        rnd = random.Random(5)
+        for order in [-1, 1]:
+            for lo in [-500, 0, 20]:
+                values = SortedValues(set([round(rnd.uniform(lo, 1000), 2)
+                    for _i in range(5000)]))
+                for median in [values.values()[1000], 333.333]:
+                    array = list(values.values())
+                    if values.index(median) < 0:
+                        array = sorted(array + [median])
+                    exact = self._exact._relcomp(array, order, median, True)
+                    approx, bound = self._approx._approxRankMap(values, order,
+                        median, values.sketch())
+                    self.assertEqual(sorted(approx.keys()), array)
+                    self.assertTrue(bound <= ac.MAX_GAP + ac.RANK_STEP)
+                    for value in array:
+                        self.assertTrue(
+                            abs(approx[value] - exact[value]) <= bound)
+                    # collected values give the same map as sorted ones
+                    collected, _ = self._approx._approxRankMap(set(array),
+                        order, median, values.sketch())
+                    self.assertEqual(collected, approx)
+
+    def test_approxcomp_lowCardinality(self):
+        # features with few values are ranked exactly
+        numelements = SKETCH_MIN_SIZE / 2
+        self.assertEqual(self.ranked(self._approx, numelements),
+            self.ranked(self._exact, numelements))
+        self.assertEqual(self.ranked(self._approx, numelements, True),
+            self.ranked(self._exact, numelements, True))
+
+    def test_approxcomp_rankResults(self):
+        numelements = len(self._elements)
+        for subset in [False, True]:
+            exact = self.ranked(self._exact, numelements, subset)
+            approx = self.ranked(self._approx, numelements, subset)
+            self.assertEqual(sorted(approx.keys()), sorted(exact.keys()))
+            differ = [x for x in exact if exact[x] != approx[x]]
+            self.assertTrue(len(differ) <= 0.01 * len(exact))
+        keys = [x[2] for x in rc._rankmaps.keys()]
+        self.assertEqual(keys.count("approx"), 2)
 
 
 # Load test suites
 def _suites():
     return [
         RelComp_TestSequence,
-        RelativeComparison_TestSequence
+        RelativeComparison_TestSequence,
+        ApproximateComparison_TestSequence
     ]
 
 # Load tests
@@ -2,27 +2,64 @@
 
 
 # import libs
-import warnings
+import copy
+import os
 # import classes
+import analytics.algorithms.rank as rank
+import analytics.utils.workers as workers
 from analytics.algorithms.algorithmsmap import AlgorithmsMap
 from analytics.algorithms.algorithm import Algorithm
 from analytics.algorithms.relativecomp import RelativeComparison
+from analytics.algorithms.approxcomp import ApproximateComparison
+from analytics.core.map.elementmap import ElementMap
 import analytics.utils.misc as misc
+import analytics.utils.diagnostics as diag
+import analytics.utils.deadline as dl
+import analytics.utils.metrics as metrics
+import analytics.utils.timings as tm
 
-# static algorithms map
+# static algorithms map, it is shared by all requests and therefore frozen,
+# use "ALGORITHMS.copy()" to get map that can be filtered
 ALGORITHMS = AlgorithmsMap()
 DEFAULT_ALGORITHM = RelativeComparison()
+# opt-in algorithms are used only, when query selects them explicitly
+OPT_IN_ALGORITHMS = [ApproximateComparison()]
 # add algorithms to the map
 ALGORITHMS.assign(DEFAULT_ALGORITHM)
+for _algorithm in OPT_IN_ALGORITHMS:
+    ALGORITHMS.assign(_algorithm)
+ALGORITHMS.freeze()
+# metrics of ranking by algorithm
+RANKING_DURATION = metrics.REGISTRY.histogram(
+    "pulsar_ranking_duration_seconds", "Time to rank elements",
+    ["algorithm"])
+RANKED_ELEMENTS = metrics.REGISTRY.counter("pulsar_ranked_elements_total",
+    "Elements ranked", ["algorithm"])
+# partitions of at least this many elements are ranked in other processes,
+# smaller partitions are ranked in calling process, as sending them costs
+# more
+PARALLEL_MIN_SIZE = 2000
+# maximum number of processes ranking partitions of a request, one for each
+# CPU by default, partitions are ranked in calling process, if it is 0
+PARALLEL_PROCESSES = int(os.environ.get("RANK_PROCESSES",
+    str(workers.MAX_PROCESSES)) or 0)
+
+# processes ranking partitions for requests of any thread, servers start
+# them before their threads, see "startPool"
+_pool = None
 
 
 class AnalyseBlock(object):
-    def __init__(self, algmap, elements, pulses):
+    def __init__(self, algmap, elements, pulses, diagnostics=None, scope=None,
+            deadline=None):
         self._elementmap = elements
         self._pulsemap = pulses
         self._algorithm = None
         self._data = {"map": algmap}
         self._isAnalysed = False
+        self._diagnostics = diag.orWarnings(diagnostics)
+        self._scope = scope
+        self._deadline = dl.orNever(deadline)
 
 
 # [Public]
@@ -41,54 +78,100 @@ def analyseWithBlock(analyseBlock):
         return analyseBlock
 
     # analyse with block and reassign updated elements map
+    start = tm.clock()
     result = analyseUsingMap(
         analyseBlock._data["map"],
         analyseBlock._elementmap,
-        analyseBlock._pulsemap
+        analyseBlock._pulsemap,
+        True,
+        analyseBlock._diagnostics,
+        analyseBlock._scope,
+        analyseBlock._deadline
     )
     analyseBlock._elementmap = result["map"]
     analyseBlock._algorithm = result["algorithm"]
     analyseBlock._isAnalysed = True
+    labels = (result["algorithm"].getId(),)
+    RANKING_DURATION.observe(tm.clock() - start, labels)
+    RANKED_ELEMENTS.inc(len(result["map"]._map), labels)
     return analyseBlock
 
 
 # [Public]
-def analyseUsingMap(algmap, elements, pulses, withDefault=True):
+def analyseUsingMap(algmap, elements, pulses, withDefault=True,
+        diagnostics=None, scope=None, deadline=None):
     """
         Analyses using map instead of algorithm. Selects one algorithm from
-        the map provided and uses it to sort the results. "withDefault"
-        flag indicates whether default algorithm is used if map is empty.
+        the map provided and uses it to sort the results, see
+        "selectAlgorithm". "withDefault" flag indicates whether default
+        algorithm is used if map is empty. If scope is provided, elements
+        are ranked within clusters, see "analyseByCluster".
 
         Args:
             algmap (AlgorithmsMap): map with algorithms
             elements (ElementMap): map with elements to rank
             pulses (PulseMap): map with pulses to use for ranking
             withDefault (bool): flag to use default algorithm
+            diagnostics (Diagnostics): diagnostics to report selection
+            scope (dict<str, obj>): ranking scope of selector, or None
+            deadline (Deadline): deadline to pass to algorithm
 
         Returns:
             dict<str, obj>: algorithm and updated results map
     """
+    diagnostics = diag.orWarnings(diagnostics)
+    algorithm = selectAlgorithm(algmap, withDefault, diagnostics)
+    if scope is not None:
+        updatemap = analyseByCluster(algorithm, elements, pulses,
+            scope.get("depth"), diagnostics, deadline)
+        return {"algorithm": algorithm, "map": updatemap}
+    # call "analyseUsingAlgorithm" method
+    updatemap = analyseUsingAlgorithm(algorithm, elements, pulses, diagnostics,
+        deadline)
+    result = {"algorithm": algorithm, "map": updatemap}
+    return result
+
+
+# [Public]
+def selectAlgorithm(algmap, withDefault=True, diagnostics=None):
+    """
+        Selects one algorithm from the map provided. Opt-in algorithms are
+        selected only, if they are the only algorithms in the map.
+        "withDefault" flag indicates whether default algorithm is used if
+        map is empty, otherwise None is returned.
+
+        Args:
+            algmap (AlgorithmsMap): map with algorithms
+            withDefault (bool): flag to use default algorithm
+            diagnostics (Diagnostics): diagnostics to report selection
+
+        Returns:
+            Algorithm: selected algorithm
+    """
     misc.checkTypeAgainst(type(algmap), AlgorithmsMap, __file__)
+    diagnostics = diag.orWarnings(diagnostics)
     # assign algorithm
     algorithm = None
     if not algmap.isEmpty():
-        if len(algmap.keys()) > 1:
+        keys = algmap.keys()
+        if len(keys) > 1:
+            optin = [x.getId() for x in OPT_IN_ALGORITHMS]
+            keys = [x for x in keys if x not in optin] or keys
+        if len(keys) > 1:
             msg = "Few algorithms were specified, first one will be selected"
-            warnings.warn(msg, UserWarning)
-        algorithm = ALGORITHMS.get(algmap.keys()[0])
+            diagnostics.report(diag.ALGORITHMS_AMBIGUOUS, msg)
+        algorithm = ALGORITHMS.get(keys[0])
     elif withDefault:
         msg = "Nothing was specified, default algorithm will be used"
-        warnings.warn(msg, UserWarning)
+        diagnostics.report(diag.ALGORITHM_DEFAULT, msg)
         # set default algorithm
         algorithm = DEFAULT_ALGORITHM
-    # call "analyseUsingAlgorithm" method
-    updatemap = analyseUsingAlgorithm(algorithm, elements, pulses)
-    result = {"algorithm": algorithm, "map": updatemap}
-    return result
+    return algorithm
 
 
 # [Public]
-def analyseUsingAlgorithm(algorithm, elements, pulses):
+def analyseUsingAlgorithm(algorithm, elements, pulses, diagnostics=None,
+        deadline=None):
     """
         Uses algorithm to rank elements. Calls "rankResults" method that is
         impolemented in abstract class Algorithm.
@@ -97,6 +180,8 @@ def analyseUsingAlgorithm(algorithm, elements, pulses):
             algorithm (Algorithm): Algorithm instance to use for ranking
             elements (ElementMap): map with elements to rank
             pulses (PulseMap): map with pulses
+            diagnostics (Diagnostics): diagnostics to pass to algorithm
+            deadline (Deadline): deadline to pass to algorithm
 
         Returns:
             ElementMap: updated elements map
@@ -104,4 +189,231 @@ def analyseUsingAlgorithm(algorithm, elements, pulses):
     # check arguments
     misc.checkInstanceAgainst(algorithm, Algorithm, __file__)
     # rank results using algorithm
-    return algorithm.rankResults(elements, pulses)
+    return algorithm.rankResults(elements, pulses, diagnostics, deadline)
+
+
+# [Public]
+def partitionByCluster(elements, depth=None):
+    """
+        Splits elements by cluster. Elements are grouped by their own cluster,
+        or by ancestor cluster at "depth" of the cluster tree, where root
+        clusters are at depth 1. Elements of clusters above that depth are
+        grouped by their own cluster, and elements without cluster are
+        grouped together with key None. Partitions of elements with token
+        are identified by token, depth and key.
+
+        Args:
+            elements (ElementMap): map with elements
+            depth (int): depth of clusters to group by, or None
+
+        Returns:
+            dict<str, ElementMap>: map of cluster id and its elements
+    """
+    misc.checkTypeAgainst(type(elements), ElementMap, __file__)
+    # cluster to group by is found once for each cluster
+    keys = {}; partitions = {}
+    for element in elements._map.values():
+        cluster = element.cluster()
+        cid = None if cluster is None else cluster.id()
+        if cid not in keys:
+            path = []
+            while cluster is not None:
+                path.append(cluster)
+                cluster = cluster.parent()
+            if depth is not None and len(path) >= depth:
+                keys[cid] = path[len(path) - depth].id()
+            else:
+                keys[cid] = cid
+        key = keys[cid]
+        if key not in partitions:
+            partitions[key] = ElementMap()
+        partitions[key]._map[element.id()] = element
+    if elements.token() is not None:
+        for key, partition in partitions.items():
+            partition.setToken((elements.token(), depth, key))
+    return partitions
+
+
+# [Public]
+def startPool(numprocesses=None):
+    """
+        Starts pool of processes that rank partitions of requests, see
+        "analyseByCluster". Pool must be started, before calling process
+        starts other threads, e.g. by server before its request threads.
+        Returns True, if pool is running.
+
+        Args:
+            numprocesses (int): number of processes, PARALLEL_PROCESSES if
+                None
+
+        Returns:
+            bool: flag showing that pool is running
+    """
+    global _pool
+    numprocesses = PARALLEL_PROCESSES if numprocesses is None else \
+        numprocesses
+    if _pool is not None:
+        return _pool.isRunning()
+    if numprocesses < 2:
+        return False
+    pool = workers.ProcessPool(numprocesses)
+    if not pool.start():
+        return False
+    _pool = pool
+    return True
+
+
+# [Public]
+def stopPool():
+    """
+        Stops pool of processes, partitions are ranked as if pool was never
+        started afterwards.
+    """
+    global _pool
+    pool = _pool
+    _pool = None
+    if pool is not None:
+        pool.stop()
+
+
+# [Public]
+def poolStats():
+    """
+        Returns statistics of pool of processes, or None, if it is not
+        started.
+
+        Returns:
+            dict<str, obj>: statistics of the pool, see "ProcessPool"
+    """
+    pool = _pool
+    return None if pool is None else pool.stats()
+
+
+# [Private]
+def _detachedPartition(partition):
+    """
+        Returns copy of partition to send to another process. Elements are
+        shallow copies without cluster, so cluster tree is not pickled with
+        them.
+
+        Args:
+            partition (ElementMap): map with elements
+
+        Returns:
+            ElementMap: copy of the map
+    """
+    detached = ElementMap()
+    for key, element in partition._map.items():
+        element = copy.copy(element)
+        element._cluster = None
+        detached._map[key] = element
+    detached.setToken(partition.token())
+    return detached
+
+
+# [Private]
+def _rankPartition(task):
+    """
+        Ranks partition in process of pool, see "analyseByCluster".
+
+        Args:
+            task (tuple): algorithm, partition, pulses and seconds left
+                before deadline, or None
+
+        Returns:
+            tuple<dict<str, str>, Diagnostics>: rank name by element id and
+                diagnostics of ranking
+    """
+    algorithm, partition, pulses, remaining = task
+    deadline = dl.NEVER if remaining is None else dl.Deadline(remaining)
+    local = diag.Diagnostics()
+    analyseUsingAlgorithm(algorithm, partition, pulses, local, deadline)
+    ranks = dict((key, x.rank()._name) for key, x in partition._map.items())
+    return (ranks, local)
+
+
+# [Public]
+def analyseByCluster(algorithm, elements, pulses, depth=None,
+        diagnostics=None, deadline=None):
+    """
+        Ranks elements within each cluster independently, see
+        "partitionByCluster". If PARALLEL_PROCESSES is set, partitions of
+        at least PARALLEL_MIN_SIZE elements are ranked in other processes,
+        others are ranked in calling process. Processes of pool are used, if
+        it is started, see "startPool", otherwise at most PARALLEL_PROCESSES
+        processes are forked, if calling process runs no other threads, see
+        "mapForked". Forked processes are terminated, once deadline passes,
+        and processes of pool stop ranking at deadline. Ranks are assigned
+        to elements of the map, so results are merged into one map.
+
+        Args:
+            algorithm (Algorithm): Algorithm instance to use for ranking
+            elements (ElementMap): map with elements to rank
+            pulses (PulseMap): map with pulses
+            depth (int): depth of clusters to rank within, or None
+            diagnostics (Diagnostics): diagnostics to pass to algorithm
+            deadline (Deadline): deadline to pass to algorithm, other
+                processes check expiry, but not cancellation
+
+        Returns:
+            ElementMap: updated elements map
+    """
+    misc.checkInstanceAgainst(algorithm, Algorithm, __file__)
+    diagnostics = diag.orWarnings(diagnostics)
+    deadline = dl.orNever(deadline)
+    partitions = partitionByCluster(elements, depth).values()
+    parallel = PARALLEL_PROCESSES > 0
+    large = [x for x in partitions if parallel and
+        len(x._map) >= PARALLEL_MIN_SIZE]
+    if len(large) < 2:
+        large = []
+    for partition in partitions:
+        if not large or len(partition._map) < PARALLEL_MIN_SIZE:
+            analyseUsingAlgorithm(algorithm, partition, pulses, diagnostics,
+                deadline)
+    if not large:
+        return elements
+    pool = _pool
+    if pool is not None and pool.isRunning():
+        tasks = [(algorithm, _detachedPartition(x), pulses,
+            deadline.remaining()) for x in large]
+        values = pool.map(_rankPartition, tasks, deadline.remaining())
+    else:
+        # forked process inherits partition, and returns rank names and
+        # its own diagnostics
+        values = workers.mapForked(
+            lambda x: _rankPartition((algorithm, x, pulses,
+                deadline.remaining())),
+            large, PARALLEL_PROCESSES, deadline.remaining())
+    for ranks, local in values:
+        diagnostics.merge(local)
+        for key, name in ranks.items():
+            elements._map[key].setRank(rank.RSYS.getRank(name))
+    return elements
+
+
+# [Public]
+def sweepUsingMap(algmap, elements, pulses, swept, candidates,
+        diagnostics=None):
+    """
+        Ranks elements for every candidate list of default values of swept
+        pulses with algorithm selected from the map. Default algorithm is
+        used, if map is empty.
+
+        Args:
+            algmap (AlgorithmsMap): map with algorithms
+            elements (ElementMap): map with elements to rank
+            pulses (PulseMap): map with pulses to use for ranking
+            swept (list<DynamicPulse>): pulses to set defaults of
+            candidates (list<list<obj>>): default values of swept pulses
+            diagnostics (Diagnostics): diagnostics to pass to algorithm
+
+        Returns:
+            dict<str, obj>: algorithm and ranks of elements for candidates
+    """
+    diagnostics = diag.orWarnings(diagnostics)
+    algorithm = selectAlgorithm(algmap, True, diagnostics)
+    misc.checkInstanceAgainst(algorithm, Algorithm, __file__)
+    ranks = algorithm.rankCandidates(elements, pulses, swept, candidates,
+        diagnostics)
+    return {"algorithm": algorithm, "ranks": ranks}
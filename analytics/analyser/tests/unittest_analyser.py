@@ -25,6 +25,7 @@ import analytics.exceptions.exceptions as ex
 import analytics.core.processor.processor as processor
 import analytics.analyser.analyser as analyser
 import analytics.algorithms.rank as rnk
+import analytics.utils.diagnostics as diag
 from analytics.algorithms.algorithmsmap import AlgorithmsMap
 from analytics.algorithms.relativecomp import RelativeComparison
 from analytics.core.map.elementmap import ElementMap
@@ -135,6 +136,91 @@ class Analyser_TestSequence(unittest.TestCase):
         for element in elements._map.values():
             self.assertEqual(element.rank()._name, rnk.RSYS.UND_RANK._name)
 
+    def test_analyser_optInAlgorithms(self):
+        # opt-in algorithm is selected only, when it is the only one in map
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter("always")
+            result = analyser.analyseUsingMap(analyser.ALGORITHMS.copy(),
+                self.elements, self.pulses)
+            self.assertEqual(result["algorithm"], analyser.DEFAULT_ALGORITHM)
+            ambiguous = [x for x in w if "Few algorithms" in str(x.message)]
+            self.assertEqual(len(ambiguous), 0)
+        for optin in analyser.OPT_IN_ALGORITHMS:
+            algorithms = AlgorithmsMap()
+            algorithms.assign(optin)
+            result = analyser.analyseUsingMap(algorithms, self.elements,
+                self.pulses)
+            self.assertEqual(result["algorithm"], optin)
+
+    def clusteredMaps(self):
+        # clusters "A" and "B" of elements are children of root cluster "O"
+        clusters = [
+            {"id": "O", "name": "O", "desc": "O", "parent": None},
+            {"id": "A", "name": "A", "desc": "A", "parent": "O"},
+            {"id": "B", "name": "B", "desc": "B", "parent": "O"}
+        ]
+        elements = ElementMap(); pulses = PulseMap()
+        clustermap = ClusterMap()
+        idmapper = processor.parseClusters(clusters, clustermap, {})
+        idmapper = processor.parseElements(self._b, elements, idmapper)
+        processor.parsePulses(self._a, pulses, idmapper)
+        names = dict((x.id(), x.name()) for x in clustermap._map.values())
+        return (elements, pulses, names)
+
+    def test_analyser_partitionByCluster(self):
+        elements, pulses, names = self.clusteredMaps()
+        partitions = analyser.partitionByCluster(elements)
+        self.assertEqual(sorted([names[x] for x in partitions.keys()]),
+            ["A", "B"])
+        self.assertEqual(sum([len(x._map) for x in partitions.values()]), 7)
+        # both clusters are children of root cluster
+        partitions = analyser.partitionByCluster(elements, 1)
+        self.assertEqual([names[x] for x in partitions.keys()], ["O"])
+        self.assertEqual(len(partitions.values()[0]._map), 7)
+        partitions = analyser.partitionByCluster(elements, 3)
+        self.assertEqual(len(partitions), 2)
+        # elements without cluster are grouped together
+        partitions = analyser.partitionByCluster(self.elements)
+        self.assertEqual(partitions.keys(), [None])
+
+    def test_analyser_analyseByCluster(self):
+        # ranks within cluster are the same as ranks of cluster alone
+        elements, pulses, names = self.clusteredMaps()
+        algorithm = RelativeComparison()
+        expected = {}
+        for partition in analyser.partitionByCluster(elements).values():
+            algorithm.rankResults(partition, pulses, diag.Diagnostics())
+            for element in partition._map.values():
+                expected[element.id()] = element.rank()
+                element.setRank(rnk.RSYS.UND_RANK)
+        minsize = analyser.PARALLEL_MIN_SIZE
+        processes = analyser.PARALLEL_PROCESSES
+        try:
+            # partitions are ranked in place, in forked processes, and in
+            # processes of pool
+            for size, numprocesses, pooled in [(minsize, 0, False),
+                    (1, 0, False), (1, 2, False), (1, 2, True)]:
+                analyser.PARALLEL_MIN_SIZE = size
+                analyser.PARALLEL_PROCESSES = numprocesses
+                if pooled:
+                    analyser.startPool()
+                diagnostics = diag.Diagnostics()
+                result = analyser.analyseUsingMap(AlgorithmsMap(),
+                    elements, pulses, True, diagnostics,
+                    {"scope": "CLUSTER", "depth": None})
+                ranks = dict((x.id(), x.rank()) for x in
+                    result["map"]._map.values())
+                self.assertEqual(ranks, expected)
+                self.assertEqual(diagnostics.count(diag.ALGORITHM_DEFAULT), 1)
+        finally:
+            analyser.stopPool()
+            analyser.PARALLEL_MIN_SIZE = minsize
+            analyser.PARALLEL_PROCESSES = processes
+        # ranks within cluster differ from global ranks
+        algorithm.rankResults(elements, pulses, diag.Diagnostics())
+        ranks = dict((x.id(), x.rank()) for x in elements._map.values())
+        self.assertNotEqual(ranks, expected)
+
 
 # Load test suites
 def _suites():
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+
+'''
+Copyright 2015 Ivan Sadikov
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+
+# import os, sys and update path
+import os
+import sys
+
+# set default path as an external directory of the module
+DIR_PATH = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+)
+sys.path.append(DIR_PATH)
+
+# import libs
+import gc
+import time
+# import classes
+import analytics.benchmarks.generator as generator
+import analytics.algorithms.relativecomp as relativecomp
+import analytics.algorithms.approxcomp as approxcomp
+import analytics.core.processor.processor as processor
+from analytics.core.map.clustermap import ClusterMap
+from analytics.core.map.elementmap import ElementMap
+from analytics.core.map.pulsemap import PulseMap
+
+"""
+    Benchmark and accuracy harness of approximate relative comparison. Both
+    algorithms rank the same elements with two continuous dynamic features,
+    and harness reports time of ranking and share of elements that get
+    different rank or rank class from approximate algorithm. Elements are
+    ranked as a whole and as a filtered subset, that is ranked from
+    collected values instead of sorted values of pulses.
+
+    Usage:
+        python analytics/benchmarks/bench_approx.py [elements]
+"""
+
+
+# [Private]
+def _processedBlock(numelements):
+    # features "f0" and "f2" are continuous, so they are ranked together
+    dataset = generator.generateDataset(numelements)
+    for obj in dataset["pulses"]:
+        obj["dynamic"] = obj["id"] in ["f0", "f2"]
+    block = processor.ProcessBlock(
+        {"map": ClusterMap(), "data": dataset["clusters"]},
+        {"map": ElementMap(), "data": dataset["elements"]},
+        {"map": PulseMap(), "data": dataset["pulses"]}
+    )
+    return processor.processWithBlock(block)
+
+# [Private]
+def _rank(algorithm, block, subset):
+    clone = processor.cloneBlock(block)
+    if subset:
+        for key in clone._elementmap._map.keys()[::2]:
+            clone._elementmap.remove(key)
+    relativecomp.clearRankMapCache()
+    gc.collect()
+    start = time.time()
+    algorithm.rankResults(clone._elementmap, clone._pulsemap)
+    spent = time.time() - start
+    ranks = dict((x.id(), x.rank()) for x in clone._elementmap._map.values())
+    return (ranks, spent)
+
+# [Public]
+def compare(block, subset=False):
+    """
+        Ranks elements of processed block with exact and approximate
+        algorithm and compares results.
+
+        Args:
+            block (ProcessBlock): processed block
+            subset (bool): rank every other element only
+
+        Returns:
+            dict<str, obj>: time of each algorithm, number of elements, and
+                number of elements with different rank and rank class
+    """
+    exact, exactTime = _rank(relativecomp.RelativeComparison(), block, subset)
+    approx, approxTime = _rank(approxcomp.ApproximateComparison(), block,
+        subset)
+    ranks = 0; classes = 0
+    for key in exact.keys():
+        if exact[key]._name != approx[key]._name:
+            ranks += 1
+        if exact[key]._class._name != approx[key]._class._name:
+            classes += 1
+    return {"elements": len(exact), "exact": exactTime, "approx": approxTime,
+        "ranks": ranks, "classes": classes}
+
+# [Public]
+def rankMaps(block):
+    """
+        Computes rank map of each continuous feature exactly and with
+        interpolation, and returns time of both, error bound of interpolated
+        rank map and maximum observed difference from exact rank map.
+
+        Args:
+            block (ProcessBlock): processed block
+
+        Returns:
+            dict<str, dict<str, float>>: results for each feature
+    """
+    exact = relativecomp.RelativeComparison()
+    approx = approxcomp.ApproximateComparison()
+    result = {}
+    for pulse in block._pulsemap._map.values():
+        values = pulse.sortedValues() if hasattr(pulse, "sortedValues") \
+            else None
+        if values is None or pulse.static() or pulse.default() is None:
+            continue
+        order = pulse._dynamic.priority(); median = pulse.default()
+        sketch = values.sketch()
+        array = list(values.values())
+        if values.index(median) < 0:
+            array = sorted(array + [median])
+        start = time.time()
+        exactMap = exact._relcomp(array, order, median, True)
+        exactTime = time.time() - start
+        start = time.time()
+        rankMap, bound = approx._approxRankMap(values, order, median, sketch)
+        approxTime = time.time() - start
+        observed = max([abs(rankMap[x] - exactMap[x]) for x in exactMap] or
+            [0.0])
+        result[pulse.name()] = {"exact": exactTime, "approx": approxTime,
+            "bound": bound, "observed": observed}
+    return result
+
+# [Public]
+def run(numelements=50000):
+    """
+        Runs harness and returns comparison of full and subset ranking, and
+        comparison of rank maps of features.
+
+        Args:
+            numelements (int): number of elements
+
+        Returns:
+            dict<str, obj>: results of "compare" and "rankMaps"
+    """
+    block = _processedBlock(numelements)
+    return {
+        "full": compare(block),
+        "subset": compare(block, True),
+        "features": rankMaps(block)
+    }
+
+
+if __name__ == '__main__':
+    numelements = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    res = run(numelements)
+    print ""
+    print "### Approximate ranking: %d elements ###" % (numelements)
+    print "-" * 70
+    for key in ["full", "subset"]:
+        r = res[key]
+        print "%-8s exact: %7.3f sec  approx: %7.3f sec  (%.1fx)" % (key,
+            r["exact"], r["approx"], r["exact"] / max(r["approx"], 1e-9))
+        print "%-8s rank disagreement: %d of %d (%.3f%%), class: %d (%.3f%%)" \
+            % ("", r["ranks"], r["elements"],
+            100.0 * r["ranks"] / max(r["elements"], 1), r["classes"],
+            100.0 * r["classes"] / max(r["elements"], 1))
+    for name in sorted(res["features"].keys()):
+        r = res["features"][name]
+        print "feature %s rank map exact: %.3f sec  approx: %.3f sec  (%.1fx)" \
+            % (name, r["exact"], r["approx"], r["exact"] / max(r["approx"],
+            1e-9))
+        print "%-10s error bound: %.4f  observed: %.4f" % ("", r["bound"],
+            r["observed"])
+    print ""
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+
+'''
+Copyright 2015 Ivan Sadikov
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+
+# import os, sys and update path
+import os
+import sys
+
+# set default path as an external directory of the module
+DIR_PATH = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+)
+sys.path.append(DIR_PATH)
+
+# import libs
+import json
+import shutil
+import tempfile
+import threading
+import time
+# import classes
+import analytics.benchmarks.generator as generator
+import analytics.service as service
+from analytics.datamanager.datamanager import DataManager
+
+"""
+    Benchmark of request throughput with different number of threads. Each
+    thread runs the whole pipeline (load, process, filter, rank, serialize)
+    against generated datasets. Storage latency can be simulated to model
+    I/O-bound loading, e.g. reading files from remote storage. Cache of
+    processed datasets is bypassed unless asked, so every request loads and
+    processes dataset. Every response
+    is compared with response of serial run, any difference is reported as
+    corruption.
+
+    Usage:
+        python analytics/benchmarks/bench_concurrency.py [requests] [latency]
+            [cached]
+"""
+
+# number of datasets to spread requests across
+_DATASETS = 4
+# number of threads to run
+_THREADS = [1, 2, 4, 8]
+# queries to run, one of them reports warnings
+_QUERIES = [
+    "",
+    "select from ${pulses} where @f0 |is| dynamic and @f1 |is| dynamic",
+    "select from ${clusters} where @id = [c1] or @id = [c2]"
+]
+
+
+# [Private]
+def _request(dmngr, datasetId, query, cached=False):
+    if not cached:
+        service._processed.remove((datasetId, dmngr.getVersion(datasetId)))
+    result = service.requestData(datasetId, query, dmngr, True)
+    return json.dumps(result, sort_keys=True)
+
+# [Private]
+def _simulateLatency(latency):
+    # wrap dataset loading with sleep, sleeping releases GIL as blocking I/O
+    # does, so it shows how well I/O-bound stage overlaps
+    load = service._loadDataset
+    def slowLoad(dataset):
+        time.sleep(latency)
+        return load(dataset)
+    service._loadDataset = slowLoad
+    return load
+
+# [Private]
+def _runThreads(dmngr, tasks, numthreads, expected, cached):
+    corrupted = []
+    lock = threading.Lock()
+    position = [0]
+    def worker():
+        while True:
+            with lock:
+                if position[0] >= len(tasks):
+                    return
+                task = tasks[position[0]]
+                position[0] += 1
+            if _request(dmngr, task[0], task[1], cached) != expected[task]:
+                corrupted.append(task)
+    threads = [threading.Thread(target=worker) for _i in range(numthreads)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {"time": time.time() - start, "corrupted": len(corrupted)}
+
+# [Public]
+def run(numrequests=64, latency=0.1, numelements=200, cached=False):
+    """
+        Runs benchmark and returns results for each number of threads.
+
+        Args:
+            numrequests (int): number of requests for each run
+            latency (float): simulated storage latency (sec) per dataset load
+            numelements (int): number of elements in each dataset
+            cached (bool): flag to use cache of processed datasets
+
+        Returns:
+            dict<int, dict>: time (sec), throughput (req/sec) and number of
+                corrupted responses for each number of threads
+    """
+    directory = tempfile.mkdtemp()
+    load = _simulateLatency(latency) if latency > 0 else None
+    try:
+        ids = []
+        for _i in range(_DATASETS):
+            datasetId = "bench_%d" % (_i)
+            generator.writeDataset(
+                os.path.join(directory, datasetId),
+                datasetId,
+                numelements,
+                seed=_i
+            )
+            ids.append(datasetId)
+        dmngr = DataManager()
+        dmngr.loadDatasets(directory)
+        # expected responses from serial run
+        tasks = [(ids[_i % len(ids)], _QUERIES[_i % len(_QUERIES)])
+            for _i in range(numrequests)]
+        expected = {}
+        for task in set(tasks):
+            expected[task] = _request(dmngr, task[0], task[1])
+        results = {}
+        for numthreads in _THREADS:
+            res = _runThreads(dmngr, tasks, numthreads, expected, cached)
+            res["throughput"] = numrequests / res["time"]
+            results[numthreads] = res
+        return results
+    finally:
+        if load is not None:
+            service._loadDataset = load
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    numrequests = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.1
+    cached = len(sys.argv) > 3 and sys.argv[3] in ["1", "true"]
+    results = run(numrequests, latency, cached=cached)
+    base = results[_THREADS[0]]
+    print ""
+    print "### Concurrency: %d requests, %.3f sec storage latency%s ###" \
+        % (numrequests, latency, ", cached" if cached else "")
+    print "-" * 70
+    for numthreads in _THREADS:
+        res = results[numthreads]
+        print "%2d threads  time: %7.3f sec  %7.1f req/sec (x%4.2f)  " \
+            "corrupted: %d" % (
+                numthreads,
+                res["time"],
+                res["throughput"],
+                res["throughput"] / base["throughput"],
+                res["corrupted"]
+            )
+    print ""
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+
+'''
+Copyright 2015 Ivan Sadikov
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+
+# import os, sys and update path
+import os
+import sys
+
+# set default path as an external directory of the module
+DIR_PATH = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+)
+sys.path.append(DIR_PATH)
+
+# import libs
+import json
+import random
+import shutil
+import tempfile
+import time
+# import classes
+import analytics.benchmarks.generator as generator
+import analytics.service as service
+import analytics.datamanager.compaction as compaction
+from analytics.datamanager.datamanager import DataManager
+from analytics.loading.jsonloader import JsonLoader
+
+"""
+    Benchmark of ingesting change of dataset as delta files compared to full
+    reload of dataset with the same change.
+
+    Usage:
+        python analytics/benchmarks/bench_deltas.py [elements] [percent]
+"""
+
+_DATASET_ID = "bench_deltas"
+
+
+# [Private]
+def _deltaRecords(numelements, numchanges, seed=2):
+    # half of changes update existing elements, others insert new ones and
+    # delete existing ones
+    rnd = random.Random(seed)
+    fresh = generator.generateElements(numchanges, seed=seed)
+    records = []
+    for _i in range(numchanges):
+        obj = fresh[_i]
+        if _i % 2 == 0:
+            obj["id"] = "e%d" % (rnd.randrange(numelements))
+            records.append({"op": "upsert", "data": obj})
+        elif _i % 4 == 1:
+            obj["id"] = "n%d" % (_i)
+            records.append({"op": "upsert", "data": obj})
+        else:
+            records.append({"op": "delete",
+                "id": "e%d" % (rnd.randrange(numelements))})
+    return records
+
+# [Private]
+def _build(dmngr, directory, rebuild=False):
+    dmngr.loadDatasets(directory)
+    dataset, version = dmngr.getDatasetVersion(_DATASET_ID)
+    start = time.time()
+    service._snapshot(dataset, version, rebuild)
+    return time.time() - start
+
+# [Public]
+def run(numelements=20000, percent=1.0):
+    """
+        Runs benchmark and returns time of full reload, incremental ingest
+        and compaction.
+
+        Args:
+            numelements (int): number of elements in dataset
+            percent (float): size of change in percent of elements
+
+        Returns:
+            dict<str, float>: time (sec) of each step, first delta also
+                counts values of base snapshot
+    """
+    directory = tempfile.mkdtemp()
+    try:
+        manifestpath = generator.writeDataset(directory, _DATASET_ID,
+            numelements)
+        numchanges = max(int(numelements * percent / 100.0), 1)
+        records = _deltaRecords(numelements, numchanges)
+        dmngr = DataManager()
+        service._processed.clear()
+        results = {"changes": numchanges}
+        results["initial"] = _build(dmngr, directory)
+        # change is added as delta file
+        with open(os.path.join(directory, "delta1.json"), "w") as f:
+            json.dump(records, f)
+        manifest = JsonLoader(manifestpath).processData()
+        manifest["data"]["deltas"] = [{"file": "delta1", "type": "json"}]
+        with open(manifestpath, "w") as f:
+            json.dump(manifest, f)
+        # the first delta also counts values of base snapshot
+        results["first"] = _build(dmngr, directory)
+        records = _deltaRecords(numelements, numchanges, 3)
+        with open(os.path.join(directory, "delta2.json"), "w") as f:
+            json.dump(records, f)
+        manifest["data"]["deltas"].append({"file": "delta2", "type": "json"})
+        with open(manifestpath, "w") as f:
+            json.dump(manifest, f)
+        results["incremental"] = _build(dmngr, directory)
+        # the same change processed from scratch
+        service._processed.clear()
+        results["full"] = _build(dmngr, directory)
+        start = time.time()
+        compaction.compactDataset(manifestpath)
+        results["compaction"] = time.time() - start
+        return results
+    finally:
+        service._processed.clear()
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    numelements = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    percent = float(sys.argv[2]) if len(sys.argv) > 2 else 1.0
+    res = run(numelements, percent)
+    print ""
+    print "### Deltas: %d elements, %d changed (%.2f%%) ###" \
+        % (numelements, res["changes"], percent)
+    print "-" * 70
+    print "full reload:        %8.3f sec" % (res["full"])
+    print "first delta:        %8.3f sec (%.1f%% of full reload)" % (
+        res["first"], 100.0 * res["first"] / res["full"])
+    print "next delta:         %8.3f sec (%.1f%% of full reload)" % (
+        res["incremental"], 100.0 * res["incremental"] / res["full"])
+    print "compaction:         %8.3f sec" % (res["compaction"])
+    print ""
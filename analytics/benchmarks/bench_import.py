@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+
+'''
+Copyright 2015 Ivan Sadikov
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+
+# import os, sys and update path
+import os
+import sys
+
+# set default path as an external directory of the module
+DIR_PATH = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+)
+sys.path.append(DIR_PATH)
+
+# import libs
+import __builtin__
+import json
+import subprocess
+import time
+
+"""
+    Import-time benchmark, similar to "python -X importtime" that is not
+    available in Python 2.7. Module is imported in a fresh interpreter with
+    timing hook on "__import__", and self and cumulative time is reported for
+    every module loaded for the first time.
+
+    Usage:
+        python analytics/benchmarks/bench_import.py [module] [top]
+"""
+
+# [Private]
+def _installHook():
+    """
+        Installs timing hook and returns list of records, each record is
+        [name, self time, cumulative time, depth] in order of completion.
+    """
+    records = []
+    stack = []
+    original = __builtin__.__import__
+    def timedImport(name, *args, **kwargs):
+        loaded = set(sys.modules.keys())
+        stack.append(0.0)
+        start = time.time()
+        try:
+            return original(name, *args, **kwargs)
+        finally:
+            spent = time.time() - start
+            nested = stack.pop()
+            if stack:
+                stack[-1] += spent
+            new = [x for x in sys.modules.keys()
+                if x not in loaded and sys.modules[x] is not None]
+            # report import only if it loaded something
+            if new:
+                records.append([name, spent - nested, spent, len(stack)])
+    __builtin__.__import__ = timedImport
+    return records
+
+# [Public]
+def measure(module):
+    """
+        Imports module in separate interpreter and returns import breakdown
+        and list of all modules loaded.
+
+        Args:
+            module (str): module name to import
+
+        Returns:
+            dict<str, obj>: total time (sec), records and modules
+    """
+    code = "\n".join([
+        "import sys, json",
+        "sys.path.insert(0, %r)" % (DIR_PATH),
+        "import analytics.benchmarks.bench_import as b",
+        "before = set(sys.modules.keys())",
+        "records = b._installHook()",
+        "import time; start = time.time()",
+        "__import__(%r)" % (module),
+        "total = time.time() - start",
+        "modules = sorted(x for x in sys.modules.keys()",
+        "    if x not in before and sys.modules[x] is not None)",
+        "print json.dumps({'total': total, 'records': records,",
+        "    'modules': modules})"
+    ])
+    proc = subprocess.Popen(
+        [sys.executable, "-c", code],
+        stdout=subprocess.PIPE,
+        cwd=DIR_PATH
+    )
+    out = proc.communicate()[0]
+    if proc.returncode != 0:
+        raise StandardError("Failed to import %s" % (module))
+    return json.loads(out.strip().splitlines()[-1])
+
+
+if __name__ == '__main__':
+    module = sys.argv[1] if len(sys.argv) > 1 else "analytics.service"
+    top = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    result = measure(module)
+    print ""
+    print "### Import time: %s, %.1f ms, %d modules ###" \
+        % (module, result["total"] * 1000, len(result["modules"]))
+    print "-" * 70
+    print "%10s | %10s | %s" % ("self (us)", "cumul (us)", "import")
+    records = sorted(result["records"], key=lambda x: x[2], reverse=True)
+    for name, own, cumulative, depth in records[:top]:
+        print "%10d | %10d | %s%s" % (own * 1e6, cumulative * 1e6,
+            "  " * depth, name)
+    print ""
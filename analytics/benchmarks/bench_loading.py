@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+
+'''
+Copyright 2015 Ivan Sadikov
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+
+# import os, sys and update path
+import os
+import sys
+
+# set default path as an external directory of the module
+DIR_PATH = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+)
+sys.path.append(DIR_PATH)
+
+# import libs
+import shutil
+import tempfile
+import time
+# import classes
+import analytics.benchmarks.generator as generator
+import analytics.service as service
+from analytics.datamanager.datamanager import DataManager
+from analytics.loading.jsonloader import JsonLoader
+
+"""
+    Benchmark of dataset discovery and preloading with different number of
+    workers. Slow disk is simulated by delay of every json file read, which
+    applies to manifests and data files.
+
+    Usage:
+        python analytics/benchmarks/bench_loading.py [datasets] [latency]
+"""
+
+# number of workers to compare
+_WORKERS = [1, 4, 8]
+
+
+# [Private]
+def _simulateLatency(latency):
+    # sleep releases GIL as blocking read does
+    processData = JsonLoader.processData
+    def slowProcessData(self):
+        time.sleep(latency)
+        return processData(self)
+    JsonLoader.processData = slowProcessData
+    return processData
+
+# [Public]
+def run(numdatasets=24, latency=0.05, numelements=100):
+    """
+        Runs benchmark and returns results for each number of workers.
+
+        Args:
+            numdatasets (int): number of datasets
+            latency (float): simulated delay (sec) of every file read
+            numelements (int): number of elements in each dataset
+
+        Returns:
+            dict<int, dict>: discovery time, preload time, sum and maximum of
+                per-dataset times for each number of workers
+    """
+    directory = tempfile.mkdtemp()
+    processData = _simulateLatency(latency)
+    try:
+        ids = []
+        for _i in range(numdatasets):
+            datasetId = "bench_%d" % (_i)
+            generator.writeDataset(
+                os.path.join(directory, datasetId),
+                datasetId,
+                numelements,
+                seed=_i
+            )
+            ids.append(datasetId)
+        results = {}
+        for maxworkers in _WORKERS:
+            service._processed.clear()
+            dmngr = DataManager()
+            start = time.time()
+            dmngr.loadDatasets(directory, maxworkers)
+            discovery = time.time() - start
+            start = time.time()
+            timings = service.preload(ids, dmngr, maxworkers)
+            preload = time.time() - start
+            times = [x["time"] for x in timings.values()]
+            results[maxworkers] = {
+                "discovery": discovery,
+                "preload": preload,
+                "sum": sum(times),
+                "max": max(times),
+                "errors": len([x for x in timings.values()
+                    if x["status"] != "success"])
+            }
+        return results
+    finally:
+        JsonLoader.processData = processData
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    numdatasets = int(sys.argv[1]) if len(sys.argv) > 1 else 24
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.05
+    results = run(numdatasets, latency)
+    print ""
+    print "### Loading: %d datasets, %.3f sec per file read ###" \
+        % (numdatasets, latency)
+    print "-" * 70
+    for maxworkers in _WORKERS:
+        res = results[maxworkers]
+        print "%2d workers  discovery: %6.3f sec  preload: %6.3f sec  " \
+            "(per dataset sum %6.3f, max %5.3f, errors %d)" % (
+                maxworkers,
+                res["discovery"],
+                res["preload"],
+                res["sum"],
+                res["max"],
+                res["errors"]
+            )
+    print ""
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+
+'''
+Copyright 2015 Ivan Sadikov
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+
+# import os, sys and update path
+import os
+import sys
+
+# set default path as an external directory of the module
+DIR_PATH = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+)
+sys.path.append(DIR_PATH)
+
+# import libs
+import json
+import time
+import warnings
+# import classes
+import analytics.benchmarks.generator as generator
+import analytics.core.processor.processor as processor
+import analytics.analyser.analyser as analyser
+import analytics.serializer.serializer as serializer
+from analytics.core.map.clustermap import ClusterMap
+from analytics.core.map.elementmap import ElementMap
+from analytics.core.map.pulsemap import PulseMap
+from analytics.algorithms.algorithmsmap import AlgorithmsMap
+
+"""
+    Benchmark of payload size and serialisation time of elements in default
+    and columnar formats. Serialisation time includes building json object
+    from elements and encoding it into string.
+
+    Usage:
+        python analytics/benchmarks/bench_serializer.py [elements] [features]
+"""
+
+# number of repeats, best time is reported
+_REPEATS = 5
+
+
+# [Private]
+def _rankedElements(numelements, numfeatures):
+    dataset = generator.generateDataset(numelements, numfeatures)
+    block = processor.ProcessBlock(
+        {"map": ClusterMap(), "data": dataset["clusters"]},
+        {"map": ElementMap(), "data": dataset["elements"]},
+        {"map": PulseMap(), "data": dataset["pulses"]}
+    )
+    block = processor.processWithBlock(block)
+    ablock = analyser.AnalyseBlock(
+        AlgorithmsMap(),
+        block._elementmap,
+        block._pulsemap
+    )
+    ablock = analyser.analyseWithBlock(ablock)
+    return processor.sortElements(ablock._elementmap._map.values())
+
+# [Private]
+def _measure(elementlist, dataformat):
+    best = None; payload = None
+    positions = serializer.catalogueIndex(elementlist)
+    for _i in range(_REPEATS):
+        start = time.time()
+        payload = json.dumps(
+            serializer.serializeElements(elementlist, dataformat, positions)
+        )
+        spent = time.time() - start
+        best = spent if best is None or spent < best else best
+    return {"size": len(payload), "time": best}
+
+# [Public]
+def run(numelements=10000, numfeatures=20):
+    """
+        Runs benchmark and returns results for each format.
+
+        Args:
+            numelements (int): number of elements
+            numfeatures (int): number of numeric features per element
+
+        Returns:
+            dict<str, dict>: size (bytes) and time (sec) for each format
+    """
+    elementlist = _rankedElements(numelements, numfeatures)
+    results = {}
+    for dataformat in serializer.FORMATS:
+        results[dataformat] = _measure(elementlist, dataformat)
+    return results
+
+
+if __name__ == '__main__':
+    warnings.simplefilter("ignore")
+    numelements = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    numfeatures = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    results = run(numelements, numfeatures)
+    base = results[serializer.FORMAT_DEFAULT]
+    print ""
+    print "### Serializer: %d elements, %d features ###" \
+        % (numelements, numfeatures)
+    print "-" * 70
+    for dataformat in serializer.FORMATS:
+        res = results[dataformat]
+        print "%-10s size: %10d bytes (%5.1f%%)  time: %8.4f sec (%5.1f%%)" % (
+            dataformat,
+            res["size"],
+            100.0 * res["size"] / base["size"],
+            res["time"],
+            100.0 * res["time"] / base["time"]
+        )
+    print ""
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+
+'''
+Copyright 2015 Ivan Sadikov
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+
+# import os, sys and update path
+import os
+import sys
+
+# set default path as an external directory of the module
+DIR_PATH = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+)
+sys.path.append(DIR_PATH)
+
+# import libs
+import httplib
+import threading
+import time
+import urllib
+# import classes
+import analytics.service as service
+import analytics.server.asyncserver as asyncserver
+from analytics.datamanager.datamanager import DataManager
+
+"""
+    Local load test of async server. Clients send the same query over and
+    over, either over one keep-alive connection each, or with new connection
+    for every request, and load test reports requests per second and
+    latency. Responses are cached by ETag after the first one, so the test
+    measures overhead of the server rather than ranking.
+
+    Usage:
+        python analytics/benchmarks/bench_server.py [clients] [requests]
+"""
+
+# datasets for load test, they are known to be valid
+_DATASETS_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.realpath(__file__))),
+    "tests",
+    "datasets"
+)
+
+
+# [Private]
+def _client(address, path, numrequests, keepalive, latencies, errors):
+    connection = None
+    for _i in range(numrequests):
+        if connection is None:
+            connection = httplib.HTTPConnection(*address, timeout=60)
+        start = time.time()
+        try:
+            headers = {} if keepalive else {"Connection": "close"}
+            connection.request("GET", path, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            if response.status != 200:
+                errors.append(response.status)
+        except (httplib.HTTPException, IOError) as e:
+            errors.append(str(e))
+        latencies.append(time.time() - start)
+        if not keepalive:
+            connection.close()
+            connection = None
+    if connection is not None:
+        connection.close()
+
+# [Public]
+def load(address, path, numclients, numrequests, keepalive):
+    """
+        Runs clients against server and returns throughput and latency.
+
+        Args:
+            address (tuple<str, int>): address of the server
+            path (str): request path with parameters
+            numclients (int): number of concurrent clients
+            numrequests (int): number of requests of each client
+            keepalive (bool): flag to reuse connection for requests
+
+        Returns:
+            dict<str, float>: requests/sec, mean and maximum latency (sec),
+                number of errors
+    """
+    latencies = []; errors = []
+    threads = [threading.Thread(target=_client, args=(address, path,
+        numrequests, keepalive, latencies, errors)) for x in range(numclients)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    spent = time.time() - start
+    return {
+        "throughput": len(latencies) / spent,
+        "mean": sum(latencies) / max(len(latencies), 1),
+        "max": max(latencies or [0.0]),
+        "errors": len(errors)
+    }
+
+# [Public]
+def run(numclients=16, numrequests=200):
+    """
+        Starts async server and runs load test with and without keep-alive.
+
+        Args:
+            numclients (int): number of concurrent clients
+            numrequests (int): number of requests of each client
+
+        Returns:
+            dict<str, dict>: results of "load" for each mode
+    """
+    dmngr = DataManager()
+    dmngr.loadDatasets(_DATASETS_PATH)
+    datasetId = dmngr.getDatasets()[0]._id
+    server = asyncserver.AsyncServer(("127.0.0.1", 0),
+        auth=lambda headers: service.EMAIL_LIST[0], dmngr=dmngr)
+    server.start()
+    thread = threading.Thread(target=server.serveForever)
+    thread.start()
+    try:
+        address = server.address()
+        path = "/api/query?" + urllib.urlencode({"d": datasetId, "s": 1})
+        return {
+            "keep-alive": load(address, path, numclients, numrequests, True),
+            "close": load(address, path, numclients, numrequests, False)
+        }
+    finally:
+        server.stop()
+        thread.join()
+
+
+if __name__ == '__main__':
+    numclients = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    numrequests = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    res = run(numclients, numrequests)
+    print ""
+    print "### Async server: %d clients, %d requests each ###" % (numclients,
+        numrequests)
+    print "-" * 70
+    for key in ["keep-alive", "close"]:
+        r = res[key]
+        print "%-10s %8.1f req/sec  mean: %6.2f ms  max: %7.2f ms  errors: %d" \
+            % (key, r["throughput"], r["mean"] * 1000, r["max"] * 1000,
+            r["errors"])
+    print ""
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+
+'''
+Copyright 2015 Ivan Sadikov
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+
+# import os, sys and update path
+import os
+import sys
+
+# set default path as an external directory of the module
+DIR_PATH = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+)
+sys.path.append(DIR_PATH)
+
+# import libs
+import time
+# import classes
+import analytics.benchmarks.generator as generator
+import analytics.utils.diagnostics as diag
+import analytics.core.processor.processor as processor
+import analytics.selector.selector as selector
+import analytics.analyser.analyser as analyser
+import analytics.serializer.serializer as serializer
+import analytics.sharding.sharding as sharding
+from analytics.core.map.clustermap import ClusterMap
+from analytics.core.map.elementmap import ElementMap
+from analytics.core.map.pulsemap import PulseMap
+
+"""
+    Benchmark of query throughput of sharded execution with different number
+    of shards, compared to the whole pipeline in one process. Queries are
+    run one after another, so speedup comes only from shards filtering and
+    ranking in parallel. Every response is compared with ranks of the whole
+    pipeline, any difference is reported as mismatch.
+
+    Usage:
+        python analytics/benchmarks/bench_sharding.py [elements] [queries]
+"""
+
+# number of shards to run
+_SHARDS = [1, 2, 4, 8]
+# queries to run
+_QUERIES = [
+    "",
+    "select from ${pulses} where @f0 |is| dynamic and @f1 |is| dynamic",
+    "select from ${clusters} where @id = [c1] and @id = [c2]",
+    "select from ${algorithms} where @scope |is| cluster"
+]
+
+
+# [Private]
+def _processedBlock(numelements):
+    dataset = generator.generateDataset(numelements)
+    block = processor.ProcessBlock(
+        {"map": ClusterMap(), "data": dataset["clusters"]},
+        {"map": ElementMap(), "data": dataset["elements"]},
+        {"map": PulseMap(), "data": dataset["pulses"]}
+    )
+    return processor.processWithBlock(block)
+
+# [Private]
+def _query(block, queryset):
+    # the whole pipeline in one process, as service runs it
+    clone = processor.cloneBlock(block)
+    fblock = selector.filterWithBlock(queryset, selector.FilterBlock(
+        analyser.ALGORITHMS.copy(), clone._pulsemap, clone._clustermap,
+        clone._elementmap, diag.Diagnostics()))
+    ablock = analyser.analyseWithBlock(analyser.AnalyseBlock(fblock._alg,
+        fblock._ele, fblock._pul, diag.Diagnostics(), fblock._scope))
+    return serializer.elementsToJSON(ablock._elementmap._map.values())
+
+# [Private]
+def _ranks(elements):
+    return dict((x["id"], x["rank"]["name"]) for x in elements)
+
+# [Public]
+def run(numelements=50000, numqueries=8):
+    """
+        Runs benchmark and returns results of the whole pipeline and of each
+        number of shards.
+
+        Args:
+            numelements (int): number of elements in dataset
+            numqueries (int): number of queries for each run
+
+        Returns:
+            dict<obj, dict>: time (sec), throughput (queries/sec), number
+                of mismatched responses and flag of processes for each
+                number of shards, key "whole" for the whole pipeline
+    """
+    block = _processedBlock(numelements)
+    queries = [_QUERIES[_i % len(_QUERIES)] for _i in range(numqueries)]
+    expected = dict((x, _ranks(_query(block, x))) for x in set(queries))
+    start = time.time()
+    for queryset in queries:
+        _query(block, queryset)
+    spent = time.time() - start
+    results = {"whole": {"time": spent, "throughput": numqueries / spent,
+        "mismatched": 0, "parallel": False}}
+    for numshards in _SHARDS:
+        executor = sharding.ShardedExecutor(block, numshards)
+        try:
+            mismatched = 0
+            start = time.time()
+            for queryset in queries:
+                result = executor.query(queryset, False, diag.Diagnostics())
+                if _ranks(result["elements"]) != expected[queryset]:
+                    mismatched += 1
+            spent = time.time() - start
+            results[numshards] = {"time": spent,
+                "throughput": numqueries / spent, "mismatched": mismatched,
+                "parallel": executor.isParallel()}
+        finally:
+            executor.stop()
+    return results
+
+
+if __name__ == '__main__':
+    numelements = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    numqueries = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    res = run(numelements, numqueries)
+    print ""
+    print "### Sharding: %d elements, %d queries ###" % (numelements,
+        numqueries)
+    print "-" * 70
+    whole = res["whole"]
+    for key in ["whole"] + _SHARDS:
+        r = res[key]
+        name = key if key == "whole" else "%d shards" % (key)
+        print "%-10s %7.3f sec  %6.2f q/sec  (%.2fx)  mismatched: %d%s" % (
+            name, r["time"], r["throughput"],
+            r["throughput"] / whole["throughput"], r["mismatched"],
+            "" if key == "whole" or r["parallel"] else "  (inline)")
+    print ""
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+
+'''
+Copyright 2015 Ivan Sadikov
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+
+# import libs
+import os
+import json
+import random
+
+"""
+    Synthetic dataset generator for benchmarks. Produces raw lists of
+    clusters, elements and pulses in the same shape as loaders return them,
+    so they can be passed to processor directly, or written on disk with
+    manifest, so they can be found by datamanager.
+"""
+
+# [Public]
+def generateClusters(numclusters=10):
+    """
+        Generates list of cluster objects. First cluster is a root, others
+        are its children.
+
+        Args:
+            numclusters (int): number of clusters
+
+        Returns:
+            list<dict>: list of cluster objects
+    """
+    clusters = []
+    for _i in range(numclusters):
+        clusters.append({
+            "id": "c%d" % (_i),
+            "name": "Cluster %d" % (_i),
+            "desc": "Cluster %d" % (_i),
+            "parent": None if _i == 0 else "c0"
+        })
+    return clusters
+
+# [Public]
+def generatePulses(numfeatures=5):
+    """
+        Generates list of pulse objects. Features "f0" and "f1" are dynamic,
+        other numeric features are static, and feature "dir" is a string
+        feature.
+
+        Args:
+            numfeatures (int): number of numeric features
+
+        Returns:
+            list<dict>: list of pulse objects
+    """
+    pulses = []
+    for _i in range(numfeatures):
+        pulses.append({
+            "id": "f%d" % (_i),
+            "name": "f%d" % (_i),
+            "desc": "Feature %d" % (_i),
+            "sample": 1.0 if _i % 2 == 0 else 1,
+            "priority": 1 if _i % 3 else -1,
+            "dynamic": _i < 2
+        })
+    pulses.append({"id": "dir", "name": "dir", "desc": "dir", "sample": "s"})
+    return pulses
+
+# [Public]
+def generateElements(numelements=1000, numfeatures=5, numclusters=10,
+        seed=1):
+    """
+        Generates list of element objects with random feature values. Values
+        are deterministic for the same seed.
+
+        Args:
+            numelements (int): number of elements
+            numfeatures (int): number of numeric features
+            numclusters (int): number of clusters
+            seed (int): random seed
+
+        Returns:
+            list<dict>: list of element objects
+    """
+    rnd = random.Random(seed)
+    elements = []
+    for _i in range(numelements):
+        obj = {
+            "id": "e%d" % (_i),
+            "name": "Element %d" % (_i),
+            "desc": "Element %d" % (_i),
+            "cluster": "c%d" % (rnd.randrange(numclusters))
+        }
+        for _j in range(numfeatures):
+            if _j % 2 == 0:
+                obj["f%d" % (_j)] = round(rnd.uniform(0, 1000), 2)
+            else:
+                obj["f%d" % (_j)] = rnd.randrange(100)
+        obj["dir"] = rnd.choice(["up", "down"])
+        elements.append(obj)
+    return elements
+
+# [Public]
+def generateDataset(numelements=1000, numfeatures=5, numclusters=10, seed=1):
+    """
+        Generates dataset as dictionary of clusters, elements and pulses
+        lists.
+
+        Args:
+            numelements (int): number of elements
+            numfeatures (int): number of numeric features
+            numclusters (int): number of clusters
+            seed (int): random seed
+
+        Returns:
+            dict<str, list>: clusters, elements and pulses lists
+    """
+    return {
+        "clusters": generateClusters(numclusters),
+        "elements": generateElements(
+            numelements,
+            numfeatures,
+            numclusters,
+            seed
+        ),
+        "pulses": generatePulses(numfeatures)
+    }
+
+# [Public]
+def writeDataset(directory, datasetId, numelements=1000, numfeatures=5,
+        numclusters=10, seed=1):
+    """
+        Generates dataset and writes it into directory as json files with
+        manifest. Directory is created, if it does not exist.
+
+        Args:
+            directory (str): directory to write dataset into
+            datasetId (str): dataset id
+            numelements (int): number of elements
+            numfeatures (int): number of numeric features
+            numclusters (int): number of clusters
+            seed (int): random seed
+
+        Returns:
+            str: path to the manifest
+    """
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    dataset = generateDataset(numelements, numfeatures, numclusters, seed)
+    data = {}
+    for key in ["clusters", "elements", "pulses"]:
+        with open(os.path.join(directory, "%s.json" % (key)), "w") as f:
+            json.dump(dataset[key], f)
+        data[key] = {"file": key, "type": "json"}
+    manifest = {
+        "id": datasetId,
+        "name": datasetId,
+        "desc": "Generated dataset %s" % (datasetId),
+        "data": data,
+        "discover": False
+    }
+    path = os.path.join(directory, "manifest.json")
+    with open(path, "w") as f:
+        json.dump(manifest, f)
+    return path
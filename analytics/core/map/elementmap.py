@@ -8,10 +8,17 @@ from analytics.core.map.dataitemmap import DataItemMap
 
 class ElementMap(DataItemMap):
     """
-        Map to keep elements.
+        Map to keep elements. Map can have token, that identifies its
+        elements, e.g. dataset version of processed snapshot, so results
+        that depend only on elements can be cached by token. Token is reset,
+        when element is added or removed.
+
+        Attributes:
+            _token (obj): hashable token of elements, or None
     """
     def __init__(self):
         super(ElementMap, self).__init__()
+        self._token = None
 
     # [Public]
     def add(self, element):
@@ -23,3 +30,36 @@ class ElementMap(DataItemMap):
         """
         misc.checkInstanceAgainst(element, Element, __file__)
         super(ElementMap, self).add(element)
+        self._token = None
+
+    # [Public]
+    def remove(self, id):
+        """
+            Removes element with specified id from map.
+
+            Args:
+                id (str): element id
+        """
+        super(ElementMap, self).remove(id)
+        self._token = None
+
+    # [Public]
+    def token(self):
+        """
+            Returns token of elements, or None, if elements are not known.
+
+            Returns:
+                obj: token of elements
+        """
+        return self._token
+
+    # [Public]
+    def setToken(self, token):
+        """
+            Sets token of elements. Elements must not be changed afterwards
+            without "add" or "remove", as token would not be reset.
+
+            Args:
+                token (obj): hashable token of elements, or None
+        """
+        self._token = token
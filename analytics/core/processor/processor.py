@@ -2,9 +2,11 @@
 
 # import libs
 from types import ListType, DictType, IntType, FloatType
-import warnings
+from collections import Counter
 # import classes
 import analytics.utils.misc as misc
+import analytics.utils.diagnostics as diag
+import analytics.utils.deadline as dl
 from analytics.core.map.dataitemmap import DataItemMap
 from analytics.core.map.clustermap import ClusterMap
 from analytics.core.map.elementmap import ElementMap
@@ -14,11 +16,21 @@ from analytics.core.element import Element
 from analytics.core.pulse import DynamicPulse, StaticPulse
 from analytics.core.attribute.dynamic import Dynamic
 from analytics.core.attribute.feature import Feature
+from analytics.utils.sortedvalues import SortedValues, SKETCH_MIN_SIZE
 
 
-# unknown cluster for elements with parent = None
+# unknown cluster for elements with parent = None, it is only a template:
+# every processed block gets its own copy (see "unknownCluster"), because
+# cluster map attaches children to the instance it holds
 UNKNOWN_CLUSTER = Cluster(None, "Unknown Cluster", "Unknown Cluster")
 
+# delta record operations and keys, see "applyDeltas"
+DELTA_OP = "op"
+DELTA_UPSERT = "upsert"
+DELTA_DELETE = "delete"
+DELTA_DATA = "data"
+DELTA_ID = "id"
+
 
 class ProcessBlock(object):
     """
@@ -29,8 +41,13 @@ class ProcessBlock(object):
             _pulsemap (PulseMap): map of pulses
             _elementmap (ElementMap): map of elements
             _isProcessed (bool): flag to show that block is processed
+            _diagnostics (Diagnostics): diagnostics of the request
+            _valuecounts (dict<str, Counter>): number of elements for each
+                feature value, computed when deltas are applied first time
+            _deadline (Deadline): deadline of the request
     """
-    def __init__(self, clusters, elements, pulses, discovery=False):
+    def __init__(self, clusters, elements, pulses, discovery=False,
+            diagnostics=None, deadline=None):
         self._clustermap = clusters["map"]
         self._elementmap = elements["map"]
         self._pulsemap = pulses["map"]
@@ -41,6 +58,9 @@ class ProcessBlock(object):
         }
         self._isDiscovery = bool(discovery)
         self._isProcessed = False
+        self._diagnostics = diag.orWarnings(diagnostics)
+        self._valuecounts = None
+        self._deadline = dl.orNever(deadline)
 
 # [Public]
 def processWithBlock(block):
@@ -55,30 +75,38 @@ def processWithBlock(block):
             ProcessBlock: updated block
     """
     if block._isProcessed:
-        return processBlock
+        return block
     # util map
     idmapper = {}
+    diagnostics = block._diagnostics
     # parse object lists
     ## clusters
     idmapper = parseClusters(
         block._data["clusters"],
         block._clustermap,
-        idmapper
+        idmapper,
+        diagnostics
     )
     ## elements
     idmapper = parseElements(
         block._data["elements"],
         block._elementmap,
-        idmapper
+        idmapper,
+        diagnostics,
+        block._deadline
     )
     ## pulses
     ### if discovery is true we try searching elements for pulses
     if block._isDiscovery:
-        block._data["pulses"] = _createPulseObjects(block._elementmap)
+        block._data["pulses"] = _createPulseObjects(
+            block._elementmap,
+            diagnostics
+        )
     idmapper = parsePulses(
         block._data["pulses"],
         block._pulsemap,
-        idmapper
+        idmapper,
+        diagnostics
     )
     ## check if there is any None parents in elements
     assignUnknownCluster(block._clustermap, block._elementmap)
@@ -87,9 +115,262 @@ def processWithBlock(block):
     # return block
     return block
 
+# [Public]
+def cloneBlock(block, diagnostics=None, deadline=None):
+    """
+        Returns copy of the processed block. Clusters, elements and pulses are
+        copied, so filtering and ranking of the copy do not change original
+        block, which can be shared between requests. Features, ranks and
+        pulse stores are shared, as they are not changed after processing.
+        Copying is much cheaper than processing, since ids are not generated
+        again.
+
+        Args:
+            block (ProcessBlock): processed block
+            diagnostics (Diagnostics): diagnostics of the copy
+            deadline (Deadline): deadline of the copy
+
+        Returns:
+            ProcessBlock: processed copy of the block
+    """
+    misc.checkTypeAgainst(type(block), ProcessBlock, __file__)
+    if not block._isProcessed:
+        misc.raiseStandardError("Block is not processed", __file__)
+    # clusters, copy first and then relink parents and children
+    source = block._clustermap
+    clusters = {}
+    for key, cluster in source._map.items():
+        clone = _shallowCopy(cluster)
+        clone._children = {}
+        clusters[key] = clone
+    for key, cluster in source._map.items():
+        clone = clusters[key]
+        parent = cluster._parent
+        clone._parent = clusters.get(parent._id) if parent is not None else None
+        for child in cluster._children.keys():
+            if child in clusters:
+                clone._children[child] = clusters[child]
+    clustermap = ClusterMap()
+    clustermap._map = clusters
+    clustermap._root = dict((x, clusters[x]) for x in source._root.keys())
+    clustermap._waitlist = dict((x, [clusters[y._id] for y in source._waitlist[x]])
+        for x in source._waitlist.keys())
+    # elements
+    deadline = dl.orNever(deadline)
+    elementmap = ElementMap()
+    for _i, (key, element) in enumerate(block._elementmap._map.items()):
+        if _i % dl.CHECK_INTERVAL == 0:
+            deadline.check()
+        clone = _shallowCopy(element)
+        parent = element._cluster
+        clone._cluster = clusters.get(parent._id) if parent is not None else None
+        elementmap._map[key] = clone
+    elementmap.setToken(block._elementmap.token())
+    # pulses
+    pulsemap = PulseMap()
+    for key, pulse in block._pulsemap._map.items():
+        pulsemap._map[key] = _shallowCopy(pulse)
+    clone = ProcessBlock(
+        {"map": clustermap, "data": block._data["clusters"]},
+        {"map": elementmap, "data": block._data["elements"]},
+        {"map": pulsemap, "data": block._data["pulses"]},
+        block._isDiscovery,
+        diagnostics,
+        deadline
+    )
+    clone._isProcessed = True
+    clone._valuecounts = block._valuecounts
+    return clone
+
+# [Public]
+def applyDeltas(block, records, diagnostics=None):
+    """
+        Returns copy of the processed block with delta records applied.
+        Record either upserts element, {"op": "upsert", "data": element}
+        where element is the same object as in elements file, or deletes
+        element by id, {"op": "delete", "id": element id}. Records are
+        applied in order, and applying record twice gives the same result.
+        Only elements in delta and stores of their pulses are changed, other
+        elements are copied, so original block stays untouched.
+
+        Args:
+            block (ProcessBlock): processed block
+            records (list<dict>): delta records
+            diagnostics (Diagnostics): diagnostics to report failures
+
+        Returns:
+            ProcessBlock: processed copy of the block with deltas applied
+    """
+    misc.checkTypeAgainst(type(records), ListType, __file__)
+    diagnostics = diag.orWarnings(diagnostics)
+    clone = cloneBlock(block, block._diagnostics)
+    counts = dict(_valueCounts(block))
+    clustermap = clone._clustermap; elementmap = clone._elementmap
+    # features, which value counts were copied, and values changed
+    touched = {}; changed = {}
+    def count(element, delta):
+        for feature in element.features():
+            fid = feature.id(); value = feature.value()
+            if not _isHashable(value):
+                continue
+            if fid not in touched:
+                counts[fid] = Counter(counts.get(fid, {}))
+                touched[fid] = feature
+                changed[fid] = set()
+            counts[fid][value] += delta
+            changed[fid].add(value)
+    failures = 0
+    for record in records:
+        try:
+            op = record[DELTA_OP]
+            if op == DELTA_UPSERT:
+                obj = record[DELTA_DATA]
+                clid = obj["cluster"]
+                cluster = clustermap.get(misc.generateId(str(clid).strip())) \
+                    if clid is not None else None
+                element = _processElementObject(obj, {clid: {"cluster": cluster}})
+                if element.cluster() is None:
+                    element._cluster = _unknownClusterOf(clustermap)
+                key = element.id()
+            elif op == DELTA_DELETE:
+                element = None
+                key = misc.generateId(str(record[DELTA_ID]).strip())
+            else:
+                misc.raiseValueError("Unknown delta operation", __file__)
+        except:
+            failures += 1
+            continue
+        previous = elementmap.get(key)
+        if previous is not None:
+            count(previous, -1)
+            elementmap.remove(key)
+        if element is not None:
+            count(element, 1)
+            elementmap.add(element)
+    # rebuild stores of pulses that were changed, new features are
+    # discovered, if block discovers pulses
+    discovered = []
+    for fid, feature in touched.items():
+        values = counts[fid]; pulse = clone._pulsemap.get(fid)
+        store = set(pulse._store) if pulse is not None else None
+        # only changed values are checked, so cost does not depend on
+        # number of distinct values
+        for value in changed[fid]:
+            if values[value] <= 0:
+                del values[value]
+                if store is not None:
+                    store.discard(value)
+            elif store is not None and type(value) is pulse.type():
+                store.add(value)
+        if pulse is not None:
+            pulse._store = store
+            if type(pulse) is DynamicPulse and pulse._sorted is not None:
+                pulse._sorted = _updateSorted(pulse, changed[fid], values)
+        elif clone._isDiscovery and len(counts[fid]) > 0:
+            obj = {"name": feature.name(), "desc": feature.desc(),
+                "sample": feature.value()}
+            if feature.type() in [IntType, FloatType]:
+                obj["dynamic"] = True
+                obj["priority"] = 1
+            discovered.append(obj)
+    if discovered:
+        valmap = dict((x, list(counts[x].elements())) for x in touched.keys())
+        parsePulses(discovered, clone._pulsemap, valmap, diagnostics)
+    clone._valuecounts = counts
+    clone._diagnostics = diagnostics
+    if failures > 0:
+        msg = "%d delta records could not be applied" %(failures)
+        diagnostics.report(diag.DELTA_RECORD_FAILED, msg)
+    return clone
+
+# [Private]
+def _updateSorted(pulse, changed, counts):
+    """
+        Returns copy of sorted values of dynamic pulse with changed values
+        set to their new counts. Values are inserted and removed with binary
+        search, so cost depends on number of changed values only. Sketch of
+        values cannot remove values, it is built again, when it is needed.
+
+        Args:
+            pulse (DynamicPulse): dynamic pulse
+            changed (set<obj>): changed values
+            counts (Counter): new number of elements for each value
+
+        Returns:
+            SortedValues: updated sorted values
+    """
+    values = pulse._sorted.copy()
+    for value in changed:
+        if type(value) is not pulse.type():
+            continue
+        delta = counts[value] - values.count(value)
+        if delta > 0:
+            values.add(value, delta)
+        elif delta < 0:
+            values.remove(value, -delta)
+    return values
+
+# [Private]
+def _valueCounts(block):
+    """
+        Returns number of elements for each feature value of the block.
+        Counts are computed once and kept in block, as they do not change.
+
+        Args:
+            block (ProcessBlock): processed block
+
+        Returns:
+            dict<str, Counter>: map of feature id and counts of values
+    """
+    if block._valuecounts is None:
+        counts = {}
+        for element in block._elementmap._map.values():
+            for feature in element.features():
+                if not _isHashable(feature.value()):
+                    continue
+                if feature.id() not in counts:
+                    counts[feature.id()] = Counter()
+                counts[feature.id()][feature.value()] += 1
+        block._valuecounts = counts
+    return block._valuecounts
+
+# [Private]
+def _shallowCopy(obj):
+    """
+        Returns shallow copy of the object, that shares attribute values with
+        original. It is faster than "copy.copy" for plain objects, as it
+        skips pickle protocol.
+
+        Args:
+            obj (obj): object to copy
+
+        Returns:
+            obj: copy of the object
+    """
+    clone = obj.__class__.__new__(obj.__class__)
+    clone.__dict__.update(obj.__dict__)
+    return clone
+
+# [Private]
+def _isHashable(value):
+    """
+        Returns True, if value can be counted, i.e. it is hashable.
+
+        Args:
+            value (obj): feature value
+
+        Returns:
+            bool: flag showing whether value is hashable
+    """
+    try:
+        hash(value)
+        return True
+    except TypeError:
+        return False
+
 ### Parsing clusters
 # [Public]
-def parseClusters(objlist, clustermap, idmapper={}):
+def parseClusters(objlist, clustermap, idmapper={}, diagnostics=None):
     """
         Parses clusters using objects list, cluster map and idmapper.
 
@@ -97,6 +378,7 @@ def parseClusters(objlist, clustermap, idmapper={}):
             objlist (list<dict>): list of objects to parse into clusters
             clustermap (ClusterMap): map to add clusters
             idmapper (dict<str, obj>):  util dictionary
+            diagnostics (Diagnostics): diagnostics to report failures
 
         Returns:
             dict<str, obj>: util dictionary to use later
@@ -104,6 +386,7 @@ def parseClusters(objlist, clustermap, idmapper={}):
     misc.checkTypeAgainst(type(objlist), ListType, __file__)
     misc.checkTypeAgainst(type(clustermap), ClusterMap, __file__)
     misc.checkTypeAgainst(type(idmapper), DictType, __file__)
+    diagnostics = diag.orWarnings(diagnostics)
     # number of failed clusters
     parse_failures = 0
     for obj in objlist:
@@ -133,23 +416,27 @@ def parseClusters(objlist, clustermap, idmapper={}):
     # see if there is anything failed
     if parse_failures > 0:
         msg = "%d cluster entries could not be parsed" %(parse_failures)
-        warnings.warn(msg, UserWarning)
+        diagnostics.report(diag.CLUSTER_PARSE_FAILED, msg)
     if assign_failures > 0:
         msg = "%d failures to assign cluster parent" %(assign_failures)
-        warnings.warn(msg, UserWarning)
+        diagnostics.report(diag.CLUSTER_PARENT_FAILED, msg)
     # return idmapper to use it later
     return idmapper
 
 ### Parsing elements
 # [Public]
-def parseElements(objlist, elementmap, idmapper={}):
+def parseElements(objlist, elementmap, idmapper={}, diagnostics=None,
+        deadline=None):
     """
         Parses elements using objects list, element map and idmapper.
+        Deadline is checked every CHECK_INTERVAL objects.
 
         Args:
             objlist (list<dict>): list of objects to parse into clusters
             elementmap (ElementMap): map to add clusters
             idmapper (dict<str, obj>):  util dictionary
+            diagnostics (Diagnostics): diagnostics to report failures
+            deadline (Deadline): deadline of the request
 
         Returns:
             dict<str, obj>: util dictionary to use later
@@ -157,12 +444,17 @@ def parseElements(objlist, elementmap, idmapper={}):
     misc.checkTypeAgainst(type(objlist), ListType, __file__)
     misc.checkTypeAgainst(type(elementmap), ElementMap, __file__)
     misc.checkTypeAgainst(type(idmapper), DictType, __file__)
+    diagnostics = diag.orWarnings(diagnostics)
+    deadline = dl.orNever(deadline)
     # failures
     parse_failures = 0
     # parse elements
     # map for values
     valmap = {}
-    for obj in objlist:
+    for _i, obj in enumerate(objlist):
+        # checked outside of "try", as it catches everything
+        if _i % dl.CHECK_INTERVAL == 0:
+            deadline.check()
         element = None
         try:
             element = _processElementObject(obj, idmapper)
@@ -181,13 +473,13 @@ def parseElements(objlist, elementmap, idmapper={}):
     # see if there is anything failed
     if parse_failures > 0:
         msg = "%d element entries could not be parsed" %(parse_failures)
-        warnings.warn(msg, UserWarning)
+        diagnostics.report(diag.ELEMENT_PARSE_FAILED, msg)
     # return idmapper
     return valmap
 
 ### Parsing pulses
 # [Public]
-def parsePulses(objlist, pulsemap, idmapper={}):
+def parsePulses(objlist, pulsemap, idmapper={}, diagnostics=None):
     """
         Parses clusters using objects list, pulse map and idmapper.
 
@@ -195,6 +487,7 @@ def parsePulses(objlist, pulsemap, idmapper={}):
             objlist (list<dict>): list of objects to parse into pulses
             clustermap (PulseMap): map to add clusters
             idmapper (dict<str, obj>):  util dictionary
+            diagnostics (Diagnostics): diagnostics to report failures
 
         Returns:
             dict<str, obj>: util dictionary to use later
@@ -202,6 +495,7 @@ def parsePulses(objlist, pulsemap, idmapper={}):
     misc.checkTypeAgainst(type(objlist), ListType, __file__)
     misc.checkTypeAgainst(type(pulsemap), PulseMap, __file__)
     misc.checkTypeAgainst(type(idmapper), DictType, __file__)
+    diagnostics = diag.orWarnings(diagnostics)
     # failures
     parse_failures = 0
     # parse pulse objects
@@ -213,6 +507,14 @@ def parsePulses(objlist, pulsemap, idmapper={}):
             if pulse.id() in idmapper:
                 for vl in idmapper[pulse.id()]:
                     pulse.addValueToStore(vl)
+            # dynamic pulse keeps values sorted for ranking
+            if type(pulse) is DynamicPulse:
+                pulse._sorted = SortedValues([x for x in
+                    idmapper.get(pulse.id(), []) if type(x) is pulse.type()])
+                # sketch for approximate ranking is built at load time, so
+                # the first query does not pay for it
+                if pulse._sorted.size() >= SKETCH_MIN_SIZE:
+                    pulse._sorted.sketch()
         except:
             # TODO: do not forget to log it!
             parse_failures += 1
@@ -221,15 +523,31 @@ def parsePulses(objlist, pulsemap, idmapper={}):
             pulsemap.add(pulse)
     if parse_failures > 0:
         msg = "%d pulse entries could not be parsed" %(parse_failures)
-        warnings.warn(msg, UserWarning)
+        diagnostics.report(diag.PULSE_PARSE_FAILED, msg)
     # return idmapper
     return idmapper
 
 
 ### Checking elements for None parent
+# [Public]
+def unknownCluster():
+    """
+        Returns new instance of unknown cluster with the same id, name and
+        description as UNKNOWN_CLUSTER template.
+
+        Returns:
+            Cluster: unknown cluster instance
+    """
+    cluster = Cluster(None, UNKNOWN_CLUSTER.name(), UNKNOWN_CLUSTER.desc())
+    cluster._id = UNKNOWN_CLUSTER.id()
+    return cluster
+
+# [Public]
 def assignUnknownCluster(clustermap, elementmap):
     """
-        Assigns unknown cluster to the element, if parent is None.
+        Assigns unknown cluster to the element, if parent is None. Unknown
+        cluster is created once per cluster map and never shared between
+        maps.
 
         Args:
             clustermap (ClusterMap): cluster map
@@ -239,9 +557,25 @@ def assignUnknownCluster(clustermap, elementmap):
     misc.checkTypeAgainst(type(elementmap), ElementMap, __file__)
     for element in elementmap._map.values():
         if element.cluster() is None:
-            element._cluster = UNKNOWN_CLUSTER
-            if not clustermap.has(UNKNOWN_CLUSTER.id()):
-                clustermap.add(UNKNOWN_CLUSTER)
+            element._cluster = _unknownClusterOf(clustermap)
+
+# [Private]
+def _unknownClusterOf(clustermap):
+    """
+        Returns unknown cluster of the cluster map, adds it, if map does not
+        have one.
+
+        Args:
+            clustermap (ClusterMap): cluster map
+
+        Returns:
+            Cluster: unknown cluster of the map
+    """
+    cluster = clustermap.get(UNKNOWN_CLUSTER.id())
+    if cluster is None:
+        cluster = unknownCluster()
+        clustermap.add(cluster)
+    return cluster
 
 
 ### Processing functions
@@ -321,19 +655,20 @@ def _processPulseObject(obj, idmapper={}):
         return StaticPulse(name, desc, sample)
 
 # [Private]
-def _createPulseObjects(elementmap):
+def _createPulseObjects(elementmap, diagnostics=None):
     """
         Returns list of objects for creating pulses.
 
         Args:
             elementmap (ElementMap): map of elements
+            diagnostics (Diagnostics): diagnostics to report discovery
 
         Returns:
             list<obj>: list of objects to create pulses
     """
     misc.checkTypeAgainst(type(elementmap), ElementMap, __file__)
     msg = "Hmmm, though pulses are not specified, system discovered some"
-    warnings.warn(msg, UserWarning)
+    diag.orWarnings(diagnostics).report(diag.PULSES_DISCOVERED, msg)
     # list of maps to build pulses
     mp = {}
     for element in elementmap._map.values():
@@ -155,11 +155,26 @@ class DynamicPulse(Pulse):
         Attributes:
             _static (bool): shows currently selected mode
             _dynamic (Dynamic): dynamic attribute
+            _sorted (SortedValues): sorted values of all elements, None if
+                pulse was not created by processor
     """
     def __init__(self, name, desc, sample, priority, static=False):
         super(DynamicPulse, self).__init__(name, desc, sample)
         self._static = bool(static)
         self._dynamic = Dynamic(priority)
+        self._sorted = None
+
+    # [Public]
+    def sortedValues(self):
+        """
+            Returns sorted values of the feature of all elements, that are
+            maintained by processor, or None, if they are not known. Values
+            must not be changed, as they are shared between copies of pulse.
+
+            Returns:
+                SortedValues: sorted values with number of elements
+        """
+        return self._sorted
 
     # [Public]
     def setDefaultValue(self, default):
@@ -9,6 +9,7 @@ import warnings
 import analytics.utils.misc as misc
 import analytics.exceptions.exceptions as ex
 import analytics.core.processor.processor as processor
+import analytics.utils.diagnostics as diag
 from types import ListType, DictType
 from analytics.core.map.dataitemmap import DataItemMap
 from analytics.core.map.clustermap import ClusterMap
@@ -20,6 +21,7 @@ from analytics.core.pulse import DynamicPulse, StaticPulse, Pulse
 from analytics.core.attribute.dynamic import Dynamic
 from analytics.core.attribute.feature import Feature
 from analytics.algorithms.rank import RSYS
+from analytics.utils.deadline import Deadline
 
 
 # some general input to test
@@ -142,6 +144,18 @@ class Processor_TestSequence(unittest.TestCase):
         self.assertEqual(len(exm.features()), 1)
         self.assertEqual(exm.features()[0].name(), "dir")
 
+    def test_processor_parseElements_deadline(self):
+        deadline = Deadline()
+        deadline.cancel()
+        with self.assertRaises(ex.AnalyticsTimeoutError):
+            processor.parseElements([self._elmobj], self._elementmap, {},
+                diag.Diagnostics(), deadline)
+        self.assertEqual(len(self._elementmap._map), 0)
+        # deadline is checked every CHECK_INTERVAL elements
+        processor.parseElements([self._elmobj], self._elementmap, {},
+            diag.Diagnostics(), Deadline(60))
+        self.assertEqual(len(self._elementmap._map), 1)
+
     def test_processor_parsePulses(self):
         objlist = [self._plsobj, {}]
         with warnings.catch_warnings(record=True) as w:
@@ -151,6 +165,20 @@ class Processor_TestSequence(unittest.TestCase):
             self.assertTrue(issubclass(w[0].category, UserWarning))
         self.assertEqual(len(self._pulsemap._map), 1)
 
+    def test_processor_parseWithDiagnostics(self):
+        diagnostics = diag.Diagnostics()
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter("always")
+            processor.parseClusters([{}, {}], ClusterMap(), {}, diagnostics)
+            processor.parseElements([{}], ElementMap(), {}, diagnostics)
+            processor.parsePulses([{}], PulseMap(), {}, diagnostics)
+            # nothing is reported through warnings
+            self.assertEqual(len(w), 0)
+        self.assertEqual(diagnostics.count(), 3)
+        self.assertEqual(diagnostics.count(diag.CLUSTER_PARSE_FAILED), 1)
+        self.assertEqual(diagnostics.count(diag.ELEMENT_PARSE_FAILED), 1)
+        self.assertEqual(diagnostics.count(diag.PULSE_PARSE_FAILED), 1)
+
     def test_processor_processBlock(self):
         clusters = {"map": self._clustermap, "data": [self._clrobj]}
         elements = {"map": self._elementmap, "data": [self._elmobj]}
@@ -212,6 +240,133 @@ class Processor_TestSequence(unittest.TestCase):
         )
 
 
+    def test_processor_unknownClusterPerBlock(self):
+        elmobj = dict(self._elmobj); elmobj["cluster"] = None
+        blocks = []
+        for _i in range(2):
+            block = processor.ProcessBlock(
+                {"map": ClusterMap(), "data": []},
+                {"map": ElementMap(), "data": [elmobj]},
+                {"map": PulseMap(), "data": []}
+            )
+            blocks.append(processor.processWithBlock(block))
+        key = processor.UNKNOWN_CLUSTER.id()
+        first = blocks[0]._clustermap.get(key)
+        second = blocks[1]._clustermap.get(key)
+        self.assertNotEqual(first, None)
+        self.assertNotEqual(second, None)
+        # the same id, but different instances
+        self.assertFalse(first is second)
+        self.assertFalse(first is processor.UNKNOWN_CLUSTER)
+        self.assertEqual(first.name(), processor.UNKNOWN_CLUSTER.name())
+        element = blocks[0]._elementmap._map.values()[0]
+        self.assertTrue(element.cluster() is first)
+
+    def test_processor_cloneBlock(self):
+        clrobjs = [self._clrobj, {"id": "#2", "name": "#2", "desc": "#2",
+            "parent": "#1"}]
+        elmobjs = [self._elmobj, {"id": "#2", "name": "#2", "desc": "#2",
+            "cluster": "#2", "dir": "down"}, {"id": "#3", "name": "#3",
+            "desc": "#3", "cluster": None, "dir": "up"}]
+        block = processor.ProcessBlock(
+            {"map": self._clustermap, "data": clrobjs},
+            {"map": self._elementmap, "data": elmobjs},
+            {"map": self._pulsemap, "data": [self._plsobj]}
+        )
+        with self.assertRaises(ex.AnalyticsStandardError):
+            processor.cloneBlock(block)
+        block = processor.processWithBlock(block)
+        clone = processor.cloneBlock(block)
+        self.assertEqual(clone._isProcessed, True)
+        self.assertEqual(processor.processWithBlock(clone), clone)
+        # the same content
+        self.assertEqual(clone._clustermap.getJSON(),
+            block._clustermap.getJSON())
+        self.assertEqual(sorted(clone._elementmap._map.keys()),
+            sorted(block._elementmap._map.keys()))
+        self.assertEqual(clone._pulsemap.getJSON(), block._pulsemap.getJSON())
+        # hierarchy is relinked to copies
+        for key, cluster in clone._clustermap._map.items():
+            self.assertFalse(cluster is block._clustermap._map[key])
+            if cluster.parent() is not None:
+                self.assertTrue(
+                    cluster.parent() is clone._clustermap.get(cluster.parent().id())
+                )
+        for element in clone._elementmap._map.values():
+            self.assertTrue(
+                element.cluster() is clone._clustermap.get(element.cluster().id())
+            )
+        # changes of copy do not affect original block
+        element = clone._elementmap._map.values()[0]
+        element.setRank(RSYS.O)
+        original = block._elementmap.get(element.id())
+        self.assertEqual(original.rank(), RSYS.UND_RANK)
+        clone._pulsemap._map.values()[0].setDefaultValue(None)
+        clone._clustermap.remove(clone._clustermap._root.keys()[0])
+        self.assertEqual(len(block._clustermap._map), 3)
+        self.assertEqual(len(block._clustermap._root), 2)
+
+    def test_processor_applyDeltas(self):
+        elmobjs = [
+            {"id": "#1", "name": "#1", "desc": "#1", "cluster": "#1",
+                "dir": "up", "price": 1},
+            {"id": "#2", "name": "#2", "desc": "#2", "cluster": "#1",
+                "dir": "down", "price": 2}
+        ]
+        plsobjs = [{"name": "dir", "desc": "dir", "sample": "up"},
+            {"name": "price", "desc": "price", "sample": 1}]
+        block = processor.processWithBlock(processor.ProcessBlock(
+            {"map": self._clustermap, "data": [self._clrobj]},
+            {"map": self._elementmap, "data": elmobjs},
+            {"map": self._pulsemap, "data": plsobjs}
+        ))
+        records = [
+            # update, insert into unknown cluster, delete, invalid records
+            {"op": "upsert", "data": {"id": "#1", "name": "#1", "desc": "#1",
+                "cluster": "#1", "dir": "flat", "price": 1}},
+            {"op": "upsert", "data": {"id": "#3", "name": "#3", "desc": "#3",
+                "cluster": "#0", "dir": "up", "price": 3}},
+            {"op": "delete", "id": "#2"},
+            {"op": "delete", "id": "#4"},
+            {"op": "merge", "id": "#1"},
+            {"op": "upsert", "data": {"id": "#5"}}
+        ]
+        diagnostics = diag.Diagnostics()
+        updated = processor.applyDeltas(block, records, diagnostics)
+        self.assertEqual(diagnostics.count(diag.DELTA_RECORD_FAILED), 1)
+        self.assertEqual(sorted([x.name() for x in
+            updated._elementmap._map.values()]), ["#1", "#3"])
+        pulses = dict((x.name(), x) for x in updated._pulsemap._map.values())
+        self.assertEqual(sorted(pulses["dir"].store()), ["flat", "up"])
+        self.assertEqual(sorted(pulses["price"].store()), [1, 3])
+        element = updated._elementmap.get(misc.generateId("#3"))
+        self.assertEqual(element.cluster().id(), processor.UNKNOWN_CLUSTER.id())
+        self.assertTrue(element.cluster() is
+            updated._clustermap.get(element.cluster().id()))
+        # original block is not changed
+        self.assertEqual(len(block._elementmap._map), 2)
+        pulses = dict((x.name(), x) for x in block._pulsemap._map.values())
+        self.assertEqual(sorted(pulses["dir"].store()), ["down", "up"])
+        # applying the same records again gives the same result
+        again = processor.applyDeltas(updated, records, diag.Diagnostics())
+        self.assertEqual(sorted(again._elementmap._map.keys()),
+            sorted(updated._elementmap._map.keys()))
+        self.assertEqual(again._pulsemap.getJSON(), updated._pulsemap.getJSON())
+        # value that is left by one of two elements stays in store
+        records = [{"op": "delete", "id": "#3"}]
+        final = processor.applyDeltas(again, records, diag.Diagnostics())
+        pulses = dict((x.name(), x) for x in final._pulsemap._map.values())
+        self.assertEqual(sorted(pulses["dir"].store()), ["flat"])
+        self.assertEqual(sorted(pulses["price"].store()), [1])
+        # sorted values of dynamic pulse follow elements
+        self.assertEqual(pulses["price"].sortedValues().values(), [1])
+        self.assertEqual(pulses["price"].sortedValues().total(), 1)
+        pulses = dict((x.name(), x) for x in updated._pulsemap._map.values())
+        self.assertEqual(pulses["price"].sortedValues().values(), [1, 3])
+        pulses = dict((x.name(), x) for x in block._pulsemap._map.values())
+        self.assertEqual(pulses["price"].sortedValues().values(), [1, 2])
+        self.assertEqual(pulses["dir"].__class__, StaticPulse)
+
     def test_processor_discoverPulses(self):
         clusters = {"map": self._clustermap, "data": [self._clrobj]}
         elements = {"map": self._elementmap, "data": [self._elmobj]}
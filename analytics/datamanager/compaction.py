@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+
+'''
+Copyright 2015 Ivan Sadikov
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+
+# import os, sys and update path
+import os
+import sys
+
+# set default path as an external directory of the module
+DIR_PATH = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+)
+sys.path.append(DIR_PATH)
+
+# import libs
+import json
+from collections import OrderedDict
+from types import ListType
+# import classes
+import analytics.utils.misc as misc
+import analytics.datamanager.datamanager as datamanager
+import analytics.loading.jsonloader as jsl
+import analytics.core.processor.processor as processor
+
+"""
+    Compaction folds delta files of dataset into elements file and removes
+    them from manifest, so dataset is loaded from one file again. Every step
+    replaces a file atomically, and delta records can be applied twice with
+    the same result, so interrupted compaction leaves dataset valid. Tool is
+    meant to be run periodically, e.g. by cron:
+        python analytics/datamanager/compaction.py [searchpath] [mindeltas]
+"""
+
+# only json datasets can be written back
+_JSON = "json"
+
+
+# [Public]
+def foldRecords(objlist, records):
+    """
+        Applies delta records to list of element objects the same way
+        processor applies them to element map. Updated elements keep their
+        position, new elements are appended. Records that cannot be applied
+        are skipped.
+
+        Args:
+            objlist (list<dict>): element objects of elements file
+            records (list<dict>): delta records
+
+        Returns:
+            tuple<list<dict>, int>: folded element objects, skipped records
+    """
+    misc.checkTypeAgainst(type(objlist), ListType, __file__)
+    misc.checkTypeAgainst(type(records), ListType, __file__)
+    # elements without id are kept as they are, processor reports them
+    elements = OrderedDict()
+    for _i in range(len(objlist)):
+        obj = objlist[_i]
+        key = _elementKey(obj)
+        elements[key if key is not None else ("#", _i)] = obj
+    skipped = 0
+    for record in records:
+        try:
+            op = record[processor.DELTA_OP]
+            if op == processor.DELTA_UPSERT:
+                obj = record[processor.DELTA_DATA]
+                key = _elementKey(obj)
+                if key is None:
+                    misc.raiseValueError("Element without id", __file__)
+                elements[key] = obj
+            elif op == processor.DELTA_DELETE:
+                elements.pop(str(record[processor.DELTA_ID]).strip(), None)
+            else:
+                misc.raiseValueError("Unknown delta operation", __file__)
+        except BaseException:
+            skipped += 1
+    return (elements.values(), skipped)
+
+# [Public]
+def compactDataset(path):
+    """
+        Compacts dataset of the manifest. Elements file is replaced with
+        folded elements, then manifest is replaced without delta files, and
+        only then delta files are removed. Does nothing, if dataset has no
+        delta files.
+
+        Args:
+            path (str): path to the manifest file
+
+        Returns:
+            dict<str, obj>: dataset id, number of deltas, records, elements
+    """
+    manifest = jsl.JsonLoader(path).processData()
+    dataset = datamanager.Dataset(manifest, os.path.dirname(path))
+    result = {"id": dataset._id, "deltas": len(dataset._deltas), "records": 0,
+        "skipped": 0, "elements": None}
+    if not dataset._deltas:
+        return result
+    types = [dataset._elements[datamanager.TYPE]] + \
+        [x[datamanager.TYPE] for x in dataset._deltas]
+    if len([x for x in types if x != _JSON]) > 0:
+        misc.raiseStandardError("Only json datasets can be compacted", __file__)
+    objlist = jsl.JsonLoader(dataset._elements[datamanager.PATH]).processData()
+    records = []
+    for filepath in dataset.deltaFiles():
+        records.extend(jsl.JsonLoader(filepath).processData())
+    folded, skipped = foldRecords(objlist, records)
+    _writeJSON(dataset._elements[datamanager.PATH], folded)
+    del manifest[datamanager.DATA][datamanager.DATA_DEL]
+    _writeJSON(path, manifest)
+    for filepath in dataset.deltaFiles():
+        if os.path.isfile(filepath):
+            os.remove(filepath)
+    result["records"] = len(records)
+    result["skipped"] = skipped
+    result["elements"] = len(folded)
+    return result
+
+# [Public]
+def compactDatasets(searchpath=None, mindeltas=1):
+    """
+        Compacts every dataset in search path that has at least "mindeltas"
+        delta files. Failure of one dataset does not stop others.
+
+        Args:
+            searchpath (str): search path for datasets
+            mindeltas (int): minimum number of delta files to compact
+
+        Returns:
+            dict<str, dict>: map of manifest path and result or error
+    """
+    staging = datamanager.DataManager().scanDatasets(searchpath)
+    results = {}
+    for path in sorted(staging._manifests.values()):
+        try:
+            manifest = jsl.JsonLoader(path).processData()
+            deltas = manifest[datamanager.DATA].get(datamanager.DATA_DEL, [])
+            if len(deltas) < max(mindeltas, 1):
+                continue
+            results[path] = compactDataset(path)
+        except BaseException as e:
+            results[path] = {"error": str(e)}
+    return results
+
+# [Private]
+def _elementKey(obj):
+    """
+        Returns key of element object, that is the same for element and its
+        delta records, or None, if object has no id.
+
+        Args:
+            obj (dict<str, obj>): element object
+
+        Returns:
+            str: element key
+    """
+    if type(obj) is not dict or obj.get("id") is None:
+        return None
+    return str(obj["id"]).strip()
+
+# [Private]
+def _writeJSON(path, obj):
+    """
+        Writes json object into temporary file next to path and renames it,
+        so readers see either old or new file.
+
+        Args:
+            path (str): file path
+            obj (obj): json object
+    """
+    temp = "%s.tmp" % (path)
+    with open(temp, "w") as f:
+        json.dump(obj, f)
+    os.rename(temp, path)
+
+
+if __name__ == '__main__':
+    import projectpaths as paths
+    searchpath = sys.argv[1] if len(sys.argv) > 1 else paths.DATASETS_PATH
+    mindeltas = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    results = compactDatasets(searchpath, mindeltas)
+    print ""
+    print "### Compaction: %s ###" % (searchpath)
+    print "-" * 70
+    for path in sorted(results.keys()):
+        res = results[path]
+        if "error" in res:
+            print "%s  error: %s" % (path, res["error"])
+        else:
+            print "%s  deltas: %d  records: %d  skipped: %d  elements: %d" % (
+                path, res["deltas"], res["records"], res["skipped"],
+                res["elements"])
+    print ""
@@ -20,10 +20,15 @@ limitations under the License.
 # import libs
 import os
 import json
+import hashlib
+import threading
 from types import DictType, StringType
 # import classes
 import analytics.utils.misc as misc
 import analytics.loading.jsonloader as jsl
+import analytics.utils.workers as workers
+import analytics.utils.metrics as metrics
+import analytics.utils.timings as tm
 
 # global parameters, like manifest name and default directory
 _MANIFEST_JSON = "manifest.json"
@@ -38,10 +43,37 @@ DATA = "data"
 DATA_CLU = "clusters"
 DATA_ELE = "elements"
 DATA_PUL = "pulses"
+DATA_DEL = "deltas"
 FILE = "file"
 PATH = "path"
 TYPE = "type"
 
+# metrics of scans of datasets directory
+SCAN_DURATION = metrics.REGISTRY.histogram("pulsar_dataset_scan_seconds",
+    "Time to scan directory and parse manifests of datasets")
+MANIFEST_ERRORS = metrics.REGISTRY.counter("pulsar_manifest_errors_total",
+    "Manifests that could not be parsed")
+
+
+# [Public]
+def fileStamp(path):
+    """
+        Returns stamp of the file that consists of path, size and
+        modification time. Stamp changes when file changes, missing file has
+        its own stamp.
+
+        Args:
+            path (str): file path
+
+        Returns:
+            str: file stamp
+    """
+    try:
+        st = os.stat(path)
+        return "%s:%d:%r" % (path, st.st_size, st.st_mtime)
+    except OSError:
+        return "%s:-1:-1" % (path)
+
 
 class Dataset(object):
     """
@@ -56,6 +88,8 @@ class Dataset(object):
             _clusters (dict<str, str>): clusters information (path and type)
             _elements (dict<str, str>): elements information (path and type)
             _pulses (dict<str, str>): pulses information (path and type)
+            _deltas (list<dict>): element delta files (path and type) in order
+                they are applied
     """
     def __init__(self, obj, dr):
         misc.checkTypeAgainst(type(obj), DictType, __file__)
@@ -90,6 +124,45 @@ class Dataset(object):
                 PATH: self._filepath(dr, _pulses_filename, _pulses_filetype),
                 TYPE: _pulses_filetype
             }
+        # delta files are optional
+        self._deltas = []
+        for _delta in _data.get(DATA_DEL, []):
+            self._deltas.append({
+                PATH: self._filepath(dr, _delta[FILE], _delta[TYPE]),
+                TYPE: _delta[TYPE]
+            })
+
+    # [Public]
+    def files(self):
+        """
+            Returns list of data file paths of the dataset.
+
+            Returns:
+                list<str>: list of file paths
+        """
+        data = [self._clusters, self._elements, self._pulses] + self._deltas
+        return [x[PATH] for x in data if x is not None]
+
+    # [Public]
+    def baseFiles(self):
+        """
+            Returns list of data file paths without delta files.
+
+            Returns:
+                list<str>: list of file paths
+        """
+        data = [self._clusters, self._elements, self._pulses]
+        return [x[PATH] for x in data if x is not None]
+
+    # [Public]
+    def deltaFiles(self):
+        """
+            Returns list of delta file paths in order they are applied.
+
+            Returns:
+                list<str>: list of file paths
+        """
+        return [x[PATH] for x in self._deltas]
 
     # [Public]
     def getJSON(self):
@@ -132,28 +205,66 @@ class DataManager(object):
 
         Attributes:
             _manifests (dir<str, str>): map of dirs and manifest file paths
-            _datasets (dir<str, Dataset>): map of datasets
+            _registry (tuple<dict, dict>): map of datasets and map of dataset
+                ids and versions, tuple is replaced as a whole, so datasets
+                and versions are always read from the same scan
             _directory (str): search directory
+            _lock (Lock): lock to serialise reloading of datasets
     """
     def __init__(self):
         # declare attributes
-        self._manifests = {}; self._datasets = {}; self._directory = ""
+        self._manifests = {}; self._registry = ({}, {}); self._directory = ""
+        self._lock = threading.Lock()
         self.resetToDefault()
 
+    @property
+    def _datasets(self):
+        """
+            Returns map of datasets of the current registry.
+
+            Returns:
+                dict<str, Dataset>: map of datasets
+        """
+        return self._registry[0]
+
+    @property
+    def _versions(self):
+        """
+            Returns map of dataset ids and versions of the current registry.
+
+            Returns:
+                dict<str, str>: map of dataset ids and versions
+        """
+        return self._registry[1]
+
     # [Private]
-    def _findManifests(self, directory):
+    def _findManifests(self, directory, maxworkers=1):
         """
             Scans directory and collects manifests paths into _manifests
-            attribute.
+            attribute. Subdirectories of the top level are scanned
+            concurrently, if more than one worker is allowed.
 
             Args:
                 directory (str): directory to search in
+                maxworkers (int): maximum number of threads to scan with
         """
         misc.checkTypeAgainst(type(directory), StringType, __file__)
-        for root, dirs, files in os.walk(directory):
-            for file in files:
-                if file == _MANIFEST_JSON:
-                    self._manifests[root] = os.path.join(root, file)
+        if not os.path.isdir(directory):
+            return
+        # walk every subtree and return (root, manifest path) pairs
+        def walk(subdirectory):
+            found = []
+            for root, dirs, files in os.walk(subdirectory):
+                if _MANIFEST_JSON in files:
+                    found.append((root, os.path.join(root, _MANIFEST_JSON)))
+            return found
+        entries = [os.path.join(directory, x) for x in os.listdir(directory)]
+        subdirectories = [x for x in entries if os.path.isdir(x)]
+        if os.path.isfile(os.path.join(directory, _MANIFEST_JSON)):
+            self._manifests[directory] = os.path.join(directory, _MANIFEST_JSON)
+        for found in workers.mapParallel(walk, subdirectories, maxworkers):
+            for root, path in found:
+                self._manifests[root] = path
 
     # [Private]
     def _parseManifest(self, path):
@@ -168,6 +279,27 @@ class DataManager(object):
             Returns:
                 bool: status of parsing operation
         """
+        path, dataset, version = self._readManifest(path)
+        if dataset is None:
+            return False
+        else:
+            self._datasets[dataset._id] = dataset
+            self._versions[dataset._id] = version
+        return True
+
+    # [Private]
+    def _readManifest(self, path):
+        """
+            Reads manifest and computes version of the dataset without
+            changing instance, so manifests can be read concurrently. If
+            manifest cannot be parsed, dataset and version are None.
+
+            Args:
+                path (str): path to the manifest file
+
+            Returns:
+                tuple<str, Dataset, str>: path, dataset and its version
+        """
         # load from path, if it fails, skip it
         dataset = None
         try:
@@ -178,31 +310,106 @@ class DataManager(object):
             dataset = Dataset(obj, os.path.dirname(path))
         except:
             dataset = None
-
         if dataset is None:
-            return False
-        else:
-            self._datasets[dataset._id] = dataset
-        return True
+            MANIFEST_ERRORS.inc()
+            return (path, None, None)
+        return (path, dataset, self._computeVersion(path, dataset))
+
+    # [Private]
+    def _computeVersion(self, path, dataset):
+        """
+            Computes version of the dataset as a hash of manifest path, and
+            size and modification time of manifest and every data file. Any
+            change of the files results in a new version. Missing files are
+            also taken into account.
+
+            Args:
+                path (str): path to the manifest file
+                dataset (Dataset): dataset parsed from manifest
+
+            Returns:
+                str: version of the dataset
+        """
+        md5 = hashlib.md5()
+        for filepath in [path] + dataset.files():
+            md5.update(fileStamp(filepath))
+        return md5.hexdigest()
 
     # [Public]
-    def loadDatasets(self, searchpath=None):
+    def loadDatasets(self, searchpath=None, maxworkers=workers.MAX_WORKERS):
         """
-            Loads datasets from _directory path.
+            Loads datasets from _directory path. Datasets are collected into
+            new maps first, and then maps are replaced as a whole, so
+            concurrent readers never see partially loaded or empty registry.
+            Directories are scanned and manifests are parsed concurrently.
 
             Args:
                 searchpath (str): search path for datasets
+                maxworkers (int): maximum number of threads to use
         """
         # assign search path or use it to save previous path
         searchpath = searchpath or self._directory
-        # clean previous datasets and manifests info
-        self.resetToDefault()
-        # assign back search path
-        self.setSearchPath(searchpath)
-        # look for manifests and parse them
-        self._findManifests(self._directory)
-        for manifestpath in self._manifests.values():
-            self._parseManifest(manifestpath)
+        with self._lock:
+            self._swap(self.scanDatasets(searchpath, maxworkers))
+
+    # [Public]
+    def scanDatasets(self, searchpath=None, maxworkers=workers.MAX_WORKERS):
+        """
+            Scans search path and returns new datamanager with datasets and
+            versions found. Instance itself is not changed, so scan can run
+            next to requests, and result is published with "swapDatasets".
+
+            Args:
+                searchpath (str): search path for datasets
+                maxworkers (int): maximum number of threads to use
+
+            Returns:
+                DataManager: staging datamanager with datasets loaded
+        """
+        searchpath = searchpath or self._directory
+        start = tm.clock()
+        staging = DataManager()
+        staging.setSearchPath(searchpath)
+        staging._findManifests(staging._directory, maxworkers)
+        # manifests are parsed in order of sorted root paths, whatever order
+        # they were discovered in, so if two manifests share id, the one with
+        # the later root path in sorted order overwrites the earlier one
+        paths = [staging._manifests[x] for x in sorted(staging._manifests)]
+        parsed = workers.mapParallel(staging._readManifest, paths, maxworkers)
+        for path, dataset, version in parsed:
+            if dataset is not None:
+                staging._datasets[dataset._id] = dataset
+                staging._versions[dataset._id] = version
+        SCAN_DURATION.observe(tm.clock() - start)
+        return staging
+
+    # [Public]
+    def swapDatasets(self, staging):
+        """
+            Replaces datasets, versions and manifests with ones of staging
+            datamanager. Registry is replaced, not updated, so readers that
+            hold old registry keep consistent view.
+
+            Args:
+                staging (DataManager): datamanager returned by "scanDatasets"
+        """
+        misc.checkInstanceAgainst(staging, DataManager, __file__)
+        with self._lock:
+            self._swap(staging)
+
+    # [Private]
+    def _swap(self, staging):
+        """
+            Replaces maps with ones of staging datamanager, lock must be held
+            by caller.
+
+            Args:
+                staging (DataManager): staging datamanager
+        """
+        # datasets and versions are published together with one assignment
+        self._directory = staging._directory
+        self._manifests = staging._manifests
+        self._registry = staging._registry
 
     # [Public]
     def getDatasets(self):
@@ -212,7 +419,19 @@ class DataManager(object):
             Returns:
                 list<Dataset>: list of Dataset instances
         """
-        return self._datasets.values()
+        return self._registry[0].values()
+
+    # [Public]
+    def getDatasetVersions(self):
+        """
+            Returns list of datasets collected with their versions. Pairs are
+            read from the same registry, so version always matches dataset.
+
+            Returns:
+                list<tuple<Dataset, str>>: list of datasets and versions
+        """
+        datasets, versions = self._registry
+        return [(x, versions[x._id]) for x in datasets.values()]
 
     # [Public]
     def getDataset(self, id):
@@ -226,7 +445,41 @@ class DataManager(object):
             Returns:
                 Dataset: dataset object with id specified
         """
-        return self._datasets[id] if id in self._datasets else None
+        return self.getDatasetVersion(id)[0]
+
+    # [Public]
+    def getVersion(self, id):
+        """
+            Returns version of the dataset by id specified. Version changes
+            every time dataset files change. If there is no such id, then
+            returns None.
+
+            Args:
+                id (str): dataset id
+
+            Returns:
+                str: dataset version
+        """
+        return self.getDatasetVersion(id)[1]
+
+    # [Public]
+    def getDatasetVersion(self, id):
+        """
+            Returns dataset and its version by id specified. Both are read
+            from the same registry, so version always matches dataset, even if
+            datasets are reloaded concurrently. If there is no such id, then
+            returns (None, None).
+
+            Args:
+                id (str): dataset id
+
+            Returns:
+                tuple<Dataset, str>: dataset object and its version
+        """
+        datasets, versions = self._registry
+        if id not in datasets:
+            return (None, None)
+        return (datasets[id], versions[id])
 
     # [Public]
     def setSearchPath(self, path):
@@ -245,7 +498,7 @@ class DataManager(object):
         """
         self._directory = _DIRECTORY
         self._manifests = {}
-        self._datasets = {}
+        self._registry = ({}, {})
 
     # [Public]
     def util_testDatasets(self, searchpath=None):
@@ -283,6 +536,9 @@ class DataManager(object):
             ds_stats[ds._id] = {}
             ds_stats[ds._id][DATA_CLU] = os.path.isfile(ds._clusters[PATH])
             ds_stats[ds._id][DATA_ELE] = os.path.isfile(ds._elements[PATH])
+            if ds._deltas:
+                ds_stats[ds._id][DATA_DEL] = all(
+                    [os.path.isfile(x) for x in ds.deltaFiles()])
             if ds._discover:
                 continue
             ds_stats[ds._id][DATA_PUL] = os.path.isfile(ds._pulses[PATH])
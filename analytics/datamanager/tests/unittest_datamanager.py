@@ -20,11 +20,16 @@ limitations under the License.
 # import libs
 import unittest
 import os
+import shutil
+import json
+import tempfile
 from types import DictType
 # import classes
 import projectpaths as paths
 import analytics.exceptions.exceptions as ex
 import analytics.datamanager.datamanager as dm
+import analytics.datamanager.watcher as watcher
+import analytics.datamanager.compaction as compaction
 
 
 class DataManager_TestSequence(unittest.TestCase):
@@ -127,17 +132,227 @@ class DataManager_TestSequence(unittest.TestCase):
             if "pulses" in dsf:
                 self.assertEqual(dsf["pulses"], True)
 
+    def test_datamanager_getVersion(self):
+        t = dm.DataManager()
+        t.loadDatasets(paths.DATASETS_PATH)
+        self.assertEqual(t.getVersion("#"), None)
+        for dataset in t.getDatasets():
+            version = t.getVersion(dataset._id)
+            self.assertNotEqual(version, None)
+            self.assertEqual(len(version), 32)
+        # version does not change when files do not change
+        versions = dict(t._versions)
+        t.loadDatasets(paths.DATASETS_PATH)
+        self.assertEqual(t._versions, versions)
+        t.resetToDefault()
+        self.assertEqual(t._versions, {})
+
+    def test_datamanager_reloadSwapsMaps(self):
+        t = dm.DataManager()
+        t.loadDatasets(paths.DATASETS_PATH)
+        datasets = t._datasets
+        snapshot = dict(datasets)
+        self.assertTrue(len(snapshot) > 0)
+        # reload replaces maps, reader holding old map sees it unchanged
+        t.loadDatasets(paths.DATASETS_PATH)
+        self.assertFalse(t._datasets is datasets)
+        self.assertEqual(datasets, snapshot)
+        self.assertEqual(sorted(t._datasets.keys()), sorted(snapshot.keys()))
+
+    def test_datamanager_getDatasetVersion(self):
+        t = dm.DataManager()
+        t.loadDatasets(paths.DATASETS_PATH)
+        self.assertEqual(t.getDatasetVersion("#"), (None, None))
+        for dataset, version in t.getDatasetVersions():
+            self.assertEqual(t.getDatasetVersion(dataset._id),
+                (dataset, version))
+        # pair is read from one registry, that is replaced as a whole
+        registry = t._registry
+        datasetId = t.getDatasets()[0]._id
+        staging = t.scanDatasets(paths.DATASETS_PATH)
+        staging._versions[datasetId] = "#version"
+        t.swapDatasets(staging)
+        self.assertFalse(t._registry is registry)
+        self.assertEqual(t.getDatasetVersion(datasetId),
+            (staging._datasets[datasetId], "#version"))
+        self.assertFalse(registry[1][datasetId] == "#version")
+
+    def test_datamanager_parallelLoad(self):
+        serial = dm.DataManager()
+        serial.loadDatasets(paths.DATASETS_PATH, 1)
+        parallel = dm.DataManager()
+        parallel.loadDatasets(paths.DATASETS_PATH, 4)
+        self.assertEqual(parallel._manifests, serial._manifests)
+        self.assertEqual(parallel._versions, serial._versions)
+        self.assertEqual(
+            sorted(parallel._datasets.keys()),
+            sorted(serial._datasets.keys())
+        )
+        # missing directory does not fail
+        t = dm.DataManager()
+        t.loadDatasets(os.path.join(paths.DATASETS_PATH, "#missing"))
+        self.assertEqual(t._datasets, {})
+
+    def test_datamanager_duplicateId(self):
+        source = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+            "datasets", "test")
+        directory = tempfile.mkdtemp()
+        try:
+            # both manifests have id "test", names are used to tell them apart
+            for name in ["b", "a"]:
+                shutil.copytree(source, os.path.join(directory, name))
+                path = os.path.join(directory, name, "manifest.json")
+                with open(path) as f:
+                    obj = json.load(f)
+                obj["name"] = name
+                with open(path, "w") as f:
+                    json.dump(obj, f)
+            for maxworkers in [1, 4]:
+                t = dm.DataManager()
+                t.loadDatasets(directory, maxworkers)
+                self.assertEqual(len(t._manifests), 2)
+                self.assertEqual(t._datasets.keys(), ["test"])
+                # later root path in sorted order wins
+                self.assertEqual(t.getDataset("test")._name, "b")
+                path = os.path.join(directory, "b", "manifest.json")
+                self.assertEqual(t.getVersion("test"),
+                    t._computeVersion(path, t.getDataset("test")))
+        finally:
+            shutil.rmtree(directory)
+
     def test_datamanager_checkDatasetTest(self):
         directory = os.path.join(paths.ANALYTICS_PATH, "datasets")
         t = dm.DataManager()
         res = t.util_testDatasets(directory)
         self.assertEqual(t.util_checkDatasetsResult(res), True)
 
+    def test_datamanager_deltaFiles(self):
+        obj = {"id": "1", "name": "1", "desc": "1", "discover": True,
+            "data": {
+                "clusters": {"file": "clusters", "type": "json"},
+                "elements": {"file": "elements", "type": "json"},
+                "deltas": [{"file": "d1", "type": "json"},
+                    {"file": "d2", "type": "json"}]
+            }}
+        dataset = dm.Dataset(obj, "dir")
+        self.assertEqual(dataset.deltaFiles(),
+            [os.path.join("dir", "d1.json"), os.path.join("dir", "d2.json")])
+        self.assertEqual(dataset.baseFiles(), [os.path.join("dir",
+            "clusters.json"), os.path.join("dir", "elements.json")])
+        self.assertEqual(dataset.files(),
+            dataset.baseFiles() + dataset.deltaFiles())
+        del obj["data"]["deltas"]
+        self.assertEqual(dm.Dataset(obj, "dir").deltaFiles(), [])
+
+    def test_datamanager_foldRecords(self):
+        objlist = [{"id": "1", "v": 1}, {"v": 0}, {"id": "2", "v": 2}]
+        records = [
+            {"op": "upsert", "data": {"id": "3", "v": 3}},
+            {"op": "upsert", "data": {"id": " 1 ", "v": 10}},
+            {"op": "delete", "id": "2"},
+            {"op": "delete", "id": "4"},
+            {"op": "upsert", "data": {"v": 5}},
+            {"op": "merge", "id": "1"}
+        ]
+        folded, skipped = compaction.foldRecords(objlist, records)
+        self.assertEqual(folded,
+            [{"id": " 1 ", "v": 10}, {"v": 0}, {"id": "3", "v": 3}])
+        self.assertEqual(skipped, 2)
+        # records can be applied twice
+        self.assertEqual(compaction.foldRecords(folded, records)[0], folded)
+        with self.assertRaises(ex.AnalyticsCheckError):
+            compaction.foldRecords(None, records)
+
+    def test_datamanager_compactWithoutDeltas(self):
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+            "datasets", "test", "manifest.json")
+        res = compaction.compactDataset(path)
+        self.assertEqual(res["id"], "test")
+        self.assertEqual(res["deltas"], 0)
+        self.assertEqual(res["elements"], None)
+
+
+class DatasetWatcher_TestSequence(unittest.TestCase):
+    def setUp(self):
+        source = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+            "datasets", "test")
+        self._directory = tempfile.mkdtemp()
+        self._path = os.path.join(self._directory, "test")
+        shutil.copytree(source, self._path)
+        self._dmngr = dm.DataManager()
+        self._dmngr.loadDatasets(self._directory)
+        self._rebuilt = []; self._retired = []
+        self._watcher = watcher.DatasetWatcher(
+            self._dmngr,
+            1,
+            lambda dataset, version: self._rebuilt.append(
+                (dataset._id, version, self._dmngr.getVersion(dataset._id))),
+            lambda datasetId, version: self._retired.append((datasetId, version))
+        )
+
+    def tearDown(self):
+        self._watcher.stop()
+        shutil.rmtree(self._directory)
+
+    def test_watcher_init(self):
+        with self.assertRaises(ex.AnalyticsTypeError):
+            watcher.DatasetWatcher(None)
+        with self.assertRaises(ex.AnalyticsValueError):
+            watcher.DatasetWatcher(self._dmngr, 0)
+        self.assertEqual(self._watcher.isRunning(), False)
+
+    def test_watcher_pollUnchanged(self):
+        datasets = self._dmngr._datasets
+        self.assertEqual(self._watcher.poll(), [])
+        self.assertTrue(self._dmngr._datasets is datasets)
+        self.assertEqual(self._rebuilt, [])
+        self.assertEqual(self._watcher.stats()["reloads"], 0)
+
+    def test_watcher_pollChanged(self):
+        version = self._dmngr.getVersion("test")
+        datasets = self._dmngr._datasets; dataset = datasets["test"]
+        with open(os.path.join(self._path, "elements.json"), "w") as f:
+            f.write("[]")
+        self.assertEqual(self._watcher.poll(), ["test"])
+        newversion = self._dmngr.getVersion("test")
+        self.assertNotEqual(newversion, version)
+        # rebuilt before new version was published, old one is retired
+        self.assertEqual(self._rebuilt, [("test", newversion, version)])
+        self.assertEqual(self._retired, [("test", version)])
+        # old registry is left as it was
+        self.assertEqual(datasets, {"test": dataset})
+        self.assertEqual(self._watcher.stats()["reloads"], 1)
+
+    def test_watcher_pollRemoved(self):
+        version = self._dmngr.getVersion("test")
+        shutil.rmtree(self._path)
+        self.assertEqual(self._watcher.poll(), ["test"])
+        self.assertEqual(self._dmngr.getDataset("test"), None)
+        self.assertEqual(self._rebuilt, [])
+        self.assertEqual(self._retired, [("test", version)])
+
+    def test_watcher_rebuildFailure(self):
+        def rebuild(dataset, version):
+            raise StandardError()
+        self._watcher._rebuild = rebuild
+        with open(os.path.join(self._path, "elements.json"), "w") as f:
+            f.write("[]")
+        self.assertEqual(self._watcher.poll(), ["test"])
+        self.assertEqual(len(self._retired), 1)
+
+    def test_watcher_startStop(self):
+        thread = self._watcher.start()
+        self.assertEqual(self._watcher.isRunning(), True)
+        self.assertTrue(self._watcher.start() is thread)
+        self._watcher.stop()
+        self.assertEqual(self._watcher.isRunning(), False)
+
 
 # Load test suites
 def _suites():
     return [
-        DataManager_TestSequence
+        DataManager_TestSequence,
+        DatasetWatcher_TestSequence
     ]
 
 # Load tests
@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+
+'''
+Copyright 2015 Ivan Sadikov
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+
+# import libs
+import threading
+from types import IntType, FloatType
+# import classes
+import analytics.utils.misc as misc
+from analytics.datamanager.datamanager import DataManager
+
+"""
+    Watcher polls datasets directory and reloads datasets, when size or
+    modification time of any manifest or data file changes. Nothing but file
+    system is used, so it works anywhere datasets directory is readable.
+    Reload is read-copy-update: new registry is built aside, changed datasets
+    are rebuilt by callback, and only then registry is swapped in, so
+    requests never wait for reload and keep using version they started with.
+"""
+
+# default polling interval in seconds
+POLL_INTERVAL = 10.0
+
+
+class DatasetWatcher(object):
+    """
+        DatasetWatcher class polls search path of datamanager and publishes
+        new versions of datasets.
+
+        Attributes:
+            _dmngr (DataManager): datamanager to keep up to date
+            _interval (float): polling interval in seconds
+            _rebuild (func): called with (dataset, version) for every changed
+                or new dataset before it becomes visible
+            _retire (func): called with (dataset id, version) for every
+                replaced or removed version after swap
+            _stopped (Event): event to stop polling thread
+            _thread (Thread): polling thread, None if it is not started
+            _polls (int): number of polls done
+            _reloads (int): number of polls that swapped datasets
+    """
+    def __init__(self, dmngr, interval=POLL_INTERVAL, rebuild=None,
+            retire=None):
+        misc.checkInstanceAgainst(dmngr, DataManager, __file__)
+        if type(interval) not in [IntType, FloatType] or interval <= 0:
+            misc.raiseValueError("Polling interval must be positive", __file__)
+        self._dmngr = dmngr
+        self._interval = interval
+        self._rebuild = rebuild
+        self._retire = retire
+        self._stopped = threading.Event()
+        self._thread = None
+        self._polls = 0
+        self._reloads = 0
+
+    # [Public]
+    def poll(self):
+        """
+            Scans datasets once and swaps registry, if any dataset was added,
+            changed or removed. Changed datasets are rebuilt before swap,
+            failure of rebuild does not stop reload, dataset is processed on
+            request instead. Returns ids of datasets that changed.
+
+            Returns:
+                list<str>: sorted ids of added, changed and removed datasets
+        """
+        self._polls += 1
+        staging = self._dmngr.scanDatasets()
+        current = self._dmngr._versions
+        changed = [x for x in staging._versions
+            if staging._versions[x] != current.get(x)]
+        removed = [x for x in current if x not in staging._versions]
+        if not changed and not removed:
+            return []
+        if self._rebuild is not None:
+            for datasetId in changed:
+                try:
+                    self._rebuild(staging.getDataset(datasetId),
+                        staging.getVersion(datasetId))
+                except BaseException:
+                    pass
+        self._dmngr.swapDatasets(staging)
+        self._reloads += 1
+        if self._retire is not None:
+            for datasetId in changed + removed:
+                if datasetId in current:
+                    self._retire(datasetId, current[datasetId])
+        return sorted(changed + removed)
+
+    # [Public]
+    def start(self):
+        """
+            Starts polling in a daemon thread. Does nothing, if watcher is
+            already running.
+
+            Returns:
+                Thread: polling thread
+        """
+        if self.isRunning():
+            return self._thread
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="watcher")
+        self._thread.daemon = True
+        self._thread.start()
+        return self._thread
+
+    # [Public]
+    def stop(self, timeout=None):
+        """
+            Stops polling thread and waits for it to finish.
+
+            Args:
+                timeout (float): maximum time to wait in seconds
+        """
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    # [Public]
+    def isRunning(self):
+        """
+            Returns True, if polling thread is running.
+
+            Returns:
+                bool: running flag
+        """
+        return self._thread is not None and self._thread.isAlive()
+
+    # [Public]
+    def stats(self):
+        """
+            Returns statistics of the watcher.
+
+            Returns:
+                dict<str, obj>: interval, number of polls and reloads
+        """
+        return {
+            "interval": self._interval,
+            "polls": self._polls,
+            "reloads": self._reloads,
+            "running": self.isRunning()
+        }
+
+    # [Private]
+    def _run(self):
+        """
+            Polls datasets until watcher is stopped. Failed poll is retried
+            on the next interval.
+        """
+        while not self._stopped.wait(self._interval):
+            try:
+                self.poll()
+            except BaseException:
+                pass
@@ -34,6 +34,30 @@ class AnalyticsBaseException(BaseException):
         msg = "%s: %s - %s" %(self._source, self._line, self._errmsg)
         super(AnalyticsBaseException, self).__init__(msg)
 
+    def __reduce__(self):
+        # subclasses have different constructors, so pickled exception is
+        # restored from its state instead of calling constructor again
+        return (_restore, (self.__class__, self.args, self.__dict__))
+
+
+# [Private]
+def _restore(cls, args, state):
+    """
+        Restores pickled analytics exception without calling constructor.
+
+        Args:
+            cls (type): class of the exception
+            args (tuple): arguments of BaseException
+            state (dict): attributes of the exception
+
+        Returns:
+            AnalyticsBaseException: restored exception
+    """
+    error = cls.__new__(cls)
+    BaseException.__init__(error, *args)
+    error.__dict__.update(state)
+    return error
+
 
 class AnalyticsCheckError(AnalyticsBaseException):
     """
@@ -125,3 +149,33 @@ class AnalyticsAssertionError(AnalyticsBaseException):
     """
     def __init__(self, message, source="Global", line=1):
         super(AnalyticsAssertionError, self).__init__(message, source, line)
+
+
+class AnalyticsOverloadError(AnalyticsBaseException):
+    """
+        Overload error class for analytics. Raised, when request is not
+        admitted, because service is saturated with expensive requests.
+        Supports source and line attributes.
+
+        Args for __init__:
+            message (str): error message
+            source (str): file where error occured
+            line (int): line number where error occured
+    """
+    def __init__(self, message, source="Global", line=1):
+        super(AnalyticsOverloadError, self).__init__(message, source, line)
+
+
+class AnalyticsTimeoutError(AnalyticsBaseException):
+    """
+        Timeout error class for analytics. Raised, when request exceeds its
+        deadline or is cancelled, while it is being processed. Supports
+        source and line attributes.
+
+        Args for __init__:
+            message (str): error message
+            source (str): file where error occured
+            line (int): line number where error occured
+    """
+    def __init__(self, message, source="Global", line=1):
+        super(AnalyticsTimeoutError, self).__init__(message, source, line)
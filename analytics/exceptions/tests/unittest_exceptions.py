@@ -18,6 +18,7 @@ limitations under the License.
 
 
 # import libs
+import pickle
 import unittest
 # import classes
 import analytics.exceptions.exceptions as c
@@ -112,6 +113,49 @@ class AnalyticsStandardError_TestsSequence(Exceptions_TestsSequence):
         self.assertEqual("standardfile", arg._source)
         self.assertEqual("15", arg._line)
 
+    def test_standarderror_pickle(self):
+        for error in [c.AnalyticsStandardError("message", "file", 15),
+                c.AnalyticsCheckError(int, str, "file", 15)]:
+            restored = pickle.loads(pickle.dumps(error, 2))
+            self.assertEqual(type(restored), type(error))
+            self.assertEqual(str(restored), str(error))
+            self.assertEqual(restored._errmsg, error._errmsg)
+            self.assertEqual(restored._line, "15")
+
+
+class AnalyticsOverloadError_TestsSequence(Exceptions_TestsSequence):
+
+    def test_overloaderror_raise(self):
+        with self.assertRaises(c.AnalyticsOverloadError):
+            raise c.AnalyticsOverloadError("Test message")
+
+    def test_overloaderror_tryCatch(self):
+        msg = ""
+        try:
+            raise c.AnalyticsOverloadError("overloaderror", "overloadfile", "15")
+        except c.AnalyticsOverloadError as arg:
+            msg = "overloaderror"
+        self.assertEqual(msg, arg._errmsg)
+        self.assertEqual("overloadfile", arg._source)
+        self.assertEqual("15", arg._line)
+
+
+class AnalyticsTimeoutError_TestsSequence(Exceptions_TestsSequence):
+
+    def test_timeouterror_raise(self):
+        with self.assertRaises(c.AnalyticsTimeoutError):
+            raise c.AnalyticsTimeoutError("Test message")
+
+    def test_timeouterror_tryCatch(self):
+        msg = ""
+        try:
+            raise c.AnalyticsTimeoutError("timeouterror", "timeoutfile", "15")
+        except c.AnalyticsTimeoutError as arg:
+            msg = "timeouterror"
+        self.assertEqual(msg, arg._errmsg)
+        self.assertEqual("timeoutfile", arg._source)
+        self.assertEqual("15", arg._line)
+
 
 # Load test suites
 def _suites():
@@ -120,7 +164,9 @@ def _suites():
         AnalyticsSyntaxError_TestsSequence,
         AnalyticsTypeError_TestsSequence,
         AnalyticsValueError_TestsSequence,
-        AnalyticsStandardError_TestsSequence
+        AnalyticsStandardError_TestsSequence,
+        AnalyticsOverloadError_TestsSequence,
+        AnalyticsTimeoutError_TestsSequence
     ]
 
 # Load tests
@@ -22,7 +22,7 @@ import json
 from types import StringType, UnicodeType
 # import classes
 import analytics.utils.misc as misc
-from analytics.loading.loader import Loader
+from analytics.loading.loader import Loader, measureLoad
 
 
 class JsonLoader(Loader):
@@ -74,9 +74,10 @@ class JsonLoader(Loader):
                 dict<str, object> / list<object>: json object from the file
         """
         fpath = filepath if filepath is not None else self._filepath
-        with open(fpath) as file:
-            jsonObject = json.load(file, object_hook=self._decode_dict)
-        return jsonObject
+        def load():
+            with open(fpath) as file:
+                return json.load(file, object_hook=self._decode_dict)
+        return measureLoad("json", fpath, load)
 
     # [Private]
     def _decode_dict(self, data):
@@ -17,6 +17,51 @@ limitations under the License.
 '''
 
 
+# import libs
+import os
+# import classes
+import analytics.utils.metrics as metrics
+import analytics.utils.timings as tm
+
+
+# metrics of loaded files by format
+LOAD_DURATION = metrics.REGISTRY.histogram("pulsar_loader_duration_seconds",
+    "Time to load and parse data file", ["format"])
+LOAD_BYTES = metrics.REGISTRY.counter("pulsar_loader_bytes_total",
+    "Size of loaded data files", ["format"])
+LOAD_ERRORS = metrics.REGISTRY.counter("pulsar_loader_errors_total",
+    "Data files that could not be loaded", ["format"])
+
+
+# [Public]
+def measureLoad(dataformat, filepath, func):
+    """
+        Calls function that loads file and records its duration and size of
+        the file, or error, if function fails.
+
+        Args:
+            dataformat (str): format of the file
+            filepath (str): file path
+            func (func): function without arguments that loads file
+
+        Returns:
+            obj: value of the function
+    """
+    labels = (dataformat,)
+    start = tm.clock()
+    try:
+        data = func()
+    except:
+        LOAD_ERRORS.inc(1, labels)
+        raise
+    LOAD_DURATION.observe(tm.clock() - start, labels)
+    try:
+        LOAD_BYTES.inc(os.path.getsize(filepath), labels)
+    except OSError:
+        pass
+    return data
+
+
 # [Abstract]
 class Loader(object):
     """
@@ -22,7 +22,7 @@ from xml.dom import minidom
 from types import StringType, DictType
 # import classes
 import analytics.utils.misc as misc
-from analytics.loading.loader import Loader
+from analytics.loading.loader import Loader, measureLoad
 
 # constants for xml loader
 class Const(object):
@@ -92,7 +92,7 @@ class XmlLoader(Loader):
         """
         json = [];
         fpath = filepath if filepath is not None else self._filepath
-        xmldoc = minidom.parse(fpath)
+        xmldoc = measureLoad("xml", fpath, lambda: minidom.parse(fpath))
         for element in xmldoc.getElementsByTagName(Const.XML_ELEMENT):
             js = {}
             for attr in element.getElementsByTagName(Const.XML_ATTRIBUTE):
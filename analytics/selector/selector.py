@@ -1,11 +1,14 @@
 #!/usr/bin/env python
 
 # import libs
+import copy
 from types import StringType, ListType
-import warnings
 # import classes
 import analytics.utils.queryengine as q
 import analytics.utils.misc as misc
+import analytics.utils.diagnostics as diag
+import analytics.utils.deadline as dl
+import analytics.utils.timings as tm
 from analytics.algorithms.algorithmsmap import AlgorithmsMap
 from analytics.core.map.clustermap import ClusterMap
 from analytics.core.map.elementmap import ElementMap
@@ -18,6 +21,11 @@ CLUSTERS = "CLUSTERS"
 ELEMENTS = "ELEMENTS"
 PULSES = "PULSES"
 ALGORITHMS = "ALGORITHMS"
+# ranking scopes
+SCOPE_CLUSTER = "CLUSTER"
+# statuses of predicates in explanation of queryset
+APPLIED = "applied"
+IGNORED = "ignored"
 
 class FilterBlock(object):
     """
@@ -29,13 +37,22 @@ class FilterBlock(object):
             _clu (ClusterMap): map of clusters
             _ele (ElementMap): map of elements
             _isFiltered (bool): flag to show that filter block is filtered
+            _diagnostics (Diagnostics): diagnostics of the request
+            _scope (dict<str, obj>): ranking scope, None to rank globally
+            _deadline (Deadline): deadline of the request
+            _timings (Timings): timings to record filtering of elements to
     """
-    def __init__(self, algorithmsmap, pulsemap, clustermap, elementmap):
+    def __init__(self, algorithmsmap, pulsemap, clustermap, elementmap,
+            diagnostics=None, deadline=None, timings=None):
         self._alg = algorithmsmap
         self._pul = pulsemap
         self._clu = clustermap
         self._ele = elementmap
         self._isFiltered = False
+        self._diagnostics = diag.orWarnings(diagnostics)
+        self._scope = None
+        self._deadline = dl.orNever(deadline)
+        self._timings = tm.orDiscard(timings)
 
 # [Public]
 def filterWithBlock(queryset, flrblock):
@@ -51,7 +68,7 @@ def filterWithBlock(queryset, flrblock):
     if flrblock._isFiltered:
         return flrblock
     # extract query blocks
-    blocks = parseQueryset(queryset, q.QueryEngine())
+    blocks = parseQueryset(queryset, q.QueryEngine(), flrblock._diagnostics)
     if not blocks:
         return flrblock
     # filter blocks to match maps
@@ -63,17 +80,201 @@ def filterWithBlock(queryset, flrblock):
             pblock = block
         elif block._statement._table.upper() == CLUSTERS:
             cblock = block
+    # filtered elements depend only on elements and query, so they are
+    # identified by both
+    token = flrblock._ele.token()
     # use each block to parse map
+    flrblock._scope = filterScope(ablock, flrblock._diagnostics)
     flrblock._alg = filterAlgorithms(ablock, flrblock._alg)
-    flrblock._pul = filterPulses(pblock, flrblock._pul)
+    flrblock._pul = filterPulses(pblock, flrblock._pul, flrblock._diagnostics)
     flrblock._clu = filterClusters(cblock, flrblock._clu)
-    flrblock._ele = filterElements(flrblock._ele, flrblock._clu, flrblock._pul)
+    flrblock._ele = filterElements(flrblock._ele, flrblock._clu, flrblock._pul,
+        flrblock._deadline, flrblock._timings)
+    if token is not None:
+        flrblock._ele.setToken((token, queryset))
     # finished filtering
     flrblock._isFiltered = True
     return flrblock
 
 # [Public]
-def parseQueryset(queryset=None, engine=None):
+def explainQueryset(blocks, algorithmsmap, pulsemap, clustermap):
+    """
+        Explains how query blocks would filter maps, maps are not changed.
+        Only the last block of algorithms, pulses and clusters is used by
+        "filterWithBlock", other blocks are ignored. Each predicate is marked
+        as applied or ignored with reason, following "filterScope",
+        "filterAlgorithms", "filterPulses" and "filterClusters". Pulses are
+        filtered as copies, so defaults are accepted or rejected by pulses
+        themselves.
+
+        Args:
+            blocks (list<QueryBlock>): parsed query blocks
+            algorithmsmap (AlgorithmsMap): map of algorithms
+            pulsemap (PulseMap): map of pulses before filtering
+            clustermap (ClusterMap): map of clusters before filtering
+
+        Returns:
+            dict<str, obj>: blocks with table, query, flag of used block and
+                predicates with status and reason, and dynamic pulses that
+                rank elements with their defaults
+    """
+    misc.checkTypeAgainst(type(blocks), ListType, __file__)
+    tables = [ALGORITHMS, PULSES, CLUSTERS]
+    last = {}
+    for _i, block in enumerate(blocks):
+        misc.checkTypeAgainst(type(block), q.QueryBlock, __file__)
+        last[block._statement._table.upper()] = _i
+    pulses = dict((x, copy.copy(y)) for x, y in pulsemap._map.items())
+    explained = []
+    for _i, block in enumerate(blocks):
+        table = block._statement._table.upper()
+        predicates = block._predicates
+        used = table in tables and last[table] == _i
+        if table not in tables:
+            msg = "Table %s is not filtered" % (table)
+            notes = [(IGNORED, msg)] * len(predicates)
+        elif not used:
+            msg = "Block is replaced by later block of %s" % (table)
+            notes = [(IGNORED, msg)] * len(predicates)
+        elif table == ALGORITHMS:
+            notes = _explainAlgorithms(predicates, algorithmsmap)
+        elif table == PULSES:
+            notes = _explainPulses(predicates, pulses)
+        else:
+            notes = _explainClusters(predicates, clustermap)
+        explained.append({
+            "table": table,
+            "query": block.queryToString(),
+            "used": used,
+            "predicates": [{"predicate": x.toString(), "status": y[0],
+                "reason": y[1]} for x, y in zip(predicates, notes)]
+        })
+    dynamic = [x for x in pulses.values() if type(x) is DynamicPulse and
+        not x.static()]
+    return {
+        "blocks": explained,
+        "dynamic": [{"id": x.id(), "name": x.name(), "default": x.default()}
+            for x in sorted(dynamic, key=lambda x: x.id())]
+    }
+
+# [Private]
+def _explainAlgorithms(predicates, algorithmsmap):
+    """
+        Returns status and reason of each predicate of algorithms block.
+
+        Args:
+            predicates (list<QueryPredicate>): predicates of the block
+            algorithmsmap (AlgorithmsMap): map of algorithms
+
+        Returns:
+            list<tuple<str, str>>: status and reason of each predicate
+    """
+    scope = None
+    for predicate in predicates:
+        if predicate._type == q._PREDICATE_TYPES.ASSIGN and \
+                predicate._parameter.upper() == "SCOPE":
+            scope = predicate._values[0].upper()
+    notes = []
+    for predicate in predicates:
+        ptype = predicate._type
+        parameter = predicate._parameter.upper()
+        value = predicate._values[0]
+        if ptype == q._PREDICATE_TYPES.EQUAL and parameter == "ID":
+            if algorithmsmap.has(value):
+                notes.append((APPLIED, "Selects algorithm"))
+            else:
+                notes.append((IGNORED, "Unknown algorithm %s" % (str(value))))
+        elif ptype == q._PREDICATE_TYPES.ASSIGN and parameter == "SCOPE":
+            if value.upper() == SCOPE_CLUSTER:
+                notes.append((APPLIED, "Ranks elements within clusters"))
+            else:
+                notes.append((IGNORED, "Scope is not supported"))
+        elif ptype == q._PREDICATE_TYPES.EQUAL and parameter == "DEPTH":
+            if not (str(value).isdigit() and int(value) > 0):
+                notes.append((IGNORED, "Depth is not a positive integer"))
+            elif scope != SCOPE_CLUSTER:
+                notes.append((IGNORED, "Depth needs cluster scope"))
+            else:
+                notes.append((APPLIED, "Ranks elements within clusters " +
+                    "at depth"))
+        else:
+            notes.append((IGNORED, "Only @id =, @scope |is| and @depth = " +
+                "are supported for algorithms"))
+    return notes
+
+# [Private]
+def _explainPulses(predicates, pulses):
+    """
+        Returns status and reason of each predicate of pulses block. Pulses
+        are changed the same way "filterPulses" changes them, so they must
+        be copies.
+
+        Args:
+            predicates (list<QueryPredicate>): predicates of the block
+            pulses (dict<str, Pulse>): copies of pulses by id
+
+        Returns:
+            list<tuple<str, str>>: status and reason of each predicate
+    """
+    notes = [None] * len(predicates)
+    # assign predicates are applied first, as in "filterPulses"
+    for _i, predicate in enumerate(predicates):
+        if predicate._type == q._PREDICATE_TYPES.ASSIGN:
+            pulse = pulses.get(predicate._parameter)
+            if pulse is None:
+                notes[_i] = (IGNORED, "Unknown pulse")
+            elif type(pulse) is not DynamicPulse:
+                notes[_i] = (IGNORED, "Pulse is not dynamic")
+            else:
+                pulse.setStatic(not predicate._values[0].upper()=="DYNAMIC")
+                notes[_i] = (APPLIED, "Pulse is %s" % ("static" if
+                    pulse.static() else "dynamic"))
+    accepted = {}
+    for _i, predicate in enumerate(predicates):
+        if predicate._type == q._PREDICATE_TYPES.EQUAL:
+            pulse = pulses.get(predicate._parameter)
+            if pulse is None:
+                notes[_i] = (IGNORED, "Unknown pulse")
+            elif not pulse.setDefaultValue(predicate._values[0]):
+                notes[_i] = (IGNORED, "Pulse cannot set value as default")
+            else:
+                if pulse.id() in accepted:
+                    notes[accepted[pulse.id()]] = (IGNORED,
+                        "Default is replaced by later predicate")
+                accepted[pulse.id()] = _i
+                notes[_i] = (APPLIED, "Filters elements" if pulse.static()
+                    else "Sets default of dynamic pulse, does not filter")
+        elif predicate._type == q._PREDICATE_TYPES.RANGE:
+            notes[_i] = (IGNORED, "Range predicates are not supported")
+    return notes
+
+# [Private]
+def _explainClusters(predicates, clustermap):
+    """
+        Returns status and reason of each predicate of clusters block.
+
+        Args:
+            predicates (list<QueryPredicate>): predicates of the block
+            clustermap (ClusterMap): map of clusters
+
+        Returns:
+            list<tuple<str, str>>: status and reason of each predicate
+    """
+    notes = []
+    for predicate in predicates:
+        ptype = predicate._type
+        parameter = predicate._parameter
+        if ptype == q._PREDICATE_TYPES.EQUAL and parameter.upper() == "ID":
+            if clustermap.has(predicate._values[0]):
+                notes.append((APPLIED, "Selects cluster"))
+            else:
+                notes.append((IGNORED, "Unknown cluster"))
+        else:
+            notes.append((IGNORED, "Only @id = is supported for clusters"))
+    return notes
+
+# [Public]
+def parseQueryset(queryset=None, engine=None, diagnostics=None):
     """
         Parsing query set. If query set is None or not a string, query set is
         reset to empty string. If query set is invalid, exception is thrown.
@@ -81,6 +282,7 @@ def parseQueryset(queryset=None, engine=None):
         Args:
             queryset (str): query set
             engine (QueryEngine): query engine to parse queryset
+            diagnostics (Diagnostics): diagnostics to report reset of query
 
         Returns:
             list<QueryBlock>: list of query blocks
@@ -89,7 +291,7 @@ def parseQueryset(queryset=None, engine=None):
         queryset = ""
     elif type(queryset) is not StringType:
         msg = "Queryset is not a string and will be reset to empty"
-        warnings.warn(msg, UserWarning)
+        diag.orWarnings(diagnostics).report(diag.QUERYSET_RESET, msg)
         queryset = ""
     else:
         queryset = queryset.strip()
@@ -131,7 +333,7 @@ def filterAlgorithms(queryblock, algorithmsmap):
         # check only equal predicates with parameter "id"
         if ptype == q._PREDICATE_TYPES.EQUAL and parameter.upper() == "ID":
             values = predicate._values
-            keys.append(values[0])
+            akeys.append(values[0])
     # remove keys that are not selected
     for key in algorithmsmap.keys():
         if key not in akeys:
@@ -139,13 +341,54 @@ def filterAlgorithms(queryblock, algorithmsmap):
     return algorithmsmap
 
 # [Public]
-def filterPulses(queryblock, pulsemap):
+def filterScope(queryblock, diagnostics=None):
+    """
+        Returns ranking scope of algorithms block. Elements are ranked within
+        each cluster with "@scope |is| cluster", and within clusters at depth
+        "n" of the cluster tree with "@depth = n", where root clusters are at
+        depth 1. Elements of clusters above that depth are ranked within
+        their own cluster. Unknown scope or depth are ignored with warning.
+
+        Args:
+            queryblock (QueryBlock): query block for algorithms
+            diagnostics (Diagnostics): diagnostics to report rejected values
+
+        Returns:
+            dict<str, obj>: scope and depth, or None to rank globally
+    """
+    if queryblock is None:
+        return None
+    misc.checkTypeAgainst(type(queryblock), q.QueryBlock, __file__)
+    scope = None; depth = None
+    for predicate in queryblock._predicates:
+        ptype = predicate._type
+        parameter = predicate._parameter.upper()
+        value = predicate._values[0]
+        if ptype == q._PREDICATE_TYPES.ASSIGN and parameter == "SCOPE":
+            if value.upper() == SCOPE_CLUSTER:
+                scope = SCOPE_CLUSTER
+            else:
+                msg = "Scope %s is not supported" % (str(value))
+                diag.orWarnings(diagnostics).report(diag.SCOPE_REJECTED, msg)
+        elif ptype == q._PREDICATE_TYPES.EQUAL and parameter == "DEPTH":
+            if str(value).isdigit() and int(value) > 0:
+                depth = int(value)
+            else:
+                msg = "Depth %s is not a positive integer" % (str(value))
+                diag.orWarnings(diagnostics).report(diag.SCOPE_REJECTED, msg)
+    if scope is None:
+        return None
+    return {"scope": scope, "depth": depth}
+
+# [Public]
+def filterPulses(queryblock, pulsemap, diagnostics=None):
     """
         Filters pulses.
 
         Args:
             queryblock (QueryBlock): query block for pulses
             pulsemap (PulseMap): map of pulses
+            diagnostics (Diagnostics): diagnostics to report rejected values
 
         Returns:
             PulseMap: reference to updated pulses map
@@ -179,7 +422,10 @@ def filterPulses(queryblock, pulsemap):
                 if not _passed:
                     _n = pulse.name(); _v = str(values[0])
                     msg = "Pulse %s cannot set value %s as default" %(_n, _v)
-                    warnings.warn(msg, UserWarning)
+                    diag.orWarnings(diagnostics).report(
+                        diag.PULSE_DEFAULT_REJECTED,
+                        msg
+                    )
     # return updated pulsemap
     return pulsemap
 
@@ -220,14 +466,19 @@ def filterClusters(queryblock, clustermap):
     return updatedmap
 
 # [Public]
-def filterElements(elementmap, clustermap, pulsemap):
+def filterElements(elementmap, clustermap, pulsemap, deadline=None,
+        timings=None):
     """
-        Filters elements using cluster map and pulse map.
+        Filters elements using cluster map and pulse map. Deadline is checked
+        every CHECK_INTERVAL elements. Filtering by clusters and by pulses is
+        recorded to timings as "filter.clusters" and "filter.pulses" stages.
 
         Args:
             elementmap (ElementMap): map of elements
             clustermap (ClusterMap): filtered map of clusters
             pulsemap (PulseMap): filtered map of pulses
+            deadline (Deadline): deadline of the request
+            timings (Timings): timings to record filters to
 
         Returns:
             ElementMap: reference to updated element map
@@ -235,12 +486,18 @@ def filterElements(elementmap, clustermap, pulsemap):
     misc.checkTypeAgainst(type(elementmap), ElementMap, __file__)
     misc.checkTypeAgainst(type(clustermap), ClusterMap, __file__)
     misc.checkTypeAgainst(type(pulsemap), PulseMap, __file__)
+    deadline = dl.orNever(deadline)
+    timings = tm.orDiscard(timings)
     # filter by clusters
     elements = elementmap._map.values()
-    for element in elements:
-        parent = element.cluster()
-        if parent is None or not clustermap.has(parent.id()):
-            elementmap.remove(element.id())
+    with timings.stage("filter.clusters", len(elements)) as stage:
+        for _i, element in enumerate(elements):
+            if _i % dl.CHECK_INTERVAL == 0:
+                deadline.check()
+            parent = element.cluster()
+            if parent is None or not clustermap.has(parent.id()):
+                elementmap.remove(element.id())
+        stage.out(len(elementmap._map))
     # filter by pulses
     elements = elementmap._map.values()
     # pulses
@@ -253,13 +510,17 @@ def filterElements(elementmap, clustermap, pulsemap):
         else:
             return False
     pulses = [x for x in pulsemap._map.values() if isselectable(x)]
-    for element in elements:
-        toRemove = False
-        for pulse in pulses:
-            feature = element._features[pulse.id()]
-            if feature is None or feature.value() != pulse.default():
-                toRemove = True
-        if toRemove:
-            elementmap.remove(element.id())
+    with timings.stage("filter.pulses", len(elements)) as stage:
+        for _i, element in enumerate(elements):
+            if _i % dl.CHECK_INTERVAL == 0:
+                deadline.check()
+            toRemove = False
+            for pulse in pulses:
+                feature = element._features[pulse.id()]
+                if feature is None or feature.value() != pulse.default():
+                    toRemove = True
+            if toRemove:
+                elementmap.remove(element.id())
+        stage.out(len(elementmap._map))
     # return element map
     return elementmap
@@ -9,6 +9,9 @@ import warnings
 import analytics.exceptions.exceptions as ex
 import analytics.core.processor.processor as processor
 import analytics.selector.selector as selector
+import analytics.utils.diagnostics as diag
+from analytics.utils.deadline import Deadline
+import analytics.utils.timings as tm
 from analytics.core.map.clustermap import ClusterMap
 from analytics.core.map.elementmap import ElementMap
 from analytics.core.map.pulsemap import PulseMap
@@ -312,6 +315,131 @@ class Selector_TestSequence(unittest.TestCase):
                     self.assertNotEqual(pulse.default(), value)
 
 
+    def test_selector_filterAlgorithmsQuery(self):
+        # regression: selecting algorithms by id failed with NameError
+        self._algorithmsmap.assign(Algorithm("%2", "%2", "%2"))
+        block = selector.filterWithBlock(
+            "select from ${algorithms} where @id = [%1]",
+            selector.FilterBlock(
+                self._algorithmsmap,
+                self._pulsemap,
+                self._clustermap,
+                self._elementmap
+            )
+        )
+        self.assertEqual(block._alg.keys(), ["%1"])
+        self.assertEqual(len(block._ele._map), len(self._e))
+        # unknown id leaves no algorithms
+        blocks = selector.parseQueryset(
+            "select from ${algorithms} where @id = [#]")
+        algmap = selector.filterAlgorithms(blocks[0], block._alg)
+        self.assertEqual(algmap.keys(), [])
+
+    def test_selector_filterAlgorithms(self):
+        self._algorithmsmap.assign(Algorithm("%2", "%2", "%2"))
+        blocks = selector.parseQueryset(
+            "select from ${algorithms} where @id = [%2]")
+        algmap = selector.filterAlgorithms(blocks[0], self._algorithmsmap)
+        self.assertEqual(algmap.keys(), ["%2"])
+        self.assertEqual(selector.filterAlgorithms(None, algmap), algmap)
+
+    def test_selector_filterScope(self):
+        diagnostics = diag.Diagnostics()
+        blocks = selector.parseQueryset("select from ${algorithms} where " +
+            "@scope |is| cluster and @depth = [2]")
+        self.assertEqual(selector.filterScope(blocks[0], diagnostics),
+            {"scope": selector.SCOPE_CLUSTER, "depth": 2})
+        self.assertEqual(selector.filterScope(None), None)
+        self.assertEqual(diagnostics.count(), 0)
+        # unknown scope and wrong depth are ignored
+        blocks = selector.parseQueryset("select from ${algorithms} where " +
+            "@scope |is| element and @depth = [0]")
+        self.assertEqual(selector.filterScope(blocks[0], diagnostics), None)
+        self.assertEqual(diagnostics.count(diag.SCOPE_REJECTED), 2)
+        blocks = selector.parseQueryset("select from ${algorithms} where " +
+            "@scope |is| CLUSTER and @depth = 1")
+        self.assertEqual(selector.filterScope(blocks[0])["depth"], 1)
+
+    def test_selector_filterElements_deadline(self):
+        deadline = Deadline()
+        deadline.cancel()
+        block = selector.FilterBlock(self._algorithmsmap, self._pulsemap,
+            self._clustermap, self._elementmap, diag.Diagnostics(), deadline)
+        with self.assertRaises(ex.AnalyticsTimeoutError):
+            selector.filterWithBlock(self.query_cluster_select("2"), block)
+        self.assertEqual(block._isFiltered, False)
+        # deadline that has not passed does not change result
+        elementmap = selector.filterElements(self._elementmap,
+            self._clustermap, self._pulsemap, Deadline(60))
+        self.assertEqual(len(elementmap._map), len(self._e))
+
+    def test_selector_filterElements_timings(self):
+        timings = tm.Timings()
+        pid = [x.id() for x in self._pulsemap._map.values() if
+            x.name() == "dir"][0]
+        cid = [x.id() for x in self._clustermap._map.values() if
+            x.name() == "#3"][0]
+        block = selector.FilterBlock(self._algorithmsmap, self._pulsemap,
+            self._clustermap, self._elementmap, None, None, timings)
+        query = self.query_all_select_static(cid, pid, "down")
+        block = selector.filterWithBlock(query, block)
+        self.assertEqual([(x[0], x[2], x[3]) for x in timings.stages()],
+            [("filter.clusters", 5, 2), ("filter.pulses", 2, 1)])
+
+    def test_selector_explainQueryset(self):
+        pulses = dict((x.name(), x.id()) for x in self._pulsemap._map.values())
+        cid = self._clustermap._map.keys()[0]
+        query = ";".join([
+            "select from ${clusters} where @id = [unknown]",
+            "select from ${clusters} where @id = [%s] and @name = [a]" % (cid),
+            "select from ${pulses} where @%s = [down] and @%s = 3 and " %
+                (pulses["dir"], pulses["random"]) + "@%s = [up] and " %
+                (pulses["random"]) + "@%s |is| dynamic and @unknown = 1 and " %
+                (pulses["dir"]) + "@%s |between| 1 |and| 2" %
+                (pulses["order"]),
+            "select from ${algorithms} where @id = [%1] and @id = [unknown] and " +
+                "@depth = 2",
+            "select from ${elements} where @id = [1]"
+        ])
+        blocks = selector.parseQueryset(query)
+        result = selector.explainQueryset(blocks, self._algorithmsmap,
+            self._pulsemap, self._clustermap)
+        explained = result["blocks"]
+        self.assertEqual([(x["table"], x["used"]) for x in explained],
+            [("CLUSTERS", False), ("CLUSTERS", True), ("PULSES", True),
+            ("ALGORITHMS", True), ("ELEMENTS", False)])
+        # parser does not keep order of predicates
+        statuses = [dict((x["predicate"], x["status"]) for x in
+            y["predicates"]) for y in explained]
+        self.assertEqual(statuses[0], {"@id = [unknown]": "ignored"})
+        self.assertEqual(statuses[1], {"@id = [%s]" % (cid): "applied",
+            "@name = [a]": "ignored"})
+        self.assertEqual(statuses[2], {
+            "@%s = [down]" % (pulses["dir"]): "applied",
+            "@%s = 3" % (pulses["random"]): "applied",
+            "@%s = [up]" % (pulses["random"]): "ignored",
+            "@%s |IS| dynamic" % (pulses["dir"]): "ignored",
+            "@unknown = 1": "ignored",
+            "@%s |BETWEEN| 1 |AND| 2" % (pulses["order"]): "ignored"
+        })
+        self.assertEqual(statuses[3], {"@id = [%251]": "applied",
+            "@id = [unknown]": "ignored", "@depth = 2": "ignored"})
+        self.assertEqual(statuses[4], {"@id = [1]": "ignored"})
+        reasons = dict((x["predicate"], x["reason"]) for x in
+            explained[2]["predicates"])
+        self.assertEqual(reasons["@%s = [down]" % (pulses["dir"])],
+            "Filters elements")
+        self.assertEqual(reasons["@%s |IS| dynamic" % (pulses["dir"])],
+            "Pulse is not dynamic")
+        self.assertEqual(reasons["@%s = 3" % (pulses["random"])],
+            "Sets default of dynamic pulse, does not filter")
+        self.assertEqual(result["dynamic"], [{"id": pulses["random"],
+            "name": "random", "default": 3}])
+        # maps are not changed
+        self.assertEqual(self._pulsemap.get(pulses["dir"]).default(), None)
+        self.assertEqual(len(self._clustermap._map), 5)
+
+
 # Load test suites
 def _suites():
     return [
@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+
+'''
+Copyright 2015 Ivan Sadikov
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+
+# import libs
+from types import ListType, DictType
+# import classes
+import analytics.utils.misc as misc
+from analytics.algorithms.rank import RSYS
+
+
+# response formats
+## default format, list of element objects with nested features
+FORMAT_DEFAULT = "default"
+## columnar format, schema header and parallel arrays
+FORMAT_COLUMNAR = "columnar"
+## rank-only format, catalogue indices and rank codes of elements
+FORMAT_RANKS = "ranks"
+# list of supported formats
+FORMATS = [FORMAT_DEFAULT, FORMAT_COLUMNAR, FORMAT_RANKS]
+
+
+# [Public]
+def isFormatSupported(dataformat):
+    """
+        Returns True, if data format is supported by serializer.
+
+        Args:
+            dataformat (str): data format
+
+        Returns:
+            bool: flag showing whether format is supported
+    """
+    return dataformat in FORMATS
+
+# [Public]
+def rankCode(rank):
+    """
+        Returns code of the rank. Rank value is unique within ranking system,
+        so it is used as a code. If rank is None, undefined rank code is
+        returned.
+
+        Args:
+            rank (Rank): rank instance
+
+        Returns:
+            int: rank code
+    """
+    return rank._value if rank is not None else RSYS.UND_RANK._value
+
+# [Public]
+def rankCodes():
+    """
+        Returns list of all ranks in the system with codes, so client can
+        decode rank codes from columnar response.
+
+        Returns:
+            list<dict>: list of rank json objects with codes
+    """
+    classes = [RSYS.ClassI, RSYS.ClassII, RSYS.ClassIII, RSYS.UND_CLASS]
+    codes = []
+    for pclass in classes:
+        for rank in pclass.allRanks():
+            obj = rank.getJSON()
+            obj["code"] = rankCode(rank)
+            codes.append(obj)
+    # keep codes in descending order, best rank first
+    return sorted(codes, key=lambda x: x["code"], reverse=True)
+
+# [Public]
+def elementsToJSON(elementlist):
+    """
+        Returns default json representation of elements, list of element
+        objects with nested features.
+
+        Args:
+            elementlist (list<Element>): list of elements
+
+        Returns:
+            list<dict>: json representation of elements
+    """
+    misc.checkTypeAgainst(type(elementlist), ListType, __file__)
+    return [x.getJSON() for x in elementlist]
+
+# [Public]
+def elementsToColumnar(elementlist, withRanks=True):
+    """
+        Returns columnar representation of elements. Feature metadata is sent
+        once in schema header, and elements are sent as parallel arrays of
+        ids, names, descriptions, cluster ids and rank codes, plus one array
+        of values per feature in schema order. Missing feature values are
+        None. Order of elements in list is preserved.
+
+        Args:
+            elementlist (list<Element>): list of elements
+            withRanks (bool): flag to include array of rank codes
+
+        Returns:
+            dict<str, obj>: columnar representation of elements
+    """
+    misc.checkTypeAgainst(type(elementlist), ListType, __file__)
+    n = len(elementlist)
+    ids = [None]*n; names = [None]*n; descs = [None]*n
+    clusters = [None]*n; ranks = [None]*n
+    # feature schema and value columns, features are kept in order of
+    # appearance, column is created lazily and filled with None for elements
+    # that were processed before feature was met
+    features = []; columns = {}
+    for _i in range(n):
+        element = elementlist[_i]
+        ids[_i] = element._id
+        names[_i] = element._name
+        descs[_i] = element._desc
+        parent = element._cluster
+        clusters[_i] = parent._id if parent is not None else None
+        ranks[_i] = rankCode(element._rank)
+        for fid, feature in element._features.items():
+            column = columns.get(fid)
+            if column is None:
+                column = [None]*n
+                columns[fid] = column
+                features.append({
+                    "id": fid,
+                    "name": feature._name,
+                    "desc": feature._desc,
+                    "type": feature._type.__name__
+                })
+            column[_i] = feature._value
+    obj = {
+        "format": FORMAT_COLUMNAR,
+        "length": n,
+        "schema": {"features": features, "ranks": rankCodes()},
+        "id": ids,
+        "name": names,
+        "desc": descs,
+        "cluster": clusters,
+        "values": [columns[x["id"]] for x in features]
+    }
+    if withRanks:
+        obj["rank"] = ranks
+    return obj
+
+# [Public]
+def catalogueOrder(elementlist):
+    """
+        Returns element ids in catalogue order. Catalogue order depends only
+        on ids, so it is the same for every request of the dataset version.
+
+        Args:
+            elementlist (list<Element>): list of elements
+
+        Returns:
+            list<str>: sorted list of element ids
+    """
+    misc.checkTypeAgainst(type(elementlist), ListType, __file__)
+    return sorted([x._id for x in elementlist])
+
+# [Public]
+def catalogueIndex(elementlist):
+    """
+        Returns position of each element id in catalogue order. Index is the
+        same for every request of the dataset version, so it is computed
+        once for processed dataset.
+
+        Args:
+            elementlist (list<Element>): list of elements
+
+        Returns:
+            dict<str, int>: catalogue position by element id
+    """
+    order = catalogueOrder(elementlist)
+    return dict((order[_i], _i) for _i in range(len(order)))
+
+# [Public]
+def elementsToCatalogue(elementlist):
+    """
+        Returns catalogue of elements, columnar representation of elements
+        in catalogue order without ranks. Clients fetch catalogue once per
+        dataset version and use rank-only responses afterwards.
+
+        Args:
+            elementlist (list<Element>): list of elements
+
+        Returns:
+            dict<str, obj>: catalogue of elements
+    """
+    misc.checkTypeAgainst(type(elementlist), ListType, __file__)
+    elementlist = sorted(elementlist, key=lambda x: x._id)
+    return elementsToColumnar(elementlist, False)
+
+# [Public]
+def elementsToRanks(elementlist, positions):
+    """
+        Returns rank-only representation of elements as parallel arrays of
+        catalogue indices and rank codes. Order of elements in list is
+        preserved.
+
+        Args:
+            elementlist (list<Element>): list of elements
+            positions (dict<str, int>): catalogue index, see "catalogueIndex"
+
+        Returns:
+            dict<str, obj>: rank-only representation of elements
+    """
+    misc.checkTypeAgainst(type(elementlist), ListType, __file__)
+    misc.checkTypeAgainst(type(positions), DictType, __file__)
+    return {
+        "format": FORMAT_RANKS,
+        "length": len(elementlist),
+        "index": [positions[x._id] for x in elementlist],
+        "rank": [rankCode(x._rank) for x in elementlist]
+    }
+
+# [Public]
+def serializeElements(elementlist, dataformat=FORMAT_DEFAULT,
+        positions=None):
+    """
+        Serializes elements list into json object using format specified.
+        Raises error, if format is not supported. Rank-only format requires
+        catalogue index of elements.
+
+        Args:
+            elementlist (list<Element>): list of elements
+            dataformat (str): data format
+            positions (dict<str, int>): catalogue index, see
+                "catalogueIndex"
+
+        Returns:
+            obj: json representation of elements
+    """
+    if dataformat == FORMAT_DEFAULT:
+        return elementsToJSON(elementlist)
+    elif dataformat == FORMAT_COLUMNAR:
+        return elementsToColumnar(elementlist)
+    elif dataformat == FORMAT_RANKS:
+        return elementsToRanks(elementlist, positions)
+    else:
+        msg = "Unknown format %s" % (str(dataformat))
+        misc.raiseValueError(msg, __file__)
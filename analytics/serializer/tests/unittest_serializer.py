@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+
+# import libs
+import unittest
+import json
+from types import ListType, DictType
+# import classes
+import analytics.exceptions.exceptions as ex
+import analytics.serializer.serializer as serializer
+from analytics.core.cluster import Cluster
+from analytics.core.element import Element
+from analytics.core.attribute.feature import Feature
+from analytics.algorithms.rank import RSYS
+
+
+class Serializer_TestSequence(unittest.TestCase):
+    def setUp(self):
+        self._cluster = Cluster("1", "#1", "#1")
+        self._elements = []
+        for _i in range(5):
+            element = Element(str(_i), "@%d" % (_i), "@%d" % (_i))
+            element._cluster = self._cluster if _i % 2 == 0 else None
+            element.addFeature(Feature("price", "price", 1.0*_i))
+            element.addFeature(Feature("dir", "dir", "up"))
+            if _i > 2:
+                element.addFeature(Feature("count", "count", _i))
+            element.setRank(RSYS.O if _i % 2 == 0 else RSYS.T)
+            self._elements.append(element)
+
+    def test_serializer_isFormatSupported(self):
+        self.assertEqual(serializer.isFormatSupported("default"), True)
+        self.assertEqual(serializer.isFormatSupported("columnar"), True)
+        self.assertEqual(serializer.isFormatSupported("csv"), False)
+        self.assertEqual(serializer.isFormatSupported(None), False)
+
+    def test_serializer_rankCodes(self):
+        codes = serializer.rankCodes()
+        self.assertEqual(len(codes), 10)
+        self.assertEqual(len(set([x["code"] for x in codes])), 10)
+        self.assertEqual(codes[0]["name"], RSYS.O._name)
+        self.assertEqual(codes[-1]["code"], serializer.rankCode(None))
+
+    def test_serializer_elementsToJSON(self):
+        obj = serializer.elementsToJSON(self._elements)
+        self.assertEqual(type(obj), ListType)
+        self.assertEqual(obj, [x.getJSON() for x in self._elements])
+        with self.assertRaises(ex.AnalyticsCheckError):
+            serializer.elementsToJSON(None)
+
+    def test_serializer_elementsToColumnar(self):
+        obj = serializer.elementsToColumnar(self._elements)
+        self.assertEqual(type(obj), DictType)
+        self.assertEqual(obj["format"], serializer.FORMAT_COLUMNAR)
+        self.assertEqual(obj["length"], len(self._elements))
+        self.assertEqual(len(obj["schema"]["features"]), 3)
+        self.assertEqual(len(obj["values"]), 3)
+        # parallel arrays preserve order of elements
+        for _i in range(len(self._elements)):
+            element = self._elements[_i]
+            self.assertEqual(obj["id"][_i], element.id())
+            self.assertEqual(obj["name"][_i], element.name())
+            self.assertEqual(obj["rank"][_i], element.rank()._value)
+            cluster = element.cluster()
+            self.assertEqual(
+                obj["cluster"][_i],
+                cluster.id() if cluster is not None else None
+            )
+            # every feature is recovered from column, missing ones are None
+            for _j in range(len(obj["schema"]["features"])):
+                fid = obj["schema"]["features"][_j]["id"]
+                value = obj["values"][_j][_i]
+                if fid in element._features:
+                    self.assertEqual(value, element._features[fid].value())
+                else:
+                    self.assertEqual(value, None)
+
+    def test_serializer_elementsToColumnarEmpty(self):
+        obj = serializer.elementsToColumnar([])
+        self.assertEqual(obj["length"], 0)
+        self.assertEqual(obj["schema"]["features"], [])
+        self.assertEqual(obj["values"], [])
+
+    def test_serializer_columnarIsSmaller(self):
+        default = json.dumps(serializer.elementsToJSON(self._elements))
+        columnar = json.dumps(serializer.elementsToColumnar(self._elements))
+        self.assertTrue(len(columnar) < len(default))
+
+    def test_serializer_catalogue(self):
+        obj = serializer.elementsToCatalogue(self._elements)
+        self.assertEqual(obj["length"], len(self._elements))
+        self.assertEqual("rank" in obj, False)
+        self.assertEqual(obj["id"], serializer.catalogueOrder(self._elements))
+        self.assertEqual(obj["id"], sorted(obj["id"]))
+
+    def test_serializer_elementsToRanks(self):
+        order = serializer.catalogueOrder(self._elements)
+        positions = serializer.catalogueIndex(self._elements)
+        self.assertEqual(sorted(positions.keys(), key=positions.get), order)
+        subset = self._elements[1:4]
+        obj = serializer.elementsToRanks(subset, positions)
+        self.assertEqual(obj["format"], serializer.FORMAT_RANKS)
+        self.assertEqual(obj["length"], len(subset))
+        for _i in range(len(subset)):
+            self.assertEqual(order[obj["index"][_i]], subset[_i].id())
+            self.assertEqual(obj["rank"][_i], subset[_i].rank()._value)
+        with self.assertRaises(ex.AnalyticsCheckError):
+            serializer.elementsToRanks(subset, None)
+
+    def test_serializer_serializeElements(self):
+        obj = serializer.serializeElements(self._elements)
+        self.assertEqual(type(obj), ListType)
+        obj = serializer.serializeElements(self._elements, "columnar")
+        self.assertEqual(type(obj), DictType)
+        positions = serializer.catalogueIndex(self._elements)
+        obj = serializer.serializeElements(self._elements, "ranks", positions)
+        self.assertEqual(obj["format"], "ranks")
+        with self.assertRaises(ex.AnalyticsValueError):
+            serializer.serializeElements(self._elements, "csv")
+
+
+# Load test suites
+def _suites():
+    return [
+        Serializer_TestSequence
+    ]
+
+# Load tests
+def loadSuites():
+    # global test suite for this module
+    gsuite = unittest.TestSuite()
+    for suite in _suites():
+        gsuite.addTest(unittest.TestLoader().loadTestsFromTestCase(suite))
+    return gsuite
+
+if __name__ == '__main__':
+    suite = loadSuites()
+    print ""
+    print "### Running tests ###"
+    print "-" * 70
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,595 @@
+#!/usr/bin/env python
+
+'''
+Copyright 2015 Ivan Sadikov
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+
+# import os, sys and update path
+import os
+import sys
+
+# set default path as an external directory of the module
+DIR_PATH = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+)
+sys.path.append(DIR_PATH)
+
+# import libs
+import asyncore
+import collections
+import errno
+import socket
+import threading
+import time
+import urlparse
+import Queue
+from types import IntType, TupleType
+# import classes
+import analytics.utils.misc as misc
+import analytics.service as service
+import analytics.server.routes as routes
+
+"""
+    Standalone event-driven HTTP server. One thread multiplexes all client
+    connections with "asyncore", so many slow or idle keep-alive clients do
+    not hold a thread each. API calls are CPU-bound and are run by bounded
+    pool of executor threads, event loop only reads requests and writes
+    responses. When executor queue is full, request is answered with 503
+    right away instead of waiting.
+
+    Connections are kept alive for HTTP/1.1 unless client sends
+    "Connection: close", and for HTTP/1.0 only with "Connection: keep-alive".
+    Requests of one connection are answered in order, one at a time. Idle
+    connections are closed after KEEPALIVE_TIMEOUT.
+
+    User is resolved by authentication hook from request headers, see
+    "routes.localUser" and "routes.trustedHeader".
+
+    Usage:
+        python analytics/server/asyncserver.py [host:port] [threads]
+"""
+
+# default address of the server
+ADDRESS = ("127.0.0.1", 8080)
+# default number of executor threads
+NUM_THREADS = 4
+# default number of requests waiting for executor
+QUEUE_SIZE = 64
+# backlog of listening socket
+BACKLOG = 128
+# seconds before idle connection is closed
+KEEPALIVE_TIMEOUT = 15.0
+# maximum size of request line and headers in bytes
+MAX_HEADER_SIZE = 64 * 1024
+# size of socket reads
+READ_SIZE = 64 * 1024
+# timeout of single loop iteration in seconds
+LOOP_TIMEOUT = 1.0
+
+# reason phrases of status codes
+_REASONS = {
+    200: "OK", 304: "Not Modified", 400: "Bad Request",
+    405: "Method Not Allowed", 431: "Request Header Fields Too Large",
+    500: "Internal Server Error", 503: "Service Unavailable"
+}
+
+
+# [Public]
+def parseRequest(data):
+    """
+        Parses request line and headers of HTTP request. Body is not
+        supported, as all API calls are GET requests.
+
+        Args:
+            data (str): request line and headers without final empty line
+
+        Returns:
+            tuple<str, str, str, dict>: method, target, version and headers,
+                or None, if request is malformed
+    """
+    lines = data.split("\r\n")
+    parts = lines[0].split()
+    if len(parts) != 3 or not parts[2].startswith("HTTP/"):
+        return None
+    headers = {}
+    for line in lines[1:]:
+        name, sep, value = line.partition(":")
+        if not sep or not name.strip():
+            return None
+        headers[name.strip()] = value.strip()
+    return (parts[0], parts[1], parts[2], headers)
+
+
+# [Public]
+def keepAlive(version, headers):
+    """
+        Returns True, if connection is kept alive after response.
+
+        Args:
+            version (str): HTTP version of request
+            headers (dict<str, str>): request headers
+
+        Returns:
+            bool: flag showing that connection is kept alive
+    """
+    connection = ""
+    for name, value in headers.items():
+        if name.lower() == "connection":
+            connection = value.lower()
+    if version == "HTTP/1.1":
+        return "close" not in connection
+    return "keep-alive" in connection
+
+
+# [Public]
+def formatResponse(code, headers, body, alive):
+    """
+        Formats HTTP/1.1 response.
+
+        Args:
+            code (int): status code
+            headers (list<tuple>): response headers
+            body (str): response body
+            alive (bool): flag showing that connection is kept alive
+
+        Returns:
+            str: response
+    """
+    lines = ["HTTP/1.1 %d %s" % (code, _REASONS.get(code, "Unknown"))]
+    for name, value in headers:
+        lines.append("%s: %s" % (name, value))
+    lines.append("Content-Length: %d" % (len(body)))
+    lines.append("Connection: %s" % ("keep-alive" if alive else "close"))
+    return "\r\n".join(lines) + "\r\n\r\n" + body
+
+
+class _Executor(object):
+    """
+        _Executor class runs API calls in bounded pool of threads. Finished
+        calls are passed to event loop through "done" queue, and loop is
+        woken up.
+
+        Attributes:
+            _tasks (Queue): tasks waiting for thread
+            _done (deque): finished tasks, connection and response
+            _wake (func): wakes up event loop
+            _threads (list<Thread>): executor threads
+    """
+    def __init__(self, numthreads, queuesize, wake):
+        self._tasks = Queue.Queue(queuesize)
+        self._done = collections.deque()
+        self._wake = wake
+        self._threads = []
+        for _i in range(numthreads):
+            thread = threading.Thread(target=self._work,
+                name="executor-%d" % (_i))
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    # [Private]
+    def _work(self):
+        while True:
+            task = self._tasks.get()
+            if task is None:
+                break
+            connection, func = task
+            try:
+                response = func()
+            except BaseException as e:
+                msg = "Internal error: %s" % (str(e))
+                response = routes.send({},
+                    service._generateErrorMessage([msg], 500))
+            self._done.append((connection, response))
+            self._wake()
+
+    # [Public]
+    def submit(self, connection, func):
+        """
+            Submits API call, returns False, if queue is full.
+
+            Args:
+                connection (_Connection): connection of request
+                func (func): API call, returns response
+
+            Returns:
+                bool: flag showing that call is accepted
+        """
+        try:
+            self._tasks.put_nowait((connection, func))
+            return True
+        except Queue.Full:
+            return False
+
+    # [Public]
+    def done(self):
+        """
+            Returns finished tasks and removes them from queue.
+
+            Returns:
+                list<tuple>: connection and response of each task
+        """
+        finished = []
+        while self._done:
+            finished.append(self._done.popleft())
+        return finished
+
+    # [Public]
+    def stop(self):
+        for thread in self._threads:
+            self._tasks.put(None)
+        for thread in self._threads:
+            thread.join()
+
+
+class _Waker(asyncore.dispatcher):
+    """
+        _Waker class wakes up event loop from other threads by writing a byte
+        into socket pair.
+
+        Attributes:
+            _writer (socket): write end of socket pair
+    """
+    def __init__(self, socketmap):
+        reader, self._writer = socket.socketpair()
+        asyncore.dispatcher.__init__(self, reader, socketmap)
+
+    # [Public]
+    def wake(self):
+        try:
+            self._writer.send("x")
+        except socket.error:
+            pass
+
+    # [Public]
+    def writable(self):
+        return False
+
+    # [Public]
+    def handle_read(self):
+        try:
+            self.recv(4096)
+        except socket.error:
+            pass
+
+    # [Public]
+    def handle_close(self):
+        self.close()
+
+    # [Public]
+    def close(self):
+        asyncore.dispatcher.close(self)
+        self._writer.close()
+
+
+class _Connection(asyncore.dispatcher):
+    """
+        _Connection class reads requests of one client and writes responses.
+
+        Attributes:
+            _server (AsyncServer): server of connection
+            _inbuf (str): received data that is not processed yet
+            _outbuf (str): response data that is not sent yet
+            _busy (bool): flag showing that request is being executed
+            _alive (bool): flag showing that connection is kept alive
+            _active (float): time of the last activity
+    """
+    def __init__(self, sock, server):
+        asyncore.dispatcher.__init__(self, sock, server._map)
+        self._server = server
+        self._inbuf = ""
+        self._outbuf = ""
+        self._busy = False
+        self._alive = True
+        self._active = time.time()
+
+    # [Public]
+    def readable(self):
+        # requests are answered one at a time, next is read afterwards
+        return not self._busy and not self._outbuf and self._alive
+
+    # [Public]
+    def writable(self):
+        return bool(self._outbuf)
+
+    # [Public]
+    def handle_read(self):
+        data = self.recv(READ_SIZE)
+        if not data:
+            return
+        self._active = time.time()
+        self._inbuf += data
+        self._next()
+
+    # [Private]
+    def _next(self):
+        """
+            Parses next request from buffer and submits it to executor.
+        """
+        end = self._inbuf.find("\r\n\r\n")
+        if end < 0:
+            if len(self._inbuf) > MAX_HEADER_SIZE:
+                self._reply(431, "Request is too large", False)
+            return
+        data = self._inbuf[:end]
+        self._inbuf = self._inbuf[end+4:]
+        request = parseRequest(data.lstrip("\r\n"))
+        if request is None:
+            self._reply(400, "Malformed request", False)
+            return
+        method, target, version, headers = request
+        alive = keepAlive(version, headers)
+        if method != "GET":
+            self._reply(405, "Method is not allowed", alive)
+            return
+        url = urlparse.urlparse(target)
+        params = dict((key, values[0]) for key, values in
+            urlparse.parse_qs(url.query, True).items())
+        server = self._server
+        def call():
+            return routes.handle(url.path, params, headers,
+                server._auth(headers), server._dmngr)
+        self._busy = True
+        self._alive = alive
+        if not server._executor.submit(self, call):
+            self._busy = False
+            server._stats["rejected"] += 1
+            self._reply(503, "Server is overloaded", alive)
+
+    # [Private]
+    def _reply(self, code, msg, alive):
+        response = routes.send({}, service._generateErrorMessage([msg], code))
+        self.respond(response, alive)
+
+    # [Public]
+    def respond(self, response, alive=None):
+        """
+            Queues response for sending. Connection is closed after response,
+            unless it is kept alive.
+
+            Args:
+                response (tuple<int, list, str>): status, headers and body
+                alive (bool): flag showing that connection is kept alive
+        """
+        self._busy = False
+        if alive is not None:
+            self._alive = alive
+        code, headers, body = response
+        self._outbuf += formatResponse(code, headers, body, self._alive)
+        self._server._stats["requests"] += 1
+        self._active = time.time()
+        self.handle_write()
+
+    # [Public]
+    def handle_write(self):
+        try:
+            sent = self.send(self._outbuf)
+        except socket.error as e:
+            if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return
+            raise
+        self._outbuf = self._outbuf[sent:]
+        if self._outbuf:
+            return
+        if not self._alive:
+            self.close()
+        elif self._inbuf:
+            # pipelined request
+            self._next()
+
+    # [Public]
+    def idle(self, now):
+        """
+            Returns True, if connection waits for request longer than
+            KEEPALIVE_TIMEOUT.
+
+            Args:
+                now (float): current time
+
+            Returns:
+                bool: flag showing that connection is idle
+        """
+        return not self._busy and not self._outbuf and \
+            now - self._active > KEEPALIVE_TIMEOUT
+
+    # [Public]
+    def handle_close(self):
+        self.close()
+
+    # [Public]
+    def handle_error(self):
+        self.close()
+
+
+class _Listener(asyncore.dispatcher):
+    """
+        _Listener class accepts connections.
+
+        Attributes:
+            _server (AsyncServer): server of listener
+    """
+    def __init__(self, server, address):
+        asyncore.dispatcher.__init__(self, map=server._map)
+        self._server = server
+        self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.set_reuse_addr()
+        self.bind(address)
+        self.listen(BACKLOG)
+
+    # [Public]
+    def handle_accept(self):
+        pair = self.accept()
+        if pair is not None:
+            sock = pair[0]
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            _Connection(sock, self._server)
+            self._server._stats["connections"] += 1
+
+
+class AsyncServer(object):
+    """
+        AsyncServer class runs event-driven HTTP server, see module
+        description. Server must be started with "start", then
+        "serveForever" runs event loop until "stop" is called from another
+        thread.
+
+        Attributes:
+            _address (tuple<str, int>): address to listen on
+            _numthreads (int): number of executor threads
+            _queuesize (int): number of requests waiting for executor
+            _auth (func): authentication hook, returns email of the user
+            _dmngr (DataManager): datamanager, default if None
+            _map (dict): socket map of event loop
+            _listener (_Listener): listener, None until started
+            _waker (_Waker): waker of event loop
+            _executor (_Executor): executor of API calls
+            _running (bool): flag showing that event loop is running
+            _watching (bool): flag showing that server started watcher of
+                default datamanager
+            _stats (dict<str, int>): number of connections, requests and
+                rejected requests
+    """
+    def __init__(self, address=ADDRESS, numthreads=NUM_THREADS,
+            queuesize=QUEUE_SIZE, auth=routes.localUser, dmngr=None):
+        misc.checkTypeAgainst(type(address), TupleType, __file__)
+        misc.checkTypeAgainst(type(numthreads), IntType, __file__)
+        misc.checkTypeAgainst(type(queuesize), IntType, __file__)
+        if numthreads < 1 or queuesize < 1:
+            misc.raiseValueError("Number of threads and queue size must be " +
+                "positive", __file__)
+        self._address = address
+        self._numthreads = numthreads
+        self._queuesize = queuesize
+        self._auth = auth
+        self._dmngr = dmngr
+        self._map = {}
+        self._listener = None
+        self._waker = None
+        self._executor = None
+        self._running = False
+        self._watching = False
+        self._ranking = False
+        self._stats = {"connections": 0, "requests": 0, "rejected": 0}
+
+    # [Public]
+    def start(self):
+        """
+            Binds listening socket and starts executor threads. Processes
+            ranking partitions and shards of hot datasets are started before
+            any thread. Watcher of default datamanager is started, if
+            WATCH_INTERVAL is positive.
+        """
+        if self._listener is not None:
+            misc.raiseStandardError("Server is started already", __file__)
+        self._ranking = service.startRankingPool()
+        service.startSharding(None, self._dmngr)
+        self._listener = _Listener(self, self._address)
+        self._waker = _Waker(self._map)
+        self._executor = _Executor(self._numthreads, self._queuesize,
+            self._waker.wake)
+        self._running = True
+        if service.WATCH_INTERVAL > 0 and self._dmngr is None:
+            service.startWatcher(None, service.WATCH_INTERVAL)
+            self._watching = True
+
+    # [Public]
+    def address(self):
+        """
+            Returns address that server listens on.
+
+            Returns:
+                tuple<str, int>: host and port
+        """
+        if self._listener is None:
+            return self._address
+        return self._listener.socket.getsockname()
+
+    # [Public]
+    def stats(self):
+        """
+            Returns number of accepted connections, answered requests and
+            requests rejected, because executor queue was full.
+
+            Returns:
+                dict<str, int>: server statistics
+        """
+        return dict(self._stats)
+
+    # [Public]
+    def serveForever(self):
+        """
+            Runs event loop until server is stopped, closes all connections
+            and stops executor afterwards.
+        """
+        try:
+            lastsweep = time.time()
+            while self._running:
+                asyncore.loop(LOOP_TIMEOUT, False, self._map, 1)
+                for connection, response in self._executor.done():
+                    if connection.connected:
+                        connection.respond(response)
+                now = time.time()
+                if now - lastsweep > 1.0:
+                    lastsweep = now
+                    for dispatcher in self._map.values():
+                        if isinstance(dispatcher, _Connection) and \
+                                dispatcher.idle(now):
+                            dispatcher.close()
+        finally:
+            self._close()
+
+    # [Public]
+    def stop(self):
+        """
+            Stops event loop, can be called from any thread.
+        """
+        self._running = False
+        # event loop may close waker at the same time
+        waker = self._waker
+        if waker is not None:
+            waker.wake()
+
+    # [Private]
+    def _close(self):
+        if self._executor is not None:
+            self._executor.stop()
+        asyncore.close_all(self._map)
+        if self._watching:
+            service.stopWatcher()
+            self._watching = False
+        if self._ranking:
+            service.stopRankingPool()
+            self._ranking = False
+        service.stopSharding()
+        self._listener = None
+        self._waker = None
+        self._executor = None
+
+
+if __name__ == '__main__':
+    address = ADDRESS
+    if len(sys.argv) > 1:
+        host, port = sys.argv[1].rsplit(":", 1)
+        address = (host, int(port))
+    numthreads = int(sys.argv[2]) if len(sys.argv) > 2 else NUM_THREADS
+    server = AsyncServer(address, numthreads)
+    server.start()
+    print "### Async server on %s:%d, %d threads ###" % (server.address() +
+        (numthreads,))
+    try:
+        server.serveForever()
+    except KeyboardInterrupt:
+        pass
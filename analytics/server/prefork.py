@@ -0,0 +1,421 @@
+#!/usr/bin/env python
+
+'''
+Copyright 2015 Ivan Sadikov
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+
+# import os, sys and update path
+import os
+import sys
+
+# set default path as an external directory of the module
+DIR_PATH = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+)
+sys.path.append(DIR_PATH)
+
+# import libs
+import BaseHTTPServer
+import errno
+import gc
+import json
+import signal
+import socket
+import threading
+import time
+import urlparse
+from types import IntType, ListType, TupleType
+# import classes
+import analytics.utils.misc as misc
+import analytics.utils.memory as memory
+import analytics.utils.workers as workers
+import analytics.service as service
+import analytics.server.routes as routes
+
+"""
+    Standalone preforking server. Master process loads and processes datasets
+    once, then forks request workers, that share processed datasets with
+    master copy-on-write, so memory of datasets is paid once instead of once
+    for every worker. Workers accept connections on the same listening
+    socket, and master starts new worker, when one exits.
+
+    Cyclic garbage collector is disabled, while datasets are built, as it
+    would scan growing heap of elements and features over and over again.
+    Heap is frozen afterwards: with "gc.freeze" (Python 3.7+) collector
+    ignores objects of master, otherwise full collections, that touch every
+    object and unshare its page, are made rare in workers.
+
+    Memory report of workers shows unique and shared memory of each worker.
+    Each worker also serves its own usage at "/api/memory".
+
+    Usage:
+        python analytics/server/prefork.py [host:port] [workers] [datasets]
+"""
+
+# default number of workers
+NUM_WORKERS = workers.MAX_PROCESSES
+# default address of the server
+ADDRESS = ("127.0.0.1", 8080)
+# backlog of listening socket
+BACKLOG = 128
+# number of second generation collections before full collection, when heap
+# cannot be frozen, Python default is 10
+FULL_COLLECTION_THRESHOLD = 1000
+# interval in seconds to check for exited workers
+POLL_INTERVAL = 0.5
+# time in seconds to wait for workers to exit on stop
+STOP_TIMEOUT = 5.0
+
+
+# [Public]
+def freezeHeap():
+    """
+        Collects garbage and freezes heap, so objects that exist now are not
+        scanned by collector in forked processes. Returns True, if heap is
+        frozen with "gc.freeze", and False, if only full collections are made
+        rare, as "gc.freeze" is not available.
+
+        Returns:
+            bool: flag showing that heap is frozen
+    """
+    gc.collect()
+    if hasattr(gc, "freeze"):
+        gc.freeze()
+        return True
+    first, second, third = gc.get_threshold()
+    gc.set_threshold(first, second, max(third, FULL_COLLECTION_THRESHOLD))
+    return False
+
+
+# [Public]
+def preloadFrozen(datasetIds, dmngr=None):
+    """
+        Loads and processes datasets with garbage collector disabled, and
+        freezes heap afterwards. Collector is restored to previous state.
+
+        Args:
+            datasetIds (list<str>): dataset ids to preload
+            dmngr (DataManager): hook to pass own datamanager for tests
+
+        Returns:
+            dict<str, dict>: load timings for every dataset, see
+                "service.preload"
+    """
+    misc.checkTypeAgainst(type(datasetIds), ListType, __file__)
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        timings = service.preload(datasetIds, dmngr)
+        freezeHeap()
+    finally:
+        if enabled:
+            gc.enable()
+    return timings
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+        _Handler class passes GET requests of worker to API calls.
+    """
+    server_version = "pulsar"
+
+    # [Public]
+    def do_GET(self):
+        url = urlparse.urlparse(self.path)
+        params = dict((key, values[0]) for key, values in
+            urlparse.parse_qs(url.query, True).items())
+        headers = dict(self.headers.items())
+        code, rheaders, body = routes.handle(url.path, params, headers,
+            self.server.auth(headers), self.server.dmngr)
+        self.send_response(code)
+        for name, value in rheaders:
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    # [Public]
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            BaseHTTPServer.BaseHTTPRequestHandler.log_message(self, format,
+                *args)
+
+
+class _WorkerServer(BaseHTTPServer.HTTPServer):
+    """
+        _WorkerServer class serves requests on listening socket inherited
+        from master.
+
+        Attributes:
+            auth (func): authentication hook, returns email of the user
+            dmngr (DataManager): datamanager, default if None
+            quiet (bool): flag to not log requests
+    """
+    def __init__(self, sock, auth, dmngr, quiet):
+        BaseHTTPServer.HTTPServer.__init__(self, sock.getsockname(), _Handler,
+            False)
+        self.socket.close()
+        self.socket = sock
+        self.auth = auth
+        self.dmngr = dmngr
+        self.quiet = quiet
+
+
+class PreforkServer(object):
+    """
+        PreforkServer class runs master of preforking server, see module
+        description. Master must be started with "start" and stopped with
+        "stop", "serveForever" serves until master receives SIGTERM or
+        SIGINT.
+
+        Attributes:
+            _address (tuple<str, int>): address to listen on
+            _numworkers (int): number of workers
+            _datasetIds (list<str>): ids of datasets to preload
+            _auth (func): authentication hook, returns email of the user
+            _dmngr (DataManager): datamanager, default if None
+            _quiet (bool): flag to not log requests
+            _socket (socket): listening socket, None until started
+            _workers (list<int>): process ids of running workers
+            _timings (dict<str, dict>): load timings of datasets
+            _running (bool): flag showing that workers are restarted
+    """
+    def __init__(self, address=ADDRESS, numworkers=NUM_WORKERS,
+            datasetIds=None, auth=routes.localUser, dmngr=None, quiet=False):
+        misc.checkTypeAgainst(type(address), TupleType, __file__)
+        misc.checkTypeAgainst(type(numworkers), IntType, __file__)
+        if numworkers < 1:
+            misc.raiseValueError("Number of workers must be positive",
+                __file__)
+        if os.name != "posix":
+            misc.raiseStandardError("Preforking requires posix", __file__)
+        self._address = address
+        self._numworkers = numworkers
+        self._datasetIds = service.HOT_DATASETS if datasetIds is None \
+            else datasetIds
+        self._auth = auth
+        self._dmngr = dmngr
+        self._quiet = quiet
+        self._socket = None
+        self._workers = []
+        self._timings = {}
+        self._running = False
+
+    # [Public]
+    def start(self):
+        """
+            Preloads datasets, binds listening socket and forks workers.
+            Watcher of datasets is stopped in master after preloading, so no
+            thread is running when workers are forked, and each worker starts
+            its own, if it is enabled, as master does not serve requests.
+        """
+        if self._socket is not None:
+            misc.raiseStandardError("Server is started already", __file__)
+        self._timings = preloadFrozen(self._datasetIds, self._dmngr)
+        service.stopWatcher()
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            sock.bind(self._address)
+            sock.listen(BACKLOG)
+        except:
+            sock.close()
+            raise
+        self._socket = sock
+        self._running = True
+        for _i in range(self._numworkers):
+            self._spawn()
+
+    # [Private]
+    def _spawn(self):
+        """
+            Forks worker, that serves requests until it is terminated. Master
+            must not run other threads, as locks they hold at the moment of
+            fork are never released in worker.
+        """
+        if threading.active_count() != 1:
+            misc.raiseStandardError("Cannot fork worker, while %d threads "
+                % (threading.active_count()) + "are running", __file__)
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                self._serveWorker()
+            except BaseException:
+                code = 1
+            finally:
+                os._exit(code)
+        self._workers.append(pid)
+
+    # [Private]
+    def _serveWorker(self):
+        """
+            Serves requests in worker process. Processes ranking partitions
+            and shards of hot datasets are forked by worker, before watcher
+            thread is started.
+        """
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        service.startRankingPool()
+        service.startSharding(None, self._dmngr)
+        if service.WATCH_INTERVAL > 0 and self._dmngr is None:
+            service.startWatcher(None, service.WATCH_INTERVAL)
+        server = _WorkerServer(self._socket, self._auth, self._dmngr,
+            self._quiet)
+        server.serve_forever()
+
+    # [Public]
+    def address(self):
+        """
+            Returns address that server listens on, e.g. with actual port, if
+            port 0 was requested.
+
+            Returns:
+                tuple<str, int>: host and port
+        """
+        if self._socket is None:
+            return self._address
+        return self._socket.getsockname()
+
+    # [Public]
+    def workers(self):
+        """
+            Returns process ids of running workers.
+
+            Returns:
+                list<int>: process ids
+        """
+        return list(self._workers)
+
+    # [Public]
+    def timings(self):
+        """
+            Returns load timings of preloaded datasets.
+
+            Returns:
+                dict<str, dict>: status, time and error for each dataset
+        """
+        return self._timings
+
+    # [Public]
+    def report(self):
+        """
+            Returns memory usage of master and each worker. Shared memory of
+            workers includes datasets processed by master.
+
+            Returns:
+                dict<str, obj>: usage of master and usage of workers by pid
+        """
+        return {
+            "master": memory.memoryUsage(os.getpid()),
+            "workers": memory.memoryReport(self._workers)
+        }
+
+    # [Public]
+    def poll(self):
+        """
+            Reaps exited workers and starts new ones instead, while server is
+            running. Returns number of workers that exited.
+
+            Returns:
+                int: number of exited workers
+        """
+        exited = 0
+        for pid in list(self._workers):
+            try:
+                done, status = os.waitpid(pid, os.WNOHANG)
+            except OSError as e:
+                if e.errno != errno.ECHILD:
+                    raise
+                done = pid
+            if done == pid:
+                self._workers.remove(pid)
+                exited += 1
+                if self._running:
+                    self._spawn()
+        return exited
+
+    # [Public]
+    def serveForever(self):
+        """
+            Restarts exited workers until master receives SIGTERM or SIGINT,
+            prints memory report on SIGUSR1, and stops server afterwards.
+        """
+        def terminate(signum, frame):
+            self._running = False
+        def report(signum, frame):
+            print json.dumps(self.report(), indent=2, sort_keys=True)
+        signal.signal(signal.SIGTERM, terminate)
+        signal.signal(signal.SIGINT, terminate)
+        signal.signal(signal.SIGUSR1, report)
+        try:
+            while self._running:
+                self.poll()
+                time.sleep(POLL_INTERVAL)
+        finally:
+            self.stop()
+
+    # [Public]
+    def stop(self):
+        """
+            Terminates workers and closes listening socket. Workers that do
+            not exit within STOP_TIMEOUT are killed.
+        """
+        self._running = False
+        for pid in self._workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+        deadline = time.time() + STOP_TIMEOUT
+        while self._workers and time.time() < deadline:
+            self.poll()
+            if self._workers:
+                time.sleep(0.01)
+        for pid in self._workers:
+            try:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+            except OSError:
+                pass
+        self._workers = []
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+
+if __name__ == '__main__':
+    address = ADDRESS
+    if len(sys.argv) > 1:
+        host, port = sys.argv[1].rsplit(":", 1)
+        address = (host, int(port))
+    numworkers = int(sys.argv[2]) if len(sys.argv) > 2 else NUM_WORKERS
+    datasetIds = sys.argv[3].split(",") if len(sys.argv) > 3 else None
+    server = PreforkServer(address, numworkers, datasetIds)
+    server.start()
+    print ""
+    print "### Prefork server on %s:%d, %d workers ###" % (server.address() +
+        (numworkers,))
+    print "-" * 70
+    for datasetId, timing in sorted(server.timings().items()):
+        print "%-30s %-8s %7.3f sec  %s" % (datasetId, timing["status"],
+            timing["time"], timing["error"] or "")
+    usage = server.report()
+    print "master: %s" % (usage["master"])
+    for pid, worker in sorted(usage["workers"].items()):
+        print "worker %d: %s" % (pid, worker)
+    print ""
+    server.serveForever()
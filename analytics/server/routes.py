@@ -0,0 +1,385 @@
+#!/usr/bin/env python
+
+'''
+Copyright 2015 Ivan Sadikov
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+
+# import libs
+import os
+import json
+# import classes
+import analytics.service as service
+import analytics.serializer.serializer as serializer
+import analytics.utils.httputils as httputils
+import analytics.utils.memory as memory
+import analytics.utils.metrics as metrics
+
+"""
+    API calls of the application, that do not depend on webapp2: request is
+    path, parameters and headers, and response is status code, headers and
+    body. Standalone servers resolve user by authentication hook from
+    request headers, and "api.py" handlers of App Engine pass user of App
+    Engine login. Access is checked against email list of the service, and
+    profiling of queries against admin list. Metrics scrapers are not users,
+    they get metrics with token of the service instead.
+"""
+
+# user of requests to standalone server, server runs locally, so it is
+# configured in environment instead of login
+LOCAL_USER = os.environ.get("LOCAL_USER")
+
+# cache of serialized and compressed responses by ETag
+_responses = httputils.ResponseCache()
+
+
+# [Public]
+def localUser(headers):
+    """
+        Default authentication hook of standalone servers, every request is
+        made by LOCAL_USER.
+
+        Args:
+            headers (dict<str, str>): request headers
+
+        Returns:
+            str: email of the user, or None
+    """
+    return LOCAL_USER
+
+
+# [Public]
+def trustedHeader(name):
+    """
+        Returns authentication hook, that takes email of the user from
+        request header, e.g. set by authenticating proxy in front of the
+        server. Header must not be accepted from clients directly.
+
+        Args:
+            name (str): header name
+
+        Returns:
+            func: authentication hook
+    """
+    def auth(headers):
+        return _header(headers, name)
+    return auth
+
+
+# [Public]
+def boolean(value):
+    """
+        Converts string into boolean.
+
+        Args:
+            value (str): parameter value
+
+        Returns:
+            bool: converted boolean value
+    """
+    if value in ["false", "0"]:
+        return False
+    else:
+        return bool(value)
+
+
+# [Private]
+def _header(headers, name):
+    """
+        Returns value of header by case-insensitive name, or None.
+
+        Args:
+            headers (dict<str, str>): request headers
+            name (str): header name
+
+        Returns:
+            str: header value
+    """
+    name = name.lower()
+    for key, value in headers.items():
+        if key.lower() == name:
+            return str(value)
+    return None
+
+
+# [Private]
+def _bearerToken(headers):
+    """
+        Returns token of "Authorization: Bearer" header, or None.
+
+        Args:
+            headers (dict<str, str>): request headers
+
+        Returns:
+            str: token
+    """
+    value = _header(headers, "Authorization")
+    if value is None:
+        return None
+    parts = value.split()
+    if len(parts) != 2 or parts[0].lower() != "bearer":
+        return None
+    return parts[1]
+
+
+# [Private]
+def _notModified(headers, etag):
+    """
+        Returns 304 response, if "If-None-Match" header matches ETag of any
+        representation, otherwise None. Response carries ETag of the matched
+        representation, so client that cached compressed body keeps it.
+
+        Args:
+            headers (dict<str, str>): request headers
+            etag (str): current ETag of the resource
+
+        Returns:
+            tuple<int, list, str>: response or None
+    """
+    if etag is None:
+        return None
+    encoding = httputils.negotiateEncoding(_header(headers, "Accept-Encoding"))
+    encoding = httputils.matchedEncoding(_header(headers, "If-None-Match"),
+        etag, encoding)
+    if encoding is None:
+        return None
+    return (304, [("ETag", httputils.encodedETag(etag, encoding)),
+        ("Vary", "Accept-Encoding")], "")
+
+
+# [Private]
+def _body(body, encoding, code, etag=None):
+    """
+        Returns json response with content encoding, status code and ETag of
+        the encoded representation.
+
+        Args:
+            body (str): json body
+            encoding (str): content encoding applied to body
+            code (int): status code
+            etag (str): ETag of identity representation
+
+        Returns:
+            tuple<int, list, str>: response
+    """
+    headers = [("Content-Type", "application/json"),
+        ("Vary", "Accept-Encoding")]
+    if encoding != httputils.IDENTITY:
+        headers.append(("Content-Encoding", encoding))
+    if etag is not None:
+        headers.append(("ETag", httputils.encodedETag(etag, encoding)))
+    return (code, headers, body)
+
+
+# [Private]
+def _cached(headers, etag):
+    """
+        Returns cached response for ETag, or None, if it is not cached.
+
+        Args:
+            headers (dict<str, str>): request headers
+            etag (str): ETag of the resource
+
+        Returns:
+            tuple<int, list, str>: response or None
+    """
+    if etag is None:
+        return None
+    encoding = httputils.negotiateEncoding(_header(headers, "Accept-Encoding"))
+    cached = _responses.getBody(etag, encoding)
+    if cached is None:
+        return None
+    return _body(cached[0], cached[1], 200, etag)
+
+
+# [Public]
+def send(headers, result, etag=None):
+    """
+        Returns response with json result. ETag is sent only with successful
+        result, and such result is cached with compressed bodies.
+
+        Args:
+            headers (dict<str, str>): request headers
+            result (dict<str, obj>): json result
+            etag (str): ETag of the result
+
+        Returns:
+            tuple<int, list, str>: response
+    """
+    encoding = httputils.negotiateEncoding(_header(headers, "Accept-Encoding"))
+    bodies = httputils.encodeJSON(result, encoding)
+    return sendBodies(headers, result["code"], bodies, etag)
+
+
+# [Public]
+def sendBodies(headers, code, bodies, etag=None):
+    """
+        Returns response with serialised json result, see "send".
+
+        Args:
+            headers (dict<str, str>): request headers
+            code (int): status code
+            bodies (dict<str, str>): bodies by encoding
+            etag (str): ETag of the result
+
+        Returns:
+            tuple<int, list, str>: response
+    """
+    encoding = httputils.negotiateEncoding(_header(headers, "Accept-Encoding"))
+    if code != 200:
+        etag = None
+    elif etag is not None:
+        _responses.putBodies(etag, bodies)
+    body, encoding = httputils.selectBody(bodies, encoding)
+    return _body(body, encoding, code, etag)
+
+
+# [Private]
+def _datasets(params, headers, dmngr):
+    etag = service.datasetsETag(dmngr)
+    response = _notModified(headers, etag) or _cached(headers, etag)
+    if response is not None:
+        return response
+    return send(headers, service.getAllDatasets(dmngr), etag)
+
+
+# [Private]
+def _query(params, headers, dmngr):
+    query = str(params.get("q", ""))
+    datasetId = str(params.get("d", ""))
+    sort = boolean(params.get("s"))
+    warn = boolean(params.get("w"))
+    dataformat = str(params.get("format") or serializer.FORMAT_DEFAULT)
+    timings = boolean(params.get("t"))
+    profile = boolean(params.get("profile"))
+    explain = str(params.get("explain") or "")
+    # explanation is returned in place of data, "explain=analyze" executes
+    # query as well
+    if boolean(explain):
+        return send(headers, service.requestExplain(datasetId, query, dmngr,
+            sort, explain.lower() == "analyze"))
+    # timings and profile differ for every request, so response is neither
+    # cached nor coalesced
+    if timings or profile:
+        return send(headers, service.requestData(datasetId, query, dmngr, sort,
+            warn, dataformat, istimings=timings, isprofile=profile))
+    # answer repeated request before any work is done
+    etag = service.queryETag(datasetId, query, dmngr, sort, warn, dataformat)
+    response = _notModified(headers, etag) or _cached(headers, etag)
+    if response is not None:
+        return response
+    # identical concurrent queries are executed once
+    encoding = httputils.negotiateEncoding(_header(headers, "Accept-Encoding"))
+    code, bodies = service.requestDataBodies(datasetId, query, dmngr, sort,
+        warn, dataformat, encoding)
+    return sendBodies(headers, code, bodies, etag)
+
+
+# [Private]
+def _sweep(params, headers, dmngr):
+    query = str(params.get("q", ""))
+    datasetId = str(params.get("d", ""))
+    warn = boolean(params.get("w"))
+    pulses = [x.strip() for x in str(params.get("p", "")).split(",")
+        if x.strip()]
+    try:
+        # values are json list of candidate values for each pulse
+        values = json.loads(params.get("v") or "[]")
+        topk = int(params.get("k") or 0)
+    except ValueError:
+        values = None; topk = 0
+    if type(values) is list and values and len(pulses) == 1 and \
+            type(values[0]) is not list:
+        values = [values]
+    if type(values) is not list:
+        msg = "Values must be json list"
+        return send(headers, service._generateErrorMessage([msg]))
+    return send(headers, service.requestSweep(datasetId, query, pulses, values,
+        topk, dmngr, iswarnings=warn))
+
+
+# [Private]
+def _catalogue(params, headers, dmngr):
+    datasetId = str(params.get("d", ""))
+    etag = service.catalogueETag(datasetId, dmngr)
+    response = _notModified(headers, etag) or _cached(headers, etag)
+    if response is not None:
+        return response
+    return send(headers, service.requestCatalogue(datasetId, dmngr), etag)
+
+
+# [Private]
+def _stats(params, headers, dmngr):
+    return send(headers, service._generateSuccessMessage([],
+        service.cacheStats()))
+
+
+# [Private]
+def _memory(params, headers, dmngr):
+    # memory of the process that serves request
+    return send(headers, service._generateSuccessMessage([],
+        memory.memoryUsage()))
+
+
+# [Private]
+def _metrics(params, headers, dmngr):
+    # metrics of the process that serves request, in Prometheus text format
+    return (200, [("Content-Type", metrics.CONTENT_TYPE)],
+        service.metricsText())
+
+
+# API calls by path
+ROUTES = {
+    "/api/datasets": _datasets,
+    "/api/query": _query,
+    "/api/sweep": _sweep,
+    "/api/catalogue": _catalogue,
+    "/api/stats": _stats,
+    "/api/memory": _memory,
+    "/api/metrics": _metrics
+}
+
+
+# [Public]
+def handle(path, params, headers, email, dmngr=None):
+    """
+        Handles API call and returns response. Access is checked for every
+        call, and profiling is allowed to admins only, unknown calls return
+        error message. Metrics are also returned to scrapers with metrics
+        token, they do not need to be in email list.
+
+        Args:
+            path (str): request path
+            params (dict<str, str>): request parameters
+            headers (dict<str, str>): request headers
+            email (str): email of the user, or None
+            dmngr (DataManager): hook to pass own datamanager for tests
+
+        Returns:
+            tuple<int, list, str>: status code, headers and body
+    """
+    route = ROUTES.get(path)
+    if route is None:
+        msg = "API does not exist"
+        return send(headers, service._generateErrorMessage([msg]))
+    if route is _metrics and service.isMetricsScraper(_bearerToken(headers)):
+        return route(params, headers, dmngr)
+    if not email or not service.isUserInEmaillist(email):
+        msg = "Access is not granted"
+        return send(headers, service._generateErrorMessage([msg]))
+    if boolean(params.get("profile")) and not service.isUserAdmin(email):
+        msg = "Profiling is not granted"
+        return send(headers, service._generateErrorMessage([msg]))
+    return route(params, headers, dmngr)
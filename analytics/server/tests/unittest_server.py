@@ -0,0 +1,515 @@
+#!/usr/bin/env python
+
+'''
+Copyright 2015 Ivan Sadikov
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+
+# import libs
+import gc
+import httplib
+import json
+import socket
+import threading
+import os
+import signal
+import time
+import unittest
+import urllib
+import urllib2
+import zlib
+# import classes
+import analytics.exceptions.exceptions as ex
+import analytics.service as service
+import analytics.server.routes as routes
+import analytics.server.prefork as prefork
+import analytics.server.asyncserver as asyncserver
+import analytics.utils.metrics as metrics
+from analytics.datamanager.datamanager import DataManager
+
+
+# datasets for integration tests, they are known to be valid
+_INTEGRATION_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(
+        os.path.realpath(__file__)))),
+    "tests",
+    "datasets"
+)
+# user that is granted access
+_EMAIL = service.EMAIL_LIST[0]
+
+
+class Server_TestSequence(unittest.TestCase):
+    def setUp(self):
+        self.dmngr = DataManager()
+        self.dmngr.loadDatasets(_INTEGRATION_PATH)
+        self.datasetId = self.dmngr.getDatasets()[0]._id
+
+    def get(self, address, path, params=None, headers=None):
+        url = "http://%s:%d%s" % (address + (path,))
+        if params:
+            url += "?" + urllib.urlencode(params)
+        request = urllib2.Request(url, headers=headers or {})
+        try:
+            response = urllib2.urlopen(request, timeout=30)
+        except urllib2.HTTPError as e:
+            # error messages are json as well
+            response = e
+        try:
+            return json.loads(response.read())
+        finally:
+            response.close()
+
+
+class Routes_TestSequence(Server_TestSequence):
+    def test_routes_handle(self):
+        code, headers, body = routes.handle("/api/unknown", {}, {}, _EMAIL,
+            self.dmngr)
+        self.assertEqual(json.loads(body)["messages"], ["API does not exist"])
+        for email in [None, "", "#"]:
+            code, headers, body = routes.handle("/api/datasets", {}, {}, email,
+                self.dmngr)
+            self.assertEqual(json.loads(body)["messages"],
+                ["Access is not granted"])
+        code, headers, body = routes.handle("/api/datasets", {}, {}, _EMAIL,
+            self.dmngr)
+        self.assertEqual(code, 200)
+        self.assertEqual(json.loads(body)["data"],
+            service.getAllDatasets(self.dmngr)["data"])
+
+    def test_routes_query(self):
+        params = {"d": self.datasetId, "q": "", "s": "1"}
+        code, headers, body = routes.handle("/api/query", params,
+            {"Accept-Encoding": "gzip"}, _EMAIL, self.dmngr)
+        self.assertEqual(code, 200)
+        headers = dict(headers)
+        self.assertEqual(headers["Content-Encoding"], "gzip")
+        # repeated request with ETag is not modified
+        etag = headers["ETag"]
+        code, headers, body = routes.handle("/api/query", params,
+            {"If-None-Match": etag}, _EMAIL, self.dmngr)
+        self.assertEqual((code, body), (304, ""))
+        code, headers, body = routes.handle("/api/query", params, {}, _EMAIL,
+            self.dmngr)
+        expected = service.requestData(self.datasetId, "", self.dmngr, True)
+        self.assertEqual(json.loads(body)["data"], json.loads(
+            json.dumps(expected["data"])))
+        # response with timings is not cached
+        params["t"] = "1"
+        code, headers, body = routes.handle("/api/query", params,
+            {"If-None-Match": etag}, _EMAIL, self.dmngr)
+        self.assertEqual(code, 200)
+        self.assertTrue("ETag" not in dict(headers))
+        self.assertTrue(len(json.loads(body)["timings"]) > 0)
+        # profile is restricted to admins
+        params = {"d": self.datasetId, "profile": "1"}
+        code, headers, body = routes.handle("/api/query", params, {}, _EMAIL,
+            self.dmngr)
+        self.assertEqual(json.loads(body)["messages"],
+            ["Profiling is not granted"])
+        admins = service.ADMIN_LIST
+        try:
+            service.ADMIN_LIST = [_EMAIL, "#"]
+            code, headers, body = routes.handle("/api/query", params, {},
+                _EMAIL, self.dmngr)
+            self.assertTrue(len(json.loads(body)["profile"]["functions"]) > 0)
+            # admin must be in email list as well
+            code, headers, body = routes.handle("/api/query", params, {}, "#",
+                self.dmngr)
+            self.assertEqual(json.loads(body)["messages"],
+                ["Access is not granted"])
+        finally:
+            service.ADMIN_LIST = admins
+
+    def test_routes_notModifiedEncoding(self):
+        params = {"d": self.datasetId, "q": "", "s": "1"}
+        request = {"Accept-Encoding": "gzip"}
+        code, headers, body = routes.handle("/api/query", params, request,
+            _EMAIL, self.dmngr)
+        headers = dict(headers)
+        self.assertEqual(headers["Content-Encoding"], "gzip")
+        expected = service.requestData(self.datasetId, "", self.dmngr, True)
+        self.assertEqual(json.loads(zlib.decompress(body, 16 + zlib.MAX_WBITS)),
+            json.loads(json.dumps(expected)))
+        # revalidation of gzip body returns ETag of gzip representation
+        etag = headers["ETag"]
+        self.assertTrue(etag.endswith('-gzip"'))
+        request["If-None-Match"] = etag
+        code, headers, body = routes.handle("/api/query", params, request,
+            _EMAIL, self.dmngr)
+        self.assertEqual((code, body), (304, ""))
+        self.assertEqual(dict(headers),
+            {"ETag": etag, "Vary": "Accept-Encoding"})
+        # any representation matches, ETag is of negotiated encoding
+        request["If-None-Match"] = "*"
+        code, headers, body = routes.handle("/api/query", params, request,
+            _EMAIL, self.dmngr)
+        self.assertEqual((code, dict(headers)["ETag"]), (304, etag))
+        request = {"If-None-Match": etag}
+        code, headers, body = routes.handle("/api/query", params, request,
+            _EMAIL, self.dmngr)
+        self.assertEqual((code, dict(headers)["ETag"]), (304, etag))
+
+    def test_routes_sweep(self):
+        params = {"d": self.datasetId, "q": "", "p": "price",
+            "v": "[120.0, 130.5]", "k": "2"}
+        code, headers, body = routes.handle("/api/sweep", params, {}, _EMAIL,
+            self.dmngr)
+        self.assertEqual(code, 200)
+        expected = service.requestSweep(self.datasetId, "", ["price"],
+            [[120.0, 130.5]], 2, self.dmngr)
+        self.assertEqual(json.loads(body)["data"], json.loads(
+            json.dumps(expected["data"])))
+        params["v"] = "#"
+        code, headers, body = routes.handle("/api/sweep", params, {}, _EMAIL,
+            self.dmngr)
+        self.assertEqual(json.loads(body)["messages"],
+            ["Values must be json list"])
+
+    def test_routes_explain(self):
+        params = {"d": self.datasetId, "q": "", "explain": "1"}
+        code, headers, body = routes.handle("/api/query", params, {}, _EMAIL,
+            self.dmngr)
+        self.assertEqual(code, 200)
+        self.assertTrue("ETag" not in dict(headers))
+        obj = json.loads(body)["data"]
+        self.assertEqual(obj["blocks"], [])
+        self.assertTrue("timings" not in obj)
+        params["explain"] = "analyze"
+        code, headers, body = routes.handle("/api/query", params, {}, _EMAIL,
+            self.dmngr)
+        self.assertTrue(len(json.loads(body)["data"]["timings"]) > 0)
+
+    def test_routes_metrics(self):
+        params = {"d": self.datasetId, "q": "", "t": "1"}
+        routes.handle("/api/query", params, {}, _EMAIL, self.dmngr)
+        code, headers, body = routes.handle("/api/metrics", {}, {}, _EMAIL,
+            self.dmngr)
+        self.assertEqual(code, 200)
+        self.assertEqual(dict(headers)["Content-Type"],
+            metrics.CONTENT_TYPE)
+        lines = body.split("\n")
+        self.assertTrue("# TYPE pulsar_query_requests_total counter" in lines)
+        self.assertTrue(any([x.startswith(
+            "pulsar_query_requests_total{code=\"200\"} ") for x in lines]))
+        self.assertTrue(any([x.startswith("pulsar_dataset_elements{" +
+            "dataset=\"%s\"} " % (self.datasetId)) for x in lines]))
+        code, headers, body = routes.handle("/api/metrics", {}, {}, "#",
+            self.dmngr)
+        self.assertEqual(json.loads(body)["messages"],
+            ["Access is not granted"])
+
+    def test_routes_metricsToken(self):
+        token = service.METRICS_TOKEN
+        try:
+            # scrapers are not allowed without token of the service
+            service.METRICS_TOKEN = ""
+            code, headers, body = routes.handle("/api/metrics", {},
+                {"Authorization": "Bearer "}, None, self.dmngr)
+            self.assertEqual(json.loads(body)["messages"],
+                ["Access is not granted"])
+            service.METRICS_TOKEN = "#token"
+            code, headers, body = routes.handle("/api/metrics", {},
+                {"authorization": "bearer #token"}, None, self.dmngr)
+            self.assertEqual(code, 200)
+            self.assertEqual(dict(headers)["Content-Type"],
+                metrics.CONTENT_TYPE)
+            for value in ["Bearer #other", "Basic #token", "#token"]:
+                code, headers, body = routes.handle("/api/metrics", {},
+                    {"Authorization": value}, None, self.dmngr)
+                self.assertEqual(json.loads(body)["messages"],
+                    ["Access is not granted"])
+            # token grants metrics only
+            code, headers, body = routes.handle("/api/datasets", {},
+                {"Authorization": "Bearer #token"}, None, self.dmngr)
+            self.assertEqual(json.loads(body)["messages"],
+                ["Access is not granted"])
+        finally:
+            service.METRICS_TOKEN = token
+
+
+class Prefork_TestSequence(Server_TestSequence):
+    def test_prefork_freezeHeap(self):
+        threshold = gc.get_threshold()
+        enabled = gc.isenabled()
+        try:
+            frozen = prefork.freezeHeap()
+            self.assertEqual(frozen, hasattr(gc, "freeze"))
+            if not frozen:
+                self.assertEqual(gc.get_threshold()[2],
+                    prefork.FULL_COLLECTION_THRESHOLD)
+        finally:
+            if hasattr(gc, "unfreeze"):
+                gc.unfreeze()
+            gc.set_threshold(*threshold)
+        self.assertEqual(gc.isenabled(), enabled)
+
+    def test_prefork_preloadFrozen(self):
+        threshold = gc.get_threshold()
+        try:
+            service._processed.clear()
+            timings = prefork.preloadFrozen([self.datasetId], self.dmngr)
+            self.assertEqual(timings[self.datasetId]["status"], "success")
+            self.assertTrue(gc.isenabled())
+            key = (self.datasetId, self.dmngr.getVersion(self.datasetId))
+            self.assertNotEqual(service._processed.get(key), None)
+        finally:
+            gc.set_threshold(*threshold)
+
+    def test_prefork_init(self):
+        with self.assertRaises(ex.AnalyticsCheckError):
+            prefork.PreforkServer(8080)
+        with self.assertRaises(ex.AnalyticsValueError):
+            prefork.PreforkServer(("127.0.0.1", 0), 0)
+
+    def test_prefork_startWithoutThreads(self):
+        # watcher must not be running, when workers are forked
+        interval = service.WATCH_INTERVAL
+        server = prefork.PreforkServer(("127.0.0.1", 0), 1, [],
+            lambda headers: _EMAIL, None, True)
+        try:
+            service.WATCH_INTERVAL = 60.0
+            server.start()
+            self.assertEqual(service._watcher, None)
+            self.assertEqual(threading.active_count(), 1)
+        finally:
+            service.WATCH_INTERVAL = interval
+            server.stop()
+            service.stopWatcher()
+        # worker is not forked, while other threads are running
+        release = threading.Event()
+        thread = threading.Thread(target=release.wait)
+        thread.start()
+        server = prefork.PreforkServer(("127.0.0.1", 0), 1, [],
+            lambda headers: _EMAIL, self.dmngr, True)
+        try:
+            with self.assertRaises(ex.AnalyticsStandardError):
+                server.start()
+            self.assertEqual(server.workers(), [])
+        finally:
+            release.set()
+            thread.join()
+            server.stop()
+
+    def test_prefork_serve(self):
+        threshold = gc.get_threshold()
+        server = prefork.PreforkServer(("127.0.0.1", 0), 2, [self.datasetId],
+            lambda headers: _EMAIL, self.dmngr, True)
+        try:
+            server.start()
+            address = server.address()
+            self.assertNotEqual(address[1], 0)
+            self.assertEqual(len(server.workers()), 2)
+            self.assertEqual(
+                server.timings()[self.datasetId]["status"], "success")
+            result = self.get(address, "/api/query", {"d": self.datasetId})
+            self.assertEqual(result["status"], "success")
+            expected = service.requestData(self.datasetId, "", self.dmngr)
+            self.assertEqual(len(result["data"]["elements"]),
+                len(expected["data"]["elements"]))
+            # memory report of each worker
+            usage = self.get(address, "/api/memory")["data"]
+            report = server.report()
+            self.assertEqual(sorted(report["workers"].keys()),
+                sorted(server.workers()))
+            if usage is not None:
+                for worker in report["workers"].values():
+                    self.assertTrue(worker["shared"] > 0)
+                    self.assertTrue(worker["unique"] > 0)
+            # exited worker is replaced
+            pid = server.workers()[0]
+            os.kill(pid, signal.SIGKILL)
+            start = time.time()
+            while server.poll() == 0 and time.time() - start < 10:
+                time.sleep(0.05)
+            self.assertEqual(len(server.workers()), 2)
+            self.assertTrue(pid not in server.workers())
+            result = self.get(address, "/api/datasets")
+            self.assertEqual(result["status"], "success")
+            workers = server.workers()
+        finally:
+            server.stop()
+            gc.set_threshold(*threshold)
+        self.assertEqual(server.workers(), [])
+        for pid in workers:
+            with self.assertRaises(OSError):
+                os.kill(pid, 0)
+
+
+class AsyncServer_TestSequence(Server_TestSequence):
+    def setUp(self):
+        super(AsyncServer_TestSequence, self).setUp()
+        self.server = None
+
+    def tearDown(self):
+        if self.server is not None:
+            self.server.stop()
+            self.thread.join(10)
+
+    def startServer(self, numthreads=2, queuesize=8, auth=None):
+        self.server = asyncserver.AsyncServer(("127.0.0.1", 0), numthreads,
+            queuesize, auth or (lambda headers: _EMAIL), self.dmngr)
+        self.server.start()
+        self.thread = threading.Thread(target=self.server.serveForever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self.server.address()
+
+    def test_asyncserver_parseRequest(self):
+        request = asyncserver.parseRequest("GET /api/query?d=1 HTTP/1.1\r\n" +
+            "Host: localhost\r\nConnection: close")
+        self.assertEqual(request, ("GET", "/api/query?d=1", "HTTP/1.1",
+            {"Host": "localhost", "Connection": "close"}))
+        for data in ["", "GET /", "GET / HTTP/1.1\r\nHost"]:
+            self.assertEqual(asyncserver.parseRequest(data), None)
+
+    def test_asyncserver_keepAlive(self):
+        self.assertEqual(asyncserver.keepAlive("HTTP/1.1", {}), True)
+        self.assertEqual(asyncserver.keepAlive("HTTP/1.1",
+            {"connection": "Close"}), False)
+        self.assertEqual(asyncserver.keepAlive("HTTP/1.0", {}), False)
+        self.assertEqual(asyncserver.keepAlive("HTTP/1.0",
+            {"Connection": "Keep-Alive"}), True)
+
+    def test_asyncserver_init(self):
+        with self.assertRaises(ex.AnalyticsCheckError):
+            asyncserver.AsyncServer(8080)
+        with self.assertRaises(ex.AnalyticsValueError):
+            asyncserver.AsyncServer(("127.0.0.1", 0), 0)
+
+    def test_asyncserver_watcher(self):
+        # watcher of default datamanager runs while server is serving
+        interval = service.WATCH_INTERVAL
+        server = asyncserver.AsyncServer(("127.0.0.1", 0), 1, 1,
+            lambda headers: _EMAIL)
+        try:
+            service.WATCH_INTERVAL = 60.0
+            server.start()
+            self.assertNotEqual(service._watcher, None)
+            thread = threading.Thread(target=server.serveForever)
+            thread.start()
+            server.stop()
+            thread.join(10)
+            self.assertEqual(service._watcher, None)
+        finally:
+            service.WATCH_INTERVAL = interval
+            service.stopWatcher()
+
+    def test_asyncserver_keepAliveRequests(self):
+        address = self.startServer()
+        connection = httplib.HTTPConnection(*address, timeout=30)
+        try:
+            expected = service.requestData(self.datasetId, "", self.dmngr)
+            for _i in range(5):
+                connection.request("GET", "/api/query?" +
+                    urllib.urlencode({"d": self.datasetId}))
+                response = connection.getresponse()
+                self.assertEqual(response.status, 200)
+                self.assertEqual(response.getheader("Connection"),
+                    "keep-alive")
+                result = json.loads(response.read())
+                self.assertEqual(len(result["data"]["elements"]),
+                    len(expected["data"]["elements"]))
+            connection.request("GET", "/api/datasets")
+            result = json.loads(connection.getresponse().read())
+            self.assertEqual(result["status"], "success")
+            connection.request("GET", "/api/datasets", headers={
+                "Connection": "close"})
+            response = connection.getresponse()
+            self.assertEqual(response.getheader("Connection"), "close")
+            response.read()
+        finally:
+            connection.close()
+        stats = self.server.stats()
+        self.assertEqual(stats["connections"], 1)
+        self.assertEqual(stats["requests"], 7)
+
+    def test_asyncserver_errors(self):
+        address = self.startServer(auth=lambda headers: None)
+        result = self.get(address, "/api/datasets")
+        self.assertEqual(result["messages"], ["Access is not granted"])
+        connection = httplib.HTTPConnection(*address, timeout=30)
+        try:
+            connection.request("POST", "/api/datasets", "")
+            response = connection.getresponse()
+            self.assertEqual(response.status, 405)
+            response.read()
+        finally:
+            connection.close()
+        sock = socket.create_connection(address, 30)
+        try:
+            sock.sendall("GET\r\n\r\n")
+            self.assertTrue(sock.recv(4096).startswith("HTTP/1.1 400"))
+        finally:
+            sock.close()
+
+    def test_asyncserver_overload(self):
+        # single executor thread is blocked, one request waits in queue, and
+        # others are rejected right away
+        release = threading.Event(); entered = threading.Event()
+        def auth(headers):
+            entered.set()
+            release.wait(30)
+            return _EMAIL
+        address = self.startServer(1, 1, auth)
+        connections = []
+        try:
+            for _i in range(4):
+                connection = httplib.HTTPConnection(*address, timeout=30)
+                connection.request("GET", "/api/datasets")
+                connections.append(connection)
+                if _i == 0:
+                    entered.wait(30)
+                if _i == 1:
+                    start = time.time()
+                    while self.server._executor._tasks.qsize() < 1 and \
+                            time.time() - start < 10:
+                        time.sleep(0.01)
+            codes = []
+            for connection in connections[2:]:
+                codes.append(connection.getresponse().status)
+            self.assertEqual(codes, [503, 503])
+            release.set()
+            for connection in connections[:2]:
+                self.assertEqual(connection.getresponse().status, 200)
+        finally:
+            release.set()
+            for connection in connections:
+                connection.close()
+        self.assertEqual(self.server.stats()["rejected"], 2)
+
+
+# Load test suites
+def _suites():
+    return [
+        Routes_TestSequence,
+        Prefork_TestSequence,
+        AsyncServer_TestSequence
+    ]
+
+# Load tests
+def loadSuites():
+    # global test suite for this module
+    gsuite = unittest.TestSuite()
+    for suite in _suites():
+        gsuite.addTest(unittest.TestLoader().loadTestsFromTestCase(suite))
+    return gsuite
+
+if __name__ == '__main__':
+    suite = loadSuites()
+    print ""
+    print "### Running tests ###"
+    print "-" * 70
+    unittest.TextTestRunner(verbosity=2).run(suite)
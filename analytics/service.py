@@ -18,24 +18,46 @@ limitations under the License.
 
 
 # import libs
-from types import StringType, ListType
+from types import StringType, ListType, DictType, IntType, FloatType
+import heapq
+import hmac
+import itertools
+import math
 import os
-import warnings
+import re
+import threading
+import time
+import uuid
 # import classes
 import analytics.exceptions.exceptions as ex
 import analytics.utils.misc as misc
+import analytics.utils.httputils as httputils
+import analytics.utils.diagnostics as diag
+import analytics.utils.workers as workers
+from analytics.utils.singleflight import SingleFlight
+from analytics.utils.admission import AdmissionController
+import analytics.utils.deadline as dl
+import analytics.utils.timings as tm
+import analytics.utils.metrics as metrics
+import analytics.utils.memory as memory
 import projectpaths as paths
 import analytics.datamanager.datamanager as datamanager
-import analytics.core.processor.processor as processor
-import analytics.selector.selector as selector
-import analytics.analyser.analyser as analyser
-from analytics.loading.loader import Loader
-from analytics.loading.jsonloader import JsonLoader
-from analytics.loading.xmlloader import XmlLoader
-from analytics.core.map.clustermap import ClusterMap
-from analytics.core.map.elementmap import ElementMap
-from analytics.core.map.pulsemap import PulseMap
-from analytics.algorithms.algorithmsmap import AlgorithmsMap
+import analytics.datamanager.watcher as watcher
+import analytics.serializer.serializer as serializer
+from analytics.utils.lazyimport import LazyModule
+from analytics.utils.lrucache import LRUCache
+# modules that are not needed to list datasets are imported on first use
+processor = LazyModule("analytics.core.processor.processor")
+selector = LazyModule("analytics.selector.selector")
+q = LazyModule("analytics.utils.queryengine")
+analyser = LazyModule("analytics.analyser.analyser")
+clustermap = LazyModule("analytics.core.map.clustermap")
+elementmap = LazyModule("analytics.core.map.elementmap")
+pulsemap = LazyModule("analytics.core.map.pulsemap")
+relativecomp = LazyModule("analytics.algorithms.relativecomp")
+corepulse = LazyModule("analytics.core.pulse")
+profiling = LazyModule("analytics.utils.profiling")
+sharding = LazyModule("analytics.sharding.sharding")
 
 
 # Authorised email list
@@ -43,12 +65,92 @@ from analytics.algorithms.algorithmsmap import AlgorithmsMap
 EMAIL_LIST = [
     "test@example.com"
 ]
+# users of email list that can profile queries, comma separated emails
+#[Private]
+ADMIN_LIST = [x.strip() for x in os.environ.get("ADMIN_EMAILS", "").split(",")
+    if x.strip()]
+# token of metrics scrapers, they are not users of email list and send token
+# in "Authorization: Bearer" header, scrapers are not allowed, if it is empty
+#[Private]
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+
+# ETag salt, changes with every deployment of the application, so clients do
+# not reuse responses that were generated by previous code
+_ETAG_SALT = os.environ.get("CURRENT_VERSION_ID", "")
+
+# hot datasets, comma separated list of dataset ids, that are processed
+# when instance is warmed up
+HOT_DATASETS = [x.strip() for x in os.environ.get("HOT_DATASETS", "").split(",")
+    if x.strip()]
+# number of processed datasets kept in memory
+PROCESSED_CACHE_SIZE = 8
+# number of datasets that are preloaded at the same time
+PRELOAD_WORKERS = 4
+# interval in seconds to poll datasets directory for changes, 0 disables
+# hot reload of datasets, watcher is started by standalone servers only
+WATCH_INTERVAL = float(os.environ.get("WATCH_INTERVAL", "0") or 0)
+# maximum number of candidate defaults ranked by one sweep request
+MAX_SWEEP_CANDIDATES = 100
+# admission control: queries with estimated cost of at least HEAVY_COST are
+# heavy, at most MAX_HEAVY_QUERIES heavy queries run at the same time, at
+# most ADMISSION_QUEUE wait for them, each at most ADMISSION_TIMEOUT seconds
+HEAVY_COST = float(os.environ.get("HEAVY_COST", "200000") or 200000)
+MAX_HEAVY_QUERIES = int(os.environ.get("MAX_HEAVY_QUERIES", "2") or 2)
+ADMISSION_QUEUE = int(os.environ.get("ADMISSION_QUEUE", "8") or 8)
+ADMISSION_TIMEOUT = 10.0
+# cost model, costs are relative to ranking one element by one pulse
+## size of one element in data files, estimates elements of dataset that is
+## not processed yet
+BYTES_PER_ELEMENT = 200
+## loading and processing, filtering and sorting of one element
+LOAD_COST = 4.0
+FILTER_COST = 0.1
+SORT_COST = 0.2
+## share of elements that pass equality predicate of static pulse
+PULSE_SELECTIVITY = 0.5
+# error code of requests rejected by admission control
+CODE_OVERLOADED = 503
+# seconds that query may take, including waiting for admission, before it
+# is aborted, 0 disables deadline
+REQUEST_TIMEOUT = float(os.environ.get("REQUEST_TIMEOUT", "30") or 0)
+# error code of requests aborted by deadline
+CODE_TIMEOUT = 504
+# directory to save profiles of queries to as .pstats files, profiles are
+# not saved, if it is not set, only the latest PROFILE_KEEP files are kept
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "")
+PROFILE_KEEP = 20
+# number of functions with the largest cumulative time in profile of query
+PROFILE_TOP = 30
+# number of shards that elements of processed dataset are split into, and
+# queries of default format are executed on, see "analytics.sharding", 0
+# disables sharded execution, at most SHARD_QUERIES queries run on shards of
+# dataset at the same time
+SHARDS = int(os.environ.get("SHARDS", "0") or 0)
+SHARD_QUERIES = int(os.environ.get("SHARD_QUERIES", "4") or 4)
 
-# datamanager
+# datamanager, datasets are discovered on first use
 _datamanager = datamanager.DataManager()
 _datamanager.setSearchPath(paths.DATASETS_PATH)
-# load all datasets
-_datamanager.loadDatasets()
+_datamanagerLoaded = False
+_datamanagerLock = threading.Lock()
+# processed datasets by dataset id and version, requests use copies
+_processed = LRUCache(PROCESSED_CACHE_SIZE)
+# watcher of default datamanager, None until it is started
+_watcher = None
+# sharded executors by dataset id and version of snapshot
+_executors = {}
+_executorsLock = threading.Lock()
+# concurrent identical queries, they are executed and serialised once
+_flights = SingleFlight()
+# admission control of heavy queries
+_admission = AdmissionController(MAX_HEAVY_QUERIES, ADMISSION_QUEUE)
+# timings of pipeline stages of successful queries by dataset id
+_stages = tm.StageHistograms()
+# metrics of queries, other metrics are computed when they are exposed
+_requests = metrics.REGISTRY.counter("pulsar_query_requests_total",
+    "Queries by response code", ["code"])
+_latency = metrics.REGISTRY.histogram("pulsar_query_duration_seconds",
+    "Time to answer query")
 
 
 # [Public]
@@ -66,6 +168,233 @@ def isUserInEmaillist(email):
     return email in EMAIL_LIST
 
 
+# [Public]
+def isUserAdmin(email):
+    """
+        Returns boolean value that indicates the user email in admin list,
+        admins can profile queries. Admin must be in email list as well.
+
+        Args:
+            email (str): user email
+
+        Returns:
+            bool: indicator whether email in admin list
+    """
+    return isUserInEmaillist(email) and email in ADMIN_LIST
+
+
+# [Public]
+def isMetricsScraper(token):
+    """
+        Returns boolean value that indicates that token is token of metrics
+        scrapers. Token is compared in constant time.
+
+        Args:
+            token (str): token sent by client, or None
+
+        Returns:
+            bool: indicator whether token is metrics token
+    """
+    if not METRICS_TOKEN or type(token) is not StringType:
+        return False
+    return hmac.compare_digest(token, METRICS_TOKEN)
+
+
+# [Private]
+def _defaultDataManager():
+    """
+        Returns default datamanager. Datasets are discovered on the first
+        call, so importing module does not scan datasets directory.
+
+        Returns:
+            DataManager: default datamanager with datasets loaded
+    """
+    global _datamanagerLoaded
+    if not _datamanagerLoaded:
+        with _datamanagerLock:
+            if not _datamanagerLoaded:
+                _datamanager.loadDatasets()
+                _datamanagerLoaded = True
+    return _datamanager
+
+
+# [Public]
+def startWatcher(dmngr=None, interval=WATCH_INTERVAL or watcher.POLL_INTERVAL):
+    """
+        Starts watcher that reloads datasets of datamanager, when their files
+        change. Processed snapshot of changed dataset is rebuilt before new
+        version is published, so requests never process dataset themselves
+        after reload, and requests in flight finish with old version. Only
+        one watcher is running, if it is started already, it is returned.
+
+        Args:
+            dmngr (DataManager): datamanager to watch, default if None
+            interval (float): polling interval in seconds
+
+        Returns:
+            DatasetWatcher: running watcher
+    """
+    global _watcher
+    dmngr = dmngr or _defaultDataManager()
+    with _datamanagerLock:
+        if _watcher is None or _watcher._dmngr is not dmngr:
+            if _watcher is not None:
+                _watcher.stop()
+            _watcher = watcher.DatasetWatcher(
+                dmngr,
+                interval,
+                _rebuildSnapshot,
+                _retireSnapshot
+            )
+        _watcher.start()
+        return _watcher
+
+
+# [Public]
+def stopWatcher():
+    """
+        Stops watcher, if it is running.
+    """
+    global _watcher
+    with _datamanagerLock:
+        if _watcher is not None:
+            _watcher.stop()
+            _watcher = None
+
+
+# [Public]
+def startRankingPool():
+    """
+        Starts processes that rank large partitions of requests in parallel,
+        see "analyser.startPool". Servers call it before they start threads,
+        as processes cannot be forked safely afterwards.
+
+        Returns:
+            bool: flag showing that processes are running
+    """
+    return analyser.startPool()
+
+
+# [Public]
+def stopRankingPool():
+    """
+        Stops processes ranking partitions, if they are running.
+    """
+    analyser.stopPool()
+
+
+# [Public]
+def startSharding(datasetIds=None, dmngr=None):
+    """
+        Processes datasets and splits them into shards, if SHARDS is
+        positive, see "_shardedObject". Servers call it before they start
+        threads, as shards run in processes only, if they are forked, while
+        no other thread is running. Shards of datasets that are processed
+        later run in calling process. Datasets that fail are skipped.
+
+        Args:
+            datasetIds (list<str>): dataset ids, HOT_DATASETS are used if None
+            dmngr (DataManager): hook to pass own datamanager for tests
+
+        Returns:
+            list<str>: ids of datasets with shards in processes
+    """
+    datasetIds = HOT_DATASETS if datasetIds is None else datasetIds
+    if SHARDS < 1:
+        return []
+    dmngr = dmngr or _defaultDataManager()
+    parallel = []
+    for datasetId in datasetIds:
+        dataset, version = dmngr.getDatasetVersion(datasetId)
+        if dataset is None:
+            continue
+        try:
+            entry = _snapshot(dataset, version)
+        except ex.AnalyticsBaseException:
+            continue
+        if _shardedExecutor(dataset._id, version, entry).isParallel():
+            parallel.append(dataset._id)
+    return parallel
+
+
+# [Public]
+def stopSharding():
+    """
+        Stops shards of all datasets, once their queries finish.
+    """
+    with _executorsLock:
+        executors = _executors.values()
+        _executors.clear()
+    for executor in executors:
+        executor.stop()
+
+
+# [Private]
+def _shardedExecutor(datasetId, version, entry):
+    """
+        Returns sharded executor of snapshot, executor is started on first
+        use. Executors of snapshots that are not cached anymore are stopped.
+
+        Args:
+            datasetId (str): dataset id
+            version (str): dataset version
+            entry (dict<str, obj>): snapshot entry
+
+        Returns:
+            ShardedExecutor: executor of the snapshot
+    """
+    key = (datasetId, version)
+    with _executorsLock:
+        executor = _executors.get(key)
+        if executor is None:
+            executor = sharding.ShardedExecutor(entry["block"], SHARDS, True,
+                SHARD_QUERIES)
+            _executors[key] = executor
+        cached = set(_processed.keys())
+        retired = [_executors.pop(x) for x in _executors.keys() if
+            x != key and x not in cached]
+    for other in retired:
+        other.stop()
+    return executor
+
+
+# [Private]
+def _shardedObject(dataset, version, entry, queryset, issorted=False,
+        diagnostics=None, deadline=None, timings=None):
+    """
+        Returns data object of query executed on shards of snapshot, or
+        None, if shards cannot execute it, e.g. approximate comparison ranks
+        all values at once, then caller executes query in process. Deadline
+        is checked before query is sent to shards only.
+
+        Args:
+            dataset (Dataset): dataset of the snapshot
+            version (str): dataset version
+            entry (dict<str, obj>): snapshot entry
+            queryset (str): query string
+            issorted (bool): indicates whether elements are sorted or not
+            diagnostics (Diagnostics): diagnostics of the request
+            deadline (Deadline): deadline of the request
+            timings (Timings): timings of the request
+
+        Returns:
+            dict<str, obj>: object with clusters, elements, pulses,
+                algorithm, or None
+    """
+    dl.orNever(deadline).check()
+    timings = tm.orDiscard(timings)
+    executor = _shardedExecutor(dataset._id, version, entry)
+    # diagnostics are reported, only if query is not executed again
+    local = diag.Diagnostics()
+    with timings.stage("shards", len(entry["block"]._elementmap._map)) as \
+            stage:
+        obj = executor.query(queryset, issorted, local)
+        stage.out(0 if obj is None else len(obj["elements"]))
+    if obj is not None and diagnostics is not None:
+        diagnostics.merge(local)
+    return obj
+
+
 # [Private]
 def searchDatasets(dmngr=None):
     """
@@ -77,31 +406,65 @@ def searchDatasets(dmngr=None):
         Returns:
             list<Dataset>: list of datasets
     """
-    dmngr = dmngr or _datamanager
+    dmngr = dmngr or _defaultDataManager()
     return dmngr.getDatasets()
 
 
 # [Public]
-def getAllDatasets():
+def datasetsETag(dmngr=None):
+    """
+        Returns ETag of the list of datasets. ETag depends on ids and versions
+        of all datasets, and is computed without loading any dataset.
+
+        Args:
+            dmngr (DataManager): hook to pass own datamanager for tests
+
+        Returns:
+            str: quoted ETag of the datasets list
+    """
+    dmngr = dmngr or _defaultDataManager()
+    pairs = sorted([(x._id, v) for x, v in dmngr.getDatasetVersions()])
+    parts = ["%s=%s" % (x, v) for x, v in pairs]
+    return httputils.generateETag(_ETAG_SALT, "datasets", *parts)
+
+
+# [Public]
+def getAllDatasets(dmngr=None):
     """
         Returns list with all datasets available. If something fails, return
         empty list.
 
+        Args:
+            dmngr (DataManager): hook to pass own datamanager for tests
+
         Returns:
             dict<str, obj>: list of available datasets
     """
     try:
-        obj = [x.getJSON() for x in searchDatasets()]
+        obj = [x.getJSON() for x in searchDatasets(dmngr)]
         return _generateSuccessMessage([], obj)
     except BaseException as e:
         return _generateErrorMessage([str(e)])
 
 
 # [Public]
-def requestData(datasetId, query, dmngr=None, issorted=False, iswarnings=True):
+def requestData(datasetId, query, dmngr=None, issorted=False, iswarnings=True,
+        dataformat=serializer.FORMAT_DEFAULT, timeout=ADMISSION_TIMEOUT,
+        deadline=None, istimings=False, isprofile=False):
     """
         Public method to request data, has error handling. Returns data json,
-        if everything is okay, otherwise returns error json.
+        if everything is okay, otherwise returns error json. Heavy queries
+        are admitted by admission control, and error with CODE_OVERLOADED is
+        returned, if they cannot be admitted. Query is aborted with
+        CODE_TIMEOUT error, once deadline passes or is cancelled, deadline
+        of REQUEST_TIMEOUT seconds is used, if none is provided. Pipeline
+        stages of successful query are added to stage histograms, and are
+        returned as "timings", if requested. If profile is requested, query
+        is executed under profiler, functions with the largest cumulative
+        time are returned as "profile", and profile is saved to PROFILE_DIR,
+        if it is set, keeping the latest PROFILE_KEEP profiles only.
+        Profiled query is not added to histograms. Callers must restrict
+        profiling to admins, see "isUserAdmin".
 
         Args:
             datasetId (str): id of a particular dataset
@@ -109,35 +472,480 @@ def requestData(datasetId, query, dmngr=None, issorted=False, iswarnings=True):
             dmngr (DataManager): hook to pass own datamanager for tests
             issorted (bool): indicates whether elements are sorted or not
             iswarnings (bool): indicates wherther warnings are reported or not
+            dataformat (str): format of elements in response
+            timeout (float): maximum time in seconds to wait for admission
+            deadline (Deadline): deadline of the request, or None
+            istimings (bool): indicates whether timings are returned or not
+            isprofile (bool): indicates whether query is profiled or not
 
         Returns:
             dict<str, obj>: json object of results
     """
     jsonobj = {}
+    start = tm.clock()
+    # diagnostics and timings belong to this request only
+    diagnostics = diag.Diagnostics()
+    timings = tm.Timings()
+    if deadline is None and REQUEST_TIMEOUT > 0:
+        deadline = dl.Deadline(REQUEST_TIMEOUT)
+    deadline = dl.orNever(deadline)
     try:
-        with warnings.catch_warnings(record=True) as w:
-            warnings.simplefilter("always")
+        # heavy queries wait for a slot, or are rejected right away, and do
+        # not wait longer than deadline allows
+        cost = estimateCost(datasetId, query, dmngr, issorted)
+        remaining = deadline.remaining()
+        if remaining is not None:
+            timeout = remaining if timeout is None else min(timeout, remaining)
+        def execute():
+            return _getDataObject(
+                datasetId,
+                query,
+                dmngr,
+                issorted,
+                dataformat,
+                diagnostics,
+                deadline,
+                timings
+            )
+        profile = None
+        with _admission.admit(cost["heavy"], timeout):
             # retrieve object
-            obj = _getDataObject(datasetId, query, dmngr, issorted)
-            # 30.03.2015 ivan.sadikov: added iswarnings feature
-            messages = [str(wm.message) for wm in w] if iswarnings else []
-            # prepare json object
-            jsonobj = _generateSuccessMessage(messages, obj)
+            if isprofile:
+                obj, profile = profiling.profileCall(execute, PROFILE_TOP,
+                    _profilePath(datasetId))
+                if profile["file"] is not None:
+                    profiling.rotateProfiles(PROFILE_DIR, PROFILE_KEEP)
+            else:
+                obj = execute()
+                _stages.add(datasetId.strip(), timings)
+        # 30.03.2015 ivan.sadikov: added iswarnings feature
+        messages = diagnostics.messages() if iswarnings else []
+        # prepare json object
+        jsonobj = _generateSuccessMessage(messages, obj,
+            timings.getJSON() if istimings else None)
+        if profile is not None:
+            jsonobj["profile"] = profile
+    except ex.AnalyticsOverloadError as e:
+        jsonobj = _generateErrorMessage([e._errmsg], CODE_OVERLOADED)
+    except ex.AnalyticsTimeoutError as e:
+        jsonobj = _generateErrorMessage([e._errmsg], CODE_TIMEOUT)
+    except ex.AnalyticsBaseException as e:
+        jsonobj = _generateErrorMessage([e._errmsg])
+    _requests.inc(1, (jsonobj["code"],))
+    _latency.observe(tm.clock() - start)
+    return jsonobj
+
+
+# [Private]
+def _profilePath(datasetId):
+    """
+        Returns path of .pstats file for profile of query, or None, if
+        PROFILE_DIR is not set. File name has dataset id, time and random
+        suffix, so profiles of concurrent queries do not overwrite each other.
+
+        Args:
+            datasetId (str): dataset id
+
+        Returns:
+            str: path of the file, or None
+    """
+    if not PROFILE_DIR:
+        return None
+    prefix = re.sub(r"[^\w.-]", "_", str(datasetId).strip())
+    name = "%s-%s-%s.pstats" % (prefix, time.strftime("%Y%m%d%H%M%S"),
+        uuid.uuid4().hex[:8])
+    return os.path.join(PROFILE_DIR, name)
+
+
+# [Public]
+def estimateCost(datasetId, query, dmngr=None, issorted=False):
+    """
+        Estimates cost of query before it is executed. Cost is number of
+        elements times selectivity of query times number of dynamic pulses
+        that rank them, plus cost of filtering all elements, sorting selected
+        ones, and loading and processing dataset, if it is not processed yet.
+        Number of elements, clusters and dynamic pulses are taken from
+        processed dataset, elements are estimated from size of data files
+        otherwise. Selectivity is share of selected clusters times
+        PULSE_SELECTIVITY for each pulse that filters elements. Estimation
+        does not fail, query that cannot be parsed is estimated as selecting
+        all elements, unknown dataset has zero cost.
+
+        Args:
+            datasetId (str): id of a particular dataset
+            query (str): select query for data
+            dmngr (DataManager): hook to pass own datamanager for tests
+            issorted (bool): indicates whether elements are sorted or not
+
+        Returns:
+            dict<str, obj>: number of elements, flag of processed dataset,
+                selectivity of clusters and of query, number of dynamic
+                pulses, cost and heavy flag
+    """
+    estimate = {"elements": 0, "processed": False, "clusters": 1.0,
+        "selectivity": 1.0, "dynamic": 0, "cost": 0.0, "heavy": False}
+    if type(datasetId) is not StringType:
+        return estimate
+    dmngr = dmngr or _defaultDataManager()
+    datasetId = datasetId.strip()
+    dataset, version = dmngr.getDatasetVersion(datasetId)
+    if dataset is None:
+        return estimate
+    entry = _processed.peek((datasetId, version))
+    block = entry["block"] if entry is not None else None
+    if block is not None:
+        elements = len(block._elementmap._map)
+        dynamic = dict((x.id(), not x.static()) for x in
+            block._pulsemap._map.values())
+    else:
+        size = 0
+        for path in dataset.baseFiles():
+            try:
+                size += os.path.getsize(path)
+            except OSError:
+                pass
+        elements = size // BYTES_PER_ELEMENT
+        dynamic = None
+    try:
+        blocks = selector.parseQueryset(str(query), q.QueryEngine())
+    except ex.AnalyticsBaseException:
+        blocks = []
+    selectivity = 1.0; clusters = 1.0
+    for qblock in blocks:
+        table = qblock._statement._table.upper()
+        equal = [x for x in qblock._predicates if
+            x._type == q._PREDICATE_TYPES.EQUAL]
+        if table == selector.CLUSTERS and block is not None:
+            # only cluster ids select clusters, see "filterClusters"
+            ids = set([x._values[0] for x in equal if
+                x._parameter.upper() == "ID"])
+            total = len(block._clustermap._map)
+            selected = len([x for x in ids if block._clustermap.has(x)])
+            share = float(selected) / total if total else 0.0
+            clusters *= share
+            selectivity *= share
+        elif table == selector.PULSES:
+            for predicate in qblock._predicates:
+                if predicate._type == q._PREDICATE_TYPES.ASSIGN and \
+                        dynamic is not None and predicate._parameter in dynamic:
+                    dynamic[predicate._parameter] = \
+                        predicate._values[0].upper() == "DYNAMIC"
+            # default of dynamic pulse does not filter elements
+            for predicate in equal:
+                if dynamic is not None and \
+                        dynamic.get(predicate._parameter) is False:
+                    selectivity *= PULSE_SELECTIVITY
+    numdynamic = len([x for x in dynamic.values() if x]) if dynamic else 0
+    selected = elements * selectivity
+    cost = selected * max(numdynamic, 1) + elements * FILTER_COST
+    if issorted and selected > 1:
+        cost += selected * math.log(selected, 2) * SORT_COST
+    if block is None:
+        cost += elements * LOAD_COST
+    estimate.update({"elements": elements, "processed": block is not None,
+        "clusters": clusters, "selectivity": selectivity,
+        "dynamic": numdynamic, "cost": cost, "heavy": cost >= HEAVY_COST})
+    return estimate
+
+
+# [Public]
+def requestDataBodies(datasetId, query, dmngr=None, issorted=False,
+        iswarnings=True, dataformat=serializer.FORMAT_DEFAULT,
+        encoding=httputils.IDENTITY):
+    """
+        Returns status code and serialised bodies of "requestData" result.
+        Concurrent requests with the same ETag, i.e. the same dataset
+        version, normalised query and flags, are coalesced: the first one is
+        executed, and others wait for it and get the same bodies. Body in
+        requested encoding is included, if it was applied for the first
+        request, identity body is always included.
+
+        Args:
+            datasetId (str): id of a particular dataset
+            query (str): select query for data
+            dmngr (DataManager): hook to pass own datamanager for tests
+            issorted (bool): indicates whether elements are sorted or not
+            iswarnings (bool): indicates wherther warnings are reported or not
+            dataformat (str): format of elements in response
+            encoding (str): content encoding of the body
+
+        Returns:
+            tuple<int, dict<str, str>>: status code and bodies by encoding
+    """
+    def execute():
+        result = requestData(datasetId, query, dmngr, issorted, iswarnings,
+            dataformat)
+        if result["code"] != 200:
+            return (result["code"], httputils.encodeJSON(result, encoding))
+        # encoding is measured separately, as it follows the query, columnar
+        # and rank-only elements keep their number
+        elements = result["data"]["elements"]
+        count = elements["length"] if type(elements) is DictType else \
+            len(elements)
+        timings = tm.Timings()
+        with timings.stage("encode", count):
+            bodies = httputils.encodeJSON(result, encoding)
+        _stages.add(datasetId.strip(), timings)
+        return (result["code"], bodies)
+    key = queryETag(datasetId, query, dmngr, issorted, iswarnings, dataformat)
+    if key is None:
+        return execute()
+    return _flights.do(key, execute)
+
+
+# [Public]
+def requestExplain(datasetId, query, dmngr=None, issorted=False,
+        isanalyze=False):
+    """
+        Public method to explain query, has error handling. Explanation has
+        parsed query blocks with predicates that are applied or ignored and
+        why, estimate of cost that admission control uses, estimated number
+        of elements after filtering by clusters and by pulses, and dynamic
+        pulses that rank elements. Query is not executed, unless analyze is
+        requested, then query is executed as "requestData" executes it, and
+        explanation has also actual number of elements after each filter and
+        timings of all stages, elements themselves are not returned.
+
+        Args:
+            datasetId (str): id of a particular dataset
+            query (str): select query for data
+            dmngr (DataManager): hook to pass own datamanager for tests
+            issorted (bool): indicates whether elements are sorted or not
+            isanalyze (bool): indicates whether query is executed or not
+
+        Returns:
+            dict<str, obj>: json object of explanation
+    """
+    jsonobj = {}
+    diagnostics = diag.Diagnostics()
+    try:
+        obj = _getExplainObject(datasetId, query, dmngr, issorted,
+            diagnostics)
+        messages = diagnostics.messages()
+        if isanalyze:
+            result = requestData(datasetId, query, dmngr, issorted,
+                istimings=True)
+            if result["status"] != "success":
+                return result
+            stages = dict((x["stage"], x) for x in result["timings"])
+            for item in obj["filters"]:
+                stage = stages.get("filter." + item["filter"])
+                item["actual"] = stage["out"] if stage is not None else None
+            obj["algorithm"] = result["data"]["algorithm"]
+            obj["timings"] = result["timings"]
+            messages = result["messages"]
+        jsonobj = _generateSuccessMessage(messages, obj)
+    except ex.AnalyticsBaseException as e:
+        jsonobj = _generateErrorMessage([e._errmsg])
+    return jsonobj
+
+
+# [Private]
+def _getExplainObject(datasetId, queryset, dmngr=None, issorted=False,
+        diagnostics=None):
+    """
+        Returns explanation of query for dataset id, see "requestExplain".
+        Cost is estimated before dataset is processed, as admission control
+        estimates it, dataset is processed afterwards to check predicates.
+
+        Args:
+            datasetId (str): dataset id
+            queryset (str): query string
+            dmngr (DataManager): hook to pass own datamanager for tests
+            issorted (bool): indicates whether elements are sorted or not
+            diagnostics (Diagnostics): diagnostics of the request
+
+        Returns:
+            dict<str, obj>: object with version, query blocks, estimate,
+                filters and dynamic pulses
+    """
+    misc.checkTypeAgainst(type(datasetId), StringType, __file__)
+    misc.checkTypeAgainst(type(queryset), StringType, __file__)
+    datasetId = datasetId.strip(); queryset = queryset.strip()
+    dmngr = dmngr or _defaultDataManager()
+    dataset, version = dmngr.getDatasetVersion(datasetId)
+    if dataset is None:
+        misc.raiseStandardError("No such dataset", __file__)
+    estimate = estimateCost(datasetId, queryset, dmngr, issorted)
+    blocks = selector.parseQueryset(queryset, q.QueryEngine(), diagnostics)
+    # snapshot is only read, so it is not copied
+    entry = _snapshot(dataset, version)
+    if diagnostics is not None:
+        diagnostics.merge(entry["diagnostics"])
+    explained = selector.explainQueryset(blocks, analyser.ALGORITHMS,
+        entry["block"]._pulsemap, entry["block"]._clustermap)
+    elements = estimate["elements"]
+    return {
+        "version": version,
+        "blocks": explained["blocks"],
+        "estimate": estimate,
+        "filters": [
+            {"filter": "clusters", "estimated":
+                int(round(elements * estimate["clusters"]))},
+            {"filter": "pulses", "estimated":
+                int(round(elements * estimate["selectivity"]))}
+        ],
+        "dynamic": explained["dynamic"]
+    }
+
+
+# [Public]
+def catalogueETag(datasetId, dmngr=None):
+    """
+        Returns ETag of the dataset catalogue. ETag depends only on dataset
+        version. If dataset does not exist, returns None.
+
+        Args:
+            datasetId (str): dataset id
+            dmngr (DataManager): hook to pass own datamanager for tests
+
+        Returns:
+            str: quoted ETag of the catalogue
+    """
+    dmngr = dmngr or _defaultDataManager()
+    version = dmngr.getVersion(str(datasetId).strip())
+    if version is None:
+        return None
+    return httputils.generateETag(_ETAG_SALT, "catalogue", version)
+
+
+# [Public]
+def queryETag(datasetId, query, dmngr=None, issorted=False, iswarnings=True,
+        dataformat=serializer.FORMAT_DEFAULT):
+    """
+        Returns ETag of the query result. ETag depends on dataset version,
+        normalised query and flags, and is computed before any loading,
+        filtering or ranking, so matching requests can be answered right away.
+        If dataset does not exist, returns None.
+
+        Args:
+            datasetId (str): id of a particular dataset
+            query (str): select query for data
+            dmngr (DataManager): hook to pass own datamanager for tests
+            issorted (bool): indicates whether elements are sorted or not
+            iswarnings (bool): indicates wherther warnings are reported or not
+            dataformat (str): format of elements in response
+
+        Returns:
+            str: quoted ETag of the query result
+    """
+    dmngr = dmngr or _defaultDataManager()
+    datasetId = str(datasetId).strip()
+    version = dmngr.getVersion(datasetId)
+    if version is None:
+        return None
+    flags = "s=%d;w=%d;f=%s" % (bool(issorted), bool(iswarnings), dataformat)
+    return httputils.generateETag(
+        _ETAG_SALT,
+        "query",
+        datasetId,
+        version,
+        _normaliseQuery(query),
+        flags
+    )
+
+
+# [Public]
+def requestCatalogue(datasetId, dmngr=None):
+    """
+        Public method to request catalogue of the dataset, has error handling.
+        Catalogue contains clusters, pulses and all elements in catalogue
+        order and does not change until dataset version changes, so clients
+        can cache it and request rank-only data afterwards.
+
+        Args:
+            datasetId (str): id of a particular dataset
+            dmngr (DataManager): hook to pass own datamanager for tests
+
+        Returns:
+            dict<str, obj>: json object of results
+    """
+    jsonobj = {}
+    diagnostics = diag.Diagnostics()
+    try:
+        obj = _getCatalogueObject(datasetId, dmngr, diagnostics)
+        jsonobj = _generateSuccessMessage(diagnostics.messages(), obj)
+    except ex.AnalyticsBaseException as e:
+        jsonobj = _generateErrorMessage([e._errmsg])
+    return jsonobj
+
+
+# [Public]
+def requestSweep(datasetId, query, pulses, values, topk=0, dmngr=None,
+        iswarnings=True):
+    """
+        Public method to rank dataset under many candidate default values of
+        one or two dynamic pulses, has error handling. Query is parsed and
+        elements are filtered once, and ranking shares values of elements
+        between candidates. Candidates are all combinations of values of
+        pulses, for each candidate histogram of rank classes and ranks is
+        returned, and "topk" best elements, if it is positive.
+
+        Args:
+            datasetId (str): id of a particular dataset
+            query (str): select query for data
+            pulses (list<str>): ids or names of dynamic pulses to sweep
+            values (list<list<obj>>): candidate values of each pulse
+            topk (int): number of best elements for each candidate
+            dmngr (DataManager): hook to pass own datamanager for tests
+            iswarnings (bool): indicates wherther warnings are reported or not
+
+        Returns:
+            dict<str, obj>: json object of results
+    """
+    jsonobj = {}
+    diagnostics = diag.Diagnostics()
+    try:
+        obj = _getSweepObject(datasetId, query, pulses, values, topk, dmngr,
+            diagnostics)
+        messages = diagnostics.messages() if iswarnings else []
+        jsonobj = _generateSuccessMessage(messages, obj)
     except ex.AnalyticsBaseException as e:
         jsonobj = _generateErrorMessage([e._errmsg])
     return jsonobj
 
 
 # [Private]
-def _getDataObject(datasetId, queryset, dmngr=None, issorted=False):
+def _normaliseQuery(query):
     """
-        Returns data object for dataset id and queryset.
+        Returns normalised query string, so equivalent queries have the same
+        representation. Query is parsed and rebuilt, that removes differences
+        in whitespaces and case of keywords. If query cannot be parsed, only
+        whitespaces are collapsed, parsing error is reported by request.
+
+        Args:
+            query (str): query string
+
+        Returns:
+            str: normalised query string
+    """
+    query = " ".join(str(query).split())
+    try:
+        blocks = selector.parseQueryset(query, q.QueryEngine())
+        return q.QueryEngine().buildQueryString(blocks)
+    except ex.AnalyticsBaseException:
+        return query
+
+
+# [Private]
+def _getDataObject(datasetId, queryset, dmngr=None, issorted=False,
+        dataformat=serializer.FORMAT_DEFAULT, diagnostics=None, deadline=None,
+        timings=None):
+    """
+        Returns data object for dataset id and queryset. Copying, filtering
+        and ranking of elements are aborted with timeout error, once
+        deadline passes. Each stage is recorded to timings with number of
+        elements in and out.
 
         Args:
             datasetId (str): dataset id
             queryset (str): query string
             dmngr (DataManager): hook to pass own datamanager for tests
             issorted (bool): indicates whether elements are sorted or not
+            dataformat (str): format of elements in response
+            diagnostics (Diagnostics): diagnostics of the request
+            deadline (Deadline): deadline of the request
+            timings (Timings): timings of the request
 
         Returns:
             dict<str, obj>: object with clusters, elements, pulses, algorithm
@@ -145,66 +953,55 @@ def _getDataObject(datasetId, queryset, dmngr=None, issorted=False):
     # check arguments
     misc.checkTypeAgainst(type(datasetId), StringType, __file__)
     misc.checkTypeAgainst(type(queryset), StringType, __file__)
+    # check format before doing any work
+    if not serializer.isFormatSupported(dataformat):
+        misc.raiseValueError("Unknown format %s" % (str(dataformat)), __file__)
+    timings = tm.orDiscard(timings)
     # trim arguments
     datasetId = datasetId.strip(); queryset = queryset.strip();
     # find that ther is actual dataset stored
     if dmngr is None:
-        dmngr = _datamanager
-    dataset = dmngr.getDataset(datasetId)
+        dmngr = _defaultDataManager()
+    dataset, version = dmngr.getDatasetVersion(datasetId)
     # check dataset
     if dataset is None:
         # no datasets - error
         misc.raiseStandardError("No such dataset", __file__)
-    # everything is okay
-    ## extract information about core elements
-    cludata = dataset._clusters
-    eledata = dataset._elements
-    puldata = dataset._pulses
-    isdiscover = dataset._discover
-    ## clusters list
-    clusters = _loaderForDatatype(
-        cludata[datamanager.TYPE],
-        cludata[datamanager.PATH]
-    ).processData()
-    ## elements list
-    elements = _loaderForDatatype(
-        eledata[datamanager.TYPE],
-        eledata[datamanager.PATH]
-    ).processData()
-    ## pulses list (if we discover pulses skip step)
-    pulses = []
-    if not isdiscover:
-        pulses = _loaderForDatatype(
-            puldata[datamanager.TYPE],
-            puldata[datamanager.PATH]
-        ).processData()
-    # create maps
-    clustermap = ClusterMap()
-    elementmap = ElementMap()
-    pulsemap = PulseMap()
-    # create process block and call processor
-    pblock = processor.ProcessBlock(
-        {"map": clustermap, "data": clusters},
-        {"map": elementmap, "data": elements},
-        {"map": pulsemap, "data": pulses},
-        isdiscover
-    )
-    pblock = processor.processWithBlock(pblock)
+    # everything is okay, load and process dataset, version and catalogue
+    # index are the ones of the snapshot that is copied
+    entry = _processedSnapshot(dataset, version, diagnostics, timings)
+    if SHARDS > 0 and dataformat == serializer.FORMAT_DEFAULT:
+        obj = _shardedObject(dataset, version, entry, queryset, issorted,
+            diagnostics, deadline, timings)
+        if obj is not None:
+            return obj
+    pblock = _copySnapshot(entry, diagnostics, deadline, timings)
 
     # create filter block and call selector
-    algmap = AlgorithmsMap()
-    for alg in analyser.ALGORITHMS.values():
-        algmap.assign(alg)
+    algmap = analyser.ALGORITHMS.copy()
     fblock = selector.FilterBlock(
         algmap,
         pblock._pulsemap,
         pblock._clustermap,
-        pblock._elementmap
+        pblock._elementmap,
+        diagnostics,
+        deadline,
+        timings
     )
-    fblock = selector.filterWithBlock(queryset, fblock)
+    with timings.stage("filter", len(fblock._ele._map)) as stage:
+        fblock = selector.filterWithBlock(queryset, fblock)
+        stage.out(len(fblock._ele._map))
     # create analyse block and call analyser
-    ablock = analyser.AnalyseBlock(fblock._alg, fblock._ele, fblock._pul)
-    ablock = analyser.analyseWithBlock(ablock)
+    ablock = analyser.AnalyseBlock(
+        fblock._alg,
+        fblock._ele,
+        fblock._pul,
+        diagnostics,
+        fblock._scope,
+        deadline
+    )
+    with timings.stage("analyse", len(ablock._elementmap._map)):
+        ablock = analyser.analyseWithBlock(ablock)
     # reassign updated maps
     clustermap = fblock._clu
     elementmap = ablock._elementmap
@@ -214,16 +1011,651 @@ def _getDataObject(datasetId, queryset, dmngr=None, issorted=False):
     ## as elements now can be sorted we extract json manually
     elementlist = elementmap._map.values()
     if issorted:
-        elementlist = processor.sortElements(elementlist)
-    obj = {
-        "clusters": clustermap.getJSON(),
-        "elements": [x.getJSON() for x in elementlist],
-        "pulses": pulsemap.getJSON(),
-        "algorithm": algorithm.getJSON()
-    }
+        with timings.stage("sort", len(elementlist)):
+            elementlist = processor.sortElements(elementlist)
+    # rank-only response does not repeat catalogue data
+    with timings.stage("serialize", len(elementlist)):
+        if dataformat == serializer.FORMAT_RANKS:
+            return {
+                "version": version,
+                "elements": serializer.elementsToRanks(elementlist,
+                    entry["index"]),
+                "algorithm": algorithm.getJSON()
+            }
+        obj = {
+            "clusters": clustermap.getJSON(),
+            "elements": serializer.serializeElements(elementlist, dataformat),
+            "pulses": pulsemap.getJSON(),
+            "algorithm": algorithm.getJSON()
+        }
     return obj
 
 
+# [Private]
+def _getCatalogueObject(datasetId, dmngr=None, diagnostics=None):
+    """
+        Returns catalogue object for dataset id.
+
+        Args:
+            datasetId (str): dataset id
+            dmngr (DataManager): hook to pass own datamanager for tests
+            diagnostics (Diagnostics): diagnostics of the request
+
+        Returns:
+            dict<str, obj>: object with version, clusters, pulses, elements
+    """
+    misc.checkTypeAgainst(type(datasetId), StringType, __file__)
+    datasetId = datasetId.strip()
+    dmngr = dmngr or _defaultDataManager()
+    dataset, version = dmngr.getDatasetVersion(datasetId)
+    if dataset is None:
+        misc.raiseStandardError("No such dataset", __file__)
+    pblock = _processedBlock(dataset, version, diagnostics)
+    elementlist = pblock._elementmap._map.values()
+    return {
+        "id": datasetId,
+        "version": version,
+        "clusters": pblock._clustermap.getJSON(),
+        "elements": serializer.elementsToCatalogue(elementlist),
+        "pulses": pblock._pulsemap.getJSON()
+    }
+
+
+# [Private]
+def _getSweepObject(datasetId, queryset, pulses, values, topk=0, dmngr=None,
+        diagnostics=None):
+    """
+        Returns sweep object for dataset id, queryset and candidate values of
+        pulses.
+
+        Args:
+            datasetId (str): dataset id
+            queryset (str): query string
+            pulses (list<str>): ids or names of dynamic pulses to sweep
+            values (list<list<obj>>): candidate values of each pulse
+            topk (int): number of best elements for each candidate
+            dmngr (DataManager): hook to pass own datamanager for tests
+            diagnostics (Diagnostics): diagnostics of the request
+
+        Returns:
+            dict<str, obj>: object with version, pulses, candidates, algorithm
+    """
+    misc.checkTypeAgainst(type(datasetId), StringType, __file__)
+    misc.checkTypeAgainst(type(queryset), StringType, __file__)
+    misc.checkTypeAgainst(type(pulses), ListType, __file__)
+    misc.checkTypeAgainst(type(values), ListType, __file__)
+    misc.checkTypeAgainst(type(topk), IntType, __file__)
+    if len(pulses) != len(values):
+        misc.raiseValueError("Every pulse needs list of values", __file__)
+    if len([x for x in values if type(x) is not ListType or not x]) > 0:
+        misc.raiseValueError("Values of pulse must be non-empty list",
+            __file__)
+    numcandidates = reduce(lambda x, y: x * len(y), values, 1)
+    if numcandidates > MAX_SWEEP_CANDIDATES:
+        msg = "Too many candidates, at most %d are allowed" \
+            % (MAX_SWEEP_CANDIDATES)
+        misc.raiseValueError(msg, __file__)
+    datasetId = datasetId.strip(); queryset = queryset.strip()
+    dmngr = dmngr or _defaultDataManager()
+    dataset, version = dmngr.getDatasetVersion(datasetId)
+    if dataset is None:
+        misc.raiseStandardError("No such dataset", __file__)
+    pblock = _processedBlock(dataset, version, diagnostics)
+    # query is parsed and elements are filtered once for all candidates
+    fblock = selector.FilterBlock(
+        analyser.ALGORITHMS.copy(),
+        pblock._pulsemap,
+        pblock._clustermap,
+        pblock._elementmap,
+        diagnostics
+    )
+    fblock = selector.filterWithBlock(queryset, fblock)
+    swept = []
+    for name in pulses:
+        found = [x for x in fblock._pul._map.values()
+            if x.id() == name or x.name() == name]
+        if not found or type(found[0]) is not corepulse.DynamicPulse or \
+                found[0].static():
+            msg = "Pulse %s is not a dynamic pulse" % (str(name))
+            misc.raiseValueError(msg, __file__)
+        swept.append(found[0])
+    candidates = []
+    for candidate in itertools.product(*values):
+        candidates.append([_sweepValue(swept[_i], candidate[_i])
+            for _i in range(len(swept))])
+    result = analyser.sweepUsingMap(fblock._alg, fblock._ele, fblock._pul,
+        swept, candidates, diagnostics)
+    elements = fblock._ele._map
+    objlist = []
+    for _i in range(len(candidates)):
+        ranks = result["ranks"][_i]
+        classes = {}; names = {}
+        for rank in ranks.values():
+            classes[rank._class._name] = classes.get(rank._class._name, 0) + 1
+            names[rank._name] = names.get(rank._name, 0) + 1
+        obj = {"defaults": candidates[_i], "classes": classes, "ranks": names}
+        if topk > 0:
+            best = heapq.nsmallest(topk, ranks.keys(),
+                key=lambda x: (-ranks[x]._value, x))
+            obj["top"] = [{"id": x, "name": elements[x].name(),
+                "rank": ranks[x]._name} for x in best]
+        objlist.append(obj)
+    return {
+        "version": version,
+        "pulses": [x.name() for x in swept],
+        "candidates": objlist,
+        "algorithm": result["algorithm"].getJSON()
+    }
+
+
+# [Private]
+def _sweepValue(pulse, value):
+    """
+        Returns candidate value converted to type of the pulse. Integer is
+        accepted for float pulse, as clients do not keep the difference.
+
+        Args:
+            pulse (DynamicPulse): swept pulse
+            value (obj): candidate value
+
+        Returns:
+            obj: value of pulse type
+    """
+    if pulse.type() is FloatType and type(value) is IntType:
+        return float(value)
+    if type(value) is not pulse.type():
+        msg = "Value %s does not match pulse %s" % (str(value), pulse.name())
+        misc.raiseValueError(msg, __file__)
+    return value
+
+
+# [Private]
+def _loadDataset(dataset):
+    """
+        Loads clusters, elements and pulses lists for dataset. If dataset
+        discovers pulses, pulses list is empty.
+
+        Args:
+            dataset (Dataset): dataset to load
+
+        Returns:
+            dict<str, list>: clusters, elements and pulses lists
+    """
+    # clusters, elements and pulses files are read concurrently, pulses are
+    # not read, if dataset discovers them
+    keys = ["clusters", "elements"]
+    specs = [dataset._clusters, dataset._elements]
+    if not dataset._discover:
+        keys.append("pulses")
+        specs.append(dataset._pulses)
+    def load(spec):
+        return _loaderForDatatype(
+            spec[datamanager.TYPE],
+            spec[datamanager.PATH]
+        ).processData()
+    data = {"pulses": []}
+    data.update(zip(keys, workers.mapParallel(load, specs, len(specs))))
+    return data
+
+
+# [Private]
+def _processDataset(dataset, diagnostics=None, timings=None):
+    """
+        Loads dataset and processes lists into maps.
+
+        Args:
+            dataset (Dataset): dataset to process
+            diagnostics (Diagnostics): diagnostics to report parsing failures
+            timings (Timings): timings to record loading and processing to
+
+        Returns:
+            ProcessBlock: processed block with cluster, element and pulse maps
+    """
+    timings = tm.orDiscard(timings)
+    with timings.stage("load") as stage:
+        data = _loadDataset(dataset)
+        stage.out(len(data["elements"]))
+    # create process block and call processor
+    pblock = processor.ProcessBlock(
+        {"map": clustermap.ClusterMap(), "data": data["clusters"]},
+        {"map": elementmap.ElementMap(), "data": data["elements"]},
+        {"map": pulsemap.PulseMap(), "data": data["pulses"]},
+        dataset._discover,
+        diagnostics
+    )
+    with timings.stage("process", len(data["elements"])) as stage:
+        pblock = processor.processWithBlock(pblock)
+        stage.out(len(pblock._elementmap._map))
+    if dataset._deltas:
+        with timings.stage("deltas", len(pblock._elementmap._map)) as stage:
+            records = _loadDeltas(dataset)
+            pblock = processor.applyDeltas(pblock, records, diagnostics)
+            stage.out(len(pblock._elementmap._map))
+    return pblock
+
+
+# [Private]
+def _loadDeltas(dataset, start=0):
+    """
+        Loads delta records of dataset, starting from delta file "start".
+        Files are read concurrently, records are returned in order of files.
+
+        Args:
+            dataset (Dataset): dataset to load deltas for
+            start (int): index of the first delta file to load
+
+        Returns:
+            list<dict>: delta records
+    """
+    def load(spec):
+        return _loaderForDatatype(
+            spec[datamanager.TYPE],
+            spec[datamanager.PATH]
+        ).processData()
+    records = []
+    for chunk in workers.mapParallel(load, dataset._deltas[start:]):
+        records.extend(chunk)
+    return records
+
+
+# [Private]
+def _processedBlock(dataset, version, diagnostics=None, deadline=None,
+        timings=None):
+    """
+        Returns copy of processed dataset. Dataset is processed once for
+        every version and kept in memory, each request gets its own copy, and
+        diagnostics of processing are reported to each request. Deadline
+        applies to copying only, processing is shared with other requests,
+        so it is not aborted.
+
+        Args:
+            dataset (Dataset): dataset to process
+            version (str): dataset version, read together with dataset
+            diagnostics (Diagnostics): diagnostics of the request
+            deadline (Deadline): deadline of the request
+            timings (Timings): timings of the request, processing is recorded
+                only, if snapshot is not cached
+
+        Returns:
+            ProcessBlock: processed block that request can change
+    """
+    entry = _processedSnapshot(dataset, version, diagnostics, timings)
+    return _copySnapshot(entry, diagnostics, deadline, timings)
+
+
+# [Private]
+def _processedSnapshot(dataset, version, diagnostics=None, timings=None):
+    """
+        Returns processed snapshot of dataset version and reports
+        diagnostics of processing to the request, see "_snapshot".
+
+        Args:
+            dataset (Dataset): dataset to process
+            version (str): dataset version
+            diagnostics (Diagnostics): diagnostics of the request
+            timings (Timings): timings of the request
+
+        Returns:
+            dict<str, obj>: snapshot entry, it must not be changed
+    """
+    entry = _snapshot(dataset, version, False, timings)
+    if diagnostics is not None:
+        diagnostics.merge(entry["diagnostics"])
+    return entry
+
+
+# [Private]
+def _copySnapshot(entry, diagnostics=None, deadline=None, timings=None):
+    """
+        Returns copy of processed block of snapshot, that request can change.
+
+        Args:
+            entry (dict<str, obj>): snapshot entry
+            diagnostics (Diagnostics): diagnostics of the request
+            deadline (Deadline): deadline of the request
+            timings (Timings): timings of the request
+
+        Returns:
+            ProcessBlock: processed block that request can change
+    """
+    timings = tm.orDiscard(timings)
+    with timings.stage("copy", len(entry["block"]._elementmap._map)):
+        return processor.cloneBlock(entry["block"], diagnostics, deadline)
+
+
+# [Private]
+def _snapshot(dataset, version, rebuild=False, timings=None):
+    """
+        Returns processed snapshot of dataset version, processes dataset, if
+        snapshot is not cached or rebuild is requested. Snapshot is never
+        changed after it is cached.
+
+        Args:
+            dataset (Dataset): dataset to process
+            version (str): dataset version
+            rebuild (bool): flag to process dataset even if it is cached
+            timings (Timings): timings to record processing to
+
+        Returns:
+            dict<str, obj>: processed block and diagnostics of processing
+    """
+    key = (dataset._id, version)
+    entry = None if rebuild else _processed.get(key)
+    if entry is None:
+        entry = _buildSnapshot(dataset, timings)
+        # elements of snapshot are identified by dataset version
+        entry["block"]._elementmap.setToken(key)
+        _processed.put(key, entry)
+    return entry
+
+
+# [Private]
+def _buildSnapshot(dataset, timings=None):
+    """
+        Processes dataset into snapshot. If cached snapshot of the dataset
+        has the same base files and its delta files are the first delta
+        files of dataset, only new delta files are loaded and applied to
+        it, otherwise dataset is processed from scratch.
+
+        Args:
+            dataset (Dataset): dataset to process
+            timings (Timings): timings to record processing to
+
+        Returns:
+            dict<str, obj>: processed block, diagnostics, catalogue index of
+                elements and file stamps
+    """
+    # files are stamped before they are read, so a file that changes while
+    # it is read is not taken as unchanged next time
+    base = [datamanager.fileStamp(x) for x in dataset.baseFiles()]
+    deltas = [datamanager.fileStamp(x) for x in dataset.deltaFiles()]
+    previous = _previousSnapshot(dataset._id, base, deltas)
+    processing = diag.Diagnostics()
+    if previous is None:
+        block = _processDataset(dataset, processing, timings)
+    else:
+        processing.merge(previous["diagnostics"])
+        start = len(previous["deltas"])
+        block = previous["block"]
+        if start < len(deltas):
+            timings = tm.orDiscard(timings)
+            with timings.stage("deltas", len(block._elementmap._map)) as stage:
+                records = _loadDeltas(dataset, start)
+                block = processor.applyDeltas(block, records, processing)
+                stage.out(len(block._elementmap._map))
+    # catalogue index is shared with previous snapshot, if block is unchanged
+    if previous is not None and block is previous["block"]:
+        index = previous["index"]
+    else:
+        index = serializer.catalogueIndex(block._elementmap._map.values())
+    return {
+        "block": block,
+        "diagnostics": processing,
+        "index": index,
+        "base": base,
+        "deltas": deltas
+    }
+
+
+# [Private]
+def _previousSnapshot(datasetId, base, deltas):
+    """
+        Returns cached snapshot of the dataset that new snapshot can be built
+        from by applying remaining delta files, or None, if there is no such
+        snapshot. Snapshot with most delta files applied is preferred.
+
+        Args:
+            datasetId (str): dataset id
+            base (list<str>): stamps of base files
+            deltas (list<str>): stamps of delta files
+
+        Returns:
+            dict<str, obj>: snapshot entry or None
+    """
+    found = None
+    for key in _processed.keys():
+        entry = _processed.get(key) if key[0] == datasetId else None
+        if entry is None or entry.get("base") != base:
+            continue
+        applied = entry["deltas"]
+        if deltas[:len(applied)] != applied:
+            continue
+        if found is None or len(applied) > len(found["deltas"]):
+            found = entry
+    return found
+
+
+# [Private]
+def _rebuildSnapshot(dataset, version):
+    """
+        Watcher callback, processes new version of dataset before it is
+        published. Only datasets that are in use, i.e. have snapshot cached,
+        or hot datasets are processed, others are processed on first request.
+
+        Args:
+            dataset (Dataset): changed dataset
+            version (str): new version
+    """
+    inuse = [x for x in _processed.keys() if x[0] == dataset._id]
+    if inuse or dataset._id in HOT_DATASETS:
+        _snapshot(dataset, version, True)
+
+
+# [Private]
+def _retireSnapshot(datasetId, version):
+    """
+        Watcher callback, drops snapshot of replaced or removed version after
+        new version is published, and stops its shards. Requests in flight
+        keep their own copies, queries on shards finish first.
+
+        Args:
+            datasetId (str): dataset id
+            version (str): old version
+    """
+    _processed.remove((datasetId, version))
+    with _executorsLock:
+        executor = _executors.pop((datasetId, version), None)
+    if executor is not None:
+        executor.stop()
+
+
+# [Public]
+def cacheStats():
+    """
+        Returns statistics of in-memory caches: processed datasets and rank
+        maps of relative comparison, statistics of coalesced and admitted
+        queries, and histograms of pipeline stages of each dataset.
+
+        Returns:
+            dict<str, dict>: hits, misses, evictions, size and weight of each
+                cache, executions and coalesced requests of queries,
+                admitted, queued and rejected queries, and timings of stages
+                by dataset id, see "StageHistograms"
+    """
+    return {
+        "processed": _processed.stats(),
+        "rankmaps": relativecomp.rankMapCacheStats(),
+        "coalescing": _flights.stats(),
+        "admission": _admission.stats(),
+        "stages": _stages.getJSON()
+    }
+
+
+# [Public]
+def metricsText():
+    """
+        Returns metrics of the process in Prometheus text format. Sizes of
+        caches, admission, coalescing, cached datasets and memory are read
+        at this moment, other metrics are updated as work is done.
+
+        Returns:
+            str: exposition text
+    """
+    return metrics.REGISTRY.exposition()
+
+
+# [Private]
+def _cacheMetric(field):
+    """
+        Returns function that reads field of statistics of each cache.
+
+        Args:
+            field (str): field of cache statistics
+
+        Returns:
+            func: function that returns values by cache name
+    """
+    def values():
+        return {
+            ("processed",): _processed.stats()[field],
+            ("rankmaps",): relativecomp.rankMapCacheStats()[field]
+        }
+    return values
+
+
+# [Private]
+def _datasetMetric(attribute):
+    """
+        Returns function that reads size of a map of each cached dataset.
+        When several versions of dataset are cached, the most recently used
+        one is reported.
+
+        Args:
+            attribute (str): attribute of processed block
+
+        Returns:
+            func: function that returns values by dataset id
+    """
+    def values():
+        sizes = {}
+        for key in _processed.keys():
+            entry = _processed.peek(key)
+            if entry is not None:
+                sizes[(key[0],)] = len(getattr(entry["block"], attribute)._map)
+        return sizes
+    return values
+
+
+# [Private]
+def _memoryMetric():
+    """
+        Returns memory usage of the process in bytes by kind, or nothing, if
+        it is not available.
+
+        Returns:
+            dict<tuple, int>: memory in bytes by kind
+    """
+    usage = memory.memoryUsage() or {}
+    return dict(((x,), y * 1024) for x, y in usage.items())
+
+
+# [Private]
+def _registerMetrics():
+    """
+        Registers metrics that are computed when they are exposed: caches,
+        cached datasets, admission, coalescing and memory of the process.
+    """
+    for register, name, field, helptext in [
+            (metrics.REGISTRY.counter, "pulsar_cache_hits_total", "hits",
+                "Cache hits"),
+            (metrics.REGISTRY.counter, "pulsar_cache_misses_total", "misses",
+                "Cache misses"),
+            (metrics.REGISTRY.counter, "pulsar_cache_evictions_total",
+                "evictions", "Cache evictions"),
+            (metrics.REGISTRY.gauge, "pulsar_cache_entries", "size",
+                "Cache entries"),
+            (metrics.REGISTRY.gauge, "pulsar_cache_weight", "weight",
+                "Cache weight")]:
+        register(name, helptext, ["cache"]).setFunction(_cacheMetric(field))
+    for attribute, name in [("_elementmap", "elements"),
+            ("_clustermap", "clusters"), ("_pulsemap", "pulses")]:
+        metrics.REGISTRY.gauge("pulsar_dataset_%s" % (name),
+            "Number of %s of cached dataset" % (name),
+            ["dataset"]).setFunction(_datasetMetric(attribute))
+    metrics.REGISTRY.gauge("pulsar_admission_running",
+        "Running expensive queries").setFunction(
+        lambda: {(): _admission.stats()["running"]})
+    metrics.REGISTRY.gauge("pulsar_admission_waiting",
+        "Expensive queries waiting for a slot").setFunction(
+        lambda: {(): _admission.stats()["waiting"]})
+    metrics.REGISTRY.counter("pulsar_admission_rejected_total",
+        "Expensive queries rejected").setFunction(lambda: {():
+        _admission.stats()["rejected"] + _admission.stats()["timedout"]})
+    metrics.REGISTRY.counter("pulsar_coalesced_total",
+        "Queries answered by identical query in flight").setFunction(
+        lambda: {(): _flights.stats()["coalesced"]})
+    metrics.REGISTRY.gauge("pulsar_process_memory_bytes",
+        "Memory of the process by kind", ["kind"]).setFunction(_memoryMetric)
+
+
+_registerMetrics()
+
+
+# [Public]
+def warmup(datasetIds=None, dmngr=None, background=True):
+    """
+        Imports modules that requests need and processes hot datasets, so
+        they are ready before first request. Work is done in a daemon thread,
+        if background is True, datasets that fail are skipped. App Engine
+        warm-up request runs it in place, standalone servers may run it in
+        the background.
+
+        Args:
+            datasetIds (list<str>): dataset ids, HOT_DATASETS are used if None
+            dmngr (DataManager): hook to pass own datamanager for tests
+            background (bool): flag to run warm-up in a separate thread
+
+        Returns:
+            Thread: warm-up thread, or None, if it was run in place
+    """
+    datasetIds = HOT_DATASETS if datasetIds is None else datasetIds
+    def work():
+        for module in [processor, selector, q, analyser]:
+            module.load()
+        preload(datasetIds, dmngr)
+    if not background:
+        work()
+        return None
+    thread = threading.Thread(target=work, name="warmup")
+    thread.daemon = True
+    thread.start()
+    return thread
+
+
+# [Public]
+def preload(datasetIds, dmngr=None, maxworkers=PRELOAD_WORKERS):
+    """
+        Loads and processes datasets concurrently, at most "maxworkers"
+        datasets at the same time, and keeps them in cache of processed
+        datasets. Failure of one dataset does not stop others. Returns load
+        timings for every dataset.
+
+        Args:
+            datasetIds (list<str>): dataset ids to preload
+            dmngr (DataManager): hook to pass own datamanager for tests
+            maxworkers (int): maximum number of datasets loaded concurrently
+
+        Returns:
+            dict<str, dict>: status, time (sec) and error for each dataset
+    """
+    misc.checkTypeAgainst(type(datasetIds), ListType, __file__)
+    dmngr = dmngr or _defaultDataManager()
+    def load(datasetId):
+        dataset, version = dmngr.getDatasetVersion(datasetId)
+        if dataset is None:
+            misc.raiseStandardError("No such dataset", __file__)
+        _processedBlock(dataset, version)
+    results = workers.runParallel(load, datasetIds, maxworkers)
+    timings = {}
+    for datasetId, result in zip(datasetIds, results):
+        timings[datasetId] = {
+            "status": "success" if result.isSuccess() else "error",
+            "time": result.time(),
+            "error": None if result.isSuccess() else str(result.error())
+        }
+    return timings
+
+
 # [Private]
 def _loaderForDatatype(datatype=None, filepath=""):
     """
@@ -236,9 +1668,12 @@ def _loaderForDatatype(datatype=None, filepath=""):
         Returns:
             Loader: loader instance
     """
+    # loaders are imported only for data types in use
     if datatype == "json":
+        from analytics.loading.jsonloader import JsonLoader
         return JsonLoader.prepareDataFrom(filepath)
     elif datatype == "xml":
+        from analytics.loading.xmlloader import XmlLoader
         return XmlLoader.prepareDataFrom(filepath)
     else:
         msg = "Unknown datatype %s" % (str(datatype))
@@ -247,14 +1682,15 @@ def _loaderForDatatype(datatype=None, filepath=""):
 
 
 # [Private]
-def _generateSuccessMessage(messages, dataobj):
+def _generateSuccessMessage(messages, dataobj, timings=None):
     """
         Generates success message that includes status, code, data object
-        and messages list.
+        and messages list, and timings of stages, if they are provided.
 
         Args:
             messages (list<str>): list of messages
             dataobj (dict<str, obj>): data object
+            timings (list<dict>): json timings of stages, or None
 
         Returns:
             dict<str, obj>: json representation of success message
@@ -267,6 +1703,8 @@ def _generateSuccessMessage(messages, dataobj):
         "data": dataobj,
         "messages": messages
     }
+    if timings is not None:
+        obj["timings"] = timings
     return obj
 
 
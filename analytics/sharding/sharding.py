@@ -0,0 +1,588 @@
+#!/usr/bin/env python
+
+'''
+Copyright 2015 Ivan Sadikov
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+
+# import libs
+import itertools
+import os
+import threading
+import zlib
+from types import IntType, StringType
+# multiprocessing is not available in every environment
+try:
+    import multiprocessing
+except ImportError:
+    multiprocessing = None
+# import classes
+import analytics.utils.misc as misc
+import analytics.utils.diagnostics as diag
+import analytics.utils.workers as workers
+import analytics.core.processor.processor as processor
+import analytics.selector.selector as selector
+import analytics.analyser.analyser as analyser
+import analytics.serializer.serializer as serializer
+from analytics.algorithms.relativecomp import RelativeComparison
+from analytics.core.map.elementmap import ElementMap
+
+"""
+    Sharded execution of queries. Elements of processed block are split
+    between shards by hash of element id, every shard is a worker process
+    that keeps its part of elements, and clusters and pulses are shared by
+    all shards. Query is executed in scatter-gather manner:
+    1. coordinator sends query to every shard, shards filter their elements
+       in parallel and return distinct values of dynamic pulses;
+    2. coordinator merges distinct values and computes rank maps once, as
+       relative comparison ranks each value against all distinct values;
+    3. shards rank their elements with the same rank maps in parallel, and
+       coordinator merges elements into one response.
+    Rank of element depends only on its values and rank maps, so ranks are
+    the same as ranks of the whole block, including ranking within clusters,
+    where values and rank maps are kept for each cluster. Shards are run in
+    calling process, when processes cannot be started, or calling process
+    runs other threads, see "workers.canFork".
+    Every query uses its own lane, i.e. connection to every shard, so
+    queries of concurrent requests do not wait for each other, shard
+    process serves each lane in a thread. Queries that shards cannot rank,
+    e.g. with approximate comparison, are left to caller.
+"""
+
+# commands of shards
+_FILTER = "filter"
+_RANK = "rank"
+_DROP = "drop"
+_STOP = "stop"
+# time to wait for shard process to stop, in seconds
+STOP_TIMEOUT = 5.0
+# default number of queries that executor runs at the same time
+MAX_QUERIES = 4
+
+
+# [Public]
+def shardOf(elementId, numshards):
+    """
+        Returns index of the shard for element id. Hash is stable across
+        processes and runs.
+
+        Args:
+            elementId (str): element id
+            numshards (int): number of shards
+
+        Returns:
+            int: index of the shard
+    """
+    return (zlib.crc32(elementId) & 0xffffffff) % numshards
+
+# [Public]
+def splitBlock(block, numshards):
+    """
+        Splits processed block into blocks with elements of each shard.
+        Clusters and pulses are shared, as requests copy block before
+        filtering anyway.
+
+        Args:
+            block (ProcessBlock): processed block
+            numshards (int): number of shards
+
+        Returns:
+            list<ProcessBlock>: processed block of each shard
+    """
+    misc.checkTypeAgainst(type(block), processor.ProcessBlock, __file__)
+    misc.checkTypeAgainst(type(numshards), IntType, __file__)
+    if numshards < 1:
+        misc.raiseValueError("Number of shards must be positive", __file__)
+    if not block._isProcessed:
+        misc.raiseStandardError("Block is not processed", __file__)
+    elementmaps = [ElementMap() for _i in range(numshards)]
+    for key, element in block._elementmap._map.items():
+        elementmaps[shardOf(key, numshards)]._map[key] = element
+    return [_blockWithElements(block, x) for x in elementmaps]
+
+# [Private]
+def _blockWithElements(block, elementmap):
+    """
+        Returns processed block with clusters and pulses of the block and
+        elements provided.
+
+        Args:
+            block (ProcessBlock): processed block
+            elementmap (ElementMap): elements of the new block
+
+        Returns:
+            ProcessBlock: processed block
+    """
+    result = processor.ProcessBlock(
+        {"map": block._clustermap, "data": block._data["clusters"]},
+        {"map": elementmap, "data": block._data["elements"]},
+        {"map": block._pulsemap, "data": block._data["pulses"]},
+        block._isDiscovery
+    )
+    result._isProcessed = True
+    return result
+
+# [Private]
+def _filteredBlock(block, queryset, diagnostics):
+    """
+        Returns filter block of copy of the processed block.
+
+        Args:
+            block (ProcessBlock): processed block
+            queryset (str): query string
+            diagnostics (Diagnostics): diagnostics of the request
+
+        Returns:
+            FilterBlock: filtered block
+    """
+    clone = processor.cloneBlock(block, diagnostics)
+    fblock = selector.FilterBlock(
+        analyser.ALGORITHMS.copy(),
+        clone._pulsemap,
+        clone._clustermap,
+        clone._elementmap,
+        diagnostics
+    )
+    return selector.filterWithBlock(queryset, fblock)
+
+
+class _ShardState(object):
+    """
+        _ShardState class keeps elements of the shard and filtered elements
+        of queries in progress, and handles commands of coordinator.
+
+        Attributes:
+            _block (ProcessBlock): processed block of the shard
+            _queries (dict<int, tuple>): token of the query, filter block,
+                algorithm and partitions of elements
+    """
+    def __init__(self, block):
+        self._block = block
+        self._queries = {}
+
+    # [Public]
+    def handle(self, command, args):
+        """
+            Handles command of coordinator and returns result.
+
+            Args:
+                command (str): command
+                args (tuple): arguments of the command
+
+            Returns:
+                obj: result of the command
+        """
+        if command == _FILTER:
+            return self._filter(*args)
+        elif command == _RANK:
+            return self._rank(*args)
+        elif command == _DROP:
+            self._queries.pop(args[0], None)
+            return None
+        misc.raiseValueError("Unknown command %s" % (str(command)), __file__)
+
+    # [Private]
+    def _filter(self, token, queryset):
+        """
+            Filters elements of the shard and returns distinct values of
+            dynamic pulses for each partition of elements. Elements are
+            partitioned by cluster, if query has cluster scope, otherwise
+            there is one partition with key None.
+
+            Args:
+                token (int): token of the query
+                queryset (str): query string
+
+            Returns:
+                dict<str, dict<str, set>>: partition key, pulse id and
+                    distinct values
+        """
+        local = diag.Diagnostics()
+        fblock = _filteredBlock(self._block, queryset, local)
+        algorithm = analyser.selectAlgorithm(fblock._alg, True, local)
+        if fblock._scope is None:
+            partitions = {None: fblock._ele}
+        else:
+            partitions = analyser.partitionByCluster(fblock._ele,
+                fblock._scope.get("depth"))
+        self._queries[token] = (fblock, algorithm, partitions)
+        return dict((key, algorithm.distinctValues(part, fblock._pul, local))
+            for key, part in partitions.items())
+
+    # [Private]
+    def _rank(self, token, rankmaps):
+        """
+            Ranks filtered elements of the query with rank maps of each
+            partition and returns json representation of elements.
+
+            Args:
+                token (int): token of the query
+                rankmaps (dict<str, dict>): partition key and rank maps
+
+            Returns:
+                list<dict>: json representation of ranked elements
+        """
+        fblock, algorithm, partitions = self._queries.pop(token)
+        for key, part in partitions.items():
+            algorithm.rankWithMaps(part, fblock._pul, rankmaps.get(key, {}))
+        return serializer.elementsToJSON(fblock._ele._map.values())
+
+
+# [Private]
+def _serve(connection, state):
+    """
+        Loop of shard process: receives commands and sends back exception
+        or None, and result of the command, until stop command.
+
+        Args:
+            connection (Connection): connection to coordinator
+            state (_ShardState): state of the shard
+    """
+    while True:
+        try:
+            command, args = connection.recv()
+        except EOFError:
+            return
+        if command == _STOP:
+            connection.close()
+            return
+        try:
+            connection.send((None, state.handle(command, args)))
+        except BaseException as e:
+            connection.send((workers.picklableError(e), None))
+
+# [Private]
+def _serveLanes(connections, state):
+    """
+        Loop of shard process with several lanes: every lane is served in its
+        own thread, until all lanes are stopped. Queries keep their state by
+        token, so lanes share state of the shard.
+
+        Args:
+            connections (list<Connection>): connection of each lane
+            state (_ShardState): state of the shard
+    """
+    threads = [threading.Thread(target=_serve, args=(x, state)) for x in
+        connections[1:]]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    _serve(connections[0], state)
+    for thread in threads:
+        thread.join()
+
+
+class _LocalShard(object):
+    """
+        _LocalShard class runs commands of the shard in calling process, when
+        processes cannot be started.
+
+        Attributes:
+            _state (_ShardState): state of the shard
+            _results (list<tuple>): exception and result of the last command
+                of each lane
+    """
+    def __init__(self, state, numlanes=1):
+        self._state = state
+        self._results = [None] * numlanes
+
+    # [Public]
+    def send(self, lane, command, args):
+        try:
+            self._results[lane] = (None, self._state.handle(command, args))
+        except BaseException as e:
+            self._results[lane] = (e, None)
+
+    # [Public]
+    def recv(self, lane):
+        result = self._results[lane]
+        self._results[lane] = None
+        return result
+
+    # [Public]
+    def stop(self):
+        self._state = None
+
+
+class _ProcessShard(object):
+    """
+        _ProcessShard class runs commands of the shard in worker process.
+        Process inherits state of the shard on fork, so elements are not
+        pickled, only commands and results are sent through the pipe of
+        each lane.
+
+        Attributes:
+            _connections (list<Connection>): connection of each lane
+            _process (Process): shard process
+    """
+    def __init__(self, state, numlanes=1):
+        pipes = [multiprocessing.Pipe() for _i in range(numlanes)]
+        self._process = multiprocessing.Process(target=_serveLanes,
+            args=([x[1] for x in pipes], state))
+        self._process.daemon = True
+        self._process.start()
+        for parent, child in pipes:
+            child.close()
+        self._connections = [x[0] for x in pipes]
+
+    # [Public]
+    def send(self, lane, command, args):
+        self._connections[lane].send((command, args))
+
+    # [Public]
+    def recv(self, lane):
+        return self._connections[lane].recv()
+
+    # [Public]
+    def stop(self):
+        for connection in self._connections:
+            try:
+                connection.send((_STOP, None))
+            except (IOError, OSError):
+                pass
+        self._process.join(STOP_TIMEOUT)
+        if self._process.is_alive():
+            self._process.terminate()
+            self._process.join()
+        for connection in self._connections:
+            connection.close()
+
+
+class ShardedExecutor(object):
+    """
+        ShardedExecutor class executes queries on processed block split into
+        shards, see module description. Executor runs at most "numqueries"
+        queries at the same time, each on its own lane, others wait for a
+        free lane. Executor must be stopped to finish shard processes.
+
+        Attributes:
+            _meta (ProcessBlock): clusters and pulses of the block
+            _shards (list<obj>): shards of the block
+            _isParallel (bool): flag showing that shards are processes
+            _numlanes (int): number of lanes
+            _lanes (list<int>): free lanes
+            _cond (Condition): condition of free lanes
+            _isStopped (bool): flag showing that executor is stopped
+            _tokens (iterator): tokens of queries
+    """
+    def __init__(self, block, numshards, parallel=True,
+            numqueries=MAX_QUERIES):
+        misc.checkTypeAgainst(type(numqueries), IntType, __file__)
+        if numqueries < 1:
+            misc.raiseValueError("Number of queries must be positive",
+                __file__)
+        blocks = splitBlock(block, numshards)
+        self._meta = _blockWithElements(block, ElementMap())
+        self._isParallel = bool(parallel) and numshards > 1 and \
+            multiprocessing is not None and os.name == "posix" and \
+            workers.canFork()
+        self._numlanes = numqueries
+        self._lanes = range(numqueries)
+        self._cond = threading.Condition()
+        self._isStopped = False
+        self._tokens = itertools.count(1)
+        self._shards = []
+        try:
+            for shard in blocks:
+                self._shards.append(self._startShard(_ShardState(shard)))
+        except:
+            self.stop()
+            raise
+
+    # [Private]
+    def _startShard(self, state):
+        """
+            Starts shard process, or local shard, if processes are not used
+            or cannot be started.
+
+            Args:
+                state (_ShardState): state of the shard
+
+            Returns:
+                obj: started shard
+        """
+        if self._isParallel:
+            try:
+                return _ProcessShard(state, self._numlanes)
+            except (OSError, NotImplementedError):
+                self._isParallel = False
+        return _LocalShard(state, self._numlanes)
+
+    # [Public]
+    def isParallel(self):
+        """
+            Returns True, if shards run in worker processes.
+
+            Returns:
+                bool: flag showing that shards are processes
+        """
+        return self._isParallel
+
+    # [Public]
+    def numShards(self):
+        """
+            Returns number of shards.
+
+            Returns:
+                int: number of shards
+        """
+        return len(self._shards)
+
+    # [Public]
+    def numQueries(self):
+        """
+            Returns maximum number of queries that run at the same time.
+
+            Returns:
+                int: number of lanes
+        """
+        return self._numlanes
+
+    # [Public]
+    def stop(self):
+        """
+            Stops shards, once queries in progress finish. Executor does not
+            run queries afterwards.
+        """
+        with self._cond:
+            self._isStopped = True
+            self._cond.notify_all()
+            while len(self._lanes) < self._numlanes:
+                self._cond.wait()
+            shards = self._shards
+            self._shards = []
+        for shard in shards:
+            shard.stop()
+
+    # [Private]
+    def _acquire(self):
+        """
+            Waits for free lane and returns it, or None, if executor is
+            stopped.
+
+            Returns:
+                int: lane of the query, or None
+        """
+        with self._cond:
+            while not self._lanes and not self._isStopped:
+                self._cond.wait()
+            if self._isStopped:
+                return None
+            return self._lanes.pop()
+
+    # [Private]
+    def _release(self, lane):
+        """
+            Returns lane of finished query.
+
+            Args:
+                lane (int): lane of the query
+        """
+        with self._cond:
+            self._lanes.append(lane)
+            self._cond.notify_all()
+
+    # [Public]
+    def query(self, queryset, issorted=False, diagnostics=None):
+        """
+            Executes query on shards and returns clusters, pulses, merged
+            elements and algorithm the same way service does for default
+            format. Returns None, if executor is stopped, or algorithm of
+            the query cannot rank shards, so caller executes query itself.
+
+            Args:
+                queryset (str): query string
+                issorted (bool): indicates whether elements are sorted or not
+                diagnostics (Diagnostics): diagnostics of the request
+
+            Returns:
+                dict<str, obj>: object with clusters, elements, pulses,
+                    algorithm, or None
+        """
+        misc.checkTypeAgainst(type(queryset), StringType, __file__)
+        if self._isStopped:
+            return None
+        diagnostics = diag.orWarnings(diagnostics)
+        queryset = queryset.strip()
+        # coordinator filters clusters and pulses only to select algorithm
+        fblock = _filteredBlock(self._meta, queryset, diagnostics)
+        algorithm = analyser.selectAlgorithm(fblock._alg, True, diagnostics)
+        # approximate comparison interpolates rank maps of all values, it is
+        # not split over shards
+        if type(algorithm) is not RelativeComparison:
+            return None
+        lane = self._acquire()
+        if lane is None:
+            return None
+        try:
+            token = next(self._tokens)
+            distinct = self._scatter(lane, _FILTER,
+                [(token, queryset)] * len(self._shards), token)
+            # values of partitions are merged over shards
+            merged = {}
+            for part in distinct:
+                for key, values in part.items():
+                    mvalues = merged.setdefault(key, {})
+                    for pulseId, pvalues in values.items():
+                        mvalues.setdefault(pulseId, set()).update(pvalues)
+            try:
+                rankmaps = dict((key, algorithm.rankMapsFor(fblock._pul,
+                    values, diagnostics)) for key, values in merged.items())
+            except:
+                self._scatter(lane, _DROP, [(token,)] * len(self._shards))
+                raise
+            # every shard gets rank maps of its partitions only
+            args = [(token, dict((key, rankmaps[key]) for key in x.keys()))
+                for x in distinct]
+            parts = self._scatter(lane, _RANK, args, token)
+        finally:
+            self._release(lane)
+        elements = [x for part in parts for x in part]
+        if issorted:
+            elements.sort(key=lambda x: -x["rank"]["value"])
+        return {
+            "clusters": fblock._clu.getJSON(),
+            "elements": elements,
+            "pulses": fblock._pul.getJSON(),
+            "algorithm": algorithm.getJSON()
+        }
+
+    # [Private]
+    def _scatter(self, lane, command, args, token=None):
+        """
+            Sends command to every shard on lane of the query and gathers
+            results in order of shards. Results of all shards are received,
+            before exception of the first failed shard is raised, so lane
+            stays in sync. If token is provided, state of the query is
+            dropped on failure.
+
+            Args:
+                lane (int): lane of the query
+                command (str): command
+                args (list<tuple>): arguments of command for each shard
+                token (int): token of the query, or None
+
+            Returns:
+                list<obj>: result of each shard
+        """
+        for _i in range(len(self._shards)):
+            self._shards[_i].send(lane, command, args[_i])
+        results = [x.recv(lane) for x in self._shards]
+        errors = [x[0] for x in results if x[0] is not None]
+        if errors:
+            if token is not None:
+                self._scatter(lane, _DROP, [(token,)] * len(self._shards))
+            raise errors[0]
+        return [x[1] for x in results]
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+
+'''
+Copyright 2015 Ivan Sadikov
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+
+# import libs
+import unittest
+import time
+# import classes
+import analytics.exceptions.exceptions as ex
+import analytics.utils.diagnostics as diag
+import analytics.utils.workers as workers
+import analytics.benchmarks.generator as generator
+import analytics.core.processor.processor as processor
+import analytics.selector.selector as selector
+import analytics.analyser.analyser as analyser
+import analytics.sharding.sharding as sharding
+from analytics.core.map.clustermap import ClusterMap
+from analytics.core.map.elementmap import ElementMap
+from analytics.core.map.pulsemap import PulseMap
+
+
+class Sharding_TestSequence(unittest.TestCase):
+    def setUp(self):
+        dataset = generator.generateDataset(300)
+        block = processor.ProcessBlock(
+            {"map": ClusterMap(), "data": dataset["clusters"]},
+            {"map": ElementMap(), "data": dataset["elements"]},
+            {"map": PulseMap(), "data": dataset["pulses"]}
+        )
+        self.block = processor.processWithBlock(block)
+        self.queries = [
+            "",
+            "select from ${pulses} where @f0 |is| dynamic and @f1 = 3",
+            "select from ${clusters} where @id = [c1] and @id = [c2]",
+            "select from ${algorithms} where @scope |is| cluster"
+        ]
+
+    def expected(self, queryset):
+        # ranks of the whole block
+        clone = processor.cloneBlock(self.block)
+        fblock = selector.filterWithBlock(queryset, selector.FilterBlock(
+            analyser.ALGORITHMS.copy(), clone._pulsemap, clone._clustermap,
+            clone._elementmap, diag.Diagnostics()))
+        ablock = analyser.analyseWithBlock(analyser.AnalyseBlock(fblock._alg,
+            fblock._ele, fblock._pul, diag.Diagnostics(), fblock._scope))
+        return dict((x.id(), x.rank()._name) for x in
+            ablock._elementmap._map.values())
+
+    def test_sharding_splitBlock(self):
+        with self.assertRaises(ex.AnalyticsValueError):
+            sharding.splitBlock(self.block, 0)
+        blocks = sharding.splitBlock(self.block, 4)
+        self.assertEqual(len(blocks), 4)
+        keys = [key for x in blocks for key in x._elementmap._map.keys()]
+        self.assertEqual(sorted(keys), sorted(self.block._elementmap._map))
+        self.assertTrue(all([len(x._elementmap._map) > 0 for x in blocks]))
+        for _i in range(len(blocks)):
+            for key in blocks[_i]._elementmap._map.keys():
+                self.assertEqual(sharding.shardOf(key, 4), _i)
+            self.assertEqual(blocks[_i]._pulsemap, self.block._pulsemap)
+
+    def test_sharding_query(self):
+        # shards in processes and in calling process rank as whole block
+        for numshards, parallel in [(1, True), (3, False), (3, True)]:
+            executor = sharding.ShardedExecutor(self.block, numshards,
+                parallel)
+            try:
+                self.assertEqual(executor.numShards(), numshards)
+                for queryset in self.queries:
+                    result = executor.query(queryset, True,
+                        diag.Diagnostics())
+                    ranks = dict((x["id"], x["rank"]["name"]) for x in
+                        result["elements"])
+                    self.assertEqual(ranks, self.expected(queryset))
+                    values = [x["rank"]["value"] for x in result["elements"]]
+                    self.assertEqual(values, sorted(values, reverse=True))
+                    self.assertEqual(sorted(result.keys()),
+                        ["algorithm", "clusters", "elements", "pulses"])
+            finally:
+                executor.stop()
+        # stopped executor leaves query to caller
+        self.assertEqual(executor.query("", False, diag.Diagnostics()), None)
+
+    def test_sharding_errors(self):
+        executor = sharding.ShardedExecutor(self.block, 2)
+        try:
+            with self.assertRaises(ex.AnalyticsSyntaxError):
+                executor.query("select from", False, diag.Diagnostics())
+            # shards are in sync after failed query
+            result = executor.query("", False, diag.Diagnostics())
+            self.assertEqual(len(result["elements"]), 300)
+            # approximate comparison is left to caller
+            self.assertEqual(executor.query("select from ${algorithms} " +
+                "where @id = [relative_comparison_approx_1]"), None)
+        finally:
+            executor.stop()
+        with self.assertRaises(ex.AnalyticsValueError):
+            sharding.ShardedExecutor(self.block, 2, False, 0)
+
+    def test_sharding_concurrentQueries(self):
+        # shards take a while to rank, queries on different lanes overlap
+        delay = 0.3
+        rank = sharding._ShardState._rank
+        def slowRank(self, token, rankmaps):
+            time.sleep(delay)
+            return rank(self, token, rankmaps)
+        sharding._ShardState._rank = slowRank
+        try:
+            for parallel in [False, True]:
+                for numqueries in [1, 3]:
+                    executor = sharding.ShardedExecutor(self.block, 2,
+                        parallel, numqueries)
+                    try:
+                        self.assertEqual(executor.numQueries(), numqueries)
+                        start = time.time()
+                        results = workers.mapParallel(lambda x:
+                            executor.query(x, False, diag.Diagnostics()),
+                            self.queries[:3], 3)
+                        elapsed = time.time() - start
+                    finally:
+                        executor.stop()
+                    for queryset, result in zip(self.queries, results):
+                        ranks = dict((x["id"], x["rank"]["name"]) for x in
+                            result["elements"])
+                        self.assertEqual(ranks, self.expected(queryset))
+                    # local shards rank one after another within query
+                    perquery = delay * (1 if executor.isParallel() else 2)
+                    if numqueries == 1:
+                        self.assertTrue(elapsed >= 3 * perquery)
+                    else:
+                        self.assertTrue(elapsed < 2 * perquery)
+        finally:
+            sharding._ShardState._rank = rank
+
+
+# Load test suites
+def _suites():
+    return [
+        Sharding_TestSequence
+    ]
+
+# Load tests
+def loadSuites():
+    # global test suite for this module
+    gsuite = unittest.TestSuite()
+    for suite in _suites():
+        gsuite.addTest(unittest.TestLoader().loadTestsFromTestCase(suite))
+    return gsuite
+
+if __name__ == '__main__':
+    suite = loadSuites()
+    print ""
+    print "### Running tests ###"
+    print "-" * 70
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -43,6 +43,9 @@ _RUN_TESTS = {
     "core":             True,
     "core_map":         True,
     "core_processor":   True,
+    "serializer":       True,
+    "sharding":         True,
+    "server":           True,
     "service":          True,
     "integration":      True
 }
@@ -142,6 +145,27 @@ def _collectSystemTests(suites):
     else:
         print "@skip: core processor tests"
 
+    # serializer
+    if _checkTest("serializer"):
+        import analytics.serializer.tests.unittest_serializer as unittest_serializer
+        suites.addTest(unittest_serializer.loadSuites())
+    else:
+        print "@skip: serializer tests"
+
+    # sharding
+    if _checkTest("sharding"):
+        import analytics.sharding.tests.unittest_sharding as unittest_sharding
+        suites.addTest(unittest_sharding.loadSuites())
+    else:
+        print "@skip: sharding tests"
+
+    # server
+    if _checkTest("server"):
+        import analytics.server.tests.unittest_server as unittest_server
+        suites.addTest(unittest_server.loadSuites())
+    else:
+        print "@skip: server tests"
+
     # service
     if _checkTest("service"):
         import analytics.tests.unittest_service as unittest_service
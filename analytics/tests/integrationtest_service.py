@@ -6,6 +6,7 @@ import sys
 import os
 import random
 import uuid
+import threading
 # import classes
 import analytics.utils.misc as misc
 import analytics.exceptions.exceptions as ex
@@ -53,6 +54,131 @@ class IntegrationTestSequence(unittest.TestCase):
         self.assertEqual(result["status"], "success")
         self.assertEqual(result["code"], 200)
 
+    def test_service_columnarFormat(self):
+        query = ""
+        datasetId = random.choice(self.datasets.keys())
+        default = service.requestData(datasetId, query, self.datamanager)
+        result = service.requestData(
+            datasetId,
+            query,
+            self.datamanager,
+            dataformat="columnar"
+        )
+        self.assertEqual(result["status"], "success")
+        self.assertEqual(result["code"], 200)
+        elements = result["data"]["elements"]
+        self.assertEqual(elements["format"], "columnar")
+        self.assertEqual(elements["length"], len(default["data"]["elements"]))
+        self.assertEqual(
+            sorted(elements["id"]),
+            sorted([x["id"] for x in default["data"]["elements"]])
+        )
+
+    def test_service_catalogue(self):
+        datasetId = random.choice(self.datasets.keys())
+        result = service.requestCatalogue(datasetId, self.datamanager)
+        self.assertEqual(result["status"], "success")
+        self.assertEqual(result["code"], 200)
+        version = self.datamanager.getVersion(datasetId)
+        self.assertEqual(result["data"]["version"], version)
+        self.assertEqual(result["data"]["elements"]["format"], "columnar")
+        etag = service.catalogueETag(datasetId, self.datamanager)
+        self.assertEqual(etag, service.catalogueETag(datasetId, self.datamanager))
+        self.assertEqual(service.catalogueETag("#", self.datamanager), None)
+        result = service.requestCatalogue("#", self.datamanager)
+        self.assertEqual(result["status"], "error")
+
+    def test_service_ranksFormat(self):
+        query = """select from ${pulses}
+                    where @1b4cf15c86ec31cd8838feab0f9856b1 |is| static
+                        and @1b4cf15c86ec31cd8838feab0f9856b1 = 2"""
+        datasetId = random.choice(self.datasets.keys())
+        catalogue = service.requestCatalogue(datasetId, self.datamanager)
+        default = service.requestData(datasetId, query, self.datamanager)
+        result = service.requestData(
+            datasetId,
+            query,
+            self.datamanager,
+            dataformat="ranks"
+        )
+        self.assertEqual(result["status"], "success")
+        self.assertEqual(result["code"], 200)
+        self.assertEqual(
+            result["data"]["version"],
+            catalogue["data"]["version"]
+        )
+        # indices refer to catalogue, ranks match default response
+        ids = catalogue["data"]["elements"]["id"]
+        elements = result["data"]["elements"]
+        ranks = dict((x["id"], x["rank"]["value"])
+            for x in default["data"]["elements"])
+        self.assertEqual(elements["length"], len(ranks))
+        for _i in range(elements["length"]):
+            eid = ids[elements["index"][_i]]
+            self.assertEqual(ranks[eid], elements["rank"][_i])
+
+    def test_service_datasetsETag(self):
+        etag = service.datasetsETag(self.datamanager)
+        self.assertEqual(etag, service.datasetsETag(self.datamanager))
+        # version change results in a new ETag
+        datasetId = random.choice(self.datasets.keys())
+        self.datamanager._versions[datasetId] = uuid.uuid4().hex
+        self.assertNotEqual(etag, service.datasetsETag(self.datamanager))
+
+    def test_service_queryETag(self):
+        datasetId = random.choice(self.datasets.keys())
+        query = """select from ${pulses}
+                    where @1b4cf15c86ec31cd8838feab0f9856b1 |is| static"""
+        etag = service.queryETag(datasetId, query, self.datamanager)
+        # equivalent query has the same ETag
+        self.assertEqual(
+            etag,
+            service.queryETag(
+                " %s " % (datasetId),
+                "SELECT  FROM ${pulses} WHERE " +
+                    "@1b4cf15c86ec31cd8838feab0f9856b1   |IS| static",
+                self.datamanager
+            )
+        )
+        # flags, query and version change ETag
+        self.assertNotEqual(
+            etag,
+            service.queryETag(datasetId, query, self.datamanager, True)
+        )
+        self.assertNotEqual(
+            etag,
+            service.queryETag(datasetId, query, self.datamanager,
+                dataformat="columnar")
+        )
+        self.assertNotEqual(
+            etag,
+            service.queryETag(datasetId, "", self.datamanager)
+        )
+        self.datamanager._versions[datasetId] = uuid.uuid4().hex
+        self.assertNotEqual(
+            etag,
+            service.queryETag(datasetId, query, self.datamanager)
+        )
+        # unknown dataset does not have ETag
+        self.assertEqual(service.queryETag("#", query, self.datamanager), None)
+        # invalid query still has ETag, error is reported by request
+        self.assertNotEqual(
+            service.queryETag(datasetId, "select", self.datamanager),
+            None
+        )
+
+    def test_service_unknownFormat(self):
+        query = ""
+        datasetId = random.choice(self.datasets.keys())
+        result = service.requestData(
+            datasetId,
+            query,
+            self.datamanager,
+            dataformat="csv"
+        )
+        self.assertEqual(result["status"], "error")
+        self.assertEqual(result["code"], 400)
+
     def service_warnings(self, warn=True):
         query = """select from ${pulses}
                     where @f4b9ea9d3bf239f5a1c80578b0556a5e |is| dynamic"""
@@ -80,6 +206,32 @@ class IntegrationTestSequence(unittest.TestCase):
         self.assertEqual(result["code"], 200)
         self.assertEqual(len(result["messages"]), 0)
 
+    def test_service_warningsIsolation(self):
+        # concurrent requests must not see diagnostics of each other
+        datasetId = random.choice(self.datasets.keys())
+        noisy = """select from ${pulses}
+                    where @f4b9ea9d3bf239f5a1c80578b0556a5e |is| dynamic"""
+        quiet = ""
+        expected = {
+            noisy: service.requestData(datasetId, noisy, self.datamanager),
+            quiet: service.requestData(datasetId, quiet, self.datamanager)
+        }
+        self.assertEqual(len(expected[noisy]["messages"]), 1)
+        self.assertEqual(len(expected[quiet]["messages"]), 0)
+        failures = []
+        def worker(query):
+            for _i in range(20):
+                result = service.requestData(datasetId, query, self.datamanager)
+                if result["messages"] != expected[query]["messages"]:
+                    failures.append(result["messages"])
+        threads = [threading.Thread(target=worker, args=(noisy if _i % 2 else
+            quiet,)) for _i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(failures, [])
+
 
 # Load test suites
 def _suites():
@@ -5,16 +5,38 @@ import unittest
 import json
 import sys
 import os
+import shutil
+import tempfile
+import threading
+import time
 from types import DictType
 # import classes
+import analytics.utils.metrics as metrics
 import analytics.utils.misc as misc
+import analytics.utils.diagnostics as diag
 import analytics.exceptions.exceptions as ex
 import analytics.service as service
+import analytics.selector.selector as selector
+import analytics.analyser.analyser as analyser
+import analytics.serializer.serializer as serializer
+import analytics.benchmarks.bench_import as bench_import
 import projectpaths as paths
+from analytics.datamanager.datamanager import DataManager
+from analytics.datamanager.watcher import DatasetWatcher
+import analytics.datamanager.compaction as compaction
+from analytics.utils.admission import AdmissionController
+from analytics.utils.deadline import Deadline
 from analytics.loading.jsonloader import JsonLoader
 from analytics.loading.xmlloader import XmlLoader
+from analytics.algorithms.relativecomp import RelativeComparison
 
 
+# datasets for integration tests, they are known to be valid
+_INTEGRATION_PATH = os.path.join(
+    os.path.dirname(os.path.realpath(__file__)),
+    "datasets"
+)
+
 general_input = [
     None, True, False, sys.maxint, -sys.maxint-1, {}, [],
     {"1": 1, "2": 2}, [1, 2, 3, 4, 5], "abc", 0, 1, -1, 1.233,
@@ -68,6 +90,670 @@ class Service_TestSequence(unittest.TestCase):
         self.assertEqual(obj["data"], dataobj)
         self.assertEqual(obj["status"], "success")
 
+    def test_service_lazyImports(self):
+        # importing service must not scan datasets or import modules that
+        # are needed only for queries
+        result = bench_import.measure("analytics.service")
+        modules = result["modules"]
+        self.assertTrue("analytics.service" in modules)
+        self.assertTrue("analytics.datamanager.datamanager" in modules)
+        lazy = [
+            "analytics.core.processor.processor",
+            "analytics.selector.selector",
+            "analytics.analyser.analyser",
+            "analytics.algorithms.relativecomp",
+            "analytics.utils.queryengine",
+            "analytics.loading.xmlloader",
+            "urllib"
+        ]
+        for name in lazy:
+            self.assertFalse(name in modules, "%s is imported" % (name))
+        print "\n%s: import time %.1f ms, %d modules" % (
+            self.id().split(".")[-1],
+            result["total"] * 1000,
+            len(modules)
+        )
+
+    def test_service_warmup(self):
+        dmngr = DataManager()
+        dmngr.loadDatasets(_INTEGRATION_PATH)
+        ids = [x._id for x in dmngr.getDatasets()]
+        service._processed.clear()
+        self.assertEqual(service.warmup(ids + ["#"], dmngr, False), None)
+        for datasetId in ids:
+            key = (datasetId, dmngr.getVersion(datasetId))
+            self.assertNotEqual(service._processed.get(key), None)
+        # requests use processed dataset
+        hits = service._processed.stats()["hits"]
+        result = service.requestData(ids[0], "", dmngr)
+        self.assertEqual(result["status"], "success")
+        self.assertEqual(service._processed.stats()["hits"], hits + 1)
+        # background warm-up
+        service._processed.clear()
+        thread = service.warmup(ids[:1], dmngr)
+        thread.join()
+        key = (ids[0], dmngr.getVersion(ids[0]))
+        self.assertNotEqual(service._processed.get(key), None)
+
+    def test_service_preload(self):
+        dmngr = DataManager()
+        dmngr.loadDatasets(_INTEGRATION_PATH)
+        ids = [x._id for x in dmngr.getDatasets()]
+        service._processed.clear()
+        timings = service.preload(ids + ["#"], dmngr, 2)
+        self.assertEqual(sorted(timings.keys()), sorted(ids + ["#"]))
+        for datasetId in ids:
+            self.assertEqual(timings[datasetId]["status"], "success")
+            self.assertEqual(timings[datasetId]["error"], None)
+            self.assertTrue(timings[datasetId]["time"] >= 0)
+        self.assertEqual(timings["#"]["status"], "error")
+        self.assertTrue("No such dataset" in timings["#"]["error"])
+
+    def test_service_hotReload(self):
+        directory = tempfile.mkdtemp()
+        try:
+            shutil.copytree(_INTEGRATION_PATH, os.path.join(directory, "data"))
+            dmngr = DataManager()
+            dmngr.loadDatasets(directory)
+            dataset = dmngr.getDatasets()[0]
+            version = dmngr.getVersion(dataset._id)
+            service._processed.clear()
+            # request in flight holds copy of old version
+            block = service._processedBlock(dataset,
+                dmngr.getVersion(dataset._id))
+            size = len(block._elementmap._map)
+            w = DatasetWatcher(dmngr, 1, service._rebuildSnapshot,
+                service._retireSnapshot)
+            # dataset without elements is new version
+            with open(dataset._elements["path"], "w") as f:
+                f.write("[]")
+            self.assertEqual(w.poll(), [dataset._id])
+            newversion = dmngr.getVersion(dataset._id)
+            keys = service._processed.keys()
+            self.assertEqual(keys, [(dataset._id, newversion)])
+            self.assertFalse((dataset._id, version) in keys)
+            # new requests see new version without processing
+            misses = service._processed.stats()["misses"]
+            obj = service.requestCatalogue(dataset._id, dmngr)
+            self.assertEqual(obj["status"], "success")
+            self.assertEqual(obj["data"]["version"], newversion)
+            self.assertEqual(obj["data"]["elements"]["length"], 0)
+            self.assertEqual(service._processed.stats()["misses"], misses)
+            self.assertEqual(len(block._elementmap._map), size)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_service_incrementalSnapshot(self):
+        directory = tempfile.mkdtemp()
+        processDataset = service._processDataset
+        def writeJSON(name, obj):
+            with open(os.path.join(directory, name), "w") as f:
+                json.dump(obj, f)
+        def summary(block):
+            elements = sorted([(x.name(), sorted([(y.name(), y.value())
+                for y in x.features()]), x.cluster().id())
+                for x in block._elementmap._map.values()])
+            pulses = sorted([(x.name(), sorted(x.store()))
+                for x in block._pulsemap._map.values()])
+            return (elements, pulses)
+        try:
+            shutil.rmtree(directory)
+            shutil.copytree(os.path.join(_INTEGRATION_PATH, "raw1"), directory)
+            manifest = JsonLoader(os.path.join(directory,
+                "manifest.json")).processData()
+            manifest["data"]["deltas"] = [{"file": "delta1", "type": "json"}]
+            writeJSON("manifest.json", manifest)
+            writeJSON("delta1.json", [
+                {"op": "upsert", "data": {"id": "1", "name": "#1", "desc": "#1",
+                    "cluster": "2", "price": 99.5, "count": 1, "dir": "flat",
+                    "order": 1}},
+                {"op": "delete", "id": "2"}
+            ])
+            dmngr = DataManager()
+            dmngr.loadDatasets(directory)
+            dataset = dmngr.getDatasets()[0]
+            service._processed.clear()
+            entry = service._snapshot(dataset, dmngr.getVersion(dataset._id))
+            names = [x.name() for x in entry["block"]._elementmap._map.values()]
+            self.assertTrue("#1" in names and "#2" not in names)
+            # second delta file is applied to cached snapshot only
+            manifest["data"]["deltas"].append({"file": "delta2", "type": "json"})
+            writeJSON("manifest.json", manifest)
+            writeJSON("delta2.json", [
+                {"op": "upsert", "data": {"id": "100", "name": "#100",
+                    "desc": "#100", "cluster": "3", "price": 1.5, "count": 9,
+                    "dir": "up", "order": 2}}
+            ])
+            def fail(dataset, diagnostics=None):
+                raise StandardError("Dataset is processed from scratch")
+            service._processDataset = fail
+            w = DatasetWatcher(dmngr, 1, service._rebuildSnapshot,
+                service._retireSnapshot)
+            self.assertEqual(w.poll(), [dataset._id])
+            dataset = dmngr.getDataset(dataset._id)
+            key = (dataset._id, dmngr.getVersion(dataset._id))
+            self.assertEqual(service._processed.keys(), [key])
+            incremental = service._processed.get(key)["block"]
+            # catalogue index is rebuilt for the new snapshot
+            index = service._processed.get(key)["index"]
+            self.assertEqual(index, serializer.catalogueIndex(
+                incremental._elementmap._map.values()))
+            self.assertEqual(len(index), len(incremental._elementmap._map))
+            service._processDataset = processDataset
+            # incremental snapshot is the same as processed from scratch
+            full = service._processDataset(dataset)
+            self.assertEqual(summary(incremental), summary(full))
+            # compaction does not change dataset content
+            res = compaction.compactDataset(os.path.join(directory,
+                "manifest.json"))
+            self.assertEqual((res["deltas"], res["records"], res["skipped"]),
+                (2, 3, 0))
+            self.assertFalse(os.path.exists(os.path.join(directory,
+                "delta1.json")))
+            dmngr.loadDatasets(directory)
+            dataset = dmngr.getDataset(dataset._id)
+            self.assertEqual(dataset.deltaFiles(), [])
+            self.assertEqual(summary(service._processDataset(dataset)),
+                summary(full))
+        finally:
+            service._processDataset = processDataset
+            shutil.rmtree(directory)
+
+    def test_service_cacheStats(self):
+        stats = service.cacheStats()
+        self.assertEqual(sorted(stats.keys()),
+            ["admission", "coalescing", "processed", "rankmaps", "stages"])
+        for key in ["processed", "rankmaps"]:
+            self.assertEqual(sorted(stats[key].keys()),
+                ["evictions", "hits", "misses", "size", "weight"])
+        self.assertEqual(sorted(stats["coalescing"].keys()),
+            ["coalesced", "executions", "inflight", "waiting"])
+
+    def test_service_estimateCost(self):
+        dmngr = DataManager()
+        dmngr.loadDatasets(_INTEGRATION_PATH)
+        datasetId = dmngr.getDatasets()[0]._id
+        self.assertEqual(service.estimateCost("#", "", dmngr)["cost"], 0)
+        self.assertEqual(service.estimateCost(None, "", dmngr)["cost"], 0)
+        service._processed.clear()
+        before = service.estimateCost(datasetId, "", dmngr)
+        self.assertEqual(before["processed"], False)
+        self.assertTrue(before["elements"] > 0)
+        self.assertTrue(before["cost"] >= before["elements"] *
+            service.LOAD_COST)
+        # processed dataset is estimated from its maps
+        block = service._processedBlock(*dmngr.getDatasetVersion(datasetId))
+        stats = service._processed.stats()
+        full = service.estimateCost(datasetId, "", dmngr)
+        self.assertEqual(service._processed.stats(), stats)
+        self.assertEqual(full["processed"], True)
+        self.assertEqual(full["elements"], len(block._elementmap._map))
+        self.assertEqual(full["selectivity"], 1.0)
+        self.assertTrue(full["cost"] < before["cost"])
+        self.assertTrue(service.estimateCost(datasetId, "", dmngr,
+            True)["cost"] > full["cost"])
+        cluster = block._clustermap._map.keys()[0]
+        query = "select from ${clusters} where @id = [%s]" % (cluster)
+        selected = service.estimateCost(datasetId, query, dmngr)
+        self.assertEqual(selected["selectivity"],
+            1.0 / len(block._clustermap._map))
+        self.assertTrue(selected["cost"] < full["cost"])
+        # wrong query is estimated as full query
+        self.assertEqual(service.estimateCost(datasetId, "select", dmngr),
+            full)
+
+    def test_service_admissionOverload(self):
+        dmngr = DataManager()
+        dmngr.loadDatasets(_INTEGRATION_PATH)
+        datasetId = dmngr.getDatasets()[0]._id
+        admission = service._admission
+        heavycost = service.HEAVY_COST
+        # every query is heavy, one runs and one waits
+        service._admission = AdmissionController(1, 1)
+        service.HEAVY_COST = 0
+        try:
+            with service._admission.admit(True):
+                results = []
+                thread = threading.Thread(target=lambda: results.append(
+                    service.requestData(datasetId, "", dmngr, timeout=30)))
+                thread.start()
+                start = time.time()
+                while service._admission.stats()["waiting"] < 1 and \
+                        time.time() - start < 10:
+                    time.sleep(0.01)
+                # queue is saturated, request fails fast
+                start = time.time()
+                result = service.requestData(datasetId, "", dmngr, timeout=30)
+                self.assertTrue(time.time() - start < 5)
+                self.assertEqual(result["code"], service.CODE_OVERLOADED)
+                self.assertEqual(result["status"], "error")
+                # cheap queries are admitted
+                service.HEAVY_COST = float("inf")
+                result = service.requestData(datasetId, "", dmngr)
+                self.assertEqual(result["status"], "success")
+                service.HEAVY_COST = 0
+            thread.join(30)
+            self.assertEqual(results[0]["status"], "success")
+            # request waiting longer than timeout is rejected
+            with service._admission.admit(True):
+                result = service.requestData(datasetId, "", dmngr,
+                    timeout=0.05)
+                self.assertEqual(result["code"], service.CODE_OVERLOADED)
+            stats = service._admission.stats()
+            self.assertEqual((stats["rejected"], stats["timedout"]), (1, 1))
+            self.assertEqual((stats["running"], stats["waiting"]), (0, 0))
+        finally:
+            service._admission = admission
+            service.HEAVY_COST = heavycost
+
+    def test_service_requestDataDeadline(self):
+        dmngr = DataManager()
+        dmngr.loadDatasets(_INTEGRATION_PATH)
+        datasetId = dmngr.getDatasets()[0]._id
+        deadline = Deadline()
+        deadline.cancel()
+        result = service.requestData(datasetId, "", dmngr, deadline=deadline)
+        self.assertEqual(result["code"], service.CODE_TIMEOUT)
+        self.assertEqual(result["status"], "error")
+        self.assertEqual(result["messages"], ["Request was cancelled"])
+        result = service.requestData(datasetId, "", dmngr,
+            deadline=Deadline(0))
+        self.assertEqual(result["code"], service.CODE_TIMEOUT)
+        # request within deadline succeeds, default deadline is used
+        result = service.requestData(datasetId, "", dmngr,
+            deadline=Deadline(60))
+        self.assertEqual(result["status"], "success")
+        self.assertEqual(service.requestData(datasetId, "", dmngr)["status"],
+            "success")
+
+    def test_service_requestDataTimings(self):
+        dmngr = DataManager()
+        dmngr.loadDatasets(_INTEGRATION_PATH)
+        datasetId = dmngr.getDatasets()[0]._id
+        service._stages.clear()
+        result = service.requestData(datasetId, "", dmngr)
+        self.assertTrue("timings" not in result)
+        service._processed.clear()
+        block = service._processedBlock(*dmngr.getDatasetVersion(datasetId))
+        cluster = block._clustermap._map.keys()[0]
+        query = "select from ${clusters} where @id = [%s]" % (cluster)
+        service._processed.clear()
+        result = service.requestData(datasetId, query, dmngr, True,
+            istimings=True)
+        stages = dict((x["stage"], x) for x in result["timings"])
+        for name in ["load", "process", "copy", "filter", "analyse", "sort",
+                "serialize"]:
+            self.assertTrue(stages[name]["ms"] >= 0)
+        n = len(block._elementmap._map)
+        self.assertEqual(stages["copy"]["out"], n)
+        self.assertEqual(stages["filter"]["in"], n)
+        self.assertTrue(stages["filter"]["out"] < n)
+        self.assertEqual(stages["serialize"]["in"],
+            len(result["data"]["elements"]))
+        # processing is not repeated, when snapshot is cached
+        result = service.requestData(datasetId, query, dmngr, istimings=True)
+        self.assertEqual([x["stage"] for x in result["timings"]],
+            ["copy", "filter.clusters", "filter.pulses", "filter", "analyse",
+            "serialize"])
+        service.requestDataBodies(datasetId, "", dmngr)
+        stats = service.cacheStats()["stages"][datasetId]
+        self.assertEqual(stats["filter"]["count"], 4)
+        self.assertEqual(stats["load"]["count"], 1)
+        self.assertEqual(stats["encode"]["count"], 1)
+
+    def test_service_requestDataProfile(self):
+        dmngr = DataManager()
+        dmngr.loadDatasets(_INTEGRATION_PATH)
+        datasetId = dmngr.getDatasets()[0]._id
+        directory = tempfile.mkdtemp()
+        profiledir = service.PROFILE_DIR; keep = service.PROFILE_KEEP
+        try:
+            service.PROFILE_DIR = ""
+            result = service.requestData(datasetId, "", dmngr, isprofile=True)
+            self.assertEqual(result["status"], "success")
+            profile = result["profile"]
+            self.assertEqual(profile["file"], None)
+            self.assertTrue(0 < len(profile["functions"]) <=
+                service.PROFILE_TOP)
+            names = [x["function"] for x in profile["functions"]]
+            self.assertTrue(any([x.endswith("(_getDataObject)")
+                for x in names]))
+            self.assertTrue("profile" not in service.requestData(datasetId,
+                "", dmngr))
+            # profile is saved, if directory is set
+            service.PROFILE_DIR = directory
+            result = service.requestData(datasetId, "", dmngr, isprofile=True)
+            path = result["profile"]["file"]
+            self.assertEqual(os.path.dirname(path), directory)
+            self.assertTrue(os.path.isfile(path))
+            # only the latest profiles are kept
+            service.PROFILE_KEEP = 2
+            for _i in range(3):
+                result = service.requestData(datasetId, "", dmngr,
+                    isprofile=True)
+            self.assertEqual(len(os.listdir(directory)), 2)
+        finally:
+            service.PROFILE_KEEP = keep
+            service.PROFILE_DIR = profiledir
+            shutil.rmtree(directory)
+
+    def test_service_metrics(self):
+        dmngr = DataManager()
+        dmngr.loadDatasets(_INTEGRATION_PATH)
+        datasetId = dmngr.getDatasets()[0]._id
+        registry = metrics.REGISTRY
+        requests = registry.get("pulsar_query_requests_total")
+        loads = registry.get("pulsar_loader_duration_seconds")
+        ranked = registry.get("pulsar_ranked_elements_total")
+        before = requests.value(("200",)) or 0
+        loaded = (loads.value(("json",)) or {"count": 0})["count"]
+        service._processed.clear()
+        result = service.requestData(datasetId, "", dmngr)
+        self.assertEqual(requests.value(("200",)), before + 1)
+        self.assertTrue(loads.value(("json",))["count"] > loaded)
+        self.assertTrue(ranked.value(("relative_comparison_1",)) > 0)
+        service.requestData("#", "", dmngr)
+        self.assertTrue(requests.value(("400",)) > 0)
+        self.assertTrue(registry.get("pulsar_dataset_scan_seconds").value()[
+            "count"] > 0)
+        elements = registry.get("pulsar_dataset_elements").samples()
+        self.assertTrue("pulsar_dataset_elements{dataset=\"%s\"} %d" % (
+            datasetId, len(result["data"]["elements"])) in elements)
+        text = service.metricsText()
+        for name in ["pulsar_cache_hits_total", "pulsar_admission_running",
+                "pulsar_coalesced_total", "pulsar_query_duration_seconds"]:
+            self.assertTrue("# TYPE %s " % (name) in text)
+
+    def test_service_requestExplain(self):
+        dmngr = DataManager()
+        dmngr.loadDatasets(_INTEGRATION_PATH)
+        datasetId = dmngr.getDatasets()[0]._id
+        service._processed.clear()
+        block = service._processedBlock(*dmngr.getDatasetVersion(datasetId))
+        cluster = block._clustermap._map.keys()[0]
+        query = "select from ${clusters} where @id = [%s] and @name = [a]" \
+            % (cluster)
+        service._processed.clear()
+        result = service.requestExplain(datasetId, query, dmngr)
+        self.assertEqual(result["status"], "success")
+        obj = result["data"]
+        # cost is estimated before dataset is processed
+        self.assertEqual(obj["estimate"]["processed"], False)
+        self.assertEqual([x["status"] for x in
+            obj["blocks"][0]["predicates"]].count("applied"), 1)
+        self.assertEqual([x["filter"] for x in obj["filters"]],
+            ["clusters", "pulses"])
+        self.assertTrue(all(["actual" not in x for x in obj["filters"]]))
+        self.assertTrue("timings" not in obj)
+        # analyze executes query and reports actual number of elements
+        result = service.requestExplain(datasetId, query, dmngr,
+            isanalyze=True)
+        obj = result["data"]
+        self.assertEqual(obj["estimate"]["processed"], True)
+        n = len(block._elementmap._map)
+        self.assertEqual(obj["filters"][0]["estimated"],
+            int(round(n * obj["estimate"]["clusters"])))
+        self.assertTrue(obj["filters"][0]["actual"] < n)
+        stages = dict((x["stage"], x) for x in obj["timings"])
+        self.assertEqual(obj["filters"][1]["actual"], stages["filter"]["out"])
+        self.assertTrue("analyse" in stages)
+        self.assertTrue("elements" not in obj)
+        # errors are reported as for data requests
+        self.assertEqual(service.requestExplain("#", "", dmngr)["status"],
+            "error")
+        self.assertEqual(service.requestExplain(datasetId, "select", dmngr)[
+            "status"], "error")
+
+    def test_service_requestDataBodies(self):
+        dmngr = DataManager()
+        dmngr.loadDatasets(_INTEGRATION_PATH)
+        datasetId = dmngr.getDatasets()[0]._id
+        expected = service.requestData(datasetId, "", dmngr, True)
+        code, bodies = service.requestDataBodies(datasetId, "", dmngr, True,
+            encoding="gzip")
+        self.assertEqual(code, 200)
+        self.assertEqual(json.loads(bodies["identity"]),
+            json.loads(json.dumps(expected)))
+        self.assertTrue("gzip" in bodies)
+        # concurrent identical requests share execution and bodies
+        stats = service._flights.stats()
+        results = [None] * 8
+        def request(index):
+            results[index] = service.requestDataBodies(datasetId, "", dmngr,
+                True)
+        threads = [threading.Thread(target=request, args=(x,)) for x in
+            range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        after = service._flights.stats()
+        self.assertEqual(after["executions"] + after["coalesced"],
+            stats["executions"] + stats["coalesced"] + 8)
+        self.assertEqual(after["inflight"], 0)
+        for code, result in results:
+            self.assertEqual(code, 200)
+            self.assertEqual(result["identity"], results[0][1]["identity"])
+        # unknown dataset is not coalesced
+        code, bodies = service.requestDataBodies("#", "", dmngr)
+        self.assertEqual(code, 400)
+        self.assertEqual(service._flights.stats()["executions"],
+            after["executions"])
+
+    def test_service_requestSweep(self):
+        dmngr = DataManager()
+        dmngr.loadDatasets(_INTEGRATION_PATH)
+        datasetId = dmngr.getDatasets()[0]._id
+        ids = dict((x.name(), x.id()) for x in
+            service._processedBlock(
+            *dmngr.getDatasetVersion(datasetId))._pulsemap._map.values())
+        query = "select from ${pulses} where @%s = [up]" % (ids["dir"])
+        prices = [120.0, 124, 130.5]; counts = [2, 5]
+        result = service.requestSweep(datasetId, query, ["price",
+            ids["count"]], [prices, counts], 3, dmngr)
+        self.assertEqual(result["status"], "success")
+        data = result["data"]
+        self.assertEqual(data["pulses"], ["price", "count"])
+        self.assertEqual(len(data["candidates"]), 6)
+        # every candidate ranks as filtered elements with the same defaults
+        dataset = dmngr.getDataset(datasetId)
+        for obj in data["candidates"]:
+            pblock = service._processedBlock(dataset,
+                dmngr.getVersion(dataset._id))
+            fblock = selector.filterWithBlock(query, selector.FilterBlock(
+                analyser.ALGORITHMS.copy(), pblock._pulsemap,
+                pblock._clustermap, pblock._elementmap))
+            fblock._pul.get(ids["price"]).setDefaultValue(obj["defaults"][0])
+            fblock._pul.get(ids["count"]).setDefaultValue(obj["defaults"][1])
+            ablock = analyser.analyseWithBlock(analyser.AnalyseBlock(
+                fblock._alg, fblock._ele, fblock._pul))
+            elements = ablock._elementmap._map.values()
+            names = {}
+            for element in elements:
+                names[element.rank()._name] = \
+                    names.get(element.rank()._name, 0) + 1
+            self.assertEqual(obj["ranks"], names)
+            self.assertEqual(sum(obj["classes"].values()), len(elements))
+            self.assertEqual(len(obj["top"]), min(3, len(elements)))
+            best = [ablock._elementmap.get(x["id"]).rank()._value
+                for x in obj["top"]]
+            self.assertEqual(best, sorted([x.rank()._value for x in elements],
+                reverse=True)[:3])
+        self.assertNotEqual(data["candidates"][0]["ranks"],
+            data["candidates"][-1]["ranks"])
+        # wrong requests
+        for pulses, values in [(["price"], [[]]), (["dir"], [["up"]]),
+                (["price"], [["1"]]), (["price", "count"], [[1.0]]),
+                (["price"], [range(service.MAX_SWEEP_CANDIDATES + 1)])]:
+            result = service.requestSweep(datasetId, "", pulses, values, 0,
+                dmngr)
+            self.assertEqual(result["status"], "error")
+
+    def test_service_clusterScope(self):
+        dmngr = DataManager()
+        dmngr.loadDatasets(_INTEGRATION_PATH)
+        datasetId = dmngr.getDatasets()[0]._id
+        ids = dict((x.name(), x.id()) for x in
+            service._processedBlock(
+            *dmngr.getDatasetVersion(datasetId))._clustermap._map.values())
+        # clusters "C" and "D" are at depth 3, "E" is a child of "D"
+        query = "select from ${algorithms} where @scope |is| cluster " + \
+            "and @depth = 3"
+        result = service.requestData(datasetId, query, dmngr)
+        self.assertEqual(result["status"], "success")
+        scoped = dict((x["id"], x["rank"]["name"]) for x in
+            result["data"]["elements"] if x["cluster"] in
+            [ids["C"], ids["D"], ids["E"]])
+        self.assertTrue(len(scoped) > 0)
+        # ranks are the same as ranks of query for each cluster
+        expected = {}
+        for name in ["C", "D"]:
+            query = "select from ${clusters} where @id = [%s]" % (ids[name])
+            data = service.requestData(datasetId, query, dmngr)["data"]
+            for element in data["elements"]:
+                expected[element["id"]] = element["rank"]["name"]
+        self.assertEqual(scoped, expected)
+
+    def test_service_clusterScopeParallel(self):
+        dmngr = DataManager()
+        dmngr.loadDatasets(_INTEGRATION_PATH)
+        datasetId = dmngr.getDatasets()[0]._id
+        query = "select from ${algorithms} where @scope |is| cluster " + \
+            "and @depth = 3"
+        result = service.requestData(datasetId, query, dmngr)
+        expected = dict((x["id"], x["rank"]["name"]) for x in
+            result["data"]["elements"])
+        # every partition is large, ranking takes a while and reports process
+        delay = 0.5
+        rankResults = RelativeComparison.rankResults
+        def slowRankResults(self, elementmap, pulsemap, diagnostics=None,
+                deadline=None):
+            time.sleep(delay)
+            if diagnostics is not None:
+                diagnostics.report(diag.ALGORITHM_DEFAULT,
+                    "Ranked in %d" % (os.getpid()))
+            return rankResults(self, elementmap, pulsemap, diagnostics,
+                deadline)
+        minsize = analyser.PARALLEL_MIN_SIZE
+        processes = analyser.PARALLEL_PROCESSES
+        analyser.PARALLEL_MIN_SIZE = 1
+        analyser.PARALLEL_PROCESSES = 2
+        RelativeComparison.rankResults = slowRankResults
+        try:
+            # pool is forked before threads, with patched algorithm
+            if not service.startRankingPool():
+                self.assertFalse(service.workers.canFork())
+                return
+            numpartitions = len(analyser.partitionByCluster(
+                service._processedBlock(*dmngr.getDatasetVersion(datasetId))
+                ._elementmap, 3))
+            self.assertTrue(numpartitions >= 2)
+            start = time.time()
+            result = service.requestData(datasetId, query, dmngr)
+            elapsed = time.time() - start
+            self.assertEqual(result["status"], "success")
+            ranks = dict((x["id"], x["rank"]["name"]) for x in
+                result["data"]["elements"])
+            self.assertEqual(ranks, expected)
+            # partitions are ranked in other processes at the same time
+            pids = set(int(x.split()[-1]) for x in result["messages"]
+                if x.startswith("Ranked in "))
+            self.assertTrue(len(pids) >= 2)
+            self.assertTrue(os.getpid() not in pids)
+            self.assertTrue(elapsed < delay * numpartitions)
+            stats = analyser.poolStats()
+            self.assertEqual(stats["tasks"], numpartitions)
+            self.assertEqual(stats["running"], True)
+        finally:
+            service.stopRankingPool()
+            RelativeComparison.rankResults = rankResults
+            analyser.PARALLEL_MIN_SIZE = minsize
+            analyser.PARALLEL_PROCESSES = processes
+        self.assertEqual(analyser.poolStats(), None)
+
+    def test_service_sharding(self):
+        dmngr = DataManager()
+        dmngr.loadDatasets(_INTEGRATION_PATH)
+        datasetId = dmngr.getDatasets()[0]._id
+        queries = ["", "select from ${algorithms} where @scope |is| cluster",
+            "select from ${algorithms} where " +
+            "@id = [relative_comparison_approx_1]"]
+        def request(query):
+            result = service.requestData(datasetId, query, dmngr, True,
+                istimings=True)
+            self.assertEqual(result["status"], "success")
+            ranks = dict((x["id"], x["rank"]["name"]) for x in
+                result["data"]["elements"])
+            stages = [x["stage"] for x in result["timings"]]
+            return (ranks, result["data"]["algorithm"]["id"], stages)
+        expected = [request(x) for x in queries]
+        shards = service.SHARDS
+        service.SHARDS = 2
+        try:
+            # shards are started before threads, and rank as the whole block
+            self.assertEqual(service.startSharding([datasetId, "none"], dmngr),
+                [datasetId] if service.workers.canFork() else [])
+            executor = service._executors.values()[0]
+            self.assertEqual(executor.numQueries(), service.SHARD_QUERIES)
+            for query, (ranks, algorithm, stages) in zip(queries, expected):
+                result = request(query)
+                self.assertEqual(result[:2], (ranks, algorithm))
+                self.assertTrue("shards" in result[2])
+                # approximate comparison is executed in process
+                self.assertEqual("analyse" in result[2],
+                    algorithm == "relative_comparison_approx_1")
+            # other formats are executed in process
+            result = service.requestData(datasetId, "", dmngr,
+                dataformat=serializer.FORMAT_RANKS)
+            self.assertEqual(result["status"], "success")
+            # shards of retired snapshot are stopped
+            dataset, version = dmngr.getDatasetVersion(datasetId)
+            service._retireSnapshot(dataset._id, version)
+            self.assertEqual(service._executors, {})
+            self.assertEqual(executor.query(""), None)
+        finally:
+            service.stopSharding()
+            service.SHARDS = shards
+        self.assertEqual(service._executors, {})
+
+    def test_service_loadDataset(self):
+        dmngr = DataManager()
+        dmngr.loadDatasets(_INTEGRATION_PATH)
+        dataset = dmngr.getDatasets()[0]
+        data = service._loadDataset(dataset)
+        self.assertEqual(sorted(data.keys()), ["clusters", "elements", "pulses"])
+        for key in data.keys():
+            loader = service._loaderForDatatype(
+                getattr(dataset, "_" + key)["type"],
+                getattr(dataset, "_" + key)["path"]
+            )
+            self.assertEqual(data[key], loader.processData())
+
+    def test_service_processedBlockIsolation(self):
+        dmngr = DataManager()
+        dmngr.loadDatasets(_INTEGRATION_PATH)
+        dataset = dmngr.getDatasets()[0]
+        first = service._processedBlock(dataset,
+            dmngr.getVersion(dataset._id))
+        second = service._processedBlock(dataset,
+            dmngr.getVersion(dataset._id))
+        self.assertFalse(first is second)
+        self.assertFalse(first._elementmap is second._elementmap)
+        # copies are identified by dataset version, filtered elements by
+        # version and query
+        token = (dataset._id, dmngr.getVersion(dataset._id))
+        self.assertEqual(first._elementmap.token(), token)
+        query = "select from ${clusters} where @id = [#]"
+        third = service._processedBlock(dataset, token[1])
+        fblock = selector.filterWithBlock(query, selector.FilterBlock(
+            analyser.ALGORITHMS.copy(), third._pulsemap, third._clustermap,
+            third._elementmap))
+        self.assertEqual(fblock._ele.token(), (token, query))
+        key = first._elementmap._map.keys()[0]
+        first._elementmap.remove(key)
+        self.assertEqual(first._elementmap.token(), None)
+        self.assertTrue(second._elementmap.has(key))
+
 
 # Load test suites
 def _suites():
@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+
+'''
+Copyright 2015 Ivan Sadikov
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+
+# import libs
+import threading
+import time
+from types import IntType
+# import classes
+import analytics.utils.misc as misc
+
+"""
+    Admission control of expensive requests. Cheap requests are always
+    admitted, at most "maxheavy" heavy requests run at the same time, and at
+    most "maxqueue" heavy requests wait for a slot, in order of arrival.
+    Heavy request that finds queue full is rejected right away, and request
+    that waits longer than its timeout is rejected as well, so bursts of
+    expensive requests cannot starve cheap ones or pile up without bound.
+"""
+
+
+class _Ticket(object):
+    """
+        _Ticket class is a slot of admitted request, slot is released, when
+        ticket is used as context manager and block exits.
+
+        Attributes:
+            _controller (AdmissionController): controller of the slot
+            _heavy (bool): flag showing that request holds heavy slot
+    """
+    def __init__(self, controller, heavy):
+        self._controller = controller
+        self._heavy = heavy
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._heavy:
+            self._controller._release()
+            self._heavy = False
+        return False
+
+
+class AdmissionController(object):
+    """
+        AdmissionController class admits requests, see module description.
+
+        Attributes:
+            _maxheavy (int): maximum number of running heavy requests
+            _maxqueue (int): maximum number of waiting heavy requests
+            _cond (Condition): condition of slots
+            _running (int): number of running heavy requests
+            _queue (list<object>): waiting heavy requests in order of arrival
+            _stats (dict<str, int>): counters of requests
+    """
+    def __init__(self, maxheavy, maxqueue):
+        misc.checkTypeAgainst(type(maxheavy), IntType, __file__)
+        misc.checkTypeAgainst(type(maxqueue), IntType, __file__)
+        if maxheavy < 1 or maxqueue < 0:
+            misc.raiseValueError("Number of heavy requests must be positive" +
+                " and queue size must not be negative", __file__)
+        self._maxheavy = maxheavy
+        self._maxqueue = maxqueue
+        self._cond = threading.Condition(threading.Lock())
+        self._running = 0
+        self._queue = []
+        self._stats = {"light": 0, "heavy": 0, "queued": 0, "rejected": 0,
+            "timedout": 0}
+
+    # [Public]
+    def admit(self, heavy, timeout=None):
+        """
+            Admits request, waits for heavy slot, if all are taken. Raises
+            overload error, if queue is full or request waits longer than
+            timeout. Returned ticket must be used in "with" statement.
+
+            Args:
+                heavy (bool): flag showing that request is heavy
+                timeout (float): maximum time to wait in seconds, no limit if
+                    None
+
+            Returns:
+                _Ticket: ticket of admitted request
+        """
+        with self._cond:
+            if not heavy:
+                self._stats["light"] += 1
+                return _Ticket(self, False)
+            if self._running < self._maxheavy and not self._queue:
+                self._running += 1
+                self._stats["heavy"] += 1
+                return _Ticket(self, True)
+            if len(self._queue) >= self._maxqueue:
+                self._stats["rejected"] += 1
+                misc.raiseOverloadError("Service is busy, too many " +
+                    "expensive requests are waiting", __file__)
+            token = object()
+            self._queue.append(token)
+            self._stats["queued"] += 1
+            deadline = None if timeout is None else time.time() + timeout
+            try:
+                while self._running >= self._maxheavy or \
+                        self._queue[0] is not token:
+                    remaining = None if deadline is None else \
+                        deadline - time.time()
+                    if remaining is not None and remaining <= 0:
+                        self._stats["timedout"] += 1
+                        misc.raiseOverloadError("Request waited too long " +
+                            "for expensive requests to finish", __file__)
+                    self._cond.wait(remaining)
+            finally:
+                self._queue.remove(token)
+                # next request in queue may be able to run now
+                self._cond.notify_all()
+            self._running += 1
+            self._stats["heavy"] += 1
+            return _Ticket(self, True)
+
+    # [Private]
+    def _release(self):
+        with self._cond:
+            self._running -= 1
+            self._cond.notify_all()
+
+    # [Public]
+    def stats(self):
+        """
+            Returns statistics of admission.
+
+            Returns:
+                dict<str, int>: numbers of admitted light and heavy requests,
+                    requests that were queued, rejected because queue was
+                    full, and rejected after waiting, and numbers of running
+                    and waiting heavy requests
+        """
+        with self._cond:
+            stats = dict(self._stats)
+            stats["running"] = self._running
+            stats["waiting"] = len(self._queue)
+            return stats
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+
+'''
+Copyright 2015 Ivan Sadikov
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+
+# import libs
+import time
+from types import IntType, LongType, FloatType
+# import classes
+import analytics.utils.misc as misc
+
+"""
+    Cooperative deadlines of requests. Request creates deadline and passes
+    it to processing, filtering and ranking, long loops check it every
+    CHECK_INTERVAL iterations and abort with timeout error, once deadline
+    has passed or request was cancelled. Nothing is interrupted from
+    outside, so work stops only at those checks.
+"""
+
+# number of loop iterations between checks of deadline
+CHECK_INTERVAL = 1000
+
+
+class Deadline(object):
+    """
+        Deadline class keeps time, when request expires, and cancellation
+        flag. Deadline without timeout expires only, when it is cancelled.
+
+        Attributes:
+            _timeout (float): timeout in seconds, or None
+            _expires (float): time when deadline expires, or None
+            _cancelled (bool): flag showing that request is cancelled
+    """
+    def __init__(self, timeout=None):
+        if timeout is not None:
+            if type(timeout) not in [IntType, LongType, FloatType]:
+                misc.raiseTypeError("Timeout must be a number", __file__)
+            if timeout < 0:
+                misc.raiseValueError("Timeout must not be negative", __file__)
+        self._timeout = timeout
+        self._expires = None if timeout is None else time.time() + timeout
+        self._cancelled = False
+
+    # [Public]
+    def cancel(self):
+        """
+            Cancels request, next check raises timeout error.
+        """
+        self._cancelled = True
+
+    # [Public]
+    def cancelled(self):
+        """
+            Returns True, if request is cancelled.
+
+            Returns:
+                bool: flag showing that request is cancelled
+        """
+        return self._cancelled
+
+    # [Public]
+    def remaining(self):
+        """
+            Returns time left before deadline, 0.0 if it is cancelled or has
+            passed, and None, if there is no timeout.
+
+            Returns:
+                float: time left in seconds, or None
+        """
+        if self._cancelled:
+            return 0.0
+        if self._expires is None:
+            return None
+        return max(self._expires - time.time(), 0.0)
+
+    # [Public]
+    def expired(self):
+        """
+            Returns True, if deadline has passed or request is cancelled.
+
+            Returns:
+                bool: flag showing that request must stop
+        """
+        if self._cancelled:
+            return True
+        return self._expires is not None and time.time() >= self._expires
+
+    # [Public]
+    def check(self):
+        """
+            Raises timeout error, if deadline has passed or request is
+            cancelled, otherwise does nothing.
+        """
+        if self._cancelled:
+            misc.raiseTimeoutError("Request was cancelled", __file__)
+        if self._expires is not None and time.time() >= self._expires:
+            misc.raiseTimeoutError("Request took longer than %s seconds" %
+                (str(self._timeout)), __file__)
+
+
+class NoDeadline(Deadline):
+    """
+        NoDeadline class is a deadline that never expires and cannot be
+        cancelled, it is used by callers that do not pass deadline.
+    """
+    def __init__(self):
+        super(NoDeadline, self).__init__(None)
+
+    # [Public]
+    def cancel(self):
+        pass
+
+    # [Public]
+    def check(self):
+        pass
+
+
+# shared deadline, stateless, so it is safe to use from any thread
+NEVER = NoDeadline()
+
+# [Public]
+def orNever(deadline):
+    """
+        Returns deadline provided, or deadline that never expires, if it is
+        None.
+
+        Args:
+            deadline (Deadline): deadline or None
+
+        Returns:
+            Deadline: deadline to check
+    """
+    return NEVER if deadline is None else deadline
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+
+'''
+Copyright 2015 Ivan Sadikov
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+
+# import libs
+import warnings
+
+"""
+    Diagnostics are non-fatal messages that processor, selector and analyser
+    report while handling request, e.g. entries that could not be parsed.
+    Diagnostics instance is created per request and passed through blocks,
+    so concurrent requests never share state. Module-level warnings are only
+    used by adapter, when no diagnostics instance is provided.
+"""
+
+# diagnostic codes
+## processor
+CLUSTER_PARSE_FAILED = "cluster-parse-failed"
+CLUSTER_PARENT_FAILED = "cluster-parent-failed"
+ELEMENT_PARSE_FAILED = "element-parse-failed"
+PULSE_PARSE_FAILED = "pulse-parse-failed"
+PULSES_DISCOVERED = "pulses-discovered"
+DELTA_RECORD_FAILED = "delta-record-failed"
+## selector
+QUERYSET_RESET = "queryset-reset"
+PULSE_DEFAULT_REJECTED = "pulse-default-rejected"
+SCOPE_REJECTED = "scope-rejected"
+## analyser and algorithms
+ALGORITHMS_AMBIGUOUS = "algorithms-ambiguous"
+ALGORITHM_DEFAULT = "algorithm-default"
+DYNAMIC_PULSES_EXCEEDED = "dynamic-pulses-exceeded"
+
+
+class Diagnostics(object):
+    """
+        Diagnostics class collects messages reported during single request.
+        Each message has a code, and repeated messages are counted instead
+        of being stored twice. Collector is not thread-safe, as it belongs to
+        one request only.
+
+        Attributes:
+            _entries (list<list>): code, message and count in order of reports
+            _index (dict<tuple, list>): map of (code, message) and entry
+            _counts (dict<str, int>): number of reports for each code
+    """
+    def __init__(self):
+        self._entries = []
+        self._index = {}
+        self._counts = {}
+
+    # [Public]
+    def report(self, code, msg):
+        """
+            Records message with code provided.
+
+            Args:
+                code (str): diagnostic code
+                msg (str): message
+        """
+        key = (code, msg)
+        entry = self._index.get(key)
+        if entry is None:
+            entry = [code, msg, 0]
+            self._index[key] = entry
+            self._entries.append(entry)
+        entry[2] += 1
+        self._counts[code] = self._counts.get(code, 0) + 1
+
+    # [Public]
+    def merge(self, diagnostics):
+        """
+            Adds all messages and counts of other diagnostics, e.g. messages
+            of processing that was done once and is reused by request.
+
+            Args:
+                diagnostics (Diagnostics): diagnostics to merge
+        """
+        for code, msg, count in diagnostics._entries:
+            for _i in range(count):
+                self.report(code, msg)
+
+    # [Public]
+    def count(self, code=None):
+        """
+            Returns number of reports for code, or total number of reports,
+            if code is None.
+
+            Args:
+                code (str): diagnostic code
+
+            Returns:
+                int: number of reports
+        """
+        if code is None:
+            return sum(self._counts.values())
+        return self._counts.get(code, 0)
+
+    # [Public]
+    def codes(self):
+        """
+            Returns map of codes and number of reports.
+
+            Returns:
+                dict<str, int>: map of codes and counts
+        """
+        return dict(self._counts)
+
+    # [Public]
+    def messages(self):
+        """
+            Returns distinct messages in order they were reported first.
+
+            Returns:
+                list<str>: list of messages
+        """
+        return [x[1] for x in self._entries]
+
+    # [Public]
+    def getJSON(self):
+        """
+            Returns json representation of diagnostics.
+
+            Returns:
+                list<dict>: code, message and count for each distinct message
+        """
+        return [{"code": x[0], "message": x[1], "count": x[2]}
+            for x in self._entries]
+
+
+class WarningsDiagnostics(Diagnostics):
+    """
+        WarningsDiagnostics class is an adapter that reports every message as
+        UserWarning and keeps nothing, preserving behaviour for callers that
+        do not pass diagnostics and capture warnings instead.
+    """
+    # [Public]
+    def report(self, code, msg):
+        warnings.warn(msg, UserWarning)
+
+
+# shared adapter, stateless, so it is safe to use from any thread
+WARNINGS = WarningsDiagnostics()
+
+# [Public]
+def orWarnings(diagnostics):
+    """
+        Returns diagnostics provided, or warnings adapter, if it is None.
+
+        Args:
+            diagnostics (Diagnostics): diagnostics or None
+
+        Returns:
+            Diagnostics: diagnostics to report to
+    """
+    return WARNINGS if diagnostics is None else diagnostics
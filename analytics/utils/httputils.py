@@ -0,0 +1,312 @@
+#!/usr/bin/env python
+
+'''
+Copyright 2015 Ivan Sadikov
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+
+# import libs
+import hashlib
+import json
+import zlib
+from types import StringType
+# import classes
+from analytics.utils.lrucache import LRUCache
+
+"""
+    HTTP utility functions that do not depend on a particular web framework,
+    so they can be shared by API handlers and tested separately.
+"""
+
+# content encodings
+IDENTITY = "identity"
+GZIP = "gzip"
+DEFLATE = "deflate"
+# supported encodings in order of preference
+ENCODINGS = [GZIP, DEFLATE]
+# bodies smaller than threshold (bytes) are not compressed
+MIN_COMPRESS_SIZE = 1024
+# compression level, trade-off between CPU and size
+COMPRESS_LEVEL = 6
+
+# [Public]
+def generateETag(*parts):
+    """
+        Generates strong ETag from parts provided. Parts are converted into
+        strings and hashed, so ETag changes when any part changes.
+
+        Args:
+            parts (list<obj>): parts that ETag depends on
+
+        Returns:
+            str: quoted ETag value
+    """
+    md5 = hashlib.md5()
+    for part in parts:
+        md5.update(str(part))
+        # delimiter to distinguish ("ab", "c") from ("a", "bc")
+        md5.update("\x00")
+    return '"%s"' % (md5.hexdigest())
+
+# [Public]
+def matchesETag(header, etag):
+    """
+        Checks whether "If-None-Match" header matches ETag provided. Header can
+        contain list of ETags or "*". Weak comparison is used, as recommended
+        for "If-None-Match".
+
+        Args:
+            header (str): value of "If-None-Match" header
+            etag (str): current quoted ETag
+
+        Returns:
+            bool: True, if header matches ETag, otherwise False
+    """
+    if type(header) is not StringType or type(etag) is not StringType:
+        return False
+    header = header.strip()
+    if header == "*":
+        return True
+    strip = lambda x: x[2:] if x.startswith("W/") else x
+    etag = strip(etag.strip())
+    for candidate in header.split(","):
+        if strip(candidate.strip()) == etag:
+            return True
+    return False
+
+# [Public]
+def encodedETag(etag, encoding):
+    """
+        Returns ETag of the representation in content encoding. Compressed
+        representations get encoding suffix, as they are different from
+        identity representation byte-wise.
+
+        Args:
+            etag (str): quoted ETag of identity representation
+            encoding (str): content encoding
+
+        Returns:
+            str: quoted ETag of encoded representation
+    """
+    if etag is None or encoding not in ENCODINGS:
+        return etag
+    return '%s-%s"' % (etag[:-1], encoding)
+
+# [Public]
+def matchesAnyETag(header, etag):
+    """
+        Checks whether "If-None-Match" header matches ETag of identity or any
+        encoded representation of the resource.
+
+        Args:
+            header (str): value of "If-None-Match" header
+            etag (str): current quoted ETag of identity representation
+
+        Returns:
+            bool: True, if header matches any representation
+    """
+    return matchedEncoding(header, etag) is not None
+
+# [Public]
+def matchedEncoding(header, etag, preferred=IDENTITY):
+    """
+        Returns content encoding of representation that "If-None-Match"
+        header matches, or None, if it matches none of them. Preferred
+        encoding is checked first, so "*" or header listing several
+        representations resolves to encoding negotiated with client.
+
+        Args:
+            header (str): value of "If-None-Match" header
+            etag (str): current quoted ETag of identity representation
+            preferred (str): encoding negotiated with client
+
+        Returns:
+            str: matched encoding, or None
+    """
+    for encoding in [preferred] + [IDENTITY] + ENCODINGS:
+        if matchesETag(header, encodedETag(etag, encoding)):
+            return encoding
+    return None
+
+# [Public]
+def negotiateEncoding(header):
+    """
+        Selects content encoding using "Accept-Encoding" header. Supports
+        quality values, e.g. "gzip;q=0.5, deflate". Returns identity, if none
+        of supported encodings is acceptable.
+
+        Args:
+            header (str): value of "Accept-Encoding" header
+
+        Returns:
+            str: selected encoding
+    """
+    if type(header) is not StringType:
+        return IDENTITY
+    quality = {}
+    for item in header.split(","):
+        parts = [x.strip() for x in item.split(";")]
+        name = parts[0].lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in parts[1:]:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        quality[name] = q
+    best = IDENTITY; bestq = 0.0
+    for encoding in ENCODINGS:
+        q = quality.get(encoding, quality.get("*", 0.0))
+        if q > bestq:
+            best = encoding; bestq = q
+    return best
+
+# [Private]
+def _compressor(encoding):
+    """
+        Returns zlib compressor for encoding. Gzip uses gzip container,
+        deflate uses zlib container as required by HTTP.
+
+        Args:
+            encoding (str): content encoding
+
+        Returns:
+            Compress: zlib compress object
+    """
+    if encoding == GZIP:
+        wbits = 16 + zlib.MAX_WBITS
+    else:
+        wbits = zlib.MAX_WBITS
+    return zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, wbits)
+
+# [Public]
+def compressBody(body, encoding):
+    """
+        Compresses body with encoding provided. Identity encoding returns body
+        as it is.
+
+        Args:
+            body (str): body to compress
+            encoding (str): content encoding
+
+        Returns:
+            str: compressed body
+    """
+    if encoding not in ENCODINGS:
+        return body
+    compressor = _compressor(encoding)
+    return compressor.compress(body) + compressor.flush()
+
+# [Public]
+def encodeJSON(obj, encoding=IDENTITY, threshold=MIN_COMPRESS_SIZE):
+    """
+        Serializes object into json and compresses it with encoding provided.
+        Json is produced in chunks and fed into streaming compressor as soon
+        as body exceeds threshold, so compression overlaps serialisation.
+        Returns map of bodies by encoding, identity body is always included,
+        compressed body is included only if it was applied.
+
+        Args:
+            obj (obj): json object
+            encoding (str): content encoding
+            threshold (int): minimum size of body to compress
+
+        Returns:
+            dict<str, str>: map of encoding and body
+    """
+    chunks = []; compressed = []; size = 0; compressor = None
+    for chunk in json.JSONEncoder().iterencode(obj):
+        chunks.append(chunk)
+        size += len(chunk)
+        if compressor is not None:
+            compressed.append(compressor.compress(chunk))
+        elif encoding in ENCODINGS and size >= threshold:
+            # body is big enough, compress everything collected so far
+            compressor = _compressor(encoding)
+            compressed.append(compressor.compress("".join(chunks)))
+    bodies = {IDENTITY: "".join(chunks)}
+    if compressor is not None:
+        compressed.append(compressor.flush())
+        bodies[encoding] = "".join(compressed)
+    return bodies
+
+# [Public]
+def selectBody(bodies, encoding):
+    """
+        Selects body for encoding from map of bodies. Falls back to identity
+        body, if there is no body for encoding.
+
+        Args:
+            bodies (dict<str, str>): map of encoding and body
+            encoding (str): content encoding
+
+        Returns:
+            tuple<str, str>: body and encoding that was applied
+    """
+    if encoding in bodies:
+        return (bodies[encoding], encoding)
+    return (bodies[IDENTITY], IDENTITY)
+
+
+class ResponseCache(LRUCache):
+    """
+        ResponseCache class keeps serialized response bodies by key (usually
+        ETag), compressed bodies are kept alongside identity body, so repeated
+        requests do not pay serialisation and compression twice. Cache is
+        bounded by number of responses and total size in bytes.
+    """
+    def __init__(self, maxsize=64, maxbytes=32*1024*1024):
+        weigher = lambda bodies: sum([len(x) for x in bodies.values()])
+        super(ResponseCache, self).__init__(maxsize, maxbytes, weigher)
+
+    # [Public]
+    def getBody(self, key, encoding, threshold=MIN_COMPRESS_SIZE):
+        """
+            Returns cached body for key and encoding. If response is cached,
+            but not in requested encoding, identity body is compressed once
+            and cached as well. Returns None, if response is not cached.
+
+            Args:
+                key (str): response key
+                encoding (str): content encoding
+                threshold (int): minimum size of body to compress
+
+            Returns:
+                tuple<str, str>: body and encoding that was applied
+        """
+        bodies = self.get(key)
+        if bodies is None:
+            return None
+        identity = bodies[IDENTITY]
+        if encoding in ENCODINGS and encoding not in bodies and \
+                len(identity) >= threshold:
+            bodies = dict(bodies)
+            bodies[encoding] = compressBody(identity, encoding)
+            self.put(key, bodies)
+        return selectBody(bodies, encoding)
+
+    # [Public]
+    def putBodies(self, key, bodies):
+        """
+            Caches bodies for key.
+
+            Args:
+                key (str): response key
+                bodies (dict<str, str>): map of encoding and body
+        """
+        self.put(key, bodies)
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+
+'''
+Copyright 2015 Ivan Sadikov
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+
+# import libs
+import importlib
+import sys
+
+
+class LazyModule(object):
+    """
+        LazyModule class is a placeholder for module that is imported on
+        first attribute access, so modules that are not needed by request are
+        not imported when application starts. Import itself is guarded by
+        interpreter import lock, so placeholder is safe to use from threads.
+
+        Attributes:
+            _name (str): full module name
+            _module (Module): imported module, None until first access
+    """
+    def __init__(self, name):
+        self.__dict__["_name"] = name
+        self.__dict__["_module"] = None
+
+    # [Public]
+    def load(self):
+        """
+            Imports module, if it has not been imported yet, and returns it.
+
+            Returns:
+                Module: imported module
+        """
+        module = self.__dict__["_module"]
+        if module is None:
+            module = importlib.import_module(self.__dict__["_name"])
+            self.__dict__["_module"] = module
+        return module
+
+    # [Public]
+    def isLoaded(self):
+        """
+            Returns True, if module has been imported, either through this
+            placeholder or by anyone else.
+
+            Returns:
+                bool: flag showing whether module is imported
+        """
+        return self.__dict__["_name"] in sys.modules
+
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self.load(), attr, value)
+
+    def __repr__(self):
+        return "<lazy module '%s'>" % (self.__dict__["_name"])
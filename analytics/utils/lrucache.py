@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+
+'''
+Copyright 2015 Ivan Sadikov
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+
+# import libs
+import threading
+from collections import OrderedDict
+from types import IntType
+# import classes
+import analytics.utils.misc as misc
+
+
+class LRUCache(object):
+    """
+        LRUCache class is a thread-safe least recently used cache. Cache is
+        bounded by number of entries and, optionally, by total weight of
+        values, e.g. size of the value in bytes. Least recently used entries
+        are evicted first. Keeps statistics of hits, misses and evictions.
+
+        Attributes:
+            _maxsize (int): maximum number of entries
+            _maxweight (int): maximum total weight of values, None if unbound
+            _weigher (func): function to compute weight of the value
+            _map (OrderedDict<obj, obj>): entries in order of usage
+            _weights (dict<obj, int>): weight of each entry
+            _weight (int): current total weight
+            _lock (Lock): lock to guard cache
+            _hits (int): number of hits
+            _misses (int): number of misses
+            _evictions (int): number of evicted entries
+    """
+    def __init__(self, maxsize=128, maxweight=None, weigher=None):
+        misc.checkTypeAgainst(type(maxsize), IntType, __file__)
+        if maxsize <= 0:
+            misc.raiseValueError("Cache size must be positive", __file__)
+        self._maxsize = maxsize
+        self._maxweight = maxweight
+        self._weigher = weigher or (lambda value: 1)
+        self._lock = threading.Lock()
+        self.clear()
+
+    # [Public]
+    def clear(self):
+        """
+            Removes all entries from cache and resets statistics.
+        """
+        self._map = OrderedDict()
+        self._weights = {}
+        self._weight = 0
+        self._hits = 0; self._misses = 0; self._evictions = 0
+
+    # [Public]
+    def get(self, key, default=None):
+        """
+            Returns value for the key and marks entry as recently used. If
+            there is no such key, returns default.
+
+            Args:
+                key (obj): hashable key
+                default (obj): default value if nothing is found
+
+            Returns:
+                obj: cached value or default
+        """
+        with self._lock:
+            if key not in self._map:
+                self._misses += 1
+                return default
+            value = self._map.pop(key)
+            self._map[key] = value
+            self._hits += 1
+            return value
+
+    # [Public]
+    def peek(self, key, default=None):
+        """
+            Returns value for the key without marking entry as recently used
+            and without counting hit or miss, e.g. to inspect cache.
+
+            Args:
+                key (obj): hashable key
+                default (obj): default value if nothing is found
+
+            Returns:
+                obj: cached value or default
+        """
+        with self._lock:
+            return self._map.get(key, default)
+
+    # [Public]
+    def put(self, key, value):
+        """
+            Adds or replaces value for the key and evicts least recently used
+            entries, if cache exceeds its bounds. Value that is heavier than
+            maximum weight is not cached.
+
+            Args:
+                key (obj): hashable key
+                value (obj): value to cache
+        """
+        weight = self._weigher(value)
+        with self._lock:
+            if key in self._map:
+                self._discard(key)
+            if self._maxweight is not None and weight > self._maxweight:
+                return
+            self._map[key] = value
+            self._weights[key] = weight
+            self._weight += weight
+            while len(self._map) > self._maxsize or (
+                    self._maxweight is not None and
+                    self._weight > self._maxweight):
+                oldest = next(iter(self._map))
+                self._discard(oldest)
+                self._evictions += 1
+
+    # [Public]
+    def remove(self, key):
+        """
+            Removes entry for the key, if it exists.
+
+            Args:
+                key (obj): hashable key
+        """
+        with self._lock:
+            if key in self._map:
+                self._discard(key)
+
+    # [Public]
+    def size(self):
+        """
+            Returns number of entries in cache.
+
+            Returns:
+                int: number of entries
+        """
+        return len(self._map)
+
+    # [Public]
+    def keys(self):
+        """
+            Returns keys of cached entries, least recently used first. Usage
+            order is not changed.
+
+            Returns:
+                list<obj>: list of keys
+        """
+        with self._lock:
+            return list(self._map.keys())
+
+    # [Public]
+    def stats(self):
+        """
+            Returns statistics of the cache.
+
+            Returns:
+                dict<str, int>: hits, misses, evictions, size and weight
+        """
+        with self._lock:
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "size": len(self._map),
+                "weight": self._weight
+            }
+
+    # [Private]
+    def _discard(self, key):
+        """
+            Removes entry without locking, lock must be held by caller.
+
+            Args:
+                key (obj): hashable key
+        """
+        del self._map[key]
+        self._weight -= self._weights.pop(key)
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+
+'''
+Copyright 2015 Ivan Sadikov
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+
+# import libs
+import os
+
+"""
+    Memory usage of processes from "/proc/<pid>/smaps". Pages of forked
+    processes are shared with parent until either of them writes to the page,
+    so memory of process is split into shared and unique (private) part, and
+    proportional set size (PSS) counts every shared page divided by number of
+    processes sharing it. Usage is not available, when there is no "/proc",
+    e.g. on App Engine or macOS.
+"""
+
+# fields of smaps that are summed, in kB
+_FIELDS = {
+    "Rss": "rss",
+    "Pss": "pss",
+    "Shared_Clean": "shared",
+    "Shared_Dirty": "shared",
+    "Private_Clean": "unique",
+    "Private_Dirty": "unique",
+    "Swap": "swap"
+}
+
+
+# [Public]
+def parseSmaps(lines):
+    """
+        Sums memory fields of all mappings in smaps lines. Works with both
+        "smaps" and "smaps_rollup" files.
+
+        Args:
+            lines (iterator<str>): lines of smaps file
+
+        Returns:
+            dict<str, int>: rss, pss, shared, unique and swap memory in kB
+    """
+    usage = dict((x, 0) for x in set(_FIELDS.values()))
+    for line in lines:
+        parts = line.split()
+        if len(parts) < 2 or not parts[0].endswith(":"):
+            continue
+        key = _FIELDS.get(parts[0][:-1])
+        if key is not None and parts[1].isdigit():
+            usage[key] += int(parts[1])
+    return usage
+
+
+# [Public]
+def memoryUsage(pid=None):
+    """
+        Returns memory usage of process, or None, if it is not available.
+        Summary "smaps_rollup" is read, where kernel provides it, as it is
+        much faster than summing all mappings.
+
+        Args:
+            pid (int): process id, current process if None
+
+        Returns:
+            dict<str, int>: rss, pss, shared, unique and swap memory in kB
+    """
+    pid = os.getpid() if pid is None else pid
+    for name in ["smaps_rollup", "smaps"]:
+        try:
+            with open("/proc/%d/%s" % (pid, name)) as f:
+                return parseSmaps(f)
+        except (IOError, OSError):
+            continue
+    return None
+
+
+# [Public]
+def memoryReport(pids):
+    """
+        Returns memory usage of each process. Processes that finished or
+        cannot be read have usage None.
+
+        Args:
+            pids (list<int>): process ids
+
+        Returns:
+            dict<int, dict>: memory usage by process id
+    """
+    return dict((pid, memoryUsage(pid)) for pid in pids)
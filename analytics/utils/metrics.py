@@ -0,0 +1,435 @@
+#!/usr/bin/env python
+
+'''
+Copyright 2015 Ivan Sadikov
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+
+# import libs
+import bisect
+import re
+import threading
+from types import StringType, ListType
+# import classes
+import analytics.utils.misc as misc
+
+"""
+    In-process metrics: counters, gauges and histograms with fixed buckets,
+    exposed in Prometheus text format. Each metric has its own lock, that
+    is held only to update a few numbers, so metrics can be updated from
+    request threads. Values of labelled metrics are kept for every tuple of
+    label values. Counters and gauges can take values from function, that
+    is called, when metrics are exposed, e.g. to report sizes of caches.
+"""
+
+# content type of exposition format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# default buckets of histograms in seconds
+DEFAULT_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+    10.0]
+# valid metric and label names
+_NAME = re.compile(r"^[a-zA-Z_:][a-zA-Z0-9_:]*$")
+
+
+# [Private]
+def _formatValue(value):
+    """
+        Returns value in exposition format.
+
+        Args:
+            value (int|float): value
+
+        Returns:
+            str: formatted value
+    """
+    if value == float("inf"):
+        return "+Inf"
+    elif value == float("-inf"):
+        return "-Inf"
+    elif value != value:
+        return "NaN"
+    elif type(value) is float:
+        return repr(value)
+    return str(value)
+
+
+# [Private]
+def _formatLabels(names, values):
+    """
+        Returns labels in exposition format, empty string, if there are no
+        labels. Backslash, double quote and new line are escaped.
+
+        Args:
+            names (list<str>): label names
+            values (tuple<str>): label values
+
+        Returns:
+            str: formatted labels
+    """
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace("\\", "\\\\").replace("\"", "\\\"")
+        pairs.append("%s=\"%s\"" % (name, value.replace("\n", "\\n")))
+    return "{%s}" % (",".join(pairs))
+
+
+class Metric(object):
+    """
+        Metric class is a base class of metrics, it keeps name, help, label
+        names and lock.
+
+        Attributes:
+            _name (str): metric name
+            _help (str): description of metric
+            _labelnames (list<str>): label names
+            _lock (Lock): lock of values
+            _values (dict<tuple, obj>): values by tuple of label values
+            _func (func): function that returns values, or None
+    """
+    TYPE = "untyped"
+
+    def __init__(self, name, help, labelnames=None):
+        misc.checkTypeAgainst(type(name), StringType, __file__)
+        misc.checkTypeAgainst(type(help), StringType, __file__)
+        labelnames = list(labelnames or [])
+        for label in [name] + labelnames:
+            if not _NAME.match(label):
+                misc.raiseValueError("Invalid name %s" % (label), __file__)
+        self._name = name
+        self._help = help
+        self._labelnames = labelnames
+        self._lock = threading.Lock()
+        self._values = {}
+        self._func = None
+
+    # [Private]
+    def _key(self, labels):
+        labels = tuple([str(x) for x in labels])
+        if len(labels) != len(self._labelnames):
+            misc.raiseValueError("Expected %d label values for %s" %
+                (len(self._labelnames), self._name), __file__)
+        return labels
+
+    # [Public]
+    def name(self):
+        return self._name
+
+    # [Public]
+    def setFunction(self, func):
+        """
+            Sets function that returns values of metric, when it is exposed,
+            values that were set directly are ignored then.
+
+            Args:
+                func (func): function without arguments, it returns dict of
+                    tuple of label values and value
+        """
+        self._func = func
+
+    # [Public]
+    def value(self, labels=()):
+        """
+            Returns current value for label values, or None.
+
+            Args:
+                labels (tuple<str>): label values
+
+            Returns:
+                obj: value of metric
+        """
+        key = self._key(labels)
+        with self._lock:
+            return self._values.get(key)
+
+    # [Private]
+    def _snapshot(self):
+        if self._func is not None:
+            return dict((self._key(x), y) for x, y in self._func().items())
+        with self._lock:
+            return dict(self._values)
+
+    # [Public]
+    def samples(self):
+        """
+            Returns samples of metric in exposition format.
+
+            Returns:
+                list<str>: lines with name, labels and value
+        """
+        values = self._snapshot()
+        return ["%s%s %s" % (self._name, _formatLabels(self._labelnames, x),
+            _formatValue(values[x])) for x in sorted(values.keys())]
+
+    # [Public]
+    def exposition(self):
+        """
+            Returns metric in exposition format, with help and type.
+
+            Returns:
+                str: metric lines
+        """
+        lines = ["# HELP %s %s" % (self._name, self._help.replace("\\",
+            "\\\\").replace("\n", "\\n")), "# TYPE %s %s" % (self._name,
+            self.TYPE)]
+        return "\n".join(lines + self.samples())
+
+
+class Counter(Metric):
+    """
+        Counter class is a metric, that only increases.
+    """
+    TYPE = "counter"
+
+    # [Public]
+    def inc(self, amount=1, labels=()):
+        """
+            Increases counter.
+
+            Args:
+                amount (int|float): non-negative amount
+                labels (tuple<str>): label values
+        """
+        if amount < 0:
+            misc.raiseValueError("Counter cannot decrease", __file__)
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """
+        Gauge class is a metric, that can be set to any value.
+    """
+    TYPE = "gauge"
+
+    # [Public]
+    def set(self, value, labels=()):
+        """
+            Sets gauge to value.
+
+            Args:
+                value (int|float): value
+                labels (tuple<str>): label values
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    # [Public]
+    def inc(self, amount=1, labels=()):
+        """
+            Increases gauge, decreases it, if amount is negative.
+
+            Args:
+                amount (int|float): amount
+                labels (tuple<str>): label values
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Histogram(Metric):
+    """
+        Histogram class counts observations in buckets with fixed upper
+        bounds, and keeps sum and count of observations.
+
+        Attributes:
+            _buckets (list<float>): sorted upper bounds of buckets
+    """
+    TYPE = "histogram"
+
+    def __init__(self, name, help, labelnames=None, buckets=None):
+        super(Histogram, self).__init__(name, help, labelnames)
+        if "le" in self._labelnames:
+            misc.raiseValueError("Label le is reserved", __file__)
+        buckets = sorted(buckets or DEFAULT_BUCKETS)
+        if buckets[-1] == float("inf"):
+            buckets = buckets[:-1]
+        self._buckets = buckets
+
+    # [Public]
+    def setFunction(self, func):
+        misc.raiseStandardError("Histogram cannot take values from function",
+            __file__)
+
+    # [Public]
+    def observe(self, value, labels=()):
+        """
+            Adds observation.
+
+            Args:
+                value (int|float): observed value
+                labels (tuple<str>): label values
+        """
+        key = self._key(labels)
+        index = bisect.bisect_left(self._buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = [[0] * (len(self._buckets) + 1), 0.0, 0]
+                self._values[key] = entry
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    # [Public]
+    def value(self, labels=()):
+        """
+            Returns counts of buckets, sum and count of observations for label
+            values, or None.
+
+            Args:
+                labels (tuple<str>): label values
+
+            Returns:
+                dict<str, obj>: non-cumulative counts of buckets, sum and
+                    count
+        """
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                return None
+            return {"buckets": list(entry[0]), "sum": entry[1],
+                "count": entry[2]}
+
+    # [Public]
+    def samples(self):
+        with self._lock:
+            values = dict((x, (list(y[0]), y[1], y[2])) for x, y in
+                self._values.items())
+        names = self._labelnames + ["le"]
+        bounds = [_formatValue(float(x)) for x in self._buckets] + ["+Inf"]
+        lines = []
+        for key in sorted(values.keys()):
+            counts, total, count = values[key]
+            cumulative = 0
+            for bound, bucket in zip(bounds, counts):
+                cumulative += bucket
+                lines.append("%s_bucket%s %d" % (self._name,
+                    _formatLabels(names, key + (bound,)), cumulative))
+            labels = _formatLabels(self._labelnames, key)
+            lines.append("%s_sum%s %s" % (self._name, labels,
+                _formatValue(total)))
+            lines.append("%s_count%s %d" % (self._name, labels, count))
+        return lines
+
+
+class Registry(object):
+    """
+        Registry class keeps metrics by name and exposes them. Metric that
+        is registered again with the same type is returned, so modules can
+        declare metrics they update.
+
+        Attributes:
+            _lock (Lock): lock of metrics map
+            _metrics (dict<str, Metric>): metrics by name
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    # [Private]
+    def _register(self, cls, name, *args):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = cls(name, *args)
+                self._metrics[name] = metric
+            elif type(metric) is not cls:
+                misc.raiseValueError("Metric %s is already registered as %s"
+                    % (name, metric.TYPE), __file__)
+            return metric
+
+    # [Public]
+    def counter(self, name, help, labelnames=None):
+        """
+            Returns counter with name, registers it, if it does not exist.
+
+            Args:
+                name (str): metric name
+                help (str): description of metric
+                labelnames (list<str>): label names
+
+            Returns:
+                Counter: counter
+        """
+        return self._register(Counter, name, help, labelnames)
+
+    # [Public]
+    def gauge(self, name, help, labelnames=None):
+        """
+            Returns gauge with name, registers it, if it does not exist.
+
+            Args:
+                name (str): metric name
+                help (str): description of metric
+                labelnames (list<str>): label names
+
+            Returns:
+                Gauge: gauge
+        """
+        return self._register(Gauge, name, help, labelnames)
+
+    # [Public]
+    def histogram(self, name, help, labelnames=None, buckets=None):
+        """
+            Returns histogram with name, registers it, if it does not exist.
+
+            Args:
+                name (str): metric name
+                help (str): description of metric
+                labelnames (list<str>): label names
+                buckets (list<float>): upper bounds of buckets
+
+            Returns:
+                Histogram: histogram
+        """
+        if buckets is not None:
+            misc.checkTypeAgainst(type(buckets), ListType, __file__)
+        return self._register(Histogram, name, help, labelnames, buckets)
+
+    # [Public]
+    def get(self, name):
+        """
+            Returns metric by name, or None.
+
+            Args:
+                name (str): metric name
+
+            Returns:
+                Metric: metric
+        """
+        with self._lock:
+            return self._metrics.get(name)
+
+    # [Public]
+    def exposition(self):
+        """
+            Returns all metrics in Prometheus text format, sorted by name.
+
+            Returns:
+                str: exposition text
+        """
+        with self._lock:
+            metrics = [self._metrics[x] for x in sorted(self._metrics.keys())]
+        return "".join([x.exposition() + "\n" for x in metrics])
+
+
+# registry of the process
+REGISTRY = Registry()
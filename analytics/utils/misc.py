@@ -115,6 +115,34 @@ def raiseValueError(message, source, convertPath=True):
     line = inspect.currentframe().f_back.f_lineno
     raise ex.AnalyticsValueError(message, source, line)
 
+# [Public]
+def raiseOverloadError(message, source, convertPath=True):
+    """
+        Raises overload error with message.
+
+        Args:
+            message (str): error message
+            source (str): file name/path where error happened
+    """
+    if convertPath:
+        source = getModuleNameAndSuffix(source)
+    line = inspect.currentframe().f_back.f_lineno
+    raise ex.AnalyticsOverloadError(message, source, line)
+
+# [Public]
+def raiseTimeoutError(message, source, convertPath=True):
+    """
+        Raises timeout error with message.
+
+        Args:
+            message (str): error message
+            source (str): file name/path where error happened
+    """
+    if convertPath:
+        source = getModuleNameAndSuffix(source)
+    line = inspect.currentframe().f_back.f_lineno
+    raise ex.AnalyticsTimeoutError(message, source, line)
+
 # [Public]
 def raiseTypeError(message, source, convertPath=True):
     """
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+
+'''
+Copyright 2015 Ivan Sadikov
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+
+# import libs
+import cProfile
+import os
+import pstats
+from types import IntType
+# import classes
+import analytics.utils.misc as misc
+
+"""
+    Profiling of a single call with cProfile. Report lists functions with
+    the largest cumulative time, and profile can be saved as .pstats file
+    for tools like snakeviz or flameprof. Only calling thread is profiled,
+    work done in other threads or forked processes is seen as time spent
+    waiting for it.
+"""
+
+# default number of functions in report
+TOP_FUNCTIONS = 30
+
+
+# [Public]
+def profileCall(func, top=TOP_FUNCTIONS, path=None):
+    """
+        Calls function under profiler and returns its value and report.
+        Profile is saved to "path", if it is provided, directory is created,
+        if it does not exist. Failure to save profile does not fail call,
+        file of report is None then. Exception of the function is raised
+        after profiler is stopped.
+
+        Args:
+            func (func): function without arguments
+            top (int): number of functions in report
+            path (str): path of .pstats file, or None
+
+        Returns:
+            tuple<obj, dict<str, obj>>: value of the function and report with
+                total time in seconds, number of calls, top functions by
+                cumulative time, and path of saved profile
+    """
+    misc.checkTypeAgainst(type(top), IntType, __file__)
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        value = func()
+    finally:
+        profiler.disable()
+    stats = pstats.Stats(profiler)
+    report = {
+        "total": round(stats.total_tt, 6),
+        "calls": stats.total_calls,
+        "functions": topFunctions(stats, top),
+        "file": None
+    }
+    if path:
+        try:
+            directory = os.path.dirname(path)
+            if directory and not os.path.isdir(directory):
+                os.makedirs(directory)
+            stats.dump_stats(path)
+            report["file"] = path
+        except (IOError, OSError):
+            report["file"] = None
+    return value, report
+
+
+# [Public]
+def rotateProfiles(directory, keep):
+    """
+        Removes the oldest .pstats files of directory, so at most "keep" of
+        them are left. Files that cannot be removed are skipped, e.g. when
+        they are removed concurrently.
+
+        Args:
+            directory (str): directory with profiles
+            keep (int): maximum number of profiles to keep
+
+        Returns:
+            list<str>: paths of removed files
+    """
+    misc.checkTypeAgainst(type(keep), IntType, __file__)
+    try:
+        paths = [os.path.join(directory, x) for x in os.listdir(directory)
+            if x.endswith(".pstats")]
+    except OSError:
+        return []
+    def mtime(path):
+        try:
+            return os.path.getmtime(path)
+        except OSError:
+            return 0
+    paths.sort(key=lambda x: (mtime(x), x))
+    removed = []
+    for path in paths[:max(len(paths) - max(keep, 0), 0)]:
+        try:
+            os.remove(path)
+            removed.append(path)
+        except OSError:
+            pass
+    return removed
+
+
+# [Public]
+def topFunctions(stats, top=TOP_FUNCTIONS):
+    """
+        Returns functions with the largest cumulative time.
+
+        Args:
+            stats (Stats): profile statistics
+            top (int): number of functions
+
+        Returns:
+            list<dict<str, obj>>: function as "file:line(name)", number of
+                calls and primitive calls, own and cumulative time in seconds
+    """
+    entries = sorted(stats.stats.items(), key=lambda x: x[1][3], reverse=True)
+    return [{
+        "function": pstats.func_std_string(func),
+        "calls": value[1],
+        "primitive": value[0],
+        "tottime": round(value[2], 6),
+        "cumtime": round(value[3], 6)
+    } for func, value in entries[:max(top, 0)]]
@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+
+'''
+Copyright 2015 Ivan Sadikov
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+
+# import libs
+import math
+from types import IntType, FloatType
+# import classes
+import analytics.utils.misc as misc
+
+"""
+    Quantile sketch is a merging t-digest: values are summarised by small
+    number of centroids (mean and weight), that are small near both tails and
+    large in the middle. Scale function k(q) = c / (2*pi) * asin(2q - 1) is
+    used, adjacent centroids are merged, while they span at most one unit of
+    k, so sketch has about c/2 centroids, and centroid at quantile q holds
+    at most about 2*pi*N*sqrt(q*(1-q)) / c of N values. Two sketches are
+    merged by compressing their centroids together, so sketch can be built
+    in parts and combined.
+"""
+
+# default compression, sketch has about half as many centroids
+COMPRESSION = 100
+# values are buffered and compressed, when buffer is this many times larger
+# than compression
+BUFFER_FACTOR = 5
+
+
+class QuantileSketch(object):
+    """
+        QuantileSketch class keeps centroids of numeric values. Minimum and
+        maximum are exact. Instance is not thread-safe, but reading methods
+        do not change sketch, once it is compressed.
+
+        Attributes:
+            _compression (int): compression, twice the number of centroids
+            _means (list<float>): means of centroids in increasing order
+            _weights (list<float>): weights of centroids
+            _buffer (list<tuple>): values and weights not compressed yet
+            _total (float): total weight of all values
+            _min (float): minimum value, None if sketch is empty
+            _max (float): maximum value, None if sketch is empty
+    """
+    def __init__(self, compression=COMPRESSION):
+        misc.checkTypeAgainst(type(compression), IntType, __file__)
+        if compression < 2:
+            misc.raiseValueError("Compression must be at least 2", __file__)
+        self._compression = compression
+        self._means = []
+        self._weights = []
+        self._buffer = []
+        self._total = 0.0
+        self._min = None
+        self._max = None
+
+    # [Public]
+    def add(self, value, weight=1):
+        """
+            Adds value with weight, that is number of occurrences.
+
+            Args:
+                value (int|float): value to add
+                weight (int|float): weight of the value
+        """
+        if type(value) not in [IntType, FloatType]:
+            misc.raiseValueError("Sketch accepts only numbers", __file__)
+        if weight <= 0:
+            return
+        self._buffer.append((value, weight))
+        self._update(value, value, weight)
+        if len(self._buffer) >= BUFFER_FACTOR * self._compression:
+            self.compress()
+
+    # [Public]
+    def merge(self, other):
+        """
+            Merges centroids of other sketch into this one. Other sketch is
+            not changed.
+
+            Args:
+                other (QuantileSketch): sketch to merge
+        """
+        misc.checkTypeAgainst(type(other), QuantileSketch, __file__)
+        if other._total <= 0:
+            return
+        self._buffer.extend(zip(other._means, other._weights))
+        self._buffer.extend(other._buffer)
+        self._update(other._min, other._max, other._total)
+        self.compress()
+
+    # [Public]
+    def compress(self):
+        """
+            Compresses buffered values and centroids into new centroids with
+            one pass over sorted centroids.
+        """
+        if not self._buffer:
+            return
+        items = sorted(zip(self._means, self._weights) + self._buffer)
+        means = []; weights = []; sofar = 0.0
+        mean, weight = items[0]
+        limit = self._qlimit(0.0)
+        for _mean, _weight in items[1:]:
+            if (sofar + weight + _weight) / self._total <= limit:
+                weight += _weight
+                mean += (_mean - mean) * _weight / weight
+            else:
+                means.append(mean); weights.append(weight)
+                sofar += weight
+                limit = self._qlimit(sofar / self._total)
+                mean, weight = _mean, _weight
+        means.append(mean); weights.append(weight)
+        self._means = means
+        self._weights = weights
+        self._buffer = []
+
+    # [Public]
+    def centroids(self):
+        """
+            Returns centroids as pairs of mean and weight in increasing order
+            of means. Buffered values are compressed first.
+
+            Returns:
+                list<tuple<float, float>>: centroids
+        """
+        self.compress()
+        return zip(self._means, self._weights)
+
+    # [Public]
+    def total(self):
+        """
+            Returns total weight of values.
+
+            Returns:
+                float: total weight
+        """
+        return self._total
+
+    # [Public]
+    def min(self):
+        """
+            Returns exact minimum value, None, if sketch is empty.
+
+            Returns:
+                int|float: minimum value
+        """
+        return self._min
+
+    # [Public]
+    def max(self):
+        """
+            Returns exact maximum value, None, if sketch is empty.
+
+            Returns:
+                int|float: maximum value
+        """
+        return self._max
+
+    # [Public]
+    def quantile(self, q):
+        """
+            Returns estimate of value at quantile q, interpolating between
+            centroids. Returns None, if sketch is empty.
+
+            Args:
+                q (float): quantile in range [0, 1]
+
+            Returns:
+                float: value at quantile
+        """
+        if q < 0 or q > 1:
+            misc.raiseValueError("Quantile must be in range [0, 1]", __file__)
+        self.compress()
+        if self._total <= 0:
+            return None
+        # centroid weight is centered on its mean, tails go to exact min/max
+        target = q * self._total; sofar = 0.0
+        prevmean = self._min; prevpos = 0.0
+        for _i in range(len(self._means)):
+            pos = sofar + self._weights[_i] / 2.0
+            if target <= pos:
+                if pos <= prevpos:
+                    return self._means[_i]
+                ratio = (target - prevpos) / (pos - prevpos)
+                return prevmean + (self._means[_i] - prevmean) * ratio
+            prevmean = self._means[_i]; prevpos = pos
+            sofar += self._weights[_i]
+        if self._total <= prevpos:
+            return self._max
+        ratio = (target - prevpos) / (self._total - prevpos)
+        return prevmean + (self._max - prevmean) * ratio
+
+    # [Private]
+    def _update(self, minvalue, maxvalue, weight):
+        """
+            Updates total weight and exact bounds.
+
+            Args:
+                minvalue (int|float): minimum of added values
+                maxvalue (int|float): maximum of added values
+                weight (int|float): weight of added values
+        """
+        self._total += weight
+        if self._min is None or minvalue < self._min:
+            self._min = minvalue
+        if self._max is None or maxvalue > self._max:
+            self._max = maxvalue
+
+    # [Private]
+    def _qlimit(self, q):
+        """
+            Returns largest quantile that centroid starting at quantile q can
+            reach, that is q(k(q) + 1) of scale function.
+
+            Args:
+                q (float): quantile where centroid starts
+
+            Returns:
+                float: quantile limit of the centroid
+        """
+        q = min(max(q, 0.0), 1.0)
+        k = self._compression / (2 * math.pi) * math.asin(2 * q - 1) + 1
+        if k >= self._compression / 4.0:
+            return 1.0
+        return (math.sin(k * 2 * math.pi / self._compression) + 1) / 2.0
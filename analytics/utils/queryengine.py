@@ -20,7 +20,6 @@ limitations under the License.
 # import libs
 from types import StringType, ListType, DictType, TupleType
 import re
-from urllib import quote, unquote
 # import classes
 import analytics.utils.misc as misc
 
@@ -112,6 +111,8 @@ def decode(text=""):
     """
     if type(text) is not StringType or len(text) == 0:
         return text
+    # urllib is imported on use, as it pulls socket and ssl modules
+    from urllib import unquote
     return str(unquote(text).decode('utf8'))
 
 def encode(text=""):
@@ -126,6 +127,7 @@ def encode(text=""):
     """
     if type(text) is not StringType or len(text) == 0:
         return text
+    from urllib import quote
     return quote(text).encode('utf8')
 
 ###########################################################
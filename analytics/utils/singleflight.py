@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+
+'''
+Copyright 2015 Ivan Sadikov
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+
+# import libs
+import threading
+
+"""
+    Single-flight execution: concurrent calls with the same key share one
+    execution. The first caller runs function, callers that arrive while it
+    runs wait for it and get the same value, or the same exception. Calls
+    that arrive after it finished run function again, results are not
+    cached.
+"""
+
+
+class _Call(object):
+    """
+        _Call class keeps execution in flight.
+
+        Attributes:
+            _done (Event): set, when execution finishes
+            _value (obj): value of the function
+            _error (BaseException): exception raised by the function, or None
+            _waiters (int): number of callers that wait for execution
+    """
+    def __init__(self):
+        self._done = threading.Event()
+        self._value = None
+        self._error = None
+        self._waiters = 0
+
+
+class SingleFlight(object):
+    """
+        SingleFlight class coalesces concurrent calls with the same key.
+
+        Attributes:
+            _lock (Lock): lock of calls and statistics
+            _calls (dict<obj, _Call>): executions in flight by key
+            _executions (int): number of executions
+            _coalesced (int): number of calls that shared execution
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._executions = 0
+        self._coalesced = 0
+
+    # [Public]
+    def do(self, key, func):
+        """
+            Returns value of function, runs it, unless execution with the
+            same key is in flight, otherwise waits for that execution.
+
+            Args:
+                key (obj): hashable key of the call
+                func (func): function without arguments
+
+            Returns:
+                obj: value of the function
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self._executions += 1
+            else:
+                call._waiters += 1
+                self._coalesced += 1
+        if not leader:
+            call._done.wait()
+            if call._error is not None:
+                raise call._error
+            return call._value
+        try:
+            call._value = func()
+        except BaseException as e:
+            call._error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call._done.set()
+        return call._value
+
+    # [Public]
+    def stats(self):
+        """
+            Returns statistics of calls.
+
+            Returns:
+                dict<str, int>: number of executions, coalesced calls, and
+                    executions and waiting callers in flight
+        """
+        with self._lock:
+            return {
+                "executions": self._executions,
+                "coalesced": self._coalesced,
+                "inflight": len(self._calls),
+                "waiting": sum([x._waiters for x in self._calls.values()])
+            }
@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+
+'''
+Copyright 2015 Ivan Sadikov
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+
+# import libs
+import bisect
+import itertools
+from collections import Counter
+# import classes
+from analytics.utils.quantilesketch import QuantileSketch
+
+# tokens of SortedValues contents, every change gets a new token
+_tokens = itertools.count(1)
+# number of distinct values, from which sketch is worth building instead of
+# ranking every value
+SKETCH_MIN_SIZE = 1000
+
+
+class SortedValues(object):
+    """
+        SortedValues class keeps sorted array of distinct values and number
+        of occurrences of each value, so values can be added and removed one
+        by one with binary search instead of sorting the whole array again.
+        Sum of adjacent gaps of sorted array is difference of the last and
+        the first value, so mean gap is known without scanning array.
+        Instance is not thread-safe, shared instance must not be changed, use
+        copy instead.
+
+        Attributes:
+            _values (list<obj>): distinct values in increasing order
+            _counts (dict<obj, int>): number of occurrences of each value
+            _total (int): total number of occurrences
+            _token (int): token of the contents, changes with every change
+            _sketch (QuantileSketch): sketch of the contents, None if it is
+                not built yet or contents changed
+    """
+    def __init__(self, values=None):
+        self._counts = Counter(values or [])
+        self._values = sorted(self._counts.keys())
+        self._total = sum(self._counts.values())
+        self._token = next(_tokens)
+        self._sketch = None
+
+    # [Public]
+    def add(self, value, count=1):
+        """
+            Adds value "count" times.
+
+            Args:
+                value (obj): value to add
+                count (int): number of occurrences
+        """
+        if count <= 0:
+            return
+        if value not in self._counts:
+            bisect.insort_left(self._values, value)
+        self._counts[value] += count
+        self._total += count
+        self._token = next(_tokens)
+        self._sketch = None
+
+    # [Public]
+    def remove(self, value, count=1):
+        """
+            Removes value "count" times. Value is removed from array, when
+            no occurrences are left.
+
+            Args:
+                value (obj): value to remove
+                count (int): number of occurrences
+        """
+        if count <= 0 or value not in self._counts:
+            return
+        count = min(count, self._counts[value])
+        self._counts[value] -= count
+        self._total -= count
+        if self._counts[value] <= 0:
+            del self._counts[value]
+            del self._values[bisect.bisect_left(self._values, value)]
+        self._token = next(_tokens)
+        self._sketch = None
+
+    # [Public]
+    def index(self, value):
+        """
+            Returns index of value in sorted array, or -1, if there is no
+            such value.
+
+            Args:
+                value (obj): value to search
+
+            Returns:
+                int: index of the value
+        """
+        _i = bisect.bisect_left(self._values, value)
+        if _i < len(self._values) and self._values[_i] == value:
+            return _i
+        return -1
+
+    # [Public]
+    def values(self):
+        """
+            Returns sorted array of distinct values. Array is not copied and
+            must not be changed.
+
+            Returns:
+                list<obj>: distinct values in increasing order
+        """
+        return self._values
+
+    # [Public]
+    def size(self):
+        """
+            Returns number of distinct values.
+
+            Returns:
+                int: number of distinct values
+        """
+        return len(self._values)
+
+    # [Public]
+    def total(self):
+        """
+            Returns total number of occurrences of all values.
+
+            Returns:
+                int: number of occurrences
+        """
+        return self._total
+
+    # [Public]
+    def count(self, value):
+        """
+            Returns number of occurrences of value.
+
+            Args:
+                value (obj): value
+
+            Returns:
+                int: number of occurrences
+        """
+        return self._counts.get(value, 0)
+
+    # [Public]
+    def token(self):
+        """
+            Returns token of the contents. Instances have different tokens,
+            unless one is a copy of another without changes, so token can be
+            used as a cache key instead of values.
+
+            Returns:
+                int: token of the contents
+        """
+        return self._token
+
+    # [Public]
+    def meanGap(self):
+        """
+            Returns mean gap between adjacent values, 1.0, if there are less
+            than 2 values. Sum of gaps telescopes to difference of the last
+            and the first value.
+
+            Returns:
+                float: mean gap between adjacent values
+        """
+        n = len(self._values)
+        if n < 2:
+            return 1.0
+        return (self._values[-1] - self._values[0]) * 1.0 / (n - 1)
+
+    # [Public]
+    def sketch(self):
+        """
+            Returns quantile sketch of values weighted by number of
+            occurrences. Sketch is built once for the contents and is kept
+            until values change, it must not be changed.
+
+            Returns:
+                QuantileSketch: sketch of the values
+        """
+        sketch = self._sketch
+        if sketch is None:
+            sketch = QuantileSketch()
+            for value in self._values:
+                sketch.add(value, self._counts[value])
+            sketch.compress()
+            self._sketch = sketch
+        return sketch
+
+    # [Public]
+    def copy(self):
+        """
+            Returns copy that can be changed independently. Copy has the same
+            token, until it is changed.
+
+            Returns:
+                SortedValues: copy of the instance
+        """
+        clone = SortedValues()
+        clone._values = list(self._values)
+        clone._counts = Counter(self._counts)
+        clone._total = self._total
+        clone._token = self._token
+        clone._sketch = self._sketch
+        return clone
@@ -19,13 +19,46 @@ limitations under the License.
 
 # import libs
 import unittest
+import os
+import sys
+import time
 import inspect
 import uuid
+import json
+import warnings
+import zlib
+import gzip
+from StringIO import StringIO
 from types import DictType, ListType
 # import classes
 import analytics.exceptions.exceptions as c
 import analytics.utils.hqueue as hq
 import analytics.utils.misc as misc
+import analytics.utils.httputils as httputils
+import analytics.utils.diagnostics as diag
+from analytics.utils.lrucache import LRUCache
+import analytics.utils.workers as workers
+import analytics.utils.memory as memory
+import threading
+from analytics.utils.singleflight import SingleFlight
+from analytics.utils.admission import AdmissionController
+import analytics.utils.deadline as dl
+import analytics.utils.timings as tm
+import analytics.utils.profiling as profiling
+import analytics.utils.metrics as metrics
+import pstats
+import shutil
+import tempfile
+from analytics.utils.lazyimport import LazyModule
+from analytics.utils.sortedvalues import SortedValues
+from analytics.utils.quantilesketch import QuantileSketch
+
+# tasks of process pool are pickled, so they are defined at module level
+def _pooledPid(item):
+    return (os.getpid(), item * 2)
+
+def _pooledError(item):
+    misc.raiseValueError("Failed %s" % (str(item)), __file__)
 
 # Superclass for this tests sequence
 class Utils_TestsSequence(unittest.TestCase):
@@ -116,11 +149,751 @@ class misc_TestsSequence(Utils_TestsSequence):
         guid = misc.generateId("test")
         self.assertEqual(uuid.uuid3(uuid.NAMESPACE_DNS, "test").hex, guid)
 
+# httputils tests
+class httputils_TestsSequence(Utils_TestsSequence):
+    def test_httputils_generateETag(self):
+        etag = httputils.generateETag("a", 1, None)
+        self.assertEqual(etag, httputils.generateETag("a", 1, None))
+        self.assertTrue(etag.startswith('"') and etag.endswith('"'))
+        self.assertNotEqual(etag, httputils.generateETag("a", 2, None))
+        self.assertNotEqual(
+            httputils.generateETag("ab", "c"),
+            httputils.generateETag("a", "bc")
+        )
+
+    def test_httputils_matchesETag(self):
+        etag = httputils.generateETag("test")
+        self.assertEqual(httputils.matchesETag(etag, etag), True)
+        self.assertEqual(httputils.matchesETag("*", etag), True)
+        self.assertEqual(httputils.matchesETag("W/" + etag, etag), True)
+        self.assertEqual(
+            httputils.matchesETag('"1", %s, "2"' % (etag), etag),
+            True
+        )
+        self.assertEqual(httputils.matchesETag('"1"', etag), False)
+        self.assertEqual(httputils.matchesETag(None, etag), False)
+        self.assertEqual(httputils.matchesETag(etag, None), False)
+
+    def test_httputils_encodedETag(self):
+        etag = httputils.generateETag("test")
+        self.assertEqual(httputils.encodedETag(etag, "identity"), etag)
+        gz = httputils.encodedETag(etag, "gzip")
+        self.assertEqual(gz, etag[:-1] + '-gzip"')
+        self.assertEqual(httputils.matchesAnyETag(gz, etag), True)
+        self.assertEqual(httputils.matchesAnyETag(etag, etag), True)
+        self.assertEqual(httputils.matchesAnyETag('"1-gzip"', etag), False)
+        self.assertEqual(httputils.matchedEncoding(gz, etag), "gzip")
+        self.assertEqual(httputils.matchedEncoding(etag, etag, "gzip"),
+            "identity")
+        self.assertEqual(httputils.matchedEncoding("*", etag, "deflate"),
+            "deflate")
+        self.assertEqual(httputils.matchedEncoding('"1"', etag), None)
+
+    def test_httputils_negotiateEncoding(self):
+        self.assertEqual(httputils.negotiateEncoding(None), "identity")
+        self.assertEqual(httputils.negotiateEncoding(""), "identity")
+        self.assertEqual(httputils.negotiateEncoding("br"), "identity")
+        self.assertEqual(httputils.negotiateEncoding("gzip, deflate"), "gzip")
+        self.assertEqual(httputils.negotiateEncoding("deflate"), "deflate")
+        self.assertEqual(
+            httputils.negotiateEncoding("gzip;q=0.5, deflate"),
+            "deflate"
+        )
+        self.assertEqual(httputils.negotiateEncoding("gzip;q=0"), "identity")
+        self.assertEqual(httputils.negotiateEncoding("*"), "gzip")
+        self.assertEqual(httputils.negotiateEncoding("*, gzip;q=0"), "deflate")
+
+    def test_httputils_encodeJSON(self):
+        obj = {"elements": [{"id": str(i), "value": i} for i in range(200)]}
+        expected = json.dumps(obj)
+        # identity
+        bodies = httputils.encodeJSON(obj)
+        self.assertEqual(bodies, {"identity": expected})
+        # gzip
+        bodies = httputils.encodeJSON(obj, "gzip")
+        self.assertEqual(bodies["identity"], expected)
+        data = gzip.GzipFile(fileobj=StringIO(bodies["gzip"])).read()
+        self.assertEqual(data, expected)
+        self.assertTrue(len(bodies["gzip"]) < len(expected))
+        # deflate
+        bodies = httputils.encodeJSON(obj, "deflate")
+        self.assertEqual(zlib.decompress(bodies["deflate"]), expected)
+        # small body is not compressed
+        bodies = httputils.encodeJSON({"a": 1}, "gzip")
+        self.assertEqual(bodies, {"identity": json.dumps({"a": 1})})
+        self.assertEqual(
+            httputils.selectBody(bodies, "gzip"),
+            (json.dumps({"a": 1}), "identity")
+        )
+
+    def test_httputils_responseCache(self):
+        cache = httputils.ResponseCache(maxsize=2)
+        obj = {"elements": [{"id": str(i), "value": i} for i in range(200)]}
+        self.assertEqual(cache.getBody("a", "gzip"), None)
+        cache.putBodies("a", httputils.encodeJSON(obj))
+        body, encoding = cache.getBody("a", "identity")
+        self.assertEqual((body, encoding), (json.dumps(obj), "identity"))
+        # compressed body is created once and kept alongside identity
+        body, encoding = cache.getBody("a", "deflate")
+        self.assertEqual(encoding, "deflate")
+        self.assertEqual(zlib.decompress(body), json.dumps(obj))
+        self.assertEqual(
+            sorted(cache.get("a").keys()),
+            ["deflate", "identity"]
+        )
+        self.assertEqual(cache.getBody("a", "deflate"), (body, encoding))
+
+# LRUCache tests
+class LRUCache_TestsSequence(Utils_TestsSequence):
+    def test_lrucache_init(self):
+        with self.assertRaises(c.AnalyticsValueError):
+            LRUCache(0)
+        with self.assertRaises(c.AnalyticsCheckError):
+            LRUCache("1")
+
+    def test_lrucache_getPut(self):
+        cache = LRUCache(2)
+        self.assertEqual(cache.get("a"), None)
+        self.assertEqual(cache.get("a", 1), 1)
+        cache.put("a", 1); cache.put("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        # "b" is least recently used
+        cache.put("c", 3)
+        self.assertEqual(cache.get("b"), None)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.get("c"), 3)
+        stats = cache.stats()
+        self.assertEqual(stats["hits"], 3)
+        self.assertEqual(stats["misses"], 3)
+        self.assertEqual(stats["evictions"], 1)
+        self.assertEqual(stats["size"], 2)
+        # peek does not change order and statistics, "a" is evicted
+        self.assertEqual(cache.peek("a"), 1)
+        self.assertEqual(cache.peek("b", 0), 0)
+        self.assertEqual(cache.stats()["hits"], 3)
+        cache.put("d", 4)
+        self.assertEqual(cache.keys(), ["c", "d"])
+        cache.remove("c")
+        self.assertEqual(cache.size(), 1)
+        cache.clear()
+        self.assertEqual(cache.size(), 0)
+        self.assertEqual(cache.stats()["hits"], 0)
+
+    def test_lrucache_weight(self):
+        cache = LRUCache(10, 5, len)
+        cache.put("a", "123"); cache.put("b", "12")
+        self.assertEqual(cache.stats()["weight"], 5)
+        cache.put("c", "1")
+        self.assertEqual(cache.get("a"), None)
+        self.assertEqual(cache.stats()["weight"], 3)
+        # value heavier than maximum weight is not cached
+        cache.put("d", "123456")
+        self.assertEqual(cache.get("d"), None)
+        cache.put("b", "1")
+        self.assertEqual(cache.stats()["weight"], 2)
+
+# Diagnostics tests
+class Diagnostics_TestsSequence(Utils_TestsSequence):
+    def test_diagnostics_report(self):
+        diagnostics = diag.Diagnostics()
+        self.assertEqual(diagnostics.count(), 0)
+        self.assertEqual(diagnostics.messages(), [])
+        diagnostics.report("a", "message a")
+        diagnostics.report("b", "message b")
+        diagnostics.report("a", "message a")
+        diagnostics.report("a", "message c")
+        self.assertEqual(diagnostics.count(), 4)
+        self.assertEqual(diagnostics.count("a"), 3)
+        self.assertEqual(diagnostics.count("c"), 0)
+        self.assertEqual(diagnostics.codes(), {"a": 3, "b": 1})
+        self.assertEqual(
+            diagnostics.messages(),
+            ["message a", "message b", "message c"]
+        )
+        self.assertEqual(diagnostics.getJSON()[0],
+            {"code": "a", "message": "message a", "count": 2})
+
+    def test_diagnostics_warnings(self):
+        self.assertEqual(diag.orWarnings(None), diag.WARNINGS)
+        diagnostics = diag.Diagnostics()
+        self.assertEqual(diag.orWarnings(diagnostics), diagnostics)
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter("always")
+            diag.WARNINGS.report("a", "message a")
+            self.assertEqual(len(w), 1)
+            self.assertTrue(issubclass(w[0].category, UserWarning))
+            self.assertEqual(str(w[0].message), "message a")
+        self.assertEqual(diag.WARNINGS.count(), 0)
+
+    def test_diagnostics_merge(self):
+        first = diag.Diagnostics(); second = diag.Diagnostics()
+        first.report("a", "message a")
+        second.report("a", "message a"); second.report("a", "message a")
+        second.report("b", "message b")
+        first.merge(second)
+        self.assertEqual(first.codes(), {"a": 3, "b": 1})
+        self.assertEqual(first.messages(), ["message a", "message b"])
+        self.assertEqual(second.count(), 3)
+
+# LazyModule tests
+class LazyModule_TestsSequence(Utils_TestsSequence):
+    def test_lazymodule_load(self):
+        name = "colorsys"
+        if name in sys.modules:
+            del sys.modules[name]
+        module = LazyModule(name)
+        self.assertEqual(module.isLoaded(), False)
+        self.assertEqual(name in sys.modules, False)
+        # attribute access imports module
+        self.assertEqual(module.rgb_to_hsv(0, 0, 0), (0.0, 0.0, 0.0))
+        self.assertEqual(module.isLoaded(), True)
+        self.assertEqual(module.load(), sys.modules[name])
+        with self.assertRaises(AttributeError):
+            module.unknownattribute
+
+    def test_lazymodule_unknown(self):
+        module = LazyModule("analytics.unknown.module")
+        with self.assertRaises(ImportError):
+            module.load()
+
+# Workers tests
+class Workers_TestsSequence(Utils_TestsSequence):
+    def test_workers_runParallel(self):
+        with self.assertRaises(c.AnalyticsCheckError):
+            workers.runParallel(str, None)
+        with self.assertRaises(c.AnalyticsValueError):
+            workers.runParallel(str, [1], 0)
+        def task(x):
+            if x == 3:
+                misc.raiseValueError("Wrong value", __file__)
+            return x * x
+        for maxworkers in [1, 2, 8]:
+            results = workers.runParallel(task, range(6), maxworkers)
+            self.assertEqual(len(results), 6)
+            self.assertEqual(results[3].isSuccess(), False)
+            self.assertEqual(type(results[3].error()), c.AnalyticsValueError)
+            self.assertEqual([x.value() for x in results],
+                [0, 1, 4, None, 16, 25])
+            self.assertTrue(all([x.time() >= 0 for x in results]))
+        self.assertEqual(workers.runParallel(task, []), [])
+
+    def test_workers_mapParallel(self):
+        self.assertEqual(workers.mapParallel(str, [1, 2, 3], 2),
+            ["1", "2", "3"])
+        with self.assertRaises(c.AnalyticsValueError):
+            workers.mapParallel(lambda x: misc.raiseValueError("!", __file__),
+                [1, 2], 2)
+
+    def test_workers_concurrency(self):
+        # tasks that wait overlap, total time is bounded by the slowest
+        start = time.time()
+        workers.mapParallel(lambda x: time.sleep(0.05), range(8), 8)
+        self.assertTrue(time.time() - start < 0.05 * 4)
+
+    def test_workers_mapForked(self):
+        with self.assertRaises(c.AnalyticsValueError):
+            workers.mapForked(str, [1], 0)
+        # closure is inherited by processes, changes of items are not
+        items = [[x] for x in range(6)]
+        offset = 10
+        def task(item):
+            item.append(0)
+            return (os.getpid(), item[0] + offset)
+        for maxworkers in [1, 3]:
+            values = workers.mapForked(task, items, maxworkers)
+            self.assertEqual([x[1] for x in values], range(10, 16))
+        forked = workers.canFork()
+        self.assertEqual([len(x) for x in items], [3] * 6 if not forked
+            else [2] * 6)
+        if forked:
+            self.assertTrue(os.getpid() not in [x[0] for x in values])
+        self.assertEqual(workers._forked, {})
+        with self.assertRaises(c.AnalyticsValueError):
+            workers.mapForked(lambda x: misc.raiseValueError("!", __file__),
+                [1, 2], 2)
+        self.assertEqual(workers._forked, {})
+        # slow processes are terminated
+        if forked:
+            start = time.time()
+            with self.assertRaises(c.AnalyticsTimeoutError):
+                workers.mapForked(lambda x: time.sleep(10), [1, 2], 2, 0.2)
+            self.assertTrue(time.time() - start < 5)
+            self.assertEqual(workers._forked, {})
+
+    def test_workers_mapForkedThreads(self):
+        # items are processed in calling process, while threads are running
+        release = threading.Event()
+        thread = threading.Thread(target=release.wait)
+        thread.start()
+        try:
+            self.assertEqual(workers.canFork(), False)
+            values = workers.mapForked(lambda x: os.getpid(), [1, 2], 2)
+            self.assertEqual(values, [os.getpid()] * 2)
+        finally:
+            release.set()
+            thread.join()
+
+    def test_workers_processPool(self):
+        with self.assertRaises(c.AnalyticsValueError):
+            workers.ProcessPool(0)
+        pool = workers.ProcessPool(2)
+        # items are processed in calling process, until pool is started
+        self.assertEqual(pool.map(_pooledPid, [1, 2]),
+            [(os.getpid(), 2), (os.getpid(), 4)])
+        self.assertEqual(pool.stats(), {"calls": 0, "tasks": 0,
+            "processes": 2, "running": False})
+        forked = pool.start()
+        try:
+            self.assertEqual(pool.start(), forked)
+            values = pool.map(_pooledPid, range(6))
+            self.assertEqual([x[1] for x in values], range(0, 12, 2))
+            with self.assertRaises(c.AnalyticsValueError):
+                pool.map(_pooledError, [1, 2])
+            if forked:
+                self.assertTrue(os.getpid() not in [x[0] for x in values])
+                self.assertEqual(pool.stats(), {"calls": 2, "tasks": 8,
+                    "processes": 2, "running": True})
+                # pool is shared by threads, that are started afterwards
+                results = workers.mapParallel(
+                    lambda x: pool.map(_pooledPid, [x]), range(4), 4)
+                self.assertEqual([x[0][1] for x in results], [0, 2, 4, 6])
+                with self.assertRaises(c.AnalyticsTimeoutError):
+                    pool.map(time.sleep, [1], 0.05)
+        finally:
+            pool.stop()
+        self.assertEqual(pool.isRunning(), False)
+        self.assertEqual(pool.map(_pooledPid, [1]), [(os.getpid(), 2)])
+
+class SortedValues_TestsSequence(Utils_TestsSequence):
+    def test_sortedvalues_init(self):
+        values = SortedValues([3, 1, 2, 3])
+        self.assertEqual(values.values(), [1, 2, 3])
+        self.assertEqual((values.size(), values.total()), (3, 4))
+        self.assertEqual(values.count(3), 2)
+        self.assertEqual(SortedValues().values(), [])
+
+    def test_sortedvalues_addRemove(self):
+        values = SortedValues([5, 1]); token = values.token()
+        values.add(3); values.add(3); values.add(7, 2)
+        self.assertEqual(values.values(), [1, 3, 5, 7])
+        self.assertEqual(values.total(), 6)
+        self.assertNotEqual(values.token(), token)
+        values.remove(3)
+        self.assertEqual(values.values(), [1, 3, 5, 7])
+        values.remove(3); values.remove(7, 5); values.remove(100)
+        self.assertEqual(values.values(), [1, 5])
+        self.assertEqual(values.total(), 2)
+
+    def test_sortedvalues_index(self):
+        values = SortedValues([1.5, -2.0, 8.25])
+        self.assertEqual(values.index(-2.0), 0)
+        self.assertEqual(values.index(8.25), 2)
+        self.assertEqual(values.index(0), -1)
+        self.assertEqual(values.index(100), -1)
+
+    def test_sortedvalues_meanGap(self):
+        self.assertEqual(SortedValues([4]).meanGap(), 1.0)
+        array = [3, 10, -4, 7, 25]
+        values = SortedValues(array)
+        gaps = [abs(x - y) for x, y in zip(values.values()[1:],
+            values.values()[:-1])]
+        self.assertEqual(values.meanGap(), sum(gaps) * 1.0 / len(gaps))
+
+    def test_sortedvalues_copy(self):
+        values = SortedValues([1, 2])
+        clone = values.copy()
+        self.assertEqual(clone.token(), values.token())
+        clone.add(3)
+        self.assertEqual(values.values(), [1, 2])
+        self.assertNotEqual(clone.token(), values.token())
+        self.assertNotEqual(SortedValues([1, 2]).token(), values.token())
+
+    def test_sortedvalues_sketch(self):
+        values = SortedValues([1, 2, 2, 3])
+        sketch = values.sketch()
+        self.assertEqual(sketch.total(), 4)
+        self.assertEqual((sketch.min(), sketch.max()), (1, 3))
+        self.assertTrue(values.sketch() is sketch)
+        clone = values.copy()
+        self.assertTrue(clone.sketch() is sketch)
+        clone.remove(3)
+        self.assertEqual(clone.sketch().max(), 2)
+        self.assertEqual(values.sketch().max(), 3)
+
+class QuantileSketch_TestsSequence(Utils_TestsSequence):
+    def test_quantilesketch_init(self):
+        with self.assertRaises(c.AnalyticsValueError):
+            QuantileSketch(1)
+        with self.assertRaises(c.AnalyticsCheckError):
+            QuantileSketch(10.0)
+        sketch = QuantileSketch()
+        self.assertEqual(sketch.centroids(), [])
+        self.assertEqual(sketch.quantile(0.5), None)
+        with self.assertRaises(c.AnalyticsValueError):
+            sketch.add("1")
+        with self.assertRaises(c.AnalyticsValueError):
+            sketch.quantile(1.5)
+
+    def test_quantilesketch_quantile(self):
+        sketch = QuantileSketch(100)
+        for value in range(10000):
+            sketch.add(value)
+        self.assertTrue(len(sketch.centroids()) <= 100)
+        self.assertEqual(sketch.total(), 10000)
+        self.assertEqual((sketch.min(), sketch.max()), (0, 9999))
+        for q in [0.01, 0.1, 0.5, 0.9, 0.99]:
+            self.assertTrue(abs(sketch.quantile(q) - q * 10000) < 100)
+        self.assertEqual(sketch.quantile(0), 0)
+        self.assertEqual(sketch.quantile(1), 9999)
+
+    def test_quantilesketch_merge(self):
+        whole = QuantileSketch(); left = QuantileSketch()
+        right = QuantileSketch()
+        for value in range(5000):
+            whole.add(value * 2, 3)
+            (left if value % 2 else right).add(value * 2, 3)
+        left.merge(right)
+        self.assertEqual(left.total(), whole.total())
+        self.assertEqual((left.min(), left.max()), (whole.min(), whole.max()))
+        for q in [0.05, 0.25, 0.5, 0.75, 0.95]:
+            self.assertTrue(abs(left.quantile(q) - whole.quantile(q)) < 100)
+        self.assertEqual(right.total(), 7500)
+
+class Memory_TestsSequence(Utils_TestsSequence):
+    def test_memory_parseSmaps(self):
+        lines = [
+            "00400000-0040b000 r-xp 00000000 08:01 1234  /bin/cat",
+            "Rss:                 100 kB",
+            "Pss:                  40 kB",
+            "Shared_Clean:         60 kB",
+            "Shared_Dirty:         20 kB",
+            "Private_Clean:         5 kB",
+            "Private_Dirty:        15 kB",
+            "Swap:                  0 kB",
+            "VmFlags: rd ex mr mw me dw",
+            "Rss:                  10 kB",
+            "Private_Dirty:        10 kB"
+        ]
+        usage = memory.parseSmaps(lines)
+        self.assertEqual(usage, {"rss": 110, "pss": 40, "shared": 80,
+            "unique": 30, "swap": 0})
+
+    def test_memory_memoryUsage(self):
+        usage = memory.memoryUsage()
+        if not os.path.exists("/proc/%d" % (os.getpid())):
+            self.assertEqual(usage, None)
+            return
+        self.assertTrue(usage["rss"] > 0)
+        self.assertEqual(usage["rss"], usage["shared"] + usage["unique"])
+        report = memory.memoryReport([os.getpid(), -1])
+        self.assertEqual(report[-1], None)
+        self.assertTrue(report[os.getpid()]["rss"] > 0)
+
+class SingleFlight_TestsSequence(Utils_TestsSequence):
+    def test_singleflight_do(self):
+        flights = SingleFlight()
+        release = threading.Event()
+        calls = []
+        def func():
+            calls.append(1)
+            release.wait(30)
+            return object()
+        results = [None] * 5
+        def call(index):
+            results[index] = flights.do("key", func)
+        threads = [threading.Thread(target=call, args=(x,)) for x in range(5)]
+        threads[0].start()
+        start = time.time()
+        while not calls and time.time() - start < 10:
+            time.sleep(0.01)
+        for thread in threads[1:]:
+            thread.start()
+        while flights.stats()["waiting"] < 4 and time.time() - start < 10:
+            time.sleep(0.01)
+        self.assertEqual(flights.stats(), {"executions": 1, "coalesced": 4,
+            "inflight": 1, "waiting": 4})
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all([x is results[0] for x in results]))
+        # finished call is not cached
+        self.assertTrue(flights.do("key", func) is not results[0])
+        self.assertEqual(flights.stats()["inflight"], 0)
+
+    def test_singleflight_error(self):
+        flights = SingleFlight()
+        def func():
+            raise c.AnalyticsValueError("test", "message")
+        with self.assertRaises(c.AnalyticsValueError):
+            flights.do("key", func)
+        self.assertEqual(flights.do("key", lambda: 1), 1)
+        self.assertEqual(flights.stats()["executions"], 2)
+
+class Admission_TestsSequence(Utils_TestsSequence):
+    def test_admission_init(self):
+        with self.assertRaises(c.AnalyticsValueError):
+            AdmissionController(0, 1)
+        with self.assertRaises(c.AnalyticsCheckError):
+            AdmissionController("1", 1)
+
+    def test_admission_admit(self):
+        admission = AdmissionController(1, 2)
+        order = []
+        def heavy(name):
+            with admission.admit(True, 30):
+                order.append(name)
+        with admission.admit(True):
+            # light requests do not wait
+            with admission.admit(False):
+                pass
+            threads = []
+            for name in ["a", "b"]:
+                thread = threading.Thread(target=heavy, args=(name,))
+                thread.start()
+                threads.append(thread)
+                start = time.time()
+                while admission.stats()["waiting"] < len(threads) and \
+                        time.time() - start < 10:
+                    time.sleep(0.01)
+            # queue is full
+            with self.assertRaises(c.AnalyticsOverloadError):
+                admission.admit(True)
+        for thread in threads:
+            thread.join(30)
+        # waiting requests are admitted in order of arrival
+        self.assertEqual(order, ["a", "b"])
+        with admission.admit(True):
+            start = time.time()
+            with self.assertRaises(c.AnalyticsOverloadError):
+                admission.admit(True, 0.05)
+            self.assertTrue(time.time() - start >= 0.05)
+        self.assertEqual(admission.stats(), {"light": 1, "heavy": 4,
+            "queued": 3, "rejected": 1, "timedout": 1, "running": 0,
+            "waiting": 0})
+
+class Deadline_TestsSequence(Utils_TestsSequence):
+    def test_deadline_init(self):
+        with self.assertRaises(c.AnalyticsTypeError):
+            dl.Deadline("1")
+        with self.assertRaises(c.AnalyticsValueError):
+            dl.Deadline(-1)
+
+    def test_deadline_check(self):
+        deadline = dl.Deadline(60)
+        deadline.check()
+        self.assertEqual(deadline.expired(), False)
+        self.assertTrue(0 < deadline.remaining() <= 60)
+        deadline = dl.Deadline(0.05)
+        time.sleep(0.06)
+        self.assertEqual(deadline.expired(), True)
+        self.assertEqual(deadline.remaining(), 0.0)
+        with self.assertRaises(c.AnalyticsTimeoutError):
+            deadline.check()
+        # deadline without timeout expires only, when it is cancelled
+        deadline = dl.Deadline()
+        self.assertEqual(deadline.remaining(), None)
+        deadline.check()
+        deadline.cancel()
+        self.assertEqual(deadline.cancelled(), True)
+        self.assertEqual(deadline.remaining(), 0.0)
+        with self.assertRaises(c.AnalyticsTimeoutError):
+            deadline.check()
+
+    def test_deadline_orNever(self):
+        deadline = dl.Deadline(1)
+        self.assertEqual(dl.orNever(deadline), deadline)
+        self.assertEqual(dl.orNever(None), dl.NEVER)
+        dl.NEVER.cancel()
+        dl.NEVER.check()
+        self.assertEqual(dl.NEVER.expired(), False)
+
+class Timings_TestsSequence(Utils_TestsSequence):
+    def test_timings_stage(self):
+        timings = tm.Timings()
+        with timings.stage("filter", 10) as stage:
+            stage.out(4)
+        with timings.stage("sort", 4):
+            pass
+        # failed stage is not recorded
+        with self.assertRaises(c.AnalyticsValueError):
+            with timings.stage("analyse", 4):
+                misc.raiseValueError("Test", __file__)
+        stages = timings.stages()
+        self.assertEqual([(x[0], x[2], x[3]) for x in stages],
+            [("filter", 10, 4), ("sort", 4, 4)])
+        self.assertTrue(all([x[1] >= 0 for x in stages]))
+        self.assertEqual([x["stage"] for x in timings.getJSON()],
+            ["filter", "sort"])
+        self.assertEqual(sorted(timings.getJSON()[0].keys()),
+            ["in", "ms", "out", "stage"])
+        # discarded stages are not kept
+        with tm.orDiscard(None).stage("filter", 1):
+            pass
+        self.assertEqual(tm.DISCARD.stages(), [])
+        self.assertEqual(tm.orDiscard(timings), timings)
+
+    def test_timings_histograms(self):
+        with self.assertRaises(c.AnalyticsValueError):
+            tm.StageHistograms(0)
+        histograms = tm.StageHistograms(2)
+        for seconds in [0.0005, 0.003, 20.0]:
+            timings = tm.Timings()
+            timings.record("filter", seconds)
+            histograms.add("dataset", timings)
+        stats = histograms.getJSON()["dataset"]["filter"]
+        # only the latest samples are kept in buckets
+        self.assertEqual((stats["count"], stats["window"]), (3, 2))
+        self.assertEqual(stats["buckets"], [[5, 1], [None, 1]])
+        self.assertEqual(stats["max"], 20000.0)
+        self.assertEqual(stats["p50"], 20000.0)
+        self.assertEqual(stats["mean"], 10001.5)
+        histograms.clear()
+        self.assertEqual(histograms.getJSON(), {})
+
+    def test_timings_clock(self):
+        self.assertTrue(tm._monotonicClock() is not time.time)
+        values = [tm.clock() for _i in range(1000)]
+        self.assertEqual(values, sorted(values))
+        if sys.platform.startswith("linux"):
+            # CLOCK_MONOTONIC and elapsed time of "os.times" measure the same
+            # durations, although they start at different points
+            start = (tm.clock(), os.times()[4])
+            time.sleep(0.1)
+            elapsed = (tm.clock() - start[0], os.times()[4] - start[1])
+            self.assertTrue(elapsed[0] >= 0.1)
+            self.assertTrue(abs(elapsed[0] - elapsed[1]) < 0.05)
+
+class Profiling_TestsSequence(Utils_TestsSequence):
+    def test_profiling_profileCall(self):
+        def square(x):
+            return x * x
+        def work():
+            return sum([square(x) for x in range(100)])
+        value, report = profiling.profileCall(work, 5)
+        self.assertEqual(value, sum([x * x for x in range(100)]))
+        self.assertEqual(sorted(report.keys()),
+            ["calls", "file", "functions", "total"])
+        self.assertEqual(report["file"], None)
+        functions = report["functions"]
+        self.assertTrue(0 < len(functions) <= 5)
+        self.assertEqual(functions, sorted(functions,
+            key=lambda x: x["cumtime"], reverse=True))
+        calls = [x["calls"] for x in functions if
+            x["function"].endswith("(square)")]
+        self.assertEqual(calls, [100])
+        with self.assertRaises(c.AnalyticsValueError):
+            profiling.profileCall(lambda: misc.raiseValueError("!", __file__))
+
+    def test_profiling_save(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, "profiles", "test.pstats")
+            value, report = profiling.profileCall(lambda: 1, 5, path)
+            self.assertEqual(report["file"], path)
+            self.assertTrue(pstats.Stats(path).total_calls > 0)
+            # profile that cannot be saved does not fail call
+            path = os.path.join(path, "test.pstats")
+            value, report = profiling.profileCall(lambda: 1, 5, path)
+            self.assertEqual((value, report["file"]), (1, None))
+        finally:
+            shutil.rmtree(directory)
+
+    def test_profiling_rotateProfiles(self):
+        directory = tempfile.mkdtemp()
+        try:
+            names = ["%d.pstats" % (_i) for _i in range(4)] + ["other.txt"]
+            for _i in range(len(names)):
+                path = os.path.join(directory, names[_i])
+                open(path, "w").close()
+                os.utime(path, (1000 + _i, 1000 + _i))
+            removed = profiling.rotateProfiles(directory, 2)
+            self.assertEqual([os.path.basename(x) for x in removed],
+                ["0.pstats", "1.pstats"])
+            self.assertEqual(sorted(os.listdir(directory)),
+                ["2.pstats", "3.pstats", "other.txt"])
+            self.assertEqual(profiling.rotateProfiles(directory, 2), [])
+            self.assertEqual(profiling.rotateProfiles(
+                os.path.join(directory, "#"), 2), [])
+        finally:
+            shutil.rmtree(directory)
+
+class Metrics_TestsSequence(Utils_TestsSequence):
+    def test_metrics_counterGauge(self):
+        registry = metrics.Registry()
+        counter = registry.counter("test_total", "Test", ["code"])
+        counter.inc(labels=(200,))
+        counter.inc(2, ("a\"b\n",))
+        with self.assertRaises(c.AnalyticsValueError):
+            counter.inc(-1, (200,))
+        with self.assertRaises(c.AnalyticsValueError):
+            counter.inc(1)
+        self.assertEqual(counter.value(("200",)), 1)
+        self.assertEqual(counter.value(("404",)), None)
+        gauge = registry.gauge("test_gauge", "Test")
+        gauge.set(5)
+        gauge.inc(-1.5)
+        self.assertEqual(gauge.value(), 3.5)
+        self.assertEqual(registry.exposition().split("\n"), [
+            "# HELP test_gauge Test",
+            "# TYPE test_gauge gauge",
+            "test_gauge 3.5",
+            "# HELP test_total Test",
+            "# TYPE test_total counter",
+            "test_total{code=\"200\"} 1",
+            "test_total{code=\"a\\\"b\\n\"} 2",
+            ""])
+        # function values replace values set directly
+        gauge.setFunction(lambda: {(): 7})
+        self.assertEqual(gauge.samples(), ["test_gauge 7"])
+
+    def test_metrics_histogram(self):
+        histogram = metrics.Histogram("test_seconds", "Test", ["stage"],
+            [0.1, 1.0])
+        for value in [0.05, 0.1, 0.5, 5.0]:
+            histogram.observe(value, ("load",))
+        self.assertEqual(histogram.value(("load",))["buckets"], [2, 1, 1])
+        self.assertEqual(histogram.samples(), [
+            "test_seconds_bucket{stage=\"load\",le=\"0.1\"} 2",
+            "test_seconds_bucket{stage=\"load\",le=\"1.0\"} 3",
+            "test_seconds_bucket{stage=\"load\",le=\"+Inf\"} 4",
+            "test_seconds_sum{stage=\"load\"} 5.65",
+            "test_seconds_count{stage=\"load\"} 4"])
+        with self.assertRaises(c.AnalyticsValueError):
+            metrics.Histogram("test_seconds", "Test", ["le"])
+        with self.assertRaises(c.AnalyticsStandardError):
+            histogram.setFunction(lambda: {})
+
+    def test_metrics_registry(self):
+        registry = metrics.Registry()
+        counter = registry.counter("test_total", "Test")
+        self.assertEqual(registry.counter("test_total", "Test"), counter)
+        self.assertEqual(registry.get("test_total"), counter)
+        self.assertEqual(registry.get("test_other"), None)
+        with self.assertRaises(c.AnalyticsValueError):
+            registry.gauge("test_total", "Test")
+        with self.assertRaises(c.AnalyticsValueError):
+            registry.counter("test-total", "Test")
+
 # Load test suites
 def _suites():
     return [
         hQueue_TestsSequence,
-        misc_TestsSequence
+        misc_TestsSequence,
+        httputils_TestsSequence,
+        LRUCache_TestsSequence,
+        Diagnostics_TestsSequence,
+        LazyModule_TestsSequence,
+        Workers_TestsSequence,
+        Memory_TestsSequence,
+        SingleFlight_TestsSequence,
+        Admission_TestsSequence,
+        Deadline_TestsSequence,
+        Timings_TestsSequence,
+        Profiling_TestsSequence,
+        Metrics_TestsSequence,
+        SortedValues_TestsSequence,
+        QuantileSketch_TestsSequence
     ]
 
 # Load tests
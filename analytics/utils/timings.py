@@ -0,0 +1,340 @@
+#!/usr/bin/env python
+
+'''
+Copyright 2015 Ivan Sadikov
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+
+# import libs
+import bisect
+import collections
+import os
+import sys
+import threading
+import time
+import timeit
+from types import IntType
+# import classes
+import analytics.utils.misc as misc
+
+"""
+    Timings of pipeline stages. Request measures each stage with "Timings",
+    i.e. time spent and number of elements in and out of the stage, and
+    timings of requests are aggregated per dataset by "StageHistograms" over
+    the last WINDOW_SIZE requests.
+"""
+
+# clock id of CLOCK_MONOTONIC on Linux
+_CLOCK_MONOTONIC = 1
+# upper bounds of histogram buckets in milliseconds, the last bucket is open
+BUCKETS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000]
+# number of latest samples of each stage kept in histogram
+WINDOW_SIZE = 256
+
+
+# [Private]
+def _clockGetTime():
+    """
+        Returns function that reads CLOCK_MONOTONIC with "clock_gettime"
+        through ctypes, or None, if ctypes or the call is not available, e.g.
+        in App Engine sandbox or on platform other than Linux.
+
+        Returns:
+            function: clock function returning seconds, or None
+    """
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        import ctypes
+        import ctypes.util
+        class _Timespec(ctypes.Structure):
+            _fields_ = [("tv_sec", ctypes.c_long), ("tv_nsec", ctypes.c_long)]
+        # library is None, if librt is not found, then symbols of the
+        # process itself are used, glibc 2.17+ has "clock_gettime" in libc
+        library = ctypes.CDLL(ctypes.util.find_library("rt"))
+        gettime = library.clock_gettime
+        gettime.argtypes = [ctypes.c_int, ctypes.POINTER(_Timespec)]
+        gettime.restype = ctypes.c_int
+        spec = _Timespec()
+        if gettime(_CLOCK_MONOTONIC, ctypes.byref(spec)) != 0:
+            return None
+    except (ImportError, OSError, AttributeError):
+        return None
+    def monotonic():
+        # structure is allocated per call, clock is read by many threads
+        spec = _Timespec()
+        gettime(_CLOCK_MONOTONIC, ctypes.byref(spec))
+        return spec.tv_sec + spec.tv_nsec * 1e-9
+    return monotonic
+
+# [Private]
+def _monotonicClock():
+    """
+        Returns monotonic clock function. Python 2.7 has no "time.monotonic",
+        and "timeit.default_timer" is wall clock time on POSIX, so durations
+        would jump with system clock. CLOCK_MONOTONIC is read, if possible,
+        otherwise elapsed real time of "os.times" is used, it is monotonic on
+        Linux, but has resolution of clock ticks. Wall clock time is used
+        only when none of them is available.
+
+        Returns:
+            function: clock function returning seconds
+    """
+    if hasattr(time, "monotonic"):
+        return time.monotonic
+    gettime = _clockGetTime()
+    if gettime is not None:
+        return gettime
+    if sys.platform.startswith("linux"):
+        try:
+            os.times()
+            return lambda: os.times()[4]
+        except (AttributeError, OSError):
+            pass
+    # on Windows default timer is performance counter, which is monotonic
+    return timeit.default_timer
+
+# clock to measure durations with
+clock = _monotonicClock()
+
+
+class _Stage(object):
+    """
+        _Stage class is a stage being measured, stage is recorded, when it is
+        used as context manager and block exits without error.
+
+        Attributes:
+            _timings (Timings): timings to record stage to
+            _name (str): name of the stage
+            _countin (int): number of elements in
+            _countout (int): number of elements out, or None
+            _start (float): time when stage started
+    """
+    def __init__(self, timings, name, countin):
+        self._timings = timings
+        self._name = name
+        self._countin = countin
+        self._countout = None
+        self._start = None
+
+    def __enter__(self):
+        self._start = clock()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            countout = self._countin if self._countout is None else \
+                self._countout
+            self._timings.record(self._name, clock() - self._start,
+                self._countin, countout)
+        return False
+
+    # [Public]
+    def out(self, countout):
+        """
+            Sets number of elements out of the stage, it is the same as
+            number of elements in, unless it is set.
+
+            Args:
+                countout (int): number of elements out
+        """
+        self._countout = countout
+
+
+class Timings(object):
+    """
+        Timings class keeps stages of one request in order they finished.
+        It is not thread-safe, as request is executed by one thread.
+
+        Attributes:
+            _stages (list<tuple>): name, seconds, elements in and out
+    """
+    def __init__(self):
+        self._stages = []
+
+    # [Public]
+    def stage(self, name, countin=0):
+        """
+            Returns stage to measure in "with" statement.
+
+            Args:
+                name (str): name of the stage
+                countin (int): number of elements in
+
+            Returns:
+                _Stage: stage to measure
+        """
+        return _Stage(self, name, countin)
+
+    # [Public]
+    def record(self, name, seconds, countin=0, countout=0):
+        """
+            Records stage that was measured.
+
+            Args:
+                name (str): name of the stage
+                seconds (float): time spent in the stage
+                countin (int): number of elements in
+                countout (int): number of elements out
+        """
+        self._stages.append((name, seconds, countin, countout))
+
+    # [Public]
+    def stages(self):
+        """
+            Returns recorded stages.
+
+            Returns:
+                list<tuple>: name, seconds, elements in and out of each stage
+        """
+        return list(self._stages)
+
+    # [Public]
+    def getJSON(self):
+        """
+            Returns json representation of timings.
+
+            Returns:
+                list<dict>: stage, milliseconds, elements in and out
+        """
+        return [{"stage": x[0], "ms": round(x[1] * 1000.0, 3), "in": x[2],
+            "out": x[3]} for x in self._stages]
+
+
+class NoTimings(Timings):
+    """
+        NoTimings class discards every stage, it is used by callers that do
+        not measure stages.
+    """
+    # [Public]
+    def record(self, name, seconds, countin=0, countout=0):
+        pass
+
+
+# shared timings, stateless, so it is safe to use from any thread
+DISCARD = NoTimings()
+
+# [Public]
+def orDiscard(timings):
+    """
+        Returns timings provided, or timings that discard stages, if it is
+        None.
+
+        Args:
+            timings (Timings): timings or None
+
+        Returns:
+            Timings: timings to record to
+    """
+    return DISCARD if timings is None else timings
+
+
+class _Histogram(object):
+    """
+        _Histogram class keeps latest samples of one stage and their counts
+        in buckets.
+
+        Attributes:
+            _samples (deque<float>): latest samples in milliseconds
+            _counts (list<int>): number of samples in each bucket
+            _total (int): number of samples ever added
+    """
+    def __init__(self, size):
+        self._samples = collections.deque(maxlen=size)
+        self._counts = [0] * (len(BUCKETS) + 1)
+        self._total = 0
+
+    def add(self, ms):
+        if len(self._samples) == self._samples.maxlen:
+            self._counts[bisect.bisect_left(BUCKETS, self._samples[0])] -= 1
+        self._samples.append(ms)
+        self._counts[bisect.bisect_left(BUCKETS, ms)] += 1
+        self._total += 1
+
+    def getJSON(self):
+        ordered = sorted(self._samples)
+        n = len(ordered)
+        percentile = lambda p: ordered[min(int(p * n), n - 1)] if n else 0.0
+        bounds = BUCKETS + [None]
+        return {
+            "count": self._total,
+            "window": n,
+            "mean": round(sum(ordered) / n, 3) if n else 0.0,
+            "p50": round(percentile(0.5), 3),
+            "p95": round(percentile(0.95), 3),
+            "max": round(ordered[-1], 3) if n else 0.0,
+            "buckets": [[bounds[x], self._counts[x]] for x in
+                range(len(bounds)) if self._counts[x] > 0]
+        }
+
+
+class StageHistograms(object):
+    """
+        StageHistograms class aggregates timings of requests into histograms
+        of milliseconds for each dataset and stage. Histograms are rolling,
+        only the latest "size" samples of each stage are kept.
+
+        Attributes:
+            _size (int): number of samples kept for each stage
+            _lock (Lock): lock of histograms
+            _histograms (dict<str, dict<str, _Histogram>>): histograms by
+                dataset id and stage
+    """
+    def __init__(self, size=WINDOW_SIZE):
+        misc.checkTypeAgainst(type(size), IntType, __file__)
+        if size < 1:
+            misc.raiseValueError("Size must be positive", __file__)
+        self._size = size
+        self._lock = threading.Lock()
+        self._histograms = {}
+
+    # [Public]
+    def add(self, key, timings):
+        """
+            Adds stages of request to histograms.
+
+            Args:
+                key (str): dataset id
+                timings (Timings): timings of the request
+        """
+        with self._lock:
+            stages = self._histograms.setdefault(key, {})
+            for name, seconds, countin, countout in timings._stages:
+                if name not in stages:
+                    stages[name] = _Histogram(self._size)
+                stages[name].add(seconds * 1000.0)
+
+    # [Public]
+    def clear(self):
+        """
+            Removes all histograms.
+        """
+        with self._lock:
+            self._histograms = {}
+
+    # [Public]
+    def getJSON(self):
+        """
+            Returns json representation of histograms.
+
+            Returns:
+                dict<str, dict<str, dict>>: number of samples, mean, median,
+                    95th percentile, maximum and non-empty buckets of each
+                    stage by dataset id, bucket is upper bound in
+                    milliseconds, None for the last one, and count
+        """
+        with self._lock:
+            return dict((key, dict((name, hist.getJSON()) for name, hist in
+                stages.items())) for key, stages in self._histograms.items())
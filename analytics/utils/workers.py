@@ -0,0 +1,462 @@
+#!/usr/bin/env python
+
+'''
+Copyright 2015 Ivan Sadikov
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+
+# import libs
+import cPickle
+import itertools
+import os
+import sys
+import threading
+import time
+import Queue
+from types import IntType, ListType
+# multiprocessing is not available in every environment
+try:
+    import multiprocessing
+except ImportError:
+    multiprocessing = None
+# import classes
+import analytics.utils.misc as misc
+
+"""
+    Thread pool helpers for I/O-bound work, e.g. reading dataset files.
+    Threads are started for a single call and finish with it, nothing is left
+    running in the background. Threads are used instead of processes, as
+    App Engine standard environment does not allow to spawn processes, and
+    work is mostly waiting on disk, when GIL is released.
+
+    CPU-bound work, e.g. ranking, is run in forked processes with
+    "mapForked", where processes can be started and calling process runs no
+    other threads, and in calling process otherwise. Threads of servers may
+    hold locks at the moment of fork, and such locks are never released in
+    forked process. Servers run CPU-bound work of their threads in
+    "ProcessPool" instead, that is forked, before threads are started.
+"""
+
+# default number of worker threads
+MAX_WORKERS = 8
+# default number of forked processes
+MAX_PROCESSES = multiprocessing.cpu_count() if multiprocessing else 1
+
+# tasks of forked processes, processes inherit them on fork
+_forked = {}
+_forkedTokens = itertools.count(1)
+# flag showing that processes can be started, it is reset on first failure
+_canFork = multiprocessing is not None and os.name == "posix"
+
+
+class Result(object):
+    """
+        Result class keeps outcome of the task run by workers.
+
+        Attributes:
+            _value (obj): value returned by the task
+            _error (BaseException): exception raised by the task, or None
+            _traceback (traceback): traceback of the exception, or None
+            _time (float): time spent on the task in seconds
+    """
+    def __init__(self, value=None, error=None, traceback=None, spent=0.0):
+        self._value = value
+        self._error = error
+        self._traceback = traceback
+        self._time = spent
+
+    # [Public]
+    def value(self):
+        """
+            Returns value of the task, None, if task failed.
+
+            Returns:
+                obj: value returned by the task
+        """
+        return self._value
+
+    # [Public]
+    def error(self):
+        """
+            Returns exception raised by the task, None, if task succeeded.
+
+            Returns:
+                BaseException: exception raised by the task
+        """
+        return self._error
+
+    # [Public]
+    def time(self):
+        """
+            Returns time spent on the task.
+
+            Returns:
+                float: time in seconds
+        """
+        return self._time
+
+    # [Public]
+    def isSuccess(self):
+        """
+            Returns True, if task did not raise exception.
+
+            Returns:
+                bool: flag showing whether task succeeded
+        """
+        return self._error is None
+
+
+# [Private]
+def _runTask(func, item):
+    """
+        Runs function for item and returns result with time spent.
+
+        Args:
+            func (func): function to run
+            item (obj): argument of the function
+
+        Returns:
+            Result: result of the task
+    """
+    start = time.time()
+    try:
+        value = func(item)
+        return Result(value, None, None, time.time() - start)
+    # analytics exceptions derive from BaseException
+    except BaseException as e:
+        return Result(None, e, sys.exc_info()[2], time.time() - start)
+
+# [Public]
+def runParallel(func, items, maxworkers=MAX_WORKERS):
+    """
+        Applies function to every item using at most "maxworkers" threads.
+        Returns results in order of items, exceptions are not raised, but
+        kept in results. If there is one item or one worker, tasks are run in
+        calling thread.
+
+        Args:
+            func (func): function of one argument
+            items (list<obj>): list of arguments
+            maxworkers (int): maximum number of threads
+
+        Returns:
+            list<Result>: results in order of items
+    """
+    misc.checkTypeAgainst(type(items), ListType, __file__)
+    misc.checkTypeAgainst(type(maxworkers), IntType, __file__)
+    if maxworkers < 1:
+        misc.raiseValueError("Number of workers must be positive", __file__)
+    numworkers = min(maxworkers, len(items))
+    if numworkers <= 1:
+        return [_runTask(func, x) for x in items]
+    results = [None] * len(items)
+    tasks = Queue.Queue()
+    for _i in range(len(items)):
+        tasks.put(_i)
+    def worker():
+        while True:
+            try:
+                index = tasks.get_nowait()
+            except Queue.Empty:
+                return
+            results[index] = _runTask(func, items[index])
+    threads = [threading.Thread(target=worker) for _i in range(numworkers)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+# [Public]
+def mapParallel(func, items, maxworkers=MAX_WORKERS):
+    """
+        Applies function to every item using at most "maxworkers" threads and
+        returns values in order of items. If any task fails, exception of
+        the first failed task is re-raised after all tasks are finished.
+
+        Args:
+            func (func): function of one argument
+            items (list<obj>): list of arguments
+            maxworkers (int): maximum number of threads
+
+        Returns:
+            list<obj>: values in order of items
+    """
+    results = runParallel(func, items, maxworkers)
+    for result in results:
+        if not result.isSuccess():
+            raise type(result._error), result._error, result._traceback
+    return [x._value for x in results]
+
+# [Private]
+def _runPickled(task):
+    """
+        Runs function of pickled task for item in process of "ProcessPool".
+        Exception is returned instead of value, see "_runForked".
+
+        Args:
+            task (tuple<func, obj>): function and item
+
+        Returns:
+            tuple<BaseException, obj>: exception or None, and value
+    """
+    func, item = task
+    try:
+        return (None, func(item))
+    except BaseException as e:
+        return (picklableError(e), None)
+
+# [Private]
+def _runForked(task):
+    """
+        Runs function of forked task for item. Function and items are
+        inherited from parent process, task only refers to them. Analytics
+        exceptions derive from BaseException, that pool does not catch, so
+        exception is returned instead of value.
+
+        Args:
+            task (tuple<int, int>): token of the call and index of the item
+
+        Returns:
+            tuple<BaseException, obj>: exception or None, and value
+    """
+    token, index = task
+    func, items = _forked[token]
+    try:
+        return (None, func(items[index]))
+    except BaseException as e:
+        return (picklableError(e), None)
+
+# [Public]
+def picklableError(error):
+    """
+        Returns exception, if it can be sent to another process, otherwise
+        StandardError with the same message.
+
+        Args:
+            error (BaseException): exception to send
+
+        Returns:
+            BaseException: exception that can be pickled
+    """
+    try:
+        cPickle.loads(cPickle.dumps(error, cPickle.HIGHEST_PROTOCOL))
+        return error
+    except Exception:
+        return StandardError(str(error))
+
+# [Public]
+def canFork():
+    """
+        Returns True, if "mapForked" would start processes now, i.e. they can
+        be started and calling process runs no other threads.
+
+        Returns:
+            bool: flag showing that processes are forked
+    """
+    return _canFork and threading.active_count() == 1
+
+# [Public]
+def mapForked(func, items, maxworkers=MAX_PROCESSES, timeout=None):
+    """
+        Applies function to every item using at most "maxworkers" forked
+        processes and returns values in order of items. Function and items
+        are not pickled, processes inherit them on fork, so function can be
+        a closure, only values are sent back and must be picklable. Changes
+        that function makes to items are not visible in calling process.
+        If processes cannot be started, calling process runs other
+        threads, or there is one item or one worker, items are processed in
+        calling process. Exception of the first failed item is re-raised.
+        Processes that do not finish within timeout are terminated, and
+        timeout error is raised.
+
+        Args:
+            func (func): function of one argument
+            items (list<obj>): list of arguments
+            maxworkers (int): maximum number of processes
+            timeout (float): maximum time to wait in seconds, no limit if
+                None
+
+        Returns:
+            list<obj>: values in order of items
+    """
+    global _canFork
+    misc.checkTypeAgainst(type(items), ListType, __file__)
+    misc.checkTypeAgainst(type(maxworkers), IntType, __file__)
+    if maxworkers < 1:
+        misc.raiseValueError("Number of workers must be positive", __file__)
+    numworkers = min(maxworkers, len(items))
+    if numworkers <= 1 or not canFork():
+        return [func(x) for x in items]
+    token = next(_forkedTokens)
+    _forked[token] = (func, items)
+    try:
+        try:
+            pool = multiprocessing.Pool(numworkers)
+        except (OSError, NotImplementedError):
+            _canFork = False
+            return [func(x) for x in items]
+        try:
+            pending = pool.map_async(_runForked,
+                [(token, _i) for _i in range(len(items))], 1)
+            pool.close()
+            try:
+                results = pending.get(timeout)
+            except multiprocessing.TimeoutError:
+                misc.raiseTimeoutError("Forked processes took longer than " +
+                    "%s seconds" % (str(timeout)), __file__)
+        finally:
+            pool.terminate()
+            pool.join()
+    finally:
+        del _forked[token]
+    for error, value in results:
+        if error is not None:
+            raise error
+    return [x[1] for x in results]
+
+
+class ProcessPool(object):
+    """
+        ProcessPool class keeps processes, that are forked once, while
+        calling process runs no other threads, e.g. when server starts, and
+        runs CPU-bound tasks of any thread afterwards. Unlike "mapForked",
+        function and items are pickled and sent to processes, so function
+        must be defined at module level, and items must not refer to large
+        shared structures. Pool can be used by many threads at once.
+
+        Attributes:
+            _numprocesses (int): number of processes
+            _pool (multiprocessing.Pool): processes, or None, if not started
+            _lock (threading.Lock): lock of statistics
+            _stats (dict<str, int>): number of calls and tasks
+    """
+    def __init__(self, numprocesses=MAX_PROCESSES):
+        misc.checkTypeAgainst(type(numprocesses), IntType, __file__)
+        if numprocesses < 1:
+            misc.raiseValueError("Number of processes must be positive",
+                __file__)
+        self._numprocesses = numprocesses
+        self._pool = None
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "tasks": 0}
+
+    # [Public]
+    def start(self):
+        """
+            Forks processes, if they can be started and calling process runs
+            no other threads, see "canFork". Returns True, if pool is
+            running.
+
+            Returns:
+                bool: flag showing that pool is running
+        """
+        if self._pool is not None:
+            return True
+        if not canFork():
+            return False
+        try:
+            self._pool = multiprocessing.Pool(self._numprocesses)
+        except (OSError, NotImplementedError):
+            return False
+        return True
+
+    # [Public]
+    def stop(self):
+        """
+            Terminates processes, tasks in progress are abandoned.
+        """
+        pool = self._pool
+        self._pool = None
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+    # [Public]
+    def isRunning(self):
+        """
+            Returns True, if processes are started.
+
+            Returns:
+                bool: flag showing that pool is running
+        """
+        return self._pool is not None
+
+    # [Public]
+    def numProcesses(self):
+        """
+            Returns number of processes of the pool.
+
+            Returns:
+                int: number of processes
+        """
+        return self._numprocesses
+
+    # [Public]
+    def map(self, func, items, timeout=None):
+        """
+            Applies function to every item in processes of the pool and
+            returns values in order of items. Items are processed in calling
+            process, if pool is not running. Exception of the first failed
+            item is re-raised. Timeout error is raised, if items are not
+            processed within timeout, processes are left to finish them.
+
+            Args:
+                func (func): module-level function of one argument
+                items (list<obj>): list of picklable arguments
+                timeout (float): maximum time to wait in seconds, no limit if
+                    None
+
+            Returns:
+                list<obj>: values in order of items
+        """
+        misc.checkTypeAgainst(type(items), ListType, __file__)
+        pool = self._pool
+        if pool is None:
+            return [func(x) for x in items]
+        try:
+            pending = pool.map_async(_runPickled, [(func, x) for x in items],
+                1)
+        except (AssertionError, ValueError):
+            # pool is stopped by another thread
+            return [func(x) for x in items]
+        with self._lock:
+            self._stats["calls"] += 1
+            self._stats["tasks"] += len(items)
+        try:
+            results = pending.get(timeout)
+        except multiprocessing.TimeoutError:
+            misc.raiseTimeoutError("Processes of pool took longer than " +
+                "%s seconds" % (str(timeout)), __file__)
+        for error, value in results:
+            if error is not None:
+                raise error
+        return [x[1] for x in results]
+
+    # [Public]
+    def stats(self):
+        """
+            Returns number of processes, whether pool is running, and number
+            of calls and tasks run in processes.
+
+            Returns:
+                dict<str, obj>: statistics of the pool
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        stats["processes"] = self._numprocesses
+        stats["running"] = self.isRunning()
+        return stats
@@ -3,83 +3,53 @@
 # import libs
 from google.appengine.api import users
 import analytics.service as service
+import analytics.server.routes as routes
 import webapp2
-import json
 # import classes
 import projectpaths
 
 
-def accessGranted(user):
+class APIHandler(webapp2.RequestHandler):
     """
-        Returns True, if user is granted access and in email list.
-
-        Returns:
-            bool: flag showing that user access is granted
-    """
-    return user and service.isUserInEmaillist(user.email())
-
-
-def boolean(value):
+        API calls are handled by "routes", the same as in standalone servers,
+        handler passes request and user of App Engine login, and writes
+        response back.
     """
-        Converts string into boolean
-
-        Returns:
-            bool: converted boolean value
-    """
-    if value in ["false", "0"]:
-        return False
-    else:
-        return bool(value)
-
-
-class Datasets(webapp2.RequestHandler):
     def get(self):
-        result = {}
         user = users.get_current_user()
-        if accessGranted(user):
-            result = service.getAllDatasets()
-        else:
-            msg = "Access is not granted"
-            result = service._generateErrorMessage([msg])
-        self.response.headers['Content-Type'] = 'application/json'
-        self.response.write(json.dumps(result))
-        self.response.set_status(result["code"])
-
-
-class Query(webapp2.RequestHandler):
-    def get(self):
-        result = {}
-        user = users.get_current_user()
-        if accessGranted(user):
-            query = str(self.request.get('q'))
-            datasetId = str(self.request.get('d'))
-            sort = boolean(self.request.get('s'))
-            warn = boolean(self.request.get('w'))
-            result = service.requestData(
-                datasetId,
-                query,
-                issorted=sort,
-                iswarnings=warn
-            )
-        else:
-            msg = "Access is not granted"
-            result = service._generateErrorMessage([msg])
-        self.response.headers['Content-Type'] = 'application/json'
-        self.response.write(json.dumps(result))
-        self.response.set_status(result["code"])
-
-
-class WrongAPICall(webapp2.RequestHandler):
+        email = user.email() if user else None
+        params = dict((x, self.request.get(x))
+            for x in self.request.arguments())
+        self.write(routes.handle(self.request.path, params,
+            dict(self.request.headers), email))
+
+    # [Public]
+    def write(self, response):
+        """
+            Writes response of "routes" with status code and headers.
+
+            Args:
+                response (tuple<int, list, str>): status code, headers and body
+        """
+        code, headers, body = response
+        for name, value in headers:
+            self.response.headers[name] = value
+        self.response.write(body)
+        self.response.set_status(code)
+
+
+class Warmup(APIHandler):
     def get(self):
-        msg = "API does not exist"
-        result = service._generateErrorMessage([msg])
-        self.response.headers['Content-Type'] = 'application/json'
-        self.response.write(json.dumps(result))
-        self.response.set_status(400)
+        # App Engine sends warm-up request before instance serves traffic,
+        # threads do not outlive request there, so hot datasets are
+        # processed in place
+        service.warmup(background=False)
+        obj = {"datasets": service.HOT_DATASETS}
+        self.write(routes.send(dict(self.request.headers),
+            service._generateSuccessMessage([], obj)))
 
 
 application = webapp2.WSGIApplication([
-    ('/api/datasets', Datasets),
-    ('/api/query', Query),
-    ('/api/.*', WrongAPICall)
+    ('/_ah/warmup', Warmup),
+    ('/api/.*', APIHandler)
 ], debug=True)